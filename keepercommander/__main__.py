@@ -64,6 +64,13 @@ def get_params_from_config(config_filename=None, launched_with_shortcut=False):
                         params.rest_context.fail_on_throttle = params.config['fail_on_throttle'] is True
                     if 'certificate_check' in params.config:
                         params.rest_context.certificate_check = params.config['certificate_check'] is True
+                    if isinstance(params.config.get('http_pool_size'), int) and params.config['http_pool_size'] > 0:
+                        params.rest_context.pool_size = params.config['http_pool_size']
+                    if 'http_keep_alive' in params.config:
+                        params.rest_context.keep_alive = params.config['http_keep_alive'] is not False
+                    for key in ('transmission_key_max_requests', 'transmission_key_max_age'):
+                        if isinstance(params.config.get(key), int) and params.config[key] > 0:
+                            setattr(params.rest_context, key, params.config[key])
                     if 'commands' in params.config:
                         if params.config['commands']:
                             params.commands.extend(params.config['commands'])
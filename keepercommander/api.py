@@ -11,6 +11,7 @@
 
 import base64
 import collections
+import concurrent.futures
 import itertools
 import json
 import logging
@@ -25,7 +26,7 @@ from typing import Optional, Tuple, Iterable, List, Dict, Any, Union
 import google
 from Cryptodome.PublicKey import RSA
 
-from . import constants, rest_api, loginv3, utils, crypto, vault
+from . import constants, rest_api, loginv3, utils, crypto, vault, search_index
 from .display import bcolors
 from .enterprise import query_enterprise as qe
 from .error import KeeperApiError
@@ -455,6 +456,21 @@ def get_team(params,team_uid):
     return team
 
 
+def _record_search_target(params, record_uid):    # type: (KeeperParams, str) -> Tuple[Optional[Record], str]
+    rec = get_record(params, record_uid)
+    if not rec:
+        return None, ''
+    cached_rec = params.record_cache[record_uid] or {}
+
+    if cached_rec.get('version') == 3:
+        data = cached_rec.get('data_unencrypted')
+        rec.record_type = RecordV3.get_record_type_name(data)
+        target = RecordV3.values_to_lowerstring(data)
+    else:
+        target = rec.to_lowerstring()
+    return rec, target
+
+
 def search_records(params, searchstring):
     """Search for string in record contents 
        and return array of Record objects """
@@ -462,18 +478,22 @@ def search_records(params, searchstring):
     p = re.compile(searchstring.lower())
     search_results = []
 
-    for record_uid in params.record_cache:
-        rec = get_record(params, record_uid)
+    def get_search_text(uid):
+        # password masking depends on the folder tree, index both forms
+        r, t = _record_search_target(params, uid)
+        if r and r.unmasked_password:
+            t += '\n' + r.unmasked_password
+        return t
+
+    record_uids = search_index.find_candidates(
+        params, 'legacy_record', params.record_cache, searchstring, get_search_text)
+    if record_uids is None:
+        record_uids = list(params.record_cache)
+
+    for record_uid in record_uids:
+        rec, target = _record_search_target(params, record_uid)
         if not rec:
             continue
-        cached_rec = params.record_cache[record_uid] or {}
-
-        if cached_rec.get('version') == 3:
-            data = cached_rec.get('data_unencrypted')
-            rec.record_type = RecordV3.get_record_type_name(data)
-            target = RecordV3.values_to_lowerstring(data)
-        else:
-            target = rec.to_lowerstring()
 
         if p.search(target):
             search_results.append(rec)
@@ -488,7 +508,16 @@ def search_shared_folders(params, searchstring):
 
     search_results = [] 
 
-    for shared_folder_uid in params.shared_folder_cache:
+    def get_search_text(uid):
+        sf = get_shared_folder(params, uid)
+        return sf.to_lowerstring() if sf else None
+
+    shared_folder_uids = search_index.find_candidates(
+        params, 'shared_folder', params.shared_folder_cache, searchstring, get_search_text)
+    if shared_folder_uids is None:
+        shared_folder_uids = list(params.shared_folder_cache)
+
+    for shared_folder_uid in shared_folder_uids:
 
         logging.debug('Getting Shared Folder UID: %s', shared_folder_uid)
         sf = get_shared_folder(params, shared_folder_uid)
@@ -508,7 +537,15 @@ def search_teams(params, searchstring):
 
     search_results = [] 
 
-    for team_uid in params.team_cache:
+    def get_search_text(uid):
+        t = get_team(params, uid)
+        return t.to_lowerstring() if t else None
+
+    team_uids = search_index.find_candidates(params, 'team', params.team_cache, searchstring, get_search_text)
+    if team_uids is None:
+        team_uids = list(params.team_cache)
+
+    for team_uid in team_uids:
         team = get_team(params, team_uid)
 
         target = team.to_lowerstring()
@@ -720,22 +757,28 @@ def communicate_rest(params, request, endpoint, *, rs_type=None, payload_version
     raise KeeperApiError('Error', endpoint)
 
 
+THROTTLE_RETRIES = 5
+
+
 def communicate(params, request, retry_on_throttle=True):
     # type: (KeeperParams, dict, Optional[bool]) -> dict
 
-    request['client_time'] = current_milli_time()
     request['locale'] = LOCALE
     request['device_id'] = 'Commander'
     request['session_token'] = params.session_token
     request['username'] = params.user.lower()
     try:
-        response_json = run_command(params, request)
-        if response_json['result'] != 'success':
-            if retry_on_throttle and response_json.get('result_code') == 'throttled':
-                logging.info('Throttled. sleeping for 10 seconds')
-                time.sleep(10)
-                # Allow maximum 1 retry per call
-                return communicate(params, request, retry_on_throttle=False)
+        attempt = 0
+        while True:
+            request['client_time'] = current_milli_time()
+            response_json = run_command(params, request)
+            if response_json['result'] == 'success':
+                break
+            if retry_on_throttle and response_json.get('result_code') == 'throttled' and attempt < THROTTLE_RETRIES:
+                # the governor waits with exponential backoff
+                attempt += 1
+                params.rest_context.governor.throttled(rest_api.V2_COMMAND_ENDPOINT)
+                continue
             raise KeeperApiError(response_json['result_code'], response_json['message'])
         TTK.update_time_of_last_activity()
         return response_json
@@ -745,45 +788,109 @@ def communicate(params, request, retry_on_throttle=True):
         raise kae
 
 
-def execute_batch(params, requests):
-    # type: (KeeperParams, List[dict]) -> List[dict]
-    responses = []
-    if not requests:
-        return responses
+BATCH_CHUNK_SIZE = 999
+BATCH_PIPELINE_DEPTH_CONFIG_KEY = 'batch_pipeline_depth'
+DEFAULT_BATCH_PIPELINE_DEPTH = 4
 
-    throttle_delay = 10
-    chunk_size = 999
-    queue = requests.copy()
-    delay_next_batch = False
 
-    while len(queue) > 0:
-        chunk = queue[:chunk_size]
-        queue = queue[chunk_size:]
+def get_batch_pipeline_depth(params):    # type: (KeeperParams) -> int
+    depth = params.config.get(BATCH_PIPELINE_DEPTH_CONFIG_KEY) if isinstance(params.config, dict) else None
+    return depth if isinstance(depth, int) and depth > 0 else DEFAULT_BATCH_PIPELINE_DEPTH
 
-        rq = {
+
+def execute_batch(params, requests, pipelined=False):
+    # type: (KeeperParams, List[dict], bool) -> List[dict]
+    """Executes v2 requests in "execute" chunks and returns responses in request order.
+
+    pipelined keeps up to "batch_pipeline_depth" chunks in flight. Use it only for requests that do not depend
+    on each other: chunks, including throttled tails that are sent again, may be executed in any order.
+    Exactly one response is returned per request: requests of a chunk that failed or got no "results" get
+    a "fail" response with the error.
+    """
+    if not requests:
+        return []
+
+    responses = [None] * len(requests)    # type: List[Optional[dict]]
+    queue = collections.deque((list(range(i, min(i + BATCH_CHUNK_SIZE, len(requests))))
+                               for i in range(0, len(requests), BATCH_CHUNK_SIZE)))
+
+    def execute_chunk(chunk):    # type: (List[int]) -> dict
+        return communicate(params, {
             'command': 'execute',
-            'requests': chunk
+            'requests': [requests[x] for x in chunk]
+        })
+
+    def fail_response(result_code, message):    # type: (Optional[str], Optional[str]) -> dict
+        return {
+            'result': 'fail',
+            'result_code': result_code or 'error',
+            'message': message or 'No response to the request',
         }
-        try:
-            if delay_next_batch:
-                time.sleep(throttle_delay)
-            rs = communicate(params, rq)
-            if 'results' in rs:
-                results = rs['results']  # type: list
-                if len(results) > 0:
-                    error_rs = results[-1]
-                    throttled = error_rs.get('result') != 'success' and error_rs.get('result_code') == 'throttled'
-                    if throttled:
-                        delay_next_batch = True
-                        results.pop()
-                responses.extend(results)
-
-                if len(results) < len(chunk):
-                    queue = chunk[len(results):] + queue
-        except Exception as e:
-            logging.error(e)
 
-    return responses
+    def apply_response(chunk, rs):    # type: (List[int], dict) -> bool
+        results = rs.get('results') if isinstance(rs, dict) else None
+        if not isinstance(results, list):
+            logging.error('Batch execute returned no results for %d requests', len(chunk))
+            error_rs = fail_response(rs.get('result_code'), rs.get('message')) if isinstance(rs, dict) else \
+                fail_response(None, None)
+            for i in chunk:
+                responses[i] = dict(error_rs)
+            return False
+
+        throttled = False
+        if len(results) > 0:
+            error_rs = results[-1]
+            throttled = error_rs.get('result') != 'success' and error_rs.get('result_code') == 'throttled'
+            if throttled:
+                results.pop()
+        for i, result in zip(chunk, results):
+            responses[i] = result
+
+        if len(results) < len(chunk):
+            if throttled or len(results) > 0:
+                queue.appendleft(chunk[len(results):])
+            else:
+                for i in chunk:
+                    responses[i] = fail_response(None, None)
+        return throttled
+
+    def apply_error(chunk, e):    # type: (List[int], Exception) -> None
+        logging.error(e)
+        for i in chunk:
+            responses[i] = fail_response(getattr(e, 'result_code', None), getattr(e, 'message', None) or str(e))
+
+    max_in_flight = get_batch_pipeline_depth(params) if pipelined else 1
+    if max_in_flight <= 1 or len(queue) <= 1:
+        delay_next_batch = False
+        while len(queue) > 0:
+            chunk = queue.popleft()
+            try:
+                if delay_next_batch:
+                    delay_next_batch = False
+                    params.rest_context.governor.throttled(rest_api.V2_COMMAND_ENDPOINT)
+                delay_next_batch = apply_response(chunk, execute_chunk(chunk))
+            except Exception as e:
+                apply_error(chunk, e)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            in_flight = {}    # type: Dict[concurrent.futures.Future, List[int]]
+            while len(queue) > 0 or len(in_flight) > 0:
+                while len(queue) > 0 and len(in_flight) < max_in_flight:
+                    chunk = queue.popleft()
+                    in_flight[executor.submit(execute_chunk, chunk)] = chunk
+                done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                throttled = False
+                for future in done:
+                    chunk = in_flight.pop(future)
+                    try:
+                        if apply_response(chunk, future.result()):
+                            throttled = True
+                    except Exception as e:
+                        apply_error(chunk, e)
+                if throttled:
+                    params.rest_context.governor.throttled(rest_api.V2_COMMAND_ENDPOINT)
+
+    return [x if x is not None else fail_response(None, None) for x in responses]
 
 
 def update_record(params, record, **kwargs):
@@ -8,16 +8,23 @@
 # Contact: ops@keepersecurity.com
 #
 import abc
+import collections
+import concurrent.futures
 import contextlib
 import io
+import itertools
 import json
 import logging
 import mimetypes
 import os
 import shutil
-from typing import BinaryIO, Iterator, Optional, List, Union, Dict
+import threading
+import time
+from typing import BinaryIO, Iterator, Optional, List, Union, Dict, Iterable, Callable, Any, Tuple, ContextManager
 
 import requests
+from urllib3.exceptions import HTTPError as Urllib3HTTPError
+from urllib3.fields import RequestField
 
 from . import crypto, api, utils
 from .params import KeeperParams
@@ -25,6 +32,278 @@ from .proto import record_pb2
 from .record_facades import FileRefRecordFacade
 from .vault import KeeperRecord, PasswordRecord, TypedRecord, FileRecord, AttachmentFile, AttachmentFileThumb
 
+TRANSFER_WORKERS_CONFIG_KEY = 'attachment_transfer_workers'
+DEFAULT_TRANSFER_WORKERS = 4
+TRANSFER_BUFFER_SIZE = 1024 * 1024
+TRANSFER_RETRIES = 3
+
+
+def get_transfer_workers(params):    # type: (KeeperParams) -> int
+    workers = params.config.get(TRANSFER_WORKERS_CONFIG_KEY) if isinstance(params.config, dict) else None
+    return workers if isinstance(workers, int) and workers > 0 else DEFAULT_TRANSFER_WORKERS
+
+
+class TransferProgress:
+    """Aggregate byte counter shared by concurrent file transfers"""
+    REPORT_INTERVAL = 5
+
+    def __init__(self, report=False):    # type: (bool) -> None
+        self.report = report
+        self.started = time.time()
+        self.bytes = 0
+        self.files = 0
+        self._reported = self.started
+        self._lock = threading.Lock()
+
+    def add_bytes(self, count):    # type: (int) -> None
+        with self._lock:
+            self.bytes += count
+            now = time.time()
+            should_report = self.report and now - self._reported >= self.REPORT_INTERVAL
+            if should_report:
+                self._reported = now
+        if should_report:
+            logging.info('Transferred %s (%s/s)', utils.size_to_str(self.bytes), utils.size_to_str(int(self.rate)))
+
+    def file_done(self):
+        with self._lock:
+            self.files += 1
+
+    @property
+    def rate(self):    # type: () -> float
+        elapsed = time.time() - self.started
+        return self.bytes / elapsed if elapsed > 0 else 0
+
+    def __str__(self):
+        return f'{self.files} file(s), {utils.size_to_str(self.bytes)} ' \
+               f'in {time.time() - self.started:.1f}s ({utils.size_to_str(int(self.rate))}/s)'
+
+
+def iter_transfers(items, transfer, max_workers):
+    # type: (Iterable[Any], Callable[[Any], Any], int) -> Iterator[Tuple[Any, Any, Optional[Exception]]]
+    """Runs "transfer" for items in up to "max_workers" threads.
+
+    Yields (item, result, error) tuples in item order. At most "max_workers" items are in flight,
+    so completed transfers waiting for an earlier one do not pile up in memory.
+    """
+    max_workers = max(max_workers, 1)
+    items = iter(items)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = collections.deque()
+        for item in itertools.islice(items, max_workers):
+            in_flight.append((item, executor.submit(transfer, item)))
+        while len(in_flight) > 0:
+            item, future = in_flight.popleft()
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                result, error = None, e
+            for next_item in itertools.islice(items, 1):
+                in_flight.append((next_item, executor.submit(transfer, next_item)))
+            yield item, result, error
+
+
+class HttpDownloadStream(io.RawIOBase):
+    """Reads an HTTP download. Resumes with a Range request after a connection error.
+
+    Every error is retried up to TRANSFER_RETRIES times. The counter restarts after a successful read.
+    """
+    def __init__(self, params, url, success_status_code=200, progress=None):
+        # type: (KeeperParams, str, int, Optional[TransferProgress]) -> None
+        super().__init__()
+        self.session = params.rest_context.get_session()
+        self.proxies = params.rest_context.proxies
+        self.url = url
+        self.success_status_code = success_status_code
+        self.progress = progress
+        self.position = 0
+        self.status_code = 0
+        self._response = None    # type: Optional[requests.Response]
+        self._attempt = 0
+
+    def readable(self):
+        return True
+
+    def _open(self):
+        headers = {'Range': f'bytes={self.position}-'} if self.position > 0 else None
+        response = self.session.get(self.url, headers=headers, proxies=self.proxies, stream=True)
+        if response.status_code >= 500:
+            response.close()
+            raise requests.exceptions.HTTPError(f'HTTP status code {response.status_code}')
+        if self.position > 0:
+            if response.status_code == self.success_status_code:
+                # the server ignored the range: skip the bytes that have been read already
+                to_skip = self.position
+                while to_skip > 0:
+                    skipped = len(response.raw.read(min(to_skip, TRANSFER_BUFFER_SIZE)))
+                    if skipped == 0:
+                        break
+                    to_skip -= skipped
+            elif response.status_code != 206:
+                response.close()
+                raise Exception(f'Resuming download: HTTP status code {response.status_code}')
+        else:
+            self.status_code = response.status_code
+            if response.status_code != self.success_status_code:
+                logging.warning('HTTP status code: %d', response.status_code)
+        self._response = response
+
+    def readinto(self, buffer):
+        while True:
+            try:
+                if self._response is None:
+                    self._open()
+                bytes_read = self._response.raw.readinto(buffer)
+                self.position += bytes_read
+                self._attempt = 0
+                if self.progress and bytes_read > 0:
+                    self.progress.add_bytes(bytes_read)
+                return bytes_read
+            except (requests.exceptions.RequestException, Urllib3HTTPError, ConnectionError) as e:
+                if self._response is not None:
+                    self._response.close()
+                    self._response = None
+                self._attempt += 1
+                if self._attempt > TRANSFER_RETRIES:
+                    raise
+                logging.debug('Download error at byte %d: %s. Retrying...', self.position, e)
+                time.sleep(self._attempt)
+
+    def close(self):
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+        super().close()
+
+
+def encrypted_size(size, is_gcm):    # type: (int, bool) -> int
+    """Size of "size" bytes encrypted by StreamCrypter: IV or nonce, padded CBC data or GCM data and tag"""
+    if is_gcm:
+        return 12 + size + 16
+    return 16 + (size // 16 + 1) * 16
+
+
+class EncryptedContent:
+    """Upload content that is encrypted while it is sent.
+
+    Every open() opens and encrypts the source again, so a retried upload does not keep the content in memory.
+    The plain size is counted by reading the source if it is not known.
+    """
+    def __init__(self, open_source, key, is_gcm, size=None):
+        # type: (Callable[[], ContextManager[BinaryIO]], bytes, bool, Optional[int]) -> None
+        self.open_source = open_source
+        self.key = key
+        self.is_gcm = is_gcm
+        self.size = size
+
+    def __len__(self):
+        if not isinstance(self.size, int) or self.size < 0:
+            size = 0
+            with self.open_source() as source:
+                while True:
+                    chunk = source.read(TRANSFER_BUFFER_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+            self.size = size
+        return encrypted_size(self.size, self.is_gcm)
+
+    @contextlib.contextmanager
+    def open(self):    # type: () -> Iterator[BinaryIO]
+        crypter = crypto.StreamCrypter()
+        crypter.is_gcm = self.is_gcm
+        crypter.key = self.key
+        with self.open_source() as source, crypter.set_stream(source, True, TRANSFER_BUFFER_SIZE) as crypto_stream:
+            yield crypto_stream
+
+
+def encrypt_content(open_source, key, is_gcm, size=None):
+    # type: (Callable[[], ContextManager[BinaryIO]], bytes, bool, Optional[int]) -> EncryptedContent
+    return EncryptedContent(open_source, key, is_gcm, size)
+
+
+class MultipartUploadStream(io.RawIOBase):
+    """multipart/form-data body of a presigned POST form with one file. The file content is read as it is sent"""
+    def __init__(self, parameters, file_parameter, file_name, content, content_size):
+        # type: (dict, str, str, BinaryIO, int) -> None
+        super().__init__()
+        self.boundary = os.urandom(16).hex()
+        prefix = io.BytesIO()
+        for name, value in (parameters or {}).items():
+            field = RequestField(name=name, data=str(value) if isinstance(value, int) else value)
+            field.make_multipart()
+            self._write_part(prefix, field)
+        file_field = RequestField(name=file_parameter, data=b'', filename=file_name)
+        file_field.make_multipart(content_type='application/octet-stream')
+        prefix.write(f'--{self.boundary}\r\n'.encode('latin-1'))
+        prefix.write(file_field.render_headers().encode('utf-8'))
+        self.content_size = content_size
+        self._parts = [io.BytesIO(prefix.getvalue()), content,
+                       io.BytesIO(f'\r\n--{self.boundary}--\r\n'.encode('latin-1'))]
+        self._length = len(prefix.getvalue()) + content_size + len(self._parts[2].getvalue())
+        self._part = 0
+        self._content_read = 0
+
+    def _write_part(self, output, field):    # type: (BinaryIO, RequestField) -> None
+        output.write(f'--{self.boundary}\r\n'.encode('latin-1'))
+        output.write(field.render_headers().encode('utf-8'))
+        data = field.data
+        output.write(data.encode('utf-8') if isinstance(data, str) else data)
+        output.write(b'\r\n')
+
+    @property
+    def content_type(self):    # type: () -> str
+        return f'multipart/form-data; boundary={self.boundary}'
+
+    def __len__(self):
+        return self._length
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self._part < len(self._parts):
+            bytes_read = self._parts[self._part].readinto(buffer)
+            if self._part == 1:
+                # Content-Length has been sent already
+                self._content_read += bytes_read
+                if self._content_read > self.content_size or (bytes_read == 0 and
+                                                              self._content_read < self.content_size):
+                    raise ValueError(f'Upload content size changed: {self.content_size} bytes expected')
+            if bytes_read:
+                return bytes_read
+            self._part += 1
+        return 0
+
+
+def upload_content(params, url, parameters, file_parameter, file_name, content, success_status_code,
+                   progress=None):
+    # type: (KeeperParams, str, dict, str, str, EncryptedContent, Optional[int], Optional[TransferProgress]) -> None
+    """Posts encrypted content to the upload URL. Connection and server errors are retried"""
+    session = params.rest_context.get_session()
+    content_size = len(content)
+    attempt = 0
+    while True:
+        try:
+            with content.open() as content_stream:
+                body = MultipartUploadStream(parameters, file_parameter, file_name, content_stream, content_size)
+                response = session.post(url, data=body, headers={'Content-Type': body.content_type},
+                                        proxies=params.rest_context.proxies)
+            if success_status_code is None or response.status_code == success_status_code:
+                break
+            if response.status_code < 500 or attempt >= TRANSFER_RETRIES:
+                raise Exception(f'HTTP status code {response.status_code}')
+            reason = f'HTTP status code {response.status_code}'
+        except requests.exceptions.RequestException as e:
+            if attempt >= TRANSFER_RETRIES:
+                raise
+            reason = str(e)
+        attempt += 1
+        logging.debug('Uploading file %s: %s. Retrying...', file_name, reason)
+        time.sleep(attempt)
+    if progress:
+        progress.add_bytes(content_size)
+
 
 def prepare_attachment_download(params, record_uid, attachment_name=None):
     # type: (KeeperParams, str, Optional[str]) -> Iterator[AttachmentDownloadRequest]
@@ -104,24 +383,43 @@ class AttachmentDownloadRequest:
         self.is_gcm_encrypted = False
         self.success_status_code = 200
 
-    def download_to_file(self, params, file_name):  # type: (KeeperParams, str) -> None
+    def download_to_file(self, params, file_name, progress=None):
+        # type: (KeeperParams, str, Optional[TransferProgress]) -> None
         logging.info('Downloading \'%s\'', os.path.abspath(file_name))
         with open(file_name, 'wb') as file_stream:
-            self.download_to_stream(params, file_stream)
+            self.download_to_stream(params, file_stream, progress)
 
-    def download_to_stream(self, params, output_stream):  # type: (KeeperParams, BinaryIO) -> int
-        with requests.get(self.url, proxies=params.rest_context.proxies, stream=True) as rq_http:
-            if self.success_status_code != rq_http.status_code:
-                logging.warning('HTTP status code: %d', rq_http.status_code)
+    def download_to_stream(self, params, output_stream, progress=None):
+        # type: (KeeperParams, BinaryIO, Optional[TransferProgress]) -> int
+        with HttpDownloadStream(params, self.url, self.success_status_code, progress) as http_stream:
             crypter = crypto.StreamCrypter()
             crypter.is_gcm = self.is_gcm_encrypted
             crypter.key = self.encryption_key
-            with crypter.set_stream(rq_http.raw, for_encrypt=False) as attachment:
-                shutil.copyfileobj(attachment, output_stream, 10240)
+            with crypter.set_stream(http_stream, False, TRANSFER_BUFFER_SIZE) as attachment:
+                shutil.copyfileobj(attachment, output_stream, TRANSFER_BUFFER_SIZE)
             output_stream.flush()
             return crypter.bytes_read
 
 
+def download_attachments(params, downloads, progress=None):
+    # type: (KeeperParams, Iterable[Tuple[AttachmentDownloadRequest, str]], Optional[TransferProgress]) -> int
+    """Downloads (attachment, file name) pairs concurrently. Returns the number of failed downloads"""
+    def download(item):
+        adr, file_name = item
+        adr.download_to_file(params, file_name, progress)
+
+    failed = 0
+    for (_, name), _, error in iter_transfers(downloads, download, get_transfer_workers(params)):
+        if error:
+            failed += 1
+            logging.warning('Downloading \'%s\' error: %s', name, error)
+            if os.path.isfile(name):
+                os.remove(name)
+        elif progress:
+            progress.file_done()
+    return failed
+
+
 class UploadTask(abc.ABC):
     def __init__(self):
         self.mime_type = ''
@@ -170,11 +468,11 @@ class FileUploadTask(UploadTask):
         yield open(self.file_path, 'rb')
 
 
-def upload_attachments(params, record, attachments):
-    # type: (KeeperParams, Union[PasswordRecord, TypedRecord], List[UploadTask]) -> None
-    cryptor = crypto.StreamCrypter()
+def upload_attachments(params, record, attachments, progress=None):
+    # type: (KeeperParams, Union[PasswordRecord, TypedRecord], List[UploadTask], Optional[TransferProgress]) -> None
+    workers = get_transfer_workers(params)
+    first_error = None    # type: Optional[Exception]
     if isinstance(record, PasswordRecord):
-        cryptor.is_gcm = False
         if not isinstance(record.attachments, list):
             record.attachments = []
         thumbs = [x for x in attachments if x.thumbnail is not None]
@@ -187,52 +485,59 @@ def upload_attachments(params, record, attachments):
         file_uploads = rs['file_uploads']
         thumb_uploads = rs['thumbnail_uploads']
         thumb_pos = 0
+        v2_uploads = []
         for i, task in enumerate(attachments):
-            uo = file_uploads[i]
-            attachment_id = uo['file_id']
-            attachment_key = utils.generate_aes_key()
-            cryptor.key = attachment_key
-            atta = AttachmentFile()
-            task.prepare()
-            with task.open() as task_stream, cryptor.set_stream(task_stream, True) as crypto_stream:
-                files = {
-                    uo['file_parameter']: (attachment_id, crypto_stream, 'application/octet-stream')
-                }
-                response = requests.post(uo['url'], files=files, data=uo['parameters'])
-                if response.status_code == uo['success_status_code']:
-                    atta.id = attachment_id
-                    atta.name = task.name or ''
-                    atta.title = task.title or ''
-                    atta.mime_type = task.mime_type or ''
-                    atta.last_modified = utils.current_milli_time()
-                    atta.key = utils.base64_url_encode(attachment_key)
-                    atta.size = task.size
-                    record.attachments.append(atta)
-                else:
-                    raise Exception(f'Uploading file {task.name}: HTTP status code {response.status_code}')
+            tuo = None
             if isinstance(task.thumbnail, bytes) and thumb_pos < len(thumbs) and thumb_pos < len(thumb_uploads):
-                thumb_task = thumbs[thumb_pos]
                 tuo = thumb_uploads[thumb_pos]
                 thumb_pos += 1
+            v2_uploads.append((task, file_uploads[i], tuo))
+
+        def upload_v2(item):
+            v2_task, uo, thumb_uo = item    # type: UploadTask, dict, Optional[dict]
+            attachment_id = uo['file_id']
+            attachment_key = utils.generate_aes_key()
+            v2_task.prepare()
+            content = encrypt_content(v2_task.open, attachment_key, False, v2_task.size)
+            try:
+                upload_content(params, uo['url'], uo['parameters'], uo['file_parameter'], attachment_id, content,
+                               uo['success_status_code'], progress)
+            except Exception as e:
+                raise Exception(f'Uploading file {v2_task.name}: {e}')
+            atta = AttachmentFile()
+            atta.id = attachment_id
+            atta.name = v2_task.name or ''
+            atta.title = v2_task.title or ''
+            atta.mime_type = v2_task.mime_type or ''
+            atta.last_modified = utils.current_milli_time()
+            atta.key = utils.base64_url_encode(attachment_key)
+            atta.size = v2_task.size
+            if thumb_uo:
                 atta.thumbnails = []
-                with io.BytesIO(task.thumbnail) as thumb_stream, \
-                        cryptor.set_stream(thumb_stream, True) as crypto_stream:
-                    files = {
-                        tuo['file_parameter']: (tuo['file_id'], crypto_stream, 'application/octet-stream')
-                    }
-                    response = requests.post(tuo['url'], files=files, data=tuo['parameters'])
-                    if response.status_code == uo['success_status_code']:
-                        thumb = AttachmentFileThumb()
-                        thumb.id = tuo['file_id']
-                        thumb.type = thumb_task.mime_type
-                        thumb.size = len(task.thumbnail)
-                        atta.thumbnails.append(thumb)
-                    else:
-                        logging.warning(
-                            'Uploading thumbnail %s: HTTP status code %d', task.name, response.status_code)
+                try:
+                    content = encrypt_content(lambda: io.BytesIO(v2_task.thumbnail), attachment_key, False,
+                                              len(v2_task.thumbnail))
+                    upload_content(params, thumb_uo['url'], thumb_uo['parameters'], thumb_uo['file_parameter'],
+                                   thumb_uo['file_id'], content,
+                                   thumb_uo.get('success_status_code', uo['success_status_code']))
+                    thumb = AttachmentFileThumb()
+                    thumb.id = thumb_uo['file_id']
+                    thumb.type = v2_task.mime_type
+                    thumb.size = len(v2_task.thumbnail)
+                    atta.thumbnails.append(thumb)
+                except Exception as e:
+                    logging.warning('Uploading thumbnail %s: %s', v2_task.name, e)
+            return atta
+
+        for _, atta, error in iter_transfers(v2_uploads, upload_v2, workers):
+            if error:
+                first_error = first_error or error
+            else:
+                record.attachments.append(atta)
+                if progress:
+                    progress.file_done()
 
     elif isinstance(record, TypedRecord):
-        cryptor.is_gcm = True
         rq = record_pb2.FilesAddRequest()
         rq.client_time = utils.current_milli_time()
         file_keys = {}   # type: Dict[bytes, bytes]
@@ -263,36 +568,40 @@ def upload_attachments(params, record, attachments):
         facade.record = record
 
         rs = api.communicate_rest(params, rq, 'vault/files_add', rs_type=record_pb2.FilesAddResponse)
-        for uo in rs.files:
-            file_uid = uo.record_uid
-            task = file_tasks[file_uid]
+
+        def upload_v3(uo):    # type: (record_pb2.FileAddStatus) -> str
+            v3_task = file_tasks[uo.record_uid]
             if uo.status != record_pb2.FA_SUCCESS:
-                raise Exception(f'Uploading file {task.name}: Get upload URL error.')
-
-            file_key = file_keys[file_uid]
-            cryptor.key = file_key
-            with task.open() as task_stream, cryptor.set_stream(task_stream, True) as crypto_stream:
-                file_ref = utils.base64_url_encode(file_uid)
-                files = {
-                    'file': (file_ref, crypto_stream, 'application/octet-stream')
-                }
-                response = requests.post(uo.url, files=files, data=json.loads(uo.parameters))
-                if response.status_code == uo.success_status_code:
-                    facade.file_ref.append(file_ref)
-                    if record.linked_keys is None:
-                        record.linked_keys = {}
-                    record.linked_keys[file_ref] = file_key
-                else:
-                    raise Exception(f'Uploading file {task.name}: HTTP status code {response.status_code}')
-            if isinstance(task.thumbnail, bytes):
+                raise Exception(f'Uploading file {v3_task.name}: Get upload URL error.')
+            v3_key = file_keys[uo.record_uid]
+            v3_ref = utils.base64_url_encode(uo.record_uid)
+            content = encrypt_content(v3_task.open, v3_key, True, v3_task.size)
+            try:
+                upload_content(params, uo.url, json.loads(uo.parameters), 'file', v3_ref, content,
+                               uo.success_status_code, progress)
+            except Exception as e:
+                raise Exception(f'Uploading file {v3_task.name}: {e}')
+            if isinstance(v3_task.thumbnail, bytes):
                 try:
-                    with io.BytesIO(task.thumbnail) as thumb_stream, \
-                            cryptor.set_stream(thumb_stream, True) as crypto_stream:
-                        files = {
-                            'thumb': crypto_stream
-                        }
-                        requests.post(uo.url, files=files, data=json.loads(uo.thumbnail_parameters))
+                    content = encrypt_content(lambda: io.BytesIO(v3_task.thumbnail), v3_key, True,
+                                              len(v3_task.thumbnail))
+                    upload_content(params, uo.url, json.loads(uo.thumbnail_parameters), 'thumb', 'thumb', content, None)
                 except Exception as e:
                     logging.warning('Error uploading thumbnail: %s', e)
+            return v3_ref
+
+        for file_status, file_ref, error in iter_transfers(rs.files, upload_v3, workers):
+            if error:
+                first_error = first_error or error
+                continue
+            facade.file_ref.append(file_ref)
+            if record.linked_keys is None:
+                record.linked_keys = {}
+            record.linked_keys[file_ref] = file_keys[file_status.record_uid]
+            if progress:
+                progress.file_done()
     else:
         raise Exception(f'Unsupported record type: {type(record)}')
+
+    if first_error:
+        raise first_error
@@ -18,9 +18,7 @@ from prompt_toolkit.completion import Completion, Completer
 
 from . import vault
 from .params import KeeperParams
-from .commands.folder import mv_parser
 from .commands.base import GroupCommand, Command
-from .commands.connect import ConnectCommand
 from .commands import commands, enterprise_commands, msp_commands
 from .subfolder import try_resolve_path as sf_try_resolve_path
 
@@ -207,6 +205,7 @@ class CommandCompleter(Completer):
                     elif cmd in {'mv', 'ln'}:
                         args = CommandCompleter.fix_input(raw_input)
                         if args is not None:
+                            from .commands.folder import mv_parser
                             opts, _ = mv_parser.parse_known_args(shlex.split(args))
                             if opts.dst is None:
                                 word = document.get_word_under_cursor()
@@ -289,6 +288,7 @@ class CommandCompleter(Completer):
                             if c.startswith(cmd):
                                 yield Completion(c, display=c, start_position=-len(cmd))
                     elif context == 'connect':
+                        from .commands.connect import ConnectCommand
                         ConnectCommand.find_endpoints(self.params)
                         cmd = extra['prefix']
                         comp = cmd.casefold()
@@ -210,7 +210,7 @@ class BreachWatch(object):
             api.sync_down(params)
             owned = [uid for uid, own in params.record_owner_cache.items()
                               if own.owner is True and uid in params.record_cache]
-            owned_recs = [x for x in (vault.KeeperRecord.load(params, ruid) for ruid in owned)
+            owned_recs = [x for x in (vault.KeeperRecord.load_cached(params, ruid) for ruid in owned)
                           if x and x.version in (2, 3)]
             total_reused = get_reused_pw_count(owned_recs)
             save_rq = APIRequest_pb2.ReusedPasswordsRequest()
@@ -287,7 +287,7 @@ class BreachWatch(object):
         if bw_record:
             data_obj = bw_record.get('data_unencrypted')
             if data_obj and 'passwords' in data_obj:
-                record = vault.KeeperRecord.load(params, record_uid)
+                record = vault.KeeperRecord.load_cached(params, record_uid)
                 if record:
                     record_password = BreachWatch.extract_password(record)
                     if record_password:
@@ -298,11 +298,12 @@ class BreachWatch(object):
                     callback,          # type: Callable[[vault.KeeperRecord, Optional[dict]], bool]
                     owned=False        # type: bool
                     ):                 # type: (...) -> Iterator[Tuple[vault.KeeperRecord, Optional[dict]]]
+        """Yields shared records from KeeperRecord.load_cached. Use KeeperRecord.load to modify a record."""
         if not params.record_cache:
             return
 
-        for record_uid in params.record_cache:
-            record = vault.KeeperRecord.load(params, record_uid)
+        for record_uid in list(params.record_cache):
+            record = vault.KeeperRecord.load_cached(params, record_uid)
             if not record:
                 continue
             if owned:
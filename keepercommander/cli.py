@@ -32,8 +32,6 @@ from .commands import (
     aliases, commands, command_info, enterprise_commands, msp_commands
 )
 from .commands.base import dump_report_data, CliCommand, GroupCommand
-from .commands.utils import LoginCommand
-from .commands import msp
 from .constants import OS_WHICH_CMD, KEEPER_PUBLIC_HOSTS
 from .error import CommandError, Error
 from .params import KeeperParams
@@ -95,10 +93,12 @@ def display_command_help(show_enterprise=False, show_shell=False):
 
 
 def is_executing_as_msp_admin():
+    from .commands import msp
     return msp.msp_params is not None
 
 
 def check_if_running_as_mc(params, args):
+    from .commands import msp
     if msp.current_mc_id is not None:
         if msp.current_mc_id in msp.mc_params_dict:
             params = msp.mc_params_dict[msp.current_mc_id]
@@ -244,6 +244,7 @@ def do_command(params, command_line):
                 if command.is_authorised():
                     if not params.session_token:
                         try:
+                            from .commands.utils import LoginCommand
                             LoginCommand().execute(params, email=params.user, password=params.password, new_login=False)
                         except KeyboardInterrupt:
                             logging.info('Canceled')
@@ -399,6 +400,7 @@ def loop(params):  # type: (KeeperParams) -> int
     if not params.batch_mode:
         if params.user:
             try:
+                from .commands.utils import LoginCommand
                 LoginCommand().execute(params, email=params.user, password=params.password, new_login=False)
             except KeyboardInterrupt:
                 print('')
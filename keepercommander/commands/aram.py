@@ -21,18 +21,21 @@ import json
 import logging
 import os
 import platform
+import queue
 import re
 import socket
 import ssl
 import sys
+import threading
 import time
 from functools import partial
-from typing import Optional, List, Union, Dict, Set, Any, Tuple
+from typing import Optional, List, Union, Dict, Set, Any, Tuple, Iterator, Callable
 from urllib.parse import urlparse
 
 import requests
 
-from .base import user_choice, suppress_exit, raise_parse_exception, dump_report_data, Command, field_to_title, report_output_parser
+from .base import user_choice, suppress_exit, raise_parse_exception, dump_report_data, Command, field_to_title, report_output_parser, \
+    get_command_context
 from .enterprise_common import EnterpriseCommand
 from .helpers import audit_report
 from .transfer_account import EnterpriseTransferUserCommand
@@ -43,7 +46,7 @@ from ..error import CommandError
 from ..params import KeeperParams
 from ..proto import enterprise_pb2
 from ..sox import sox_data, get_prelim_data, is_compliance_reporting_enabled, get_sox_database_name, \
-    get_compliance_data, get_node_id
+    get_compliance_data, get_node_id, run_pipelined
 from ..sox.sox_data import RebuildTask
 from ..sox.sox_types import SharedFolder
 from ..sox.storage_types import StorageRecordAging
@@ -91,6 +94,9 @@ audit_report_parser.add_argument('--max-record-details', dest='max_record_detail
 audit_report_parser.add_argument('--minimal', action='store_true', help=argparse.SUPPRESS)
 search_help = 'limit results to rows that contain the specified string'
 audit_report_parser.add_argument('pattern', nargs='?', type=str, help=search_help)
+backfill_help = 'raw reports only: fetch all events in time shards with BACKFILL concurrent requests'
+audit_report_parser.add_argument('--backfill', dest='backfill', type=int, action='store', metavar='BACKFILL',
+                                 help=backfill_help)
 
 audit_report_parser.error = raise_parse_exception
 audit_report_parser.exit = suppress_exit
@@ -110,6 +116,10 @@ node_id_help = 'Filter: Node ID(s). Overrides existing setting in config record
 audit_log_parser.add_argument('--node-id', dest='node_id', action='append', type=int, help=node_id_help)
 days_help = 'Filter: max event age in days. Overrides existing "last_event_time" value in config record'
 audit_log_parser.add_argument('--days', dest='days', type=int, action='store', help=days_help)
+backfill_help = ('fetch events in time shards with BACKFILL concurrent requests. '
+                 'Progress is saved to the config record after every shard')
+audit_log_parser.add_argument('--backfill', dest='backfill', type=int, action='store', metavar='BACKFILL',
+                              help=backfill_help)
 audit_log_parser.error = raise_parse_exception
 audit_log_parser.exit = suppress_exit
 
@@ -164,6 +174,88 @@ syslog_templates = None  # type: Optional[List[str]]
 
 API_EVENT_SUMMARY_ROW_LIMIT = 2000
 API_EVENT_RAW_ROW_LIMIT = 1000
+# pages of raw events and converted chunks buffered between audit-log export stages
+AUDIT_LOG_QUEUE_SIZE = 4
+# target number of raw events in a backfill time shard
+AUDIT_SHARD_EVENTS = 10000
+# exported backfill time shards between audit-log resume checkpoints
+AUDIT_CHECKPOINT_SHARDS = 10
+SPAN_AGGREGATES = ['occurrences', 'first_created', 'last_created']
+
+
+def split_event_period(occurrences, first_created, last_created, shard_events=AUDIT_SHARD_EVENTS):
+    # type: (int, int, int, int) -> List[Tuple[int, int]]
+    """Splits [first_created, last_created] into time shards of about "shard_events" events. Bounds are inclusive"""
+    if occurrences <= 0 or last_created < first_created:
+        return []
+    period = last_created - first_created + 1
+    shard_count = min(period, max(1, (occurrences + shard_events - 1) // shard_events))
+    step = (period + shard_count - 1) // shard_count
+    return [(x, min(x + step - 1, last_created)) for x in range(first_created, last_created + 1, step)]
+
+
+def get_event_period_shards(params, rq):    # type: (KeeperParams, dict) -> List[Tuple[int, int]]
+    """Sizes time shards of a raw events request from the span report"""
+    span_rq = {**rq, 'report_type': 'span', 'aggregate': SPAN_AGGREGATES}
+    span_rq.pop('order', None)
+    rs = api.communicate(params, span_rq)
+    rows = rs.get('audit_event_overview_report_rows')
+    if not rows:
+        return []
+    row = rows[0]
+    return split_event_period(int(row.get('occurrences') or 0), int(row.get('first_created') or 0),
+                              int(row.get('last_created') or 0))
+
+
+def page_audit_events(params, rq, min_time, max_time):
+    # type: (KeeperParams, dict, int, int) -> Iterator[Tuple[List[dict], int]]
+    """Pages raw events created in [min_time, max_time] in ascending order.
+
+    Yields events not seen before and the time the next page starts from.
+    """
+    created_filter = {'max': max_time}
+    rq = {**rq, 'report_type': 'raw', 'order': 'ascending', 'limit': API_EVENT_RAW_ROW_LIMIT,
+          'filter': {**(rq.get('filter') or {}), 'created': created_filter}}
+    event_time = min_time
+    # Requests are inclusive of the last event time, so only events created at that time can repeat
+    boundary_ids = set()
+    while True:
+        if event_time > 0:
+            created_filter['min'] = event_time
+        rs = api.communicate(params, rq)
+        if rs['result'] != 'success' or 'audit_event_overview_report_rows' not in rs:
+            return
+        audit_events = rs['audit_event_overview_report_rows']
+        new_events = [e for e in audit_events if e['id'] not in boundary_ids]
+        page_time = int(audit_events[-1]['created']) if audit_events else max_time
+        if page_time != event_time:
+            boundary_ids.clear()
+        boundary_ids.update((e['id'] for e in audit_events if int(e['created']) == page_time))
+        event_time = page_time
+        finished = max_time <= event_time
+
+        # Narrow event-age filter if the last filter/request gave no new events AND we have more to fetch
+        if not new_events and not finished:
+            event_time += 1
+        yield new_events, event_time
+        if finished:
+            return
+
+
+def fetch_event_shards(params, rq, shards, max_in_flight, on_shard, should_stop=None):
+    # type: (KeeperParams, dict, List[Tuple[int, int]], int, Callable[[Tuple[int, int], List[dict]], None], Optional[Callable[[], bool]]) -> None
+    """Fetches time shards concurrently. Calls "on_shard" with the shard events in shard order"""
+    shard_iter = iter(shards)
+
+    def next_shard():
+        if should_stop and should_stop():
+            return None
+        return next(shard_iter, None)
+
+    def fetch_shard(shard):
+        return [e for events, _ in page_audit_events(params, rq, shard[0], shard[1]) for e in events]
+
+    run_pipelined(next_shard, fetch_shard, on_shard, max_in_flight)
 
 
 def load_syslog_templates(params):
@@ -757,6 +849,143 @@ class AuditLogCommand(EnterpriseCommand):
             uid = cache.get(uname)
         return uid
 
+    def anonymize_event(self, ent_user_ids, event):    # type: (dict, dict) -> None
+        uname = event.get('email') or event.get('username') or ''
+        ent_uid = self.resolve_uid(ent_user_ids, uname)
+        event['username'] = ent_uid
+        event['email'] = ent_uid
+        to_uname = event.get('to_username') or ''
+        if to_uname:
+            event['to_username'] = self.resolve_uid(ent_user_ids, to_uname)
+        from_uname = event.get('from_username') or ''
+        if from_uname:
+            event['from_username'] = self.resolve_uid(ent_user_ids, from_uname)
+
+    def export_audit_events(self, params, log_export, props, rq, last_event_time, now_ts, total_events,
+                            ent_user_ids=None, shards=None, max_in_flight=1, on_checkpoint=None):
+        # type: (KeeperParams, AuditLogBaseExport, dict, dict, int, int, int, Optional[dict], Optional[List[Tuple[int, int]]], int, Optional[Callable[[int], None]]) -> Tuple[int, int]
+        """Streams raw audit events to the export target.
+
+        A fetcher thread pages through the events and a converter thread converts them while the calling thread
+        sends converted chunks to the target. The stages are joined by bounded queues.
+        If "shards" are given, time shards are fetched concurrently and exported in order, and
+        "on_checkpoint" is called with the resume time after every AUDIT_CHECKPOINT_SHARDS exported shards.
+        Returns the number of exported events and the time to resume the export from.
+        """
+        chunk_length = log_export.chunk_size()
+        stop = threading.Event()
+        context = get_command_context()
+        raw_pages = queue.Queue(maxsize=AUDIT_LOG_QUEUE_SIZE)
+        chunks = queue.Queue(maxsize=AUDIT_LOG_QUEUE_SIZE)
+
+        def should_stop():    # type: () -> bool
+            return stop.is_set() or (context is not None and context.is_cancelled)
+
+        def put(q, item):    # type: (queue.Queue, tuple) -> bool
+            while not should_stop():
+                try:
+                    q.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(q):    # type: (queue.Queue) -> Optional[tuple]
+            while not should_stop():
+                try:
+                    return q.get(timeout=0.5)
+                except queue.Empty:
+                    pass
+            return None
+
+        def on_shard(shard, events):    # type: (Tuple[int, int], List[dict]) -> None
+            for pos in range(0, len(events), API_EVENT_RAW_ROW_LIMIT):
+                if not put(raw_pages, ('events', events[pos:pos + API_EVENT_RAW_ROW_LIMIT])):
+                    return
+            put(raw_pages, ('shard', shard[1] + 1))
+
+        def fetch_events():
+            event_time = last_event_time
+            try:
+                if shards:
+                    fetch_event_shards(params, rq, shards, max_in_flight, on_shard, should_stop)
+                    event_time = now_ts
+                else:
+                    for new_events, event_time in page_audit_events(params, rq, last_event_time, now_ts):
+                        if new_events and not put(raw_pages, ('events', new_events)):
+                            return
+                put(raw_pages, ('done', event_time))
+            except Exception as e:
+                put(raw_pages, ('error', e))
+
+        def convert_events():
+            buffer = []     # type: List[Tuple[Any, int]]
+            try:
+                while True:
+                    item = get(raw_pages)
+                    if item is None:
+                        return
+                    kind, value = item
+                    if kind == 'events':
+                        for event in value:
+                            if ent_user_ids is not None:
+                                self.anonymize_event(ent_user_ids, event)
+                            buffer.append((log_export.convert_event(props, event), int(event['created'])))
+                    last = kind != 'events'
+                    while len(buffer) >= chunk_length or (last and buffer):
+                        chunk = buffer[:chunk_length]
+                        buffer = buffer[chunk_length:]
+                        if not put(chunks, ('events', ([x[0] for x in chunk], chunk[-1][1]))):
+                            return
+                    if last:
+                        put(chunks, item)
+                        if kind != 'shard':
+                            return
+            except Exception as e:
+                put(chunks, ('error', e))
+
+        workers = [threading.Thread(target=fetch_events, daemon=True),
+                   threading.Thread(target=convert_events, daemon=True)]
+        for worker in workers:
+            worker.start()
+
+        num_exported = 0
+        exported_shards = 0
+        started = time.time()
+        try:
+            while True:
+                item = get(chunks)
+                if item is None:
+                    break
+                kind, value = item
+                if kind == 'error':
+                    raise value
+                if kind == 'done':
+                    last_event_time = value
+                    break
+                if kind == 'shard':
+                    last_event_time = value
+                    exported_shards += 1
+                    if on_checkpoint and num_exported > 0 and exported_shards % AUDIT_CHECKPOINT_SHARDS == 0:
+                        on_checkpoint(last_event_time)
+                    continue
+                to_store, chunk_time = value
+                log_export.export_events(props, to_store)
+                if log_export.should_cancel:
+                    break
+                num_exported += len(to_store)
+                last_event_time = chunk_time
+                percent_done = num_exported / total_events * 100 if total_events else 100
+                rate = num_exported / max(time.time() - started, 0.001)
+                progress = f'Exporting events.... {percent_done:.1f}% DONE, {rate:.0f} events/sec'
+                if context:
+                    context.report_progress(progress)
+                print(progress, file=sys.stderr, end='\r', flush=True)
+        finally:
+            stop.set()
+
+        return num_exported, last_event_time
+
     def execute(self, params, **kwargs):
         load_syslog_templates(params)
 
@@ -851,12 +1080,6 @@ class AuditLogCommand(EnterpriseCommand):
                 except:
                     pass
 
-        events = []
-        finished = False
-        num_exported = 0
-        logged_ids = set()
-        chunk_length = log_export.chunk_size()
-
         anonymize = bool(kwargs.get('anonymize'))
         ent_user_ids = {}
         if anonymize and params.enterprise and 'users' in params.enterprise:
@@ -884,66 +1107,41 @@ class AuditLogCommand(EnterpriseCommand):
         created_filter_copy = {**created_filter, 'min': last_event_time}
         filter_copy = {**rq_filter, 'created': created_filter_copy}
         total_events_rq = {**rq, 'filter': filter_copy, 'report_type': 'span'}
+        backfill = kwargs.get('backfill') or 0
+        if backfill > 0:
+            total_events_rq['aggregate'] = SPAN_AGGREGATES
         total_events = 0
+        shards = None
         try:
             total_events_rs = api.communicate(params, total_events_rq)
             rows = total_events_rs['audit_event_overview_report_rows']
             total_events = rows[0].get('occurrences', 0) if rows else 0
+            if backfill > 0 and rows:
+                shards = split_event_period(int(total_events), int(rows[0].get('first_created') or 0),
+                                            int(rows[0].get('last_created') or 0))
+                logging.info('Backfill: %d event(s) in %d time shard(s)', total_events, len(shards))
         except:
             logging.info('No events to export')
             return
 
-        while not finished:
-            finished = True
-
-            if last_event_time > 0:
-                created_filter['min'] = last_event_time
+        def save_checkpoint(event_time):    # type: (int) -> None
+            nonlocal record
+            record_uid = record.record_uid
+            AuditLogBaseExport.set_record_custom(record, 'last_event_time', str(event_time))
+            record_management.update_record(params, record)
+            api.sync_down(params)
+            record = vault.KeeperRecord.load(params, record_uid)
 
-            rs = api.communicate(params, rq)
-            if rs['result'] == 'success':
-                finished = True
-                if 'audit_event_overview_report_rows' in rs:
-                    audit_events = rs['audit_event_overview_report_rows']
-                    event_count = len(audit_events)
-                    last_event_time = int(audit_events[-1]['created']) if event_count else now_ts
-
-                    # Ensure that no event is exported more than once with this command call
-                    new_events = [e for e in audit_events if e['id'] not in logged_ids]
-                    for event in new_events:
-                        logged_ids.add(event['id'])
-                        if anonymize:
-                            uname = event.get('email') or event.get('username') or ''
-                            ent_uid = self.resolve_uid(ent_user_ids, uname)
-                            event['username'] = ent_uid
-                            event['email'] = ent_uid
-                            to_uname = event.get('to_username') or ''
-                            if to_uname:
-                                event['to_username'] = self.resolve_uid(ent_user_ids, to_uname)
-                            from_uname = event.get('from_username') or ''
-                            if from_uname:
-                                event['from_username'] = self.resolve_uid(ent_user_ids, from_uname)
-                        events.append(log_export.convert_event(props, event))
-                    finished = created_filter['max'] <= last_event_time
-
-                    # Narrow event-age filter if the last filter/request gave no new events AND we have more to fetch
-                    if not new_events and not finished:
-                        last_event_time += 1
-
-            while len(events) > 0:
-                to_store = events[:chunk_length]
-                events = events[chunk_length:]
-                log_export.export_events(props, to_store)
-                if log_export.should_cancel:
-                    finished = True
-                    break
-                num_exported += len(to_store)
-                percent_done = num_exported / total_events * 100
-                percent_done = '%.1f' % percent_done
-                print(f'Exporting events.... {percent_done}% DONE', file=sys.stderr, end='\r', flush=True)
+        started = time.time()
+        num_exported, last_event_time = self.export_audit_events(
+            params, log_export, props, rq, last_event_time, now_ts, total_events, ent_user_ids if anonymize else None,
+            shards=shards, max_in_flight=backfill, on_checkpoint=save_checkpoint if shards else None)
+        elapsed = max(time.time() - started, 0.001)
 
         if last_event_time > 0:
             logging.info('')
-            logging.info('Exported %d audit event(s)', num_exported)
+            logging.info('Exported %d audit event(s) in %.1f seconds (%.0f events/sec)',
+                         num_exported, elapsed, num_exported / elapsed)
             if num_exported > 0:
                 log_export.finalize_export(props)
                 AuditLogBaseExport.set_record_custom(record, 'last_event_time', str(last_event_time))
@@ -1527,7 +1725,31 @@ class AuditReportCommand(Command):
         # Send only requests that apply event-type filters in the case where the user specifies at least one such filter
         reqs = [req for req in reqs if req.get('filter', {}).get('audit_event_type')] if audit_filter.get('audit_event_type') \
             else reqs
-        rss = api.execute_batch(params, reqs)
+        backfill = kwargs.get('backfill') or 0
+        if report_type == 'raw' and backfill > 0:
+            rss = []
+            descending = rq.get('order') != 'ascending'
+            for backfill_rq in reqs:
+                events = []
+                shards = get_event_period_shards(params, backfill_rq)
+                if descending:
+                    shards.reverse()
+
+                def on_shard(_, shard_events, rows=events):
+                    if descending:
+                        shard_events.reverse()
+                    rows.extend(shard_events)
+
+                # shards are collected in report order: no more shards are requested once the limit is reached
+                def limit_reached(rows=events):
+                    return bool(user_limit and user_limit > 0 and len(rows) >= user_limit)
+
+                fetch_event_shards(params, backfill_rq, shards, backfill, on_shard, limit_reached)
+                if user_limit and user_limit > 0:
+                    del events[user_limit:]
+                rss.append({'audit_event_overview_report_rows': events})
+        else:
+            rss = api.execute_batch(params, reqs, pipelined=True)
         fields = []
         table = []
 
@@ -1561,7 +1783,7 @@ class AuditReportCommand(Command):
                             value = self.get_value(params, field, event)
                             row.append(self.convert_value(field, value, details=details, params=params))
                         table.append(row)
-                    if len(events) >= API_EVENT_RAW_ROW_LIMIT:
+                    if len(events) >= API_EVENT_RAW_ROW_LIMIT and not backfill:
                         asc = rq.get('order') == 'ascending'
                         first_key, last_key = ('min', 'max') if asc else ('max', 'min')
                         rq_filter = rq.get('filter', {})
@@ -1588,7 +1810,7 @@ class AuditReportCommand(Command):
                                     break
                         reqs.append(rq)
                 if reqs:
-                    rss = api.execute_batch(params, reqs)
+                    rss = api.execute_batch(params, reqs, pipelined=True)
             table = filter_rows(table, pattern)
             return dump_report_data(table, fields, fmt=kwargs.get('format'), filename=kwargs.get('output'))
         else:
@@ -1888,10 +2110,14 @@ class AgingReportCommand(Command):
         sox.storage.set_last_pw_audit()
         sox.storage.set_records_dated()
         aging_entities = dict()  # type: Dict[str, StorageRecordAging]
+        event_uids = set()
+        for event_ts_lookup in event_lookups.values():
+            event_uids.update(event_ts_lookup.keys())
+        stored_entities = {x.record_uid: x for x in sox.storage.record_aging.find_entities(event_uids)}
         for e_type in event_lookups:
             event_ts_lookup = event_lookups.get(e_type)
             for uid, event_ts in event_ts_lookup.items():
-                entity = aging_entities.get(uid) or sox.storage.record_aging.get_entity(uid) or StorageRecordAging(uid)
+                entity = aging_entities.get(uid) or stored_entities.get(uid) or StorageRecordAging(uid)
                 if getattr(entity, e_type, 0) < event_ts:
                     setattr(entity, e_type, event_ts)
                     aging_entities[uid] = entity
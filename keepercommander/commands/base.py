@@ -12,6 +12,7 @@
 import abc
 import argparse
 import collections
+import contextlib
 import csv
 import datetime
 import io
@@ -21,20 +22,19 @@ import logging
 import os
 import re
 import shlex
+import threading
 from collections import OrderedDict
-from typing import Optional, Sequence, Callable, List, Any, Iterable, Dict, Set
+from typing import Optional, Sequence, Callable, List, Any, Iterable, Iterator, Dict, Set
 
 import sys
 from tabulate import tabulate
 
 from .. import api, crypto, utils, vault, resources
+from ..error import CommandError
 from ..params import KeeperParams
 from ..subfolder import try_resolve_path, BaseFolderNode
 
 aliases = {}                 # type: Dict[str, str]
-commands = {}                # type: Dict[str, Command]
-enterprise_commands = {}     # type: Dict[str, Command]
-msp_commands = {}            # type: Dict[str, Command]
 command_info = OrderedDict()
 
 
@@ -49,128 +49,356 @@ class ParseError(Exception):
     pass
 
 
-def register_commands(commands, aliases, command_info):
+def _load_record_commands(commands, aliases, command_info):
     from .record import register_commands as record_commands, register_command_info as record_command_info
     record_commands(commands)
     record_command_info(aliases, command_info)
 
+
+def _load_recordv3_commands(commands, aliases, command_info):
     from .recordv3 import register_commands as recordv3_commands, register_command_info as recordv3_command_info
     recordv3_commands(commands)
     recordv3_command_info(aliases, command_info)
 
+
+def _load_folder_commands(commands, aliases, command_info):
     from .folder import register_commands as folder_commands, register_command_info as folder_command_info
     folder_commands(commands)
     folder_command_info(aliases, command_info)
 
+
+def _load_register_commands(commands, aliases, command_info):
     from .register import register_commands as register_commands, register_command_info as register_command_info
     register_commands(commands)
     register_command_info(aliases, command_info)
 
+
+def _load_connect_commands(commands, aliases, command_info):
     from . import connect
     connect.connect_commands(commands)
     connect.connect_command_info(aliases, command_info)
 
+
+def _load_breachwatch_commands(commands, aliases, command_info):
     from . import breachwatch
     breachwatch.register_commands(commands)
     breachwatch.register_command_info(aliases, command_info)
 
+
+def _load_convert_commands(commands, aliases, command_info):
     from . import convert
     convert.register_commands(commands)
     convert.register_command_info(aliases, command_info)
 
+
+def _load_scripting_commands(commands, aliases, command_info):
     from . import scripting
     scripting.register_commands(commands)
     scripting.register_command_info(aliases, command_info)
 
+
+def _load_misc_commands(commands, aliases, command_info):
     from .utils import register_commands as misc_commands, register_command_info as misc_command_info
     misc_commands(commands)
     misc_command_info(aliases, command_info)
 
+
+def _load_verify_records_commands(commands, aliases, command_info):
     from .verify_records import VerifyRecordsCommand, VerifySharedFoldersCommand
     commands['verify-records'] = VerifyRecordsCommand()
     commands['verify-shared-folders'] = VerifySharedFoldersCommand()
 
+
+def _load_importer_commands(commands, aliases, command_info):
     from .. import importer
     importer.register_commands(commands)
     importer.register_command_info(aliases, command_info)
 
+
+def _load_plugins_commands(commands, aliases, command_info):
     from .. import plugins
     plugins.register_commands(commands)
     plugins.register_command_info(aliases, command_info)
 
+
+def _load_rsync_commands(commands, aliases, command_info):
     from .. import rsync
     rsync.register_commands(commands)
     rsync.register_command_info(aliases, command_info)
 
+
+def _load_keeper_fill_commands(commands, aliases, command_info):
     from .keeper_fill import KeeperFillCommand
     commands['keeper-fill'] = KeeperFillCommand()
     command_info['keeper-fill'] = 'KeeperFill management'
 
+
+def _load_password_report_commands(commands, aliases, command_info):
     from .password_report import PasswordReportCommand
     commands['password-report'] = PasswordReportCommand()
     command_info['password-report'] = 'Display record password report'
 
+
+def _load_two_fa_commands(commands, aliases, command_info):
     from .two_fa import TwoFaCommand
     commands['2fa'] = TwoFaCommand()
     command_info['2fa'] = '2FA management'
 
+
+def _load_service_commands(commands, aliases, command_info):
     if sys.version_info.major == 3 and sys.version_info.minor >= 8:
         from .start_service import register_commands as service_commands, register_command_info as service_command_info
         service_commands(commands)
         service_command_info(aliases, command_info)
 
+
+def _load_discoveryrotation_commands(commands, aliases, command_info):
     if sys.version_info.major == 3 and sys.version_info.minor >= 8:
         from . import discoveryrotation
         discoveryrotation.register_commands(commands)
         discoveryrotation.register_command_info(aliases, command_info)
 
 
-def register_pam_legacy_commands():
-    from . import discoveryrotation_v1
-    discoveryrotation_v1.register_commands(commands)
-    discoveryrotation_v1.register_command_info(aliases, command_info)
-
-
-def register_enterprise_commands(commands, aliases, command_info):
+def _load_enterprise_commands(commands, aliases, command_info):
     from . import enterprise
     enterprise.register_commands(commands)
     enterprise.register_command_info(aliases, command_info)
+
+
+def _load_automator_commands(commands, aliases, command_info):
     from . import automator
     automator.register_commands(commands)
     automator.register_command_info(aliases, command_info)
+
+
+def _load_enterprise_create_user_commands(commands, aliases, command_info):
     from . import enterprise_create_user
     enterprise_create_user.register_commands(commands)
     enterprise_create_user.register_command_info(aliases, command_info)
+
+
+def _load_enterprise_importer_commands(commands, aliases, command_info):
     from .. import importer
     importer.register_enterprise_commands(commands)
+
+
+def _load_scim_commands(commands, aliases, command_info):
     from . import scim
     scim.register_commands(commands)
     scim.register_command_info(aliases, command_info)
+
+
+def _load_enterprise_api_keys_commands(commands, aliases, command_info):
     from . import enterprise_api_keys
     enterprise_api_keys.register_commands(commands)
     enterprise_api_keys.register_command_info(aliases, command_info)
+
+
+def _load_switch_to_msp_commands(commands, aliases, command_info):
     from .msp import switch_to_msp_parser, SwitchToMspCommand
     commands[switch_to_msp_parser.prog] = SwitchToMspCommand()
     command_info[switch_to_msp_parser.prog] = switch_to_msp_parser.description
+
+
+def _load_enterprise_reports_commands(commands, aliases, command_info):
     from . import enterprise_reports
     enterprise_reports.register_commands(commands)
     enterprise_reports.register_command_info(aliases, command_info)
+
+
+def _load_risk_management_commands(commands, aliases, command_info):
     from .risk_management import RiskManagementReportCommand
     commands['risk-management'] = RiskManagementReportCommand()
     command_info['risk-management'] = 'Risk Management Reports'
     aliases['rmd'] = 'risk-management'
 
 
-def register_msp_commands(commands, aliases, command_info):
+def _load_msp_commands(commands, aliases, command_info):
     from .msp import register_commands as msp_commands, register_command_info as msp_command_info
     msp_commands(commands)
     msp_command_info(aliases, command_info)
+
+
+def _load_distributor_commands(commands, aliases, command_info):
     from . import distributor
     commands['distributor'] = distributor.DistributorCommand()
     command_info['distributor'] = 'Manage distributors'
     aliases['ds'] = 'distributor'
 
 
+# Command modules in registration order. The names, aliases and descriptions these loaders register are kept
+# in command_manifest.py so the CLI can start without importing the modules.
+COMMAND_GROUPS = OrderedDict((
+    ('vault', OrderedDict((
+        ('record', _load_record_commands),
+        ('recordv3', _load_recordv3_commands),
+        ('folder', _load_folder_commands),
+        ('register', _load_register_commands),
+        ('connect', _load_connect_commands),
+        ('breachwatch', _load_breachwatch_commands),
+        ('convert', _load_convert_commands),
+        ('scripting', _load_scripting_commands),
+        ('utils', _load_misc_commands),
+        ('verify_records', _load_verify_records_commands),
+        ('importer', _load_importer_commands),
+        ('plugins', _load_plugins_commands),
+        ('rsync', _load_rsync_commands),
+        ('keeper_fill', _load_keeper_fill_commands),
+        ('password_report', _load_password_report_commands),
+        ('two_fa', _load_two_fa_commands),
+        ('start_service', _load_service_commands),
+        ('discoveryrotation', _load_discoveryrotation_commands),
+    ))),
+    ('enterprise', OrderedDict((
+        ('enterprise', _load_enterprise_commands),
+        ('automator', _load_automator_commands),
+        ('enterprise_create_user', _load_enterprise_create_user_commands),
+        ('importer', _load_enterprise_importer_commands),
+        ('scim', _load_scim_commands),
+        ('enterprise_api_keys', _load_enterprise_api_keys_commands),
+        ('switch_to_msp', _load_switch_to_msp_commands),
+        ('enterprise_reports', _load_enterprise_reports_commands),
+        ('risk_management', _load_risk_management_commands),
+    ))),
+    ('msp', OrderedDict((
+        ('msp', _load_msp_commands),
+        ('distributor', _load_distributor_commands),
+    ))),
+))
+
+
+PY38_COMMAND_GROUPS = {'start_service', 'discoveryrotation'}
+
+
+class _LazyCommandGroup:
+    def __init__(self, loader):    # type: (Callable[[dict, dict, dict], None]) -> None
+        self.loader = loader
+
+
+class LazyCommandDict(dict):
+    """Command registry that imports a command module when one of its commands is first looked up"""
+
+    def add_lazy(self, names, loader):    # type: (Iterable[str], Callable[[dict, dict, dict], None]) -> None
+        group = _LazyCommandGroup(loader)
+        for name in names:
+            if name not in self:
+                dict.__setitem__(self, name, group)
+
+    def _resolve(self, key, value):
+        if not isinstance(value, _LazyCommandGroup):
+            return value
+        loaded = {}
+        value.loader(loaded, {}, OrderedDict())
+        for name in [k for k, v in dict.items(self) if v is value]:
+            if name in loaded:
+                dict.__setitem__(self, name, loaded.pop(name))
+            else:
+                dict.__delitem__(self, name)
+        for name, command in loaded.items():
+            dict.setdefault(self, name, command)
+        return dict.__getitem__(self, key)
+
+    def __getitem__(self, key):
+        return self._resolve(key, dict.__getitem__(self, key))
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def values(self):
+        return [self[x] for x in list(self.keys())]
+
+    def items(self):
+        return [(x, self[x]) for x in list(self.keys())]
+
+    def load_all(self):
+        for name in list(self.keys()):
+            self.get(name)
+
+
+commands = LazyCommandDict()               # type: Dict[str, Command]
+enterprise_commands = LazyCommandDict()    # type: Dict[str, Command]
+msp_commands = LazyCommandDict()           # type: Dict[str, Command]
+
+
+def _register_group_commands(scope, commands, aliases, command_info):
+    groups = COMMAND_GROUPS[scope]
+    if isinstance(commands, LazyCommandDict):
+        from . import command_manifest
+        for group_name, names in command_manifest.COMMANDS[scope]:
+            if group_name in PY38_COMMAND_GROUPS and sys.version_info < (3, 8):
+                continue
+            commands.add_lazy(names, groups[group_name])
+        command_info.update(command_manifest.COMMAND_INFO[scope])
+        aliases.update(command_manifest.ALIASES[scope])
+    else:
+        for loader in groups.values():
+            loader(commands, aliases, command_info)
+
+
+def register_commands(commands, aliases, command_info):
+    _register_group_commands('vault', commands, aliases, command_info)
+
+
+def register_pam_legacy_commands():
+    from . import discoveryrotation_v1
+    discoveryrotation_v1.register_commands(commands)
+    discoveryrotation_v1.register_command_info(aliases, command_info)
+
+
+def register_enterprise_commands(commands, aliases, command_info):
+    _register_group_commands('enterprise', commands, aliases, command_info)
+
+
+def register_msp_commands(commands, aliases, command_info):
+    _register_group_commands('msp', commands, aliases, command_info)
+
+
+def build_command_manifest():    # type: () -> str
+    """Registers all commands eagerly and returns the source of command_manifest.py"""
+    manifest_commands = OrderedDict()
+    manifest_info = OrderedDict()
+    manifest_aliases = OrderedDict()
+    for scope, groups in COMMAND_GROUPS.items():
+        scope_commands = []
+        scope_info = OrderedDict()
+        scope_aliases = OrderedDict()
+        for group_name, loader in groups.items():
+            group_commands = {}
+            loader(group_commands, scope_aliases, scope_info)
+            scope_commands.append((group_name, list(group_commands.keys())))
+        manifest_commands[scope] = scope_commands
+        manifest_info[scope] = list(scope_info.items())
+        manifest_aliases[scope] = list(scope_aliases.items())
+
+    lines = [
+        '#  _  __',
+        '# | |/ /___ ___ _ __  ___ _ _ ®',
+        '# | \' </ -_) -_) \'_ \\/ -_) \'_|',
+        '# |_|\\_\\___\\___| .__/\\___|_|',
+        '#              |_|',
+        '#',
+        '# Keeper Commander',
+        '# Copyright 2024 Keeper Security Inc.',
+        '# Contact: ops@keepersecurity.com',
+        '#',
+        '# Generated by keepercommander.commands.base.build_command_manifest(). Do not edit.',
+        '',
+    ]
+    for name, value in (('COMMANDS', manifest_commands), ('COMMAND_INFO', manifest_info),
+                        ('ALIASES', manifest_aliases)):
+        lines.append(f'{name} = {{')
+        for scope, entries in value.items():
+            lines.append(f'    {scope!r}: [')
+            lines.extend((f'        {x!r},' for x in entries))
+            lines.append('    ],')
+        lines.append('}')
+        lines.append('')
+    return '\n'.join(lines)
+
+
 def user_choice(question, choice, default='', show_choice=True, multi_choice=False):
     choices = [ch.lower() if ch.upper() == default.upper() else ch.lower() for ch in choice]
 
@@ -300,6 +528,83 @@ def detect_column_type(values):  # type: (Iterable[Any]) -> Optional[Callable[[A
     return None
 
 
+_report_capture = threading.local()
+
+
+@contextlib.contextmanager
+def capture_report_data():    # type: () -> Iterator[List[dict]]
+    """Collects tables that dump_report_data prints in the current thread instead of formatting them.
+
+    Every table is a dict with "title", "headers" and "rows". Reports in csv, json, pdf format
+    or to a file are not collected.
+    """
+    previous = getattr(_report_capture, 'reports', None)
+    reports = []    # type: List[dict]
+    _report_capture.reports = reports
+    try:
+        yield reports
+    finally:
+        _report_capture.reports = previous
+
+
+_command_context = threading.local()
+
+
+class CommandContext:
+    """Progress and cancellation of a command that runs in the background.
+
+    Long commands report progress with report_progress and stop when check_cancelled raises.
+    The context belongs to the thread that runs the command: worker threads of the command do not see it,
+    so get_command_context has to be called in the command thread and the context passed to the workers.
+    """
+
+    def __init__(self, on_progress=None):    # type: (Optional[Callable[[str], None]]) -> None
+        self.on_progress = on_progress
+        self._cancelled = threading.Event()
+
+    def cancel(self):    # type: () -> None
+        self._cancelled.set()
+
+    @property
+    def is_cancelled(self):    # type: () -> bool
+        return self._cancelled.is_set()
+
+    def report_progress(self, message):    # type: (str) -> None
+        if self.on_progress:
+            try:
+                self.on_progress(message)
+            except Exception as e:
+                logging.debug('Command progress error: %s', e)
+
+
+@contextlib.contextmanager
+def command_context(context):    # type: (CommandContext) -> Iterator[CommandContext]
+    """Runs commands of the current thread with the context"""
+    previous = getattr(_command_context, 'context', None)
+    _command_context.context = context
+    try:
+        yield context
+    finally:
+        _command_context.context = previous
+
+
+def get_command_context():    # type: () -> Optional[CommandContext]
+    return getattr(_command_context, 'context', None)
+
+
+def report_progress(message):    # type: (str) -> None
+    context = get_command_context()
+    if context:
+        context.report_progress(message)
+
+
+def check_cancelled(command=''):    # type: (str) -> None
+    """Raises CommandError if the command of the current thread has been cancelled"""
+    context = get_command_context()
+    if context and context.is_cancelled:
+        raise CommandError(command, 'Command cancelled')
+
+
 def dump_report_data(data, headers, title=None, fmt='', filename=None, append=False, **kwargs):
     # type: (List[List], Sequence[str], Optional[str], Optional[str], Optional[str], bool, ...) -> Optional[str]
     # kwargs:
@@ -325,6 +630,15 @@ def dump_report_data(data, headers, title=None, fmt='', filename=None, append=Fa
             reverse = kwargs.get('sort_desc') is True
             data.sort(key=lambda r: key_fn(r[sort_by] if 0 <= sort_by < len(r) else None), reverse=reverse)
 
+    reports = getattr(_report_capture, 'reports', None)
+    if reports is not None and fmt not in ('csv', 'json', 'pdf') and not filename:
+        reports.append({
+            'title': title,
+            'headers': list(headers or []),
+            'rows': data,
+        })
+        return None
+
     if fmt == 'csv':
         if filename:
             _, ext = os.path.splitext(filename)
@@ -0,0 +1,232 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+# Generated by keepercommander.commands.base.build_command_manifest(). Do not edit.
+
+COMMANDS = {
+    'vault': [
+        ('record', ['search', 'get', 'rm', 'trash', 'list', 'list-sf', 'list-team', 'record-history', 'shared-records-report', 'record-add', 'record-update', 'append-notes', 'delete-attachment', 'download-attachment', 'upload-attachment', 'clipboard-copy', 'totp', 'file-report']),
+        ('recordv3', ['add', 'edit', 'record-type-info', 'record-type']),
+        ('folder', ['ls', 'cd', 'tree', 'mkdir', 'rmdir', 'rndir', 'mv', 'ln', 'shortcut', 'arrange-folders', 'transform-folder']),
+        ('register', ['share-record', 'share-folder', 'share-report', 'record-permission', 'find-duplicate', 'one-time-share', 'create-account', 'find-ownerless']),
+        ('connect', ['ssh-agent', 'connect', 'ssh']),
+        ('breachwatch', ['breachwatch']),
+        ('convert', ['convert']),
+        ('scripting', ['run-batch', 'sleep']),
+        ('utils', ['sync-down', 'this-device', 'delete-all', 'whoami', 'proxy', 'login', 'logout', 'check-enforcements', 'accept-transfer', 'delete-corrupted', 'echo', 'set', 'help', 'secrets-manager', 'version', 'keep-alive', 'generate', 'reset-password', 'sync-security-data', 'blank-records', 'run-as']),
+        ('verify_records', ['verify-records', 'verify-shared-folders']),
+        ('importer', ['import', 'export', 'download-membership', 'apply-membership']),
+        ('plugins', ['rotate']),
+        ('rsync', ['rsync']),
+        ('keeper_fill', ['keeper-fill']),
+        ('password_report', ['password-report']),
+        ('two_fa', ['2fa']),
+        ('start_service', ['service-create', 'service-config-add', 'service-start', 'service-stop', 'service-status']),
+        ('discoveryrotation', ['pam']),
+    ],
+    'enterprise': [
+        ('enterprise', ['enterprise-down', 'enterprise-info', 'enterprise-node', 'enterprise-user', 'enterprise-role', 'enterprise-team', 'enterprise-push', 'team-approve', 'device-approve', 'transfer-user', 'audit-log', 'audit-report', 'aging-report', 'user-report', 'action-report', 'audit-alert', 'compliance', 'security-audit']),
+        ('automator', ['automator']),
+        ('enterprise_create_user', ['create-user', 'store-user-keys']),
+        ('importer', ['download-record-types', 'load-record-types']),
+        ('scim', ['scim']),
+        ('enterprise_api_keys', ['public-api-key']),
+        ('switch_to_msp', ['switch-to-msp']),
+        ('enterprise_reports', ['external-shares-report', 'license-consumption-report']),
+        ('risk_management', ['risk-management']),
+    ],
+    'msp': [
+        ('msp', ['msp-down', 'msp-info', 'msp-add', 'msp-remove', 'msp-update', 'msp-legacy-report', 'msp-billing-report', 'msp-convert-node', 'msp-copy-role', 'switch-to-mc']),
+        ('distributor', ['distributor']),
+    ],
+}
+
+COMMAND_INFO = {
+    'vault': [
+        ('get', 'Get the details of a record/folder/team by UID or title.'),
+        ('search', 'Search the vault. Can use a regular expression.'),
+        ('list', 'List records.'),
+        ('list-sf', 'List shared folders.'),
+        ('list-team', 'List teams.'),
+        ('record-history', 'Show the history of a record modifications.'),
+        ('shared-records-report', 'Report shared records for a logged-in user.'),
+        ('record-add', 'Add a record to folder.'),
+        ('record-update', 'Update a record.'),
+        ('append-notes', 'Append notes to an existing record.'),
+        ('download-attachment', 'Download record attachments.'),
+        ('delete-attachment', 'Delete an attachment from a record.'),
+        ('clipboard-copy', 'Retrieve the password for a specific record.'),
+        ('totp', 'Display the Two Factor Code for a record'),
+        ('trash', 'Manage deleted items.'),
+        ('record-type-info', 'Get record type info'),
+        ('record-type', 'Add, modify or delete record type definition'),
+        ('cd', 'Change current folder.'),
+        ('ls', 'List folder contents.'),
+        ('tree', 'Display the folder structure.'),
+        ('mkdir', 'Create a folder.'),
+        ('rmdir', 'Remove a folder and its contents.'),
+        ('rndir', 'Rename a folder.'),
+        ('mv', 'Move a record or folder to another folder.'),
+        ('ln', 'Create a link between a record and a folder.'),
+        ('transform-folder', 'Move a folder another location'),
+        ('shortcut', 'Manage record shortcuts'),
+        ('share-record', 'Change the sharing permissions of an individual record'),
+        ('share-folder', 'Change a shared folders permissions.'),
+        ('share-report', 'Display report of shared records.'),
+        ('record-permission', 'Modify a records permissions.'),
+        ('find-duplicate', 'List duplicated records.'),
+        ('share', 'Manage One-Time Shares'),
+        ('ssh-agent', 'Manage SSH Agent'),
+        ('connect', 'Establishes connection to external server.'),
+        ('ssh', 'Establishes connection to external server using SSH.'),
+        ('breachwatch', 'BreachWatch.'),
+        ('convert', 'Convert record(s) to use record types'),
+        ('run-batch', 'Run batch of Commander commands from a file'),
+        ('sleep', 'Sleep (in seconds) for adding delay between batch commands'),
+        ('sync-down', 'Download & decrypt data.'),
+        ('whoami', 'Display information about the currently logged in user.'),
+        ('this-device', 'Display and modify settings of the current device.'),
+        ('proxy', 'Sets proxy server'),
+        ('login', 'Login to Keeper.'),
+        ('logout', 'Logout from Keeper'),
+        ('echo', 'Displays an argument to output.'),
+        ('set', 'Set an environment variable.'),
+        ('help', 'Displays help on a specific command.'),
+        ('version', 'Displays version of the installed Commander.'),
+        ('secrets-manager', 'Keeper Secrets Management (KSM) Commands'),
+        ('keep-alive', 'Tell the server we are here, forestalling a timeout.'),
+        ('generate', 'Generate a new password'),
+        ('reset-password', 'Reset Master Password'),
+        ('sync-security-data', 'Sync security data.'),
+        ('import', 'Import data from a local file into Keeper.'),
+        ('export', 'Export data from Keeper to a local file.'),
+        ('download-membership', 'Unload shared folder membership to JSON file.'),
+        ('apply-membership', 'Loads shared folder membership from JSON file into Keeper.'),
+        ('download-record-types', 'Unload custom record types to JSON file.'),
+        ('rotate', 'Rotate the password for a Keeper record from this Commander.'),
+        ('rsync', 'Remote file storage sync.'),
+        ('keeper-fill', 'KeeperFill management'),
+        ('password-report', 'Display record password report'),
+        ('2fa', '2FA management'),
+        ('service-create', 'Creates and initializes the Commander API service.'),
+        ('service-config-add', 'Adds new record to the Commander API service configuration.'),
+        ('service-start', 'Starts the Commander API service with existing configuration'),
+        ('service-stop', 'Stops the Commander API service currently running'),
+        ('service-status', 'Displays if the Commander API service is running or stopped.'),
+        ('pam', 'Manage PAM Components.'),
+    ],
+    'enterprise': [
+        ('enterprise-down', 'Download & decrypt enterprise data.'),
+        ('enterprise-info', 'Display a tree structure of your enterprise.'),
+        ('enterprise-node', 'Manage an enterprise node(s).'),
+        ('enterprise-user', 'Manage an enterprise user(s).'),
+        ('enterprise-role', 'Manage an enterprise role(s).'),
+        ('enterprise-team', 'Manage an enterprise team(s).'),
+        ('transfer-user', 'Transfer user account(s).'),
+        ('enterprise-push', "Populate user's vault with default records"),
+        ('team-approve', 'Enable or disable automated team and user approval.'),
+        ('device-approve', 'Approve Cloud SSO Devices.'),
+        ('audit-log', 'Export the enterprise audit log.'),
+        ('audit-report', 'Run an audit trail report.'),
+        ('aging-report', 'Run an aging report.'),
+        ('action-report', 'Run a user action report.'),
+        ('user-report', 'Run a user report.'),
+        ('compliance', 'Compliance Reporting'),
+        ('security-audit', 'Security Audit.'),
+        ('automator', 'Manage Automator endpoints'),
+        ('create-user', 'Create Enterprise User'),
+        ('scim', 'Manage SCIM endpoints'),
+        ('public-api-key', 'Manage enterprise API keys - generate, list, and revoke API keys for integrations'),
+        ('switch-to-msp', "Switch user's context back to MSP Company."),
+        ('external-shares-report', 'Run an external shares report.'),
+        ('license-consumption-report', 'Generate a report of users consuming feature licenses based on role enforcement policies.'),
+        ('risk-management', 'Risk Management Reports'),
+    ],
+    'msp': [
+        ('msp-down', 'Download current MSP data from the Keeper Cloud.'),
+        ('msp-info', 'Displays MSP details, such as managed companies and pricing.'),
+        ('msp-add', 'Add Managed Company.'),
+        ('msp-remove', 'Remove Managed Company.'),
+        ('msp-update', 'Modify Managed Company license.'),
+        ('msp-copy-role', 'Copy role with enforcements to Managed Companies.'),
+        ('msp-legacy-report', 'Generate MSP Legacy Report.'),
+        ('msp-billing-report', 'Generate MSP Billing Reports.'),
+        ('switch-to-mc', "Switch user's context to Managed Company."),
+        ('distributor', 'Manage distributors'),
+    ],
+}
+
+ALIASES = {
+    'vault': [
+        ('g', 'get'),
+        ('s', 'search'),
+        ('l', 'list'),
+        ('lsf', 'list-sf'),
+        ('lt', 'list-team'),
+        ('rh', 'record-history'),
+        ('srr', 'shared-records-report'),
+        ('ra', 'record-add'),
+        ('ru', 'record-update'),
+        ('cc', 'clipboard-copy'),
+        ('find-password', ('clipboard-copy', '--output=stdout')),
+        ('sh', ('clipboard-copy', '--output=stdouthidden')),
+        ('an', 'append-notes'),
+        ('da', 'download-attachment'),
+        ('ua', 'upload-attachment'),
+        ('a', 'add'),
+        ('rti', 'record-type-info'),
+        ('rt', 'record-type'),
+        ('xf', 'transform-folder'),
+        ('sr', 'share-record'),
+        ('sf', 'share-folder'),
+        ('ots', 'one-time-share'),
+        ('share', 'one-time-share'),
+        ('bw', 'breachwatch'),
+        ('run', 'run-batch'),
+        ('d', 'sync-down'),
+        ('delete_all', 'delete-all'),
+        ('gen', 'generate'),
+        ('v', 'version'),
+        ('sm', 'secrets-manager'),
+        ('secrets', 'secrets-manager'),
+        ('ssd', 'sync-security-data'),
+        ('r', 'rotate'),
+    ],
+    'enterprise': [
+        ('aa', 'audit-alert'),
+        ('al', 'audit-log'),
+        ('ar', 'audit-report'),
+        ('ed', 'enterprise-down'),
+        ('ei', 'enterprise-info'),
+        ('en', 'enterprise-node'),
+        ('eu', 'enterprise-user'),
+        ('er', 'enterprise-role'),
+        ('et', 'enterprise-team'),
+        ('esr', 'external-shares-report'),
+        ('tu', 'transfer-user'),
+        ('cr', ('compliance', 'report')),
+        ('compliance-report', ('compliance', 'report')),
+        ('sar', ('security-audit', 'report')),
+        ('security-audit-report', ('security-audit', 'report')),
+        ('sas', ('security-audit', 'sync')),
+        ('lcr', 'license-consumption-report'),
+        ('rmd', 'risk-management'),
+    ],
+    'msp': [
+        ('md', 'msp-down'),
+        ('mi', 'msp-info'),
+        ('ma', 'msp-add'),
+        ('mrm', 'msp-remove'),
+        ('mu', 'msp-update'),
+        ('mlr', 'msp-legacy-report'),
+        ('mbr', 'msp-billing-report'),
+        ('ds', 'distributor'),
+    ],
+}
@@ -12,6 +12,7 @@ from .enterprise_common import EnterpriseCommand
 from ..sox.sox_types import RecordPermissions
 from .helpers.reporting import filter_rows
 from .. import sox, api
+from ..enterprise import get_enterprise_index
 from ..error import CommandError
 from ..params import KeeperParams
 from ..sox import sox_types, get_node_id
@@ -207,14 +208,16 @@ class ComplianceReportCommand(BaseComplianceReportCommand):
         # type: (KeeperParams, Dict[str, Any], SoxData, str, int, int) -> List[List[Union[str, Any]]]
         def filter_owners(rec_owners):
             def filter_by_teams(users, teams):
+                enterprise_index = get_enterprise_index(params)
                 enterprise_teams = params.enterprise.get('teams', [])
-                team_uids = {t.get('team_uid') for t in enterprise_teams}
-                enterprise_team_users = params.enterprise.get('team_users', [])
 
                 def get_team_users(team_ref):
-                    team_ids = {team_ref} if team_ref in team_uids \
+                    team_ids = {team_ref} if enterprise_index.get_team(team_ref) \
                         else {t.get('team_uid') for t in enterprise_teams if team_ref == t.get('name')}
-                    return {u.get('enterprise_user_id') for u in enterprise_team_users if u.get('team_uid') in team_ids}
+                    team_users = set()
+                    for team_uid in team_ids:
+                        team_users.update(enterprise_index.get_team_users(team_uid))
+                    return team_users
 
                 team_users = set()
                 for t_ref in teams:
@@ -498,7 +501,7 @@ class ComplianceRecordAccessReportCommand(BaseComplianceReportCommand):
             def fetch_events(requests):
                 return list(
                     itertools.chain.from_iterable(
-                        [rs.get('audit_event_overview_report_rows', []) for rs in api.execute_batch(params, requests)]
+                        [rs.get('audit_event_overview_report_rows', []) for rs in api.execute_batch(params, requests, pipelined=True)]
                     )
                 )
 
@@ -527,10 +530,10 @@ class ComplianceRecordAccessReportCommand(BaseComplianceReportCommand):
             return aging_data
 
         def save_aging_data(aging_data):
-            existing_entities = sox_data.storage.get_record_aging()
+            existing_entities = {x.record_uid: x for x in sox_data.storage.get_record_aging().find_entities(aging_data)}
             updated_entities = []
             for r, events in aging_data.items():
-                entity = existing_entities.get_entity(r) or StorageRecordAging(r)
+                entity = existing_entities.get(r) or StorageRecordAging(r)
                 created_dt = events.get('created')
                 created_ts = int(created_dt.timestamp()) if created_dt else 0
                 modified_dt = events.get('last_modified')
@@ -568,7 +571,7 @@ class ComplianceRecordAccessReportCommand(BaseComplianceReportCommand):
                 if not users_to_query:
                     break
                 requests = [get_records_accessed_rq(email, **filters_by_user.get(email)) for email in users_to_query]
-                responses = api.execute_batch(params, requests)
+                responses = api.execute_batch(params, requests, pipelined=True)
                 responses_by_user = zip(users_to_query, responses)
                 for user, response in responses_by_user:
                     access_events = response.get('audit_event_overview_report_rows', [])
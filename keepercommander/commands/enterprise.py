@@ -42,6 +42,7 @@ from .enterprise_common import EnterpriseCommand
 from .enterprise_push import EnterprisePushCommand, enterprise_push_parser
 from .transfer_account import EnterpriseTransferUserCommand, transfer_user_parser
 from .. import api, crypto, utils, constants
+from ..enterprise import get_enterprise_index
 from ..display import bcolors
 from ..error import CommandError, KeeperApiError
 from ..params import KeeperParams
@@ -748,15 +749,16 @@ class EnterpriseInfoCommand(EnterpriseCommand):
                             if team_uid not in team_roles:
                                 team_roles[team_uid] = set()
                             team_roles[team_uid].add(role_id)
-                user_teams = {}    # type: Dict[int, Set[str]]
+                user_teams = {}    # type: Dict[int, List[str]]
                 for team_uid, t in teams.items():
                     if 'users' in t:
                         for enterprise_user_id in t['users']:
                             if enterprise_user_id not in user_teams:
-                                user_teams[enterprise_user_id] = set()
-                            user_teams[enterprise_user_id].add(team_uid)
+                                user_teams[enterprise_user_id] = []
+                            user_teams[enterprise_user_id].append(team_uid)
 
                 displayed_columns = [x for x in supported_columns if x in columns]
+                enterprise_index = get_enterprise_index(params)
                 rows = []
                 for u in users.values():
                     user_status_dict = get_user_status_dict(u)
@@ -774,9 +776,9 @@ class EnterpriseInfoCommand(EnterpriseCommand):
                         elif column == 'node':
                             row.append(self.get_node_path(params, u['node_id']))
                         elif column == 'team_count':
-                            row.append(len([1 for t in teams.values() if t['users'] and user_id in t['users']]))
+                            row.append(len(user_teams.get(user_id) or ()))
                         elif column == 'teams':
-                            team_names = [t["name"] for t in teams.values() if t['users'] and user_id in t['users']]
+                            team_names = [teams[x]['name'] for x in user_teams.get(user_id) or ()]
                             row.append(team_names)
                         elif column == 'role_count' or column == 'roles':
                             role_ids = set()
@@ -792,8 +794,7 @@ class EnterpriseInfoCommand(EnterpriseCommand):
                                 role_names = [roles[role_id]['name'] for role_id in role_ids if role_id in roles]
                                 row.append(role_names)
                         elif column == 'alias':
-                            row.append([x['username'] for x in params.enterprise.get('user_aliases', [])
-                                        if x['enterprise_user_id'] == user_id and x['username'] != email])
+                            row.append([x for x in enterprise_index.get_user_aliases(user_id) if x != email])
                         elif column == '2fa_enabled':
                             row.append(u.get('tfa_enabled') or '')
                     if pattern:
@@ -2464,8 +2465,10 @@ class EnterpriseRoleCommand(EnterpriseCommand):
                             if not is_update:
                                 rq['tree_keys'] = []
                                 if 'role_users' in params.enterprise:
-                                    for user_id in [x['enterprise_user_id'] for x in params.enterprise['role_users'] if x['role_id'] == role_id]:
-                                        email = next((x['username'] for x in params.enterprise['users'] if x['enterprise_user_id'] == user_id), None)
+                                    enterprise_index = get_enterprise_index(params)
+                                    for user_id in enterprise_index.get_role_users(role_id):
+                                        user = enterprise_index.get_user(user_id)
+                                        email = user.get('username') if user else None
                                         if email:
                                             api.load_user_public_keys(params, [email], False)
                                             public_keys = params.key_cache.get(email)
@@ -3257,8 +3260,8 @@ class EnterpriseTeamCommand(EnterpriseCommand):
                         logging.warning('\'%s\' team is not %s: %s', team_name, verb, rs['message'])
                 elif command in {'team_enterprise_user_add', 'team_queue_user', 'team_enterprise_user_remove'}:
                     user_id = rq['enterprise_user_id']
-                    user_names = [x['username'] for x in params.enterprise['users'] if x['enterprise_user_id'] == user_id]
-                    user_name = user_names[0] if len(user_names) > 0 else str(user_id)
+                    user = get_enterprise_index(params).get_user(user_id)
+                    user_name = user['username'] if user else str(user_id)
                     if rs['result'] == 'success':
                         logging.info('\'%s\' %s team %s user %s', team_name, 'queued' if command == 'team_queue_user' else '',
                                      'deleted' if command == 'team_enterprise_user_remove' else 'added', user_name)
@@ -3693,7 +3696,7 @@ class DeviceApproveCommand(EnterpriseCommand):
                             found = True
                             break
                         ent_user_id = device.get('enterprise_user_id')
-                        u = next((x for x in params.enterprise['users'] if x.get('enterprise_user_id') == ent_user_id), None)
+                        u = get_enterprise_index(params).get_user(ent_user_id)
                         if u:
                             if u.get('username') == name:
                                 found = True
@@ -3886,9 +3889,9 @@ class DeviceApproveCommand(EnterpriseCommand):
                 headers = [x.replace(' ', '_').lower() for x in headers]
 
             rows = []
+            enterprise_index = get_enterprise_index(params)
             for k, v in matching_devices.items():
-                user = next((x for x in params.enterprise['users']
-                             if x.get('enterprise_user_id') == v.get('enterprise_user_id')), None)
+                user = enterprise_index.get_user(v.get('enterprise_user_id'))
                 if not user:
                     continue
 
@@ -16,6 +16,7 @@ from typing import Dict
 
 from .base import Command, user_choice
 from .. import api, utils, crypto
+from ..enterprise import get_enterprise_index
 from ..error import CommandError
 from ..params import KeeperParams, PublicKeys
 from ..proto import enterprise_pb2
@@ -356,15 +357,16 @@ class EnterpriseCommand(Command):
         if not root_node_id:
             return
 
-        enterprise_user_id = None
-        if 'users' in params.enterprise:
-            enterprise_user_id = next((x['enterprise_user_id'] for x in params.enterprise['users'] if x.get('username', '').lower() == params.user.lower()), None)
+        enterprise_index = get_enterprise_index(params)
+        enterprise_user = enterprise_index.get_user_by_email(params.user)
+        enterprise_user_id = enterprise_user['enterprise_user_id'] if enterprise_user else None
 
         root_nodes = set()
         managed_nodes = set()
         if enterprise_user_id:
-            current_user_roles = set((x['role_id'] for x in params.enterprise['role_users'] if x['enterprise_user_id'] == enterprise_user_id))
-            is_main_admin = any(True for x in params.enterprise['managed_nodes'] if x['role_id'] in current_user_roles and x['cascade_node_management'] and x['managed_node_id'] == root_node_id)
+            current_user_roles = enterprise_index.get_user_roles(enterprise_user_id)
+            is_main_admin = any(True for x in enterprise_index.get_node_managed_nodes(root_node_id)
+                                if x['role_id'] in current_user_roles and x['cascade_node_management'])
         else:
             is_main_admin = True
             current_user_roles = set()
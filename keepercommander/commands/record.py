@@ -762,7 +762,7 @@ class SearchCommand(Command):
         skip_details = not verbose
 
         if 'r' in categories:
-            records = list(vault_extensions.find_records(params, pattern))
+            records = list(vault_extensions.find_records(params, pattern, editable=False))
             if records:
                 logging.info('')
                 table = []
@@ -833,7 +833,8 @@ class RecordListCommand(Command):
             pattern,
             record_type=record_type,
             record_version=record_version,
-            search_fields=search_fields)]
+            search_fields=search_fields,
+            editable=False)]
         if any(records):
             headers = ['record_uid', 'type', 'title', 'description', 'shared']
             if fmt == 'table':
@@ -1792,7 +1793,7 @@ class SharedRecordsReport(Command):
                 for uid in folder_uids:
                     FolderMixin.traverse_folder_tree(params, uid, on_folder_fn)
         else:
-            for record in vault_extensions.find_records(params, record_version=versions):
+            for record in vault_extensions.find_records(params, record_version=versions, editable=False):
                 if not record.shared:
                     continue
                 if not all_records:
@@ -17,7 +17,7 @@ import itertools
 import json
 import logging
 import os
-from typing import List, Optional, Any, Dict, Union, Sequence
+from typing import List, Optional, Any, Dict, Union, Sequence, Tuple
 
 from cryptography.hazmat.primitives import serialization
 from cryptography.hazmat.primitives.asymmetric import ed25519
@@ -1078,6 +1078,8 @@ class RecordDownloadAttachmentCommand(Command):
 
         preserve_dir = kwargs.get('preserve_dir') is True
         record_title = kwargs.get('record_title') is True
+        downloads = []    # type: List[Tuple[attachment.AttachmentDownloadRequest, str]]
+        file_names = set()
         for record_uid in record_uids:
             attachments = list(attachment.prepare_attachment_download(params, record_uid))
             if len(attachments) == 0:
@@ -1109,13 +1111,19 @@ class RecordDownloadAttachmentCommand(Command):
                     file_name = f'{title}-{atta.title}'
                 file_name = os.path.basename(file_name)
                 name = os.path.join(subfolder_path, file_name)
-                if os.path.isfile(name):
+                if os.path.isfile(name) or name in file_names:
                     base_name, ext = os.path.splitext(file_name)
                     name = os.path.join(subfolder_path, f'{base_name}({record_uid}){ext}')
-                if os.path.isfile(name):
+                if os.path.isfile(name) or name in file_names:
                     base_name, ext = os.path.splitext(file_name)
                     name = os.path.join(subfolder_path, f'{base_name}({atta.file_id}){ext}')
-                atta.download_to_file(params, name)
+                file_names.add(name)
+                downloads.append((atta, name))
+
+        if len(downloads) > 0:
+            progress = attachment.TransferProgress(report=True)
+            attachment.download_attachments(params, downloads, progress)
+            logging.info('Downloaded %s', progress)
 
 
 class RecordUploadAttachmentCommand(Command):
@@ -1163,6 +1171,8 @@ class RecordUploadAttachmentCommand(Command):
 
         record = vault.KeeperRecord.load(params, record_uid)
         if isinstance(record, (vault.PasswordRecord, vault.TypedRecord)):
-            attachment.upload_attachments(params, record, upload_tasks)
+            progress = attachment.TransferProgress(report=True)
+            attachment.upload_attachments(params, record, upload_tasks, progress)
+            logging.info('Uploaded %s', progress)
             record_management.update_record(params, record)
             params.sync_data = True
@@ -11,7 +11,6 @@
 
 import argparse
 import logging
-import requests
 
 from .base import report_output_parser, dump_report_data, field_to_title, Command
 from .. import vault, attachment, record_facades
@@ -57,8 +56,8 @@ class RecordFileReportCommand(Command):
                 for download in downloads:
                     try:
                         if download.url:
-                            opt_rs = requests.get(download.url, proxies=params.rest_context.proxies,
-                                                  headers={"Range": "bytes=0-1"})
+                            opt_rs = params.rest_context.get_session().get(
+                                download.url, proxies=params.rest_context.proxies, headers={"Range": "bytes=0-1"})
                             statuses[download.file_id] = 'OK' if opt_rs.status_code in {200, 206} else str(opt_rs.status_code)
                     except Exception as e:
                         logging.debug(e)
@@ -16,10 +16,12 @@ import io
 import json
 import logging
 import os
-from typing import Iterable, Union, Optional, Dict, List, Set, Any, Callable
-from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+import time
+from typing import Iterable, Iterator, Union, Optional, Dict, List, Set, Any, Callable, Tuple
+from urllib.parse import urlparse, urlunparse
 
 import requests
+from requests.adapters import HTTPAdapter
 
 from .base import user_choice, dump_report_data, report_output_parser, field_to_title, GroupCommand
 from .enterprise import TeamApproveCommand, EnterpriseCommand
@@ -67,8 +69,19 @@ scim_push_parser.add_argument('--record', '-r', dest='record', action='store',
                               help='Record UID with SCIM configuration')
 scim_push_parser.add_argument('--auto-approve', dest='auto_approve', action='store', choices=['on', 'off'],
                               default='on', help='Auto approve SCIM teams')
+scim_push_parser.add_argument('--workers', dest='workers', action='store', type=int,
+                              help='Number of concurrent SCIM requests')
+scim_push_parser.add_argument('--no-bulk', dest='no_bulk', action='store_true',
+                              help='Do not use SCIM Bulk requests')
 scim_push_parser.add_argument('target', help='SCIM ID')
 
+SCIM_WORKERS_CONFIG_KEY = 'scim_push_workers'
+DEFAULT_SCIM_WORKERS = 8
+SCIM_RETRIES = 5
+SCIM_PAGE_SIZE = 500
+SCIM_BULK_MAX_OPERATIONS = 100
+SCIM_BULK_MAX_PAYLOAD = 1024 * 1024
+
 
 def register_commands(commands):
     commands['scim'] = ScimCommand()
@@ -317,6 +330,237 @@ class ScimGroup:
         return 'SCIM GROUP: ' + json.dumps(scim_group)
 
 
+def get_scim_workers(params):    # type: (KeeperParams) -> int
+    workers = params.config.get(SCIM_WORKERS_CONFIG_KEY) if isinstance(params.config, dict) else None
+    return workers if isinstance(workers, int) and workers > 0 else DEFAULT_SCIM_WORKERS
+
+
+class ScimOperation:
+    """SCIM write request. "description" names the resource in log messages"""
+    def __init__(self, method, path, data=None, description='', on_success=None):
+        # type: (str, str, Optional[dict], str, Optional[Callable[[Optional[dict]], None]]) -> None
+        self.method = method
+        self.path = path
+        self.data = data
+        self.description = description
+        self.on_success = on_success
+
+    def to_bulk(self, bulk_id):    # type: (str) -> dict
+        op = {
+            'method': self.method,
+            'path': self.path,
+            'bulkId': bulk_id
+        }
+        if self.data is not None:
+            op['data'] = self.data
+        return op
+
+
+class ScimClient:
+    """SCIM endpoint client.
+
+    Write operations are sent in RFC 7644 Bulk requests when the endpoint advertises Bulk support,
+    otherwise as individual requests in up to "workers" threads over one pooled session.
+    Throttled (429) and unavailable (503) responses are retried.
+    Bulk requests are retried only when throttled: a Bulk request that failed with 503
+    may have been partially applied, and sending it again would duplicate created resources.
+    """
+    def __init__(self, scim_url, token, workers=DEFAULT_SCIM_WORKERS, bulk=True, dry_run=False, proxies=None,
+                 session=None):
+        # type: (str, str, int, bool, bool, Optional[dict], Optional[requests.Session]) -> None
+        self.scim_url = scim_url.rstrip('/')
+        self.workers = max(workers, 1)
+        self.bulk = bulk
+        self.dry_run = dry_run
+        self.proxies = proxies
+        self.headers = {'Authorization': f'Bearer {token}'}
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self.request_count = 0
+        self._bulk_limits = None    # type: Optional[Tuple[int, int]]
+
+    @staticmethod
+    def get_retry_delay(response, attempt):    # type: (requests.Response, int) -> float
+        retry_after = response.headers.get('Retry-After')
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), 60)
+        return min(2 ** (attempt - 1), 30)
+
+    def request(self, method, path, payload=None, query=None, retry_unavailable=True):
+        # type: (str, str, Optional[dict], Optional[dict], bool) -> Optional[dict]
+        url = self.scim_url + path
+        retry_statuses = (429, 503) if retry_unavailable else (429,)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.request_count += 1
+            try:
+                rs = self.session.request(method, url, headers=self.headers, json=payload, params=query,
+                                          proxies=self.proxies)
+            except requests.exceptions.ConnectionError as e:
+                # a POST that may have reached the server is not repeated
+                if method == 'POST' or attempt > SCIM_RETRIES:
+                    raise
+                delay = attempt
+                logging.debug('SCIM %s %s: %s. Retrying...', method, path, e)
+            else:
+                if rs.status_code not in retry_statuses or attempt > SCIM_RETRIES:
+                    if rs.status_code >= 300:
+                        raise CommandError('', f'{method} error: {rs.status_code}')
+                    if rs.status_code in (200, 201) and rs.content:
+                        return rs.json()
+                    return None
+                delay = ScimClient.get_retry_delay(rs, attempt)
+                logging.debug('SCIM %s %s: HTTP status %d. Retrying in %s seconds', method, path, rs.status_code, delay)
+            time.sleep(delay)
+
+    def get_resources(self, path):    # type: (str) -> List[dict]
+        """Reads all pages of a resource list. Pages after the first one are read concurrently."""
+        def get_page(start_index):
+            return self.request('GET', path, query={'startIndex': start_index, 'count': SCIM_PAGE_SIZE}) or {}
+
+        response = get_page(1)
+        resources = list(response.get('Resources') or [])
+        total_results = response.get('totalResults') or 0
+        items_per_page = response.get('itemsPerPage') or len(resources)
+        if items_per_page > 0:
+            start_indexes = range(1 + items_per_page, total_results + 1, items_per_page)
+            for _, page, error in attachment.iter_transfers(start_indexes, get_page, self.workers):
+                if error:
+                    raise error
+                resources.extend(page.get('Resources') or [])
+        return resources
+
+    def get_bulk_limits(self):    # type: () -> Tuple[int, int]
+        """Returns maximum operations and payload size of Bulk request. (0, 0) if Bulk is not supported"""
+        if self._bulk_limits is None:
+            self._bulk_limits = (0, 0)
+            if self.bulk:
+                try:
+                    config = self.request('GET', '/ServiceProviderConfig') or {}
+                    bulk = config.get('bulk') or {}
+                    if bulk.get('supported') is True:
+                        max_operations = bulk.get('maxOperations')
+                        max_operations = min(max_operations, SCIM_BULK_MAX_OPERATIONS) \
+                            if isinstance(max_operations, int) and max_operations > 0 else SCIM_BULK_MAX_OPERATIONS
+                        max_payload = bulk.get('maxPayloadSize')
+                        max_payload = max_payload \
+                            if isinstance(max_payload, int) and max_payload > 0 else SCIM_BULK_MAX_PAYLOAD
+                        self._bulk_limits = (max_operations, max_payload)
+                except Exception as e:
+                    logging.debug('SCIM ServiceProviderConfig error: %s', e)
+        return self._bulk_limits
+
+    def execute_one(self, operation):    # type: (ScimOperation) -> Optional[dict]
+        if self.dry_run:
+            logging.info(f'{operation.method} {self.scim_url}{operation.path}')
+            if operation.data is not None:
+                logging.info(json.dumps(operation.data, indent=2))
+            if operation.method == 'POST':
+                response = operation.data.copy()
+                response['id'] = utils.generate_uid()
+                return response
+            return None
+        return self.request(operation.method, operation.path, operation.data)
+
+    def execute_bulk(self, operations):    # type: (List[ScimOperation]) -> List[Tuple[Optional[dict], Optional[Exception]]]
+        """Sends operations in one Bulk request. Operations throttled by the endpoint are sent again."""
+        results = [(None, None)] * len(operations)    # type: List[Tuple[Optional[dict], Optional[Exception]]]
+        pending = list(range(len(operations)))
+        attempt = 0
+        while pending:
+            attempt += 1
+            payload = {
+                'schemas': ['urn:ietf:params:scim:api:messages:2.0:BulkRequest'],
+                'Operations': [operations[x].to_bulk(str(x)) for x in pending]
+            }
+            rs = self.request('POST', '/Bulk', payload, retry_unavailable=False) or {}
+            bulk_results = {}
+            for no, op_rs in enumerate(rs.get('Operations') or []):
+                bulk_id = op_rs.get('bulkId')
+                bulk_results[bulk_id if bulk_id is not None else str(pending[no])] = op_rs
+
+            throttled = []
+            for index in pending:
+                operation = operations[index]
+                op_rs = bulk_results.get(str(index))
+                if op_rs is None:
+                    results[index] = (None, CommandError('', f'{operation.method} error: no Bulk response'))
+                    continue
+                status = op_rs.get('status')
+                if isinstance(status, dict):
+                    status = status.get('code')
+                status = int(status) if str(status).isdigit() else 500
+                if status == 429 and attempt <= SCIM_RETRIES:
+                    throttled.append(index)
+                elif status >= 300:
+                    results[index] = (None, CommandError('', f'{operation.method} error: {status}'))
+                else:
+                    response = op_rs.get('response')
+                    if not isinstance(response, dict) or 'id' not in response:
+                        response = dict(operation.data or {})
+                        location = op_rs.get('location')
+                        if location:
+                            response['id'] = location.rstrip('/').rsplit('/', 1)[-1]
+                    results[index] = (response, None)
+            pending = throttled
+            if pending:
+                time.sleep(min(2 ** (attempt - 1), 30))
+        return results
+
+    def execute(self, operations):
+        # type: (Iterable[ScimOperation]) -> Iterator[Tuple[ScimOperation, Optional[dict], Optional[Exception]]]
+        """Runs write operations. Yields (operation, response, error) in operation order."""
+        if self.dry_run:
+            for operation in operations:
+                yield operation, self.execute_one(operation), None
+            return
+
+        max_operations, max_payload = self.get_bulk_limits()
+        if max_operations > 0:
+            def send_batch(batch):
+                return self.execute_bulk(batch)
+
+            for batch, results, error in attachment.iter_transfers(
+                    ScimClient.split_batches(operations, max_operations, max_payload), send_batch, self.workers):
+                for no, operation in enumerate(batch):
+                    if error:
+                        yield operation, None, error
+                    else:
+                        response, op_error = results[no]
+                        yield operation, response, op_error
+        else:
+            yield from attachment.iter_transfers(operations, self.execute_one, self.workers)
+
+    @staticmethod
+    def split_batches(operations, max_operations, max_payload):
+        # type: (Iterable[ScimOperation], int, int) -> Iterator[List[ScimOperation]]
+        batch = []    # type: List[ScimOperation]
+        batch_size = 0
+        for operation in operations:
+            size = len(json.dumps(operation.to_bulk(''))) + 16
+            if batch and (len(batch) >= max_operations or batch_size + size > max_payload):
+                yield batch
+                batch = []
+                batch_size = 0
+            batch.append(operation)
+            batch_size += size
+        if batch:
+            yield batch
+
+    def run(self, operations):    # type: (Iterable[ScimOperation]) -> None
+        """Runs write operations and reports their outcome"""
+        for operation, response, error in self.execute(operations):
+            if error:
+                logging.warning('%s %s error: %s', operation.method, operation.description, error)
+            elif operation.on_success:
+                operation.on_success(response)
+
+
 class ICrmDataSource(abc.ABC):
     def __init__(self):
         self._load_errors = False     # type: bool
@@ -402,10 +646,17 @@ class ScimPushCommand(EnterpriseCommand):
             if verbose:
                 logging.info(message)
 
+        workers = kwargs.get('workers')
+        if not isinstance(workers, int) or workers <= 0:
+            workers = get_scim_workers(params)
+        client = ScimClient(scim_url, token, workers=workers, bulk=kwargs.get('no_bulk') is not True,
+                            dry_run=dry_run, proxies=params.rest_context.proxies,
+                            session=params.rest_context.get_session())
+
         keeper_users = {}  # type: Dict[str, ScimUser]
         keeper_groups = {}  # type: Dict[str, ScimGroup]
         logging.debug('SCIM Query Keeper')
-        for element in ScimPushCommand.scim_keeper(scim_url, token):
+        for element in ScimPushCommand.scim_keeper(scim_url, token, client=client):
             if isinstance(element, ScimUser):
                 keeper_users[element.id] = element
                 logging.debug(str(element))
@@ -517,9 +768,10 @@ class ScimPushCommand(EnterpriseCommand):
             verbose_logging('Switching to the "Safe Mode" due to errors')
             destructive = -1
 
-        self.sync_groups(scim_url, token, keeper_groups, other_groups, dry_run, destructive=destructive)
-        self.sync_users(scim_url, token, keeper_users, other_users, dry_run)
-        self.sync_membership(scim_url, token, keeper_groups, keeper_users, other_users, dry_run, destructive=destructive)
+        self.sync_groups(scim_url, token, keeper_groups, other_groups, dry_run, destructive=destructive, client=client)
+        self.sync_users(scim_url, token, keeper_users, other_users, dry_run, client=client)
+        self.sync_membership(scim_url, token, keeper_groups, keeper_users, other_users, dry_run,
+                             destructive=destructive, client=client)
         api.query_enterprise(params)
         auto_approve = kwargs.get('auto_approve') or ''
         if auto_approve != 'off':
@@ -533,6 +785,8 @@ class ScimPushCommand(EnterpriseCommand):
                     external_groups,
                     dry_run=False,
                     **kwargs):  # type: (str, str, Dict[str, ScimGroup], Dict[str, ScimGroup], bool, Any) -> None
+        client = kwargs.get('client') or ScimClient(scim_url, token, dry_run=dry_run)    # type: ScimClient
+        operations = []    # type: List[ScimOperation]
         keeper_group_copy = keeper_groups.copy()
         external_group_copy = external_groups.copy()
         for match_round in range(3):  # 0 - external ID, 1 - name, 2 - reuse groups
@@ -571,14 +825,14 @@ class ScimPushCommand(EnterpriseCommand):
                             'schemas': ['urn:ietf:params:scim:api:messages:2.0:PatchOp'],
                             'Operations': [op]
                         }
-                        try:
-                            ScimPushCommand.patch_scim_resource(
-                                f'{scim_url}/Groups', keeper_group.id, token, payload, dry_run)
+
+                        def group_updated(_, keeper_group=keeper_group, group=group):
                             keeper_group.external_id = group.id
                             keeper_group.name = group.name
                             logging.info('SCIM updated group "%s"', group.name)
-                        except Exception as e:
-                            logging.warning('PATCH group "%s" error: %s', group.name, e)
+
+                        operations.append(ScimOperation('PATCH', f'/Groups/{keeper_group.id}', payload,
+                                                        f'group "{group.name}"', group_updated))
 
                     del keeper_group_copy[keeper_group.id]
                     del external_group_copy[group.id]
@@ -590,9 +844,10 @@ class ScimPushCommand(EnterpriseCommand):
                     'displayName': group.name,
                     'externalId': group.id
                 }
-                try:
-                    rs = ScimPushCommand.post_scim_resource(f'{scim_url}/Groups', token, payload, dry_run)
-                    group_id = rs.get('id')
+
+
+                def group_added(rs, group=group):
+                    group_id = rs.get('id') if rs else None
                     if group_id:
                         keeper_group = ScimGroup()
                         keeper_group.id = group_id
@@ -600,8 +855,8 @@ class ScimPushCommand(EnterpriseCommand):
                         keeper_group.name = rs.get('displayName')
                         keeper_groups[group_id] = keeper_group
                         logging.info('SCIM added group "%s"', group.name)
-                except Exception as e:
-                    logging.warning('POST group "%s" error: %s', group.name, e)
+
+                operations.append(ScimOperation('POST', '/Groups', payload, f'group "{group.name}"', group_added))
         external_group_copy.clear()
 
         if len(keeper_group_copy) > 0:  # delete groups
@@ -610,25 +865,29 @@ class ScimPushCommand(EnterpriseCommand):
                 destructive = 0
             for keeper_group_id in keeper_group_copy:
                 keeper_group = keeper_group_copy[keeper_group_id]
-                try:
-                    if destructive > 0 or keeper_group.external_id:
-                        ScimPushCommand.delete_scim_resource(f'{scim_url}/Groups', keeper_group_id, token, dry_run)
-                        del keeper_groups[keeper_group_id]
+                if destructive > 0 or keeper_group.external_id:
+                    def group_deleted(_, keeper_group=keeper_group):
+                        keeper_groups.pop(keeper_group.id, None)
                         logging.info('SCIM deleted group "%s"', keeper_group.name)
+
+                    operations.append(ScimOperation('DELETE', f'/Groups/{keeper_group_id}', None,
+                                                    f'group "{keeper_group.name}"', group_deleted))
+                else:
+                    if keeper_group.external_id:
+                        logging.info('DELETE group "%s" skipped: "Safe Mode" is enforced', keeper_group.name)
                     else:
-                        if keeper_group.external_id:
-                            logging.info('DELETE group "%s" skipped: "Safe Mode" is enforced', keeper_group.name)
-                        else:
-                            logging.info('DELETE group "%s" skipped: the group is not controlled by SCIM', keeper_group.name)
-                except Exception as e:
-                    logging.warning('DELETE group "%s" error: %s', keeper_group.name, e)
+                        logging.info('DELETE group "%s" skipped: the group is not controlled by SCIM', keeper_group.name)
         keeper_group_copy.clear()
+        client.run(operations)
 
     @staticmethod
     def sync_users(scim_url, token,
                    keeper_users,
                    external_users,
-                   dry_run=False):  # type: (str, str, Dict[str, ScimUser], Dict[str, ScimUser], bool) -> None
+                   dry_run=False,
+                   **kwargs):  # type: (str, str, Dict[str, ScimUser], Dict[str, ScimUser], bool, Any) -> None
+        client = kwargs.get('client') or ScimClient(scim_url, token, dry_run=dry_run)    # type: ScimClient
+        operations = []    # type: List[ScimOperation]
         keeper_user_copy = keeper_users.copy()
         external_user_copy = external_users.copy()
         for match_round in range(1):  # 0 - email
@@ -667,17 +926,17 @@ class ScimPushCommand(EnterpriseCommand):
                             'schemas': ['urn:ietf:params:scim:api:messages:2.0:PatchOp'],
                             'Operations': [op]
                         }
-                        try:
-                            ScimPushCommand.patch_scim_resource(
-                                f'{scim_url}/Users', keeper_user.id, token, payload, dry_run)
+
+                        def user_updated(_, keeper_user=keeper_user, user=user):
                             keeper_user.external_id = user.id
                             keeper_user.full_name = user.full_name
                             keeper_user.first_name = user.first_name
                             keeper_user.last_name = user.last_name
                             keeper_user.active = user.active
                             logging.info('SCIM updated user "%s"', user.email)
-                        except Exception as e:
-                            logging.warning('PATCH user "%s" error: %s', user.email, e)
+
+                        operations.append(ScimOperation('PATCH', f'/Users/{keeper_user.id}', payload,
+                                                        f'user "{user.email}"', user_updated))
 
                     del keeper_user_copy[keeper_user.id]
                     del external_user_copy[user.id]
@@ -699,9 +958,10 @@ class ScimPushCommand(EnterpriseCommand):
                     },
                     'active': user.active
                 }
-                try:
-                    rs = ScimPushCommand.post_scim_resource(f'{scim_url}/Users', token, payload, dry_run)
-                    user_id = rs.get('id')
+
+
+                def user_added(rs, user=user):
+                    user_id = rs.get('id') if rs else None
                     if user_id:
                         keeper_user = ScimUser()
                         keeper_user.id = user_id
@@ -712,8 +972,8 @@ class ScimPushCommand(EnterpriseCommand):
                         keeper_user.last_name = user.last_name
                         keeper_users[user_id] = keeper_user
                         logging.info('SCIM added user "%s"', user.email)
-                except Exception as e:
-                    logging.warning('POST email "%s" error: %s', user.email, e)
+
+                operations.append(ScimOperation('POST', '/Users', payload, f'email "{user.email}"', user_added))
         external_user_copy.clear()
 
         if len(keeper_user_copy) > 0:  # delete users
@@ -721,13 +981,15 @@ class ScimPushCommand(EnterpriseCommand):
                 keeper_user = keeper_user_copy[keeper_user_id]
                 if not keeper_user.active:
                     continue
-                try:
-                    ScimPushCommand.delete_scim_resource(f'{scim_url}/Users', keeper_user_id, token, dry_run)
-                    del keeper_users[keeper_user_id]
+
+                def user_deleted(_, keeper_user=keeper_user):
+                    keeper_users.pop(keeper_user.id, None)
                     logging.info('SCIM deleted user "%s"', keeper_user.email)
-                except Exception as e:
-                    logging.warning('DELETE user "%s" error: %s', keeper_user.email, e)
+
+                operations.append(ScimOperation('DELETE', f'/Users/{keeper_user_id}', None,
+                                                f'user "{keeper_user.email}"', user_deleted))
         keeper_user_copy.clear()
+        client.run(operations)
 
     @staticmethod
     def sync_membership(scim_url,  # type: str
@@ -741,6 +1003,8 @@ class ScimPushCommand(EnterpriseCommand):
         destructive = kwargs.get('destructive')
         if not isinstance(destructive, int):
             destructive = 0
+        client = kwargs.get('client') or ScimClient(scim_url, token, dry_run=dry_run)    # type: ScimClient
+        operations = []    # type: List[ScimOperation]
 
         keeper_user_lookup = {x.email: x for x in keeper_users.values()}   # type: Dict[str, ScimUser]
         keeper_group_map = {x.external_id: x.id for x in keeper_groups.values() if x.external_id}
@@ -790,95 +1054,22 @@ class ScimPushCommand(EnterpriseCommand):
                         'path': 'groups',
                         'value': [{'value': x} for x in remove_groups]
                     })
-                try:
-                    ScimPushCommand.patch_scim_resource(
-                        f'{scim_url}/Users', keeper_user.id, token, payload, dry_run)
-                    logging.info('SCIM changed user "%s" membership: %d added; %d removed',
-                                 keeper_user.email, len(add_groups), len(remove_groups))
-                except Exception as e:
-                    logging.warning('PATCH user "%s" membership error: %s', keeper_user.email, e)
 
-    @staticmethod
-    def post_scim_resource(url, token, payload, dry_run=False):
-        if dry_run:
-            logging.info(f'POST {url}')
-            logging.info(json.dumps(payload, indent=2))
-            response = payload.copy()
-            response['id'] = utils.generate_uid()
-            return response
-        else:
-            headers = {
-                'Authorization': f'Bearer {token}',
-            }
-            rs = requests.post(url, headers=headers, json=payload)
-            if rs.status_code >= 300:
-                raise CommandError('', f'POST error: {rs.status_code}')
-            if rs.status_code in (200, 201):
-                return rs.json()
-
-    @staticmethod
-    def patch_scim_resource(url, resource_id, token, payload, dry_run=False):
-        patch_url = f'{url}/{resource_id}'
-        if dry_run:
-            logging.info(f'PATCH {patch_url}')
-            logging.info(json.dumps(payload, indent=2))
-        else:
-            headers = {
-                'Authorization': f'Bearer {token}',
-            }
-            rs = requests.patch(patch_url, headers=headers, json=payload)
-            if rs.status_code >= 300:
-                raise CommandError('', f'PATCH error: {rs.status_code}')
-            if rs.status_code == 200:
-                return rs.json()
-
-    @staticmethod
-    def delete_scim_resource(url, resource_id, token, dry_run=False):
-        patch_url = f'{url}/{resource_id}'
-        if dry_run:
-            logging.info(f'DELETE {patch_url}')
-        else:
-            headers = {
-                'Authorization': f'Bearer {token}',
-            }
-            rs = requests.delete(patch_url, headers=headers)
-            if rs.status_code >= 300:
-                raise CommandError('', f'DELETE error: {rs.status_code}')
-
-    @staticmethod
-    def get_scim_resource(url, token):
-        resources = []
-        start_index = 1
-        count = 500
-        headers = {
-            'Authorization': f'Bearer {token}'
-        }
-        comps = urlparse(url)
+                def membership_changed(_, keeper_user=keeper_user, added=len(add_groups), removed=len(remove_groups)):
+                    logging.info('SCIM changed user "%s" membership: %d added; %d removed',
+                                 keeper_user.email, added, removed)
 
-        while True:
-            q = parse_qsl(comps.query, keep_blank_values=True)
-            q.append(('startIndex', str(start_index)))
-            q.append(('count', str(count)))
-            query = urlencode(q, doseq=True)
-            url_comp = (comps.scheme, comps.netloc, comps.path, None, query, None)
-            rq_url = urlunparse(url_comp)
-            rs = requests.get(rq_url, headers=headers)
-            if rs.status_code != 200:
-                raise Exception(f'SCIM GET error code "{rs.status_code}"')
-            response = rs.json()
-            if 'Resources' in response:
-                resources.extend(response['Resources'])
-            total_results = response['totalResults']
-            items_per_page = response['itemsPerPage']
-            start_index = response['startIndex'] + items_per_page
-            if start_index >= total_results:
-                break
-        return resources
+                operations.append(ScimOperation('PATCH', f'/Users/{keeper_user.id}', payload,
+                                                f'user "{keeper_user.email}" membership', membership_changed))
+        client.run(operations)
 
     @staticmethod
-    def scim_keeper(scim_url, token):  # type: (str, str) -> Iterable[Union[ScimUser, ScimGroup]]
-        user_resource = ScimPushCommand.get_scim_resource(f'{scim_url}/Users', token)
-        group_resource = ScimPushCommand.get_scim_resource(f'{scim_url}/Groups', token)
+    def scim_keeper(scim_url, token, client=None):
+        # type: (str, str, Optional[ScimClient]) -> Iterable[Union[ScimUser, ScimGroup]]
+        if client is None:
+            client = ScimClient(scim_url, token)
+        user_resource = client.get_resources('/Users')
+        group_resource = client.get_resources('/Groups')
         for group in group_resource:
             group_id = group.get('id')
             group_name = group.get('displayName')
@@ -558,6 +558,10 @@ class WhoamiCommand(Command):
                 team_count = len(params.team_cache)
                 if team_count > 0:
                     print('{0:>20s}: {1}'.format('Teams', team_count))
+                throttle_stats = params.rest_context.governor.get_statistics()
+                if throttle_stats['throttle_count'] > 0:
+                    print('{0:>20s}: {1}'.format('Throttled Requests', throttle_stats['throttle_count']))
+                    print('{0:>20s}: {1}s'.format('Throttle Wait Time', throttle_stats['wait_time']))
 
             if params.enterprise:
                 print('')
@@ -1354,7 +1358,7 @@ class BlankRecordCommand(Command):
     def execute(self, params, **kwargs):
         headers = ['record_uid', 'record_type', 'record_title']
         table = []
-        for record in vault_extensions.find_records(params, record_version=(2,3)):
+        for record in vault_extensions.find_records(params, record_version=(2,3), editable=False):
             if isinstance(record, vault.PasswordRecord):
                 if not record.login and not record.password and not record.link:
                     table.append([record.record_uid, '', record.title])
@@ -216,10 +216,10 @@ class _StreamCrypter(io.RawIOBase):
                 self._base_stream.close()
             self._base_stream = None
 
-    def set_stream(self, stream, for_encrypt):
-        self.in_buffer = memoryview(bytearray(10240))
+    def set_stream(self, stream, for_encrypt, buffer_size=10240):
+        self.in_buffer = memoryview(bytearray(buffer_size))
         self.in_buffer_pos = 0
-        self.out_buffer = memoryview(bytearray(10240))
+        self.out_buffer = memoryview(bytearray(buffer_size))
         self.out_buffer_pos = 0
         self.is_encrypt = for_encrypt
         self.bytes_read = 0
@@ -12,13 +12,13 @@
 import abc
 import json
 import logging
-from typing import Optional, List, Set, Tuple, Dict
+from typing import Optional, List, Set, Tuple, Dict, Any, Iterable, AbstractSet
 
 from google.protobuf import message
 
 from .params import KeeperParams
 from .proto import enterprise_pb2 as proto
-from . import api, utils, crypto
+from . import api, utils, crypto, enterprise_cache
 
 
 def query_enterprise(params, tree_key=None):  # type: (KeeperParams, Optional[bytes]) -> None
@@ -63,12 +63,198 @@ class EnterpriseInfo(object):
         return self._enterprise_name
 
 
+def get_enterprise_index(params):  # type: (KeeperParams) -> EnterpriseIndex
+    """Returns lookup tables over params.enterprise"""
+    if params.enterprise_loader:
+        index = params.enterprise_loader.index
+    else:
+        if params.enterprise_index is None:
+            params.enterprise_index = EnterpriseIndex()
+        index = params.enterprise_index
+    index.bind(params.enterprise)
+    return index
+
+
+class EnterpriseIndex(object):
+    """Lookup tables over enterprise entities.
+
+    A table is built on first use and dropped by the enterprise loader when any of its source entities change.
+    A table is also rebuilt when one of its source entity lists is replaced or changes its length,
+    so an index without a loader follows entities added to or removed from params.enterprise.
+    Collections are ordered as their source entities.
+    Returned entities and collections are shared with the index and must not be modified.
+    """
+    _TABLE_SOURCES = {
+        'users_by_id': ('users',),
+        'users_by_email': ('users',),
+        'user_aliases': ('user_aliases',),
+        'teams_by_uid': ('teams',),
+        'roles_by_id': ('roles',),
+        'nodes_by_id': ('nodes',),
+        'node_children': ('nodes',),
+        'team_users': ('team_users',),
+        'role_users': ('role_users',),
+        'role_teams': ('role_teams',),
+        'managed_nodes': ('managed_nodes',),
+        'role_enforcements': ('role_enforcements',),
+    }
+
+    def __init__(self):
+        self._enterprise = None    # type: Optional[dict]
+        self._tables = {}          # type: Dict[str, Tuple[tuple, Any]]
+
+    def bind(self, enterprise):  # type: (Optional[dict]) -> None
+        if enterprise is not self._enterprise:
+            self._enterprise = enterprise
+            self._tables.clear()
+
+    def invalidate(self, entity_names=None):  # type: (Optional[Iterable[str]]) -> None
+        if entity_names is None:
+            self._tables.clear()
+            return
+        entity_names = set(entity_names)
+        for table_name, sources in self._TABLE_SOURCES.items():
+            if table_name in self._tables and not entity_names.isdisjoint(sources):
+                del self._tables[table_name]
+
+    def _entities(self, name):  # type: (str) -> List[dict]
+        return (self._enterprise.get(name) or []) if self._enterprise else []
+
+    def _get_sources(self, table_name):  # type: (str) -> tuple
+        """Returns source entity lists of a table with their lengths"""
+        sources = []
+        for name in self._TABLE_SOURCES[table_name]:
+            entities = self._enterprise.get(name) if self._enterprise else None
+            sources.append((entities, len(entities) if entities else 0))
+        return tuple(sources)
+
+    def _get_table(self, table_name):  # type: (str) -> Any
+        sources = self._get_sources(table_name)
+        entry = self._tables.get(table_name)
+        if entry is None or any(x[0] is not y[0] or x[1] != y[1] for x, y in zip(entry[0], sources)):
+            entry = (sources, getattr(self, '_build_' + table_name)())
+            self._tables[table_name] = entry
+        return entry[1]
+
+    def _build_users_by_id(self):
+        return {x['enterprise_user_id']: x for x in self._entities('users')}
+
+    def _build_users_by_email(self):
+        return {x['username'].lower(): x for x in self._entities('users') if x.get('username')}
+
+    def _build_user_aliases(self):
+        aliases = {}    # type: Dict[int, List[str]]
+        for x in self._entities('user_aliases'):
+            aliases.setdefault(x['enterprise_user_id'], []).append(x['username'])
+        return aliases
+
+    def _build_teams_by_uid(self):
+        return {x['team_uid']: x for x in self._entities('teams')}
+
+    def _build_roles_by_id(self):
+        return {x['role_id']: x for x in self._entities('roles')}
+
+    def _build_nodes_by_id(self):
+        return {x['node_id']: x for x in self._entities('nodes')}
+
+    def _build_node_children(self):
+        children = {}    # type: Dict[int, List[int]]
+        for x in self._entities('nodes'):
+            parent_id = x.get('parent_id')
+            if parent_id:
+                children.setdefault(parent_id, []).append(x['node_id'])
+        return children
+
+    @staticmethod
+    def _build_links(entities, key1, key2):
+        # dictionary keys keep the order of entities and support set operations
+        links1 = {}    # type: Dict[Any, Dict[Any, None]]
+        links2 = {}    # type: Dict[Any, Dict[Any, None]]
+        for x in entities:
+            id1 = x.get(key1)
+            id2 = x.get(key2)
+            links1.setdefault(id1, {})[id2] = None
+            links2.setdefault(id2, {})[id1] = None
+        return {k: v.keys() for k, v in links1.items()}, {k: v.keys() for k, v in links2.items()}
+
+    def _build_team_users(self):
+        return self._build_links(self._entities('team_users'), 'team_uid', 'enterprise_user_id')
+
+    def _build_role_users(self):
+        return self._build_links(self._entities('role_users'), 'role_id', 'enterprise_user_id')
+
+    def _build_role_teams(self):
+        return self._build_links(self._entities('role_teams'), 'role_id', 'team_uid')
+
+    def _build_managed_nodes(self):
+        by_role = {}    # type: Dict[int, List[dict]]
+        by_node = {}    # type: Dict[int, List[dict]]
+        for x in self._entities('managed_nodes'):
+            by_role.setdefault(x['role_id'], []).append(x)
+            by_node.setdefault(x['managed_node_id'], []).append(x)
+        return by_role, by_node
+
+    def _build_role_enforcements(self):
+        return {x['role_id']: x['enforcements'] for x in self._entities('role_enforcements')}
+
+    def get_user(self, enterprise_user_id):  # type: (int) -> Optional[dict]
+        return self._get_table('users_by_id').get(enterprise_user_id)
+
+    def get_user_by_email(self, email):  # type: (str) -> Optional[dict]
+        return self._get_table('users_by_email').get(email.lower()) if email else None
+
+    def get_user_aliases(self, enterprise_user_id):  # type: (int) -> List[str]
+        return self._get_table('user_aliases').get(enterprise_user_id) or []
+
+    def get_team(self, team_uid):  # type: (str) -> Optional[dict]
+        return self._get_table('teams_by_uid').get(team_uid)
+
+    def get_role(self, role_id):  # type: (int) -> Optional[dict]
+        return self._get_table('roles_by_id').get(role_id)
+
+    def get_node(self, node_id):  # type: (int) -> Optional[dict]
+        return self._get_table('nodes_by_id').get(node_id)
+
+    def get_node_children(self, node_id):  # type: (int) -> List[int]
+        return self._get_table('node_children').get(node_id) or []
+
+    def get_team_users(self, team_uid):  # type: (str) -> AbstractSet[int]
+        return self._get_table('team_users')[0].get(team_uid) or frozenset()
+
+    def get_user_teams(self, enterprise_user_id):  # type: (int) -> AbstractSet[str]
+        return self._get_table('team_users')[1].get(enterprise_user_id) or frozenset()
+
+    def get_role_users(self, role_id):  # type: (int) -> AbstractSet[int]
+        return self._get_table('role_users')[0].get(role_id) or frozenset()
+
+    def get_user_roles(self, enterprise_user_id):  # type: (int) -> AbstractSet[int]
+        return self._get_table('role_users')[1].get(enterprise_user_id) or frozenset()
+
+    def get_role_teams(self, role_id):  # type: (int) -> AbstractSet[str]
+        return self._get_table('role_teams')[0].get(role_id) or frozenset()
+
+    def get_team_roles(self, team_uid):  # type: (str) -> AbstractSet[int]
+        return self._get_table('role_teams')[1].get(team_uid) or frozenset()
+
+    def get_role_managed_nodes(self, role_id):  # type: (int) -> List[dict]
+        return self._get_table('managed_nodes')[0].get(role_id) or []
+
+    def get_node_managed_nodes(self, node_id):  # type: (int) -> List[dict]
+        return self._get_table('managed_nodes')[1].get(node_id) or []
+
+    def get_role_enforcements(self, role_id):  # type: (int) -> Optional[dict]
+        return self._get_table('role_enforcements').get(role_id)
+
+
 class _EnterpriseLoader(object):
     def __init__(self, tree_key=None):
         super(_EnterpriseLoader, self).__init__()
         self._enterprise = EnterpriseInfo()
         self._enterprise._tree_key = tree_key
         self._continuationToken = b''
+        # managed company loaders are given the tree key and are not cached
+        self._use_cache = not tree_key
+        self.index = EnterpriseIndex()
         self._data_types = {   # type: dict[int, _EnterpriseDataParser]
             proto.NODES: _EnterpriseNodeEntity(self._enterprise),
             proto.USERS: _EnterpriseUserEntity(self._enterprise),
@@ -114,9 +300,12 @@ class _EnterpriseLoader(object):
         return self._enterprise
 
     def load(self, params):  # type: (KeeperParams) -> None
+        cache = enterprise_cache.get_enterprise_cache(params) if self._use_cache else None
         if params.enterprise is None:
             params.enterprise = {}
             self._continuationToken = b''
+            if cache:
+                self.restore(params, cache)
 
         if 'unencrypted_tree_key' not in params.enterprise or 'keys' not in params.enterprise:
             rq = proto.GetEnterpriseDataKeysRequest()
@@ -181,6 +370,7 @@ class _EnterpriseLoader(object):
 
             params.enterprise['keys'] = keys
         entities = set()
+        changed_names = set()    # type: Optional[Set[str]]
         while True:
             rq = proto.EnterpriseDataRequest()
             if self._continuationToken:
@@ -192,6 +382,8 @@ class _EnterpriseLoader(object):
                 for d in self._data_types.values():
                     d.clear(params)
                 self._enterprise._enterprise_name = ''
+                self.index.invalidate()
+                changed_names = None
 
             if not self._enterprise.enterprise_name and rs.generalData:
                 self._enterprise._enterprise_name = rs.generalData.enterpriseName
@@ -204,10 +396,14 @@ class _EnterpriseLoader(object):
                 parser = self._data_types.get(ed.entity)
                 if parser:
                     parser.parse(params, ed)
+                    self.index.invalidate(parser.get_entity_names())
+                    if changed_names is not None:
+                        changed_names.update(parser.get_entity_names())
 
             self._continuationToken = rs.continuationToken
             if not rs.hasMore:
                 break
+        self.index.bind(params.enterprise)
         if proto.MANAGED_NODES in entities:
             self.load_missing_role_keys(params)
         if not entities.isdisjoint([proto.MANAGED_NODES, proto.NODES, proto.ROLE_USERS]):
@@ -215,6 +411,29 @@ class _EnterpriseLoader(object):
                 del params.enterprise['user_root_nodes']
             if 'user_managed_nodes' in params.enterprise:
                 del params.enterprise['user_managed_nodes']
+        if cache:
+            if changed_names is not None:
+                changed_names.update(('keys', 'enterprise_name', 'distributor', 'role_keys', 'role_keys2'))
+            cache.save(params.enterprise, self._enterprise.tree_key, self._continuationToken, changed_names)
+
+    def restore(self, params, cache):   # type: (KeeperParams, enterprise_cache.EnterpriseCache) -> None
+        cached = cache.load()
+        if not cached:
+            return
+        tree_key, continuation_token, data = cached
+        params.enterprise.update(data)
+        params.enterprise['unencrypted_tree_key'] = tree_key
+        self._enterprise._tree_key = tree_key
+        self._enterprise._enterprise_name = params.enterprise.get('enterprise_name') or ''
+        rsa_encrypted_private_key = (params.enterprise.get('keys') or {}).get('rsa_encrypted_private_key')
+        if rsa_encrypted_private_key:
+            try:
+                self._enterprise._rsa_key = \
+                    crypto.decrypt_aes_v2(utils.base64_url_decode(rsa_encrypted_private_key), tree_key)
+            except Exception as e:
+                logging.debug('Error decrypting enterprise RSA key: %s', e)
+        self._continuationToken = continuation_token
+        self.index.invalidate()
 
     @staticmethod
     def load_missing_role_keys(params):   # type: (KeeperParams) -> None
@@ -289,6 +508,10 @@ class _EnterpriseDataParser(abc.ABC):
         if entities:
             entities.clear()
 
+    def get_entity_names(self):  # type: () -> List[str]
+        """Returns names of entity lists that parse() can change"""
+        return [self.get_keeper_entity_name()]
+
 
 class _EnterpriseEntity(_EnterpriseDataParser):
     def __init__(self, enterprise):  # type: (EnterpriseInfo) -> None
@@ -314,6 +537,11 @@ class _EnterpriseEntity(_EnterpriseDataParser):
         if isinstance(parser, _CascadeDeleteLink):
             self._links.append((keeper_entity_id_name, parser))
 
+    def get_entity_names(self):  # type: () -> List[str]
+        names = [self.get_keeper_entity_name()]
+        names.extend((x.get_keeper_entity_name() for _, x in self._links if isinstance(x, _EnterpriseDataParser)))
+        return names
+
     def parse(self, params, enterprise_data, **kwargs):  # type: (KeeperParams, proto.EnterpriseData, dict) -> None
         if not enterprise_data.data:
             return
@@ -0,0 +1,142 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import logging
+import os
+from typing import Optional, Iterable, Tuple, Dict, Set
+
+from . import utils
+from .params import KeeperParams
+from .storage.encrypted_sqlite import EncryptedSqliteStore
+
+ENTERPRISE_CACHE_CONFIG_KEY = 'enterprise_cache'
+_KEY_CHECK = b'keeper-enterprise-cache'
+
+# params.enterprise entries that are never stored: the tree key is stored encrypted in settings,
+# the node lists are recalculated on demand
+_TRANSIENT_KEYS = {'unencrypted_tree_key', 'user_root_nodes', 'user_managed_nodes'}
+# entity lists whose items keep a set in a field
+_SET_FIELDS = {'queued_team_users': 'users'}
+
+
+class EnterpriseCacheSettings:
+    def __init__(self):
+        self.continuation_token = b''
+        self.tree_key = b''
+        self.key_check = b''
+
+
+class EnterpriseCacheEntity:
+    def __init__(self):
+        self.name = ''
+        self.data = b''
+
+
+def is_enterprise_cache_enabled(params):    # type: (KeeperParams) -> bool
+    return isinstance(params.config, dict) and params.config.get(ENTERPRISE_CACHE_CONFIG_KEY) is True
+
+
+def get_enterprise_cache_database_name(params):    # type: (KeeperParams) -> str
+    path = os.path.dirname(os.path.abspath(params.config_filename or '1'))
+    return os.path.join(path, 'enterprise_cache.db')
+
+
+def get_enterprise_cache(params):    # type: (KeeperParams) -> Optional[EnterpriseCache]
+    """Returns the enterprise cache for the logged-in user or None if the cache is disabled"""
+    if not is_enterprise_cache_enabled(params) or not params.data_key or not params.account_uid_bytes:
+        return None
+    owner = utils.base64_url_encode(params.account_uid_bytes)
+    if params.enterprise_cache is None or params.enterprise_cache.owner != owner:
+        if params.enterprise_cache:
+            params.enterprise_cache.close()
+        try:
+            params.enterprise_cache = EnterpriseCache(get_enterprise_cache_database_name(params), owner, params.data_key)
+        except Exception as e:
+            logging.debug('Enterprise cache open error: %s', e)
+            params.enterprise_cache = None
+    return params.enterprise_cache
+
+
+class EnterpriseCache(EncryptedSqliteStore):
+    """Data-key-encrypted SQLite copy of the enterprise data.
+
+    Every entity list of params.enterprise is stored as a separate encrypted row.
+    The settings row keeps the tree key encrypted with the data key and
+    the continuation token of get_enterprise_data_for_user.
+    """
+    def __init__(self, database_name, owner, data_key):     # type: (str, str, bytes) -> None
+        self._stored = set()        # type: Set[str]
+        super(EnterpriseCache, self).__init__(database_name, owner, data_key, _KEY_CHECK,
+                                              EnterpriseCacheSettings, EnterpriseCacheEntity, ['name'])
+
+    def clear(self):
+        self._stored.clear()
+        super(EnterpriseCache, self).clear()
+
+    def load(self):     # type: () -> Optional[Tuple[bytes, bytes, Dict[str, any]]]
+        """Returns the tree key, the continuation token and the enterprise data or None if nothing is cached"""
+        settings = self.load_settings()
+        if not settings or not settings.continuation_token or not settings.tree_key:
+            return None
+
+        self._stored.clear()
+        enterprise = {}
+        try:
+            tree_key = self.decrypt_bytes(settings.tree_key)
+            for entity in self._entities.select_all():
+                obj = self.decrypt(entity.data)
+                field = _SET_FIELDS.get(entity.name)
+                if field and isinstance(obj, list):
+                    for item in obj:
+                        if isinstance(item, dict) and field in item:
+                            item[field] = set(item[field])
+                enterprise[entity.name] = obj
+                self._stored.add(entity.name)
+        except Exception as e:
+            self.reset(e)
+            return None
+
+        logging.debug('Enterprise cache: restored %d user(s)', len(enterprise.get('users') or []))
+        return tree_key, settings.continuation_token, enterprise
+
+    def save(self, enterprise, tree_key, continuation_token, names=None):
+        # type: (Dict[str, any], bytes, bytes, Optional[Iterable[str]]) -> None
+        """Writes enterprise data. Writes only entries identified by "names" unless it is None"""
+        try:
+            if names is None:
+                self._entities.delete_all()
+                self._stored.clear()
+                names = enterprise.keys()
+
+            to_put = []
+            to_delete = []
+            for name in set(names).difference(_TRANSIENT_KEYS):
+                if name in enterprise:
+                    entity = EnterpriseCacheEntity()
+                    entity.name = name
+                    entity.data = self.encrypt(enterprise[name])
+                    to_put.append(entity)
+                    self._stored.add(name)
+                elif name in self._stored:
+                    to_delete.append(name)
+                    self._stored.discard(name)
+
+            if to_delete:
+                self._entities.delete_by_filter('name', to_delete, multiple_criteria=True)
+            if to_put:
+                self._entities.put(to_put)
+
+            settings = EnterpriseCacheSettings()
+            settings.continuation_token = continuation_token or b''
+            settings.tree_key = self.encrypt_bytes(tree_key) if tree_key else b''
+            self.store_settings(settings)
+        except Exception as e:
+            self.reset(e)
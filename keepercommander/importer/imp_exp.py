@@ -25,7 +25,6 @@ import pathlib
 import re
 import sys
 import math
-import requests
 import time
 import tempfile
 
@@ -33,7 +32,6 @@ from typing import Iterator, List, Optional, Union, Dict, Tuple, Set, Iterable
 
 from urllib.parse import urlparse, parse_qs
 
-from .encryption_reader import EncryptionReader
 from .importer import (importer_for_format, exporter_for_format, path_components, PathDelimiter, BaseExporter,
                        BaseImporter, Record as ImportRecord, RecordField as ImportRecordField, Folder as ImportFolder,
                        SharedFolder as ImportSharedFolder, Permission as ImportPermission, BytesAttachment,
@@ -429,6 +427,7 @@ def export(params, file_format, filename, **kwargs):
     zip_archive = kwargs.get('zip_archive') is True
     if zip_archive:
         args['zip_archive'] = zip_archive
+        args['transfer_workers'] = attachment.get_transfer_workers(params)
     if save_in_vault:
         args['save_in_vault'] = True
         if 'file_password' not in args:
@@ -1329,6 +1328,7 @@ def execute_records_update(params, records):  # type: (KeeperParams, List[record
 def upload_v3_attachments(params, records_with_attachments):  # type: (KeeperParams, list) -> None
     """Interact with the API to upload v3 attachments"""
     print('Uploading v3 attachments:')
+    progress = attachment.TransferProgress(report=True)
 
     while len(records_with_attachments) > 0:
         file_attachment_chunk = 0
@@ -1385,12 +1385,18 @@ def upload_v3_attachments(params, records_with_attachments):  # type: (KeeperPar
             records_with_attachments = []
 
         if len(rq.files) == 0:
-            return
+            break
 
         rq.client_time = api.current_milli_time()
         files_add_rs = api.communicate_rest(params, rq, 'vault/files_add', rs_type=record_pb2.FilesAddResponse)
 
-        new_attachments_by_parent_uid = {}  # type: Dict[str, List[Tuple[ImportAttachment, bytes, bytes]]]
+        def upload_file(f):    # type: (record_pb2.FileAddStatus) -> None
+            file_atta, _, file_key = uid_to_attachment[f.record_uid]
+            content = attachment.encrypt_content(file_atta.open, file_key, True, file_atta.size)
+            attachment.upload_content(params, f.url, json.loads(f.parameters), 'file', file_atta.name, content,
+                                      f.success_status_code, progress)
+
+        uploads = []
         for f in files_add_rs.files:
             atta, parent_uid, file_key = uid_to_attachment[f.record_uid]
             status = record_pb2.FileAddResult.DESCRIPTOR.values_by_number[f.status].name
@@ -1399,23 +1405,22 @@ def upload_v3_attachments(params, records_with_attachments):  # type: (KeeperPar
             if not success:
                 logging.warning(f'{bcolors.FAIL}Upload of {atta.name} failed with status: {status}{bcolors.ENDC}')
                 continue
+            uploads.append(f)
 
-            with atta.open() as src:
-                with EncryptionReader.get_buffered_reader(src, file_key) as encrypted_src:
-                    form_files = {'file': (atta.name, encrypted_src, 'application/octet-stream')}
-                    form_params = json.loads(f.parameters)
-                    print(f'{atta.name} ... ', file=sys.stderr, end='', flush=True)
-                    response = requests.post(f.url, data=form_params, files=form_files)
-
-            if str(response.status_code) == form_params.get('success_action_status'):
-                print('Done')
-                new_attachments = new_attachments_by_parent_uid.get(parent_uid)
-                if new_attachments:
-                    new_attachments.append((atta, f.record_uid, file_key))
-                else:
-                    new_attachments_by_parent_uid[parent_uid] = [(atta, f.record_uid, file_key)]
+        new_attachments_by_parent_uid = {}  # type: Dict[str, List[Tuple[ImportAttachment, bytes, bytes]]]
+        for f, _, error in attachment.iter_transfers(uploads, upload_file, attachment.get_transfer_workers(params)):
+            atta, parent_uid, file_key = uid_to_attachment[f.record_uid]
+            if error:
+                print(f'{atta.name} ... Failed', file=sys.stderr)
+                logging.debug('Upload of %s failed: %s', atta.name, error)
+                continue
+            print(f'{atta.name} ... Done', file=sys.stderr)
+            progress.file_done()
+            new_attachments = new_attachments_by_parent_uid.get(parent_uid)
+            if new_attachments:
+                new_attachments.append((atta, f.record_uid, file_key))
             else:
-                print('Failed')
+                new_attachments_by_parent_uid[parent_uid] = [(atta, f.record_uid, file_key)]
 
         rec_list = []
         record_links_add = {}
@@ -1477,6 +1482,8 @@ def upload_v3_attachments(params, records_with_attachments):  # type: (KeeperPar
         api.update_records_v3(params, rec_list, record_links_by_uid={'record_links_add': record_links_add}, silent=True)
         params.sync_data = True
 
+    logging.info('Uploaded %s', progress)
+
 
 def upload_attachment(params, attachments):
     """
@@ -1486,6 +1493,7 @@ def upload_attachment(params, attachments):
     :type attachments: [(str, ImportAttachment)]
     """
     print('Uploading attachments:')
+    progress = attachment.TransferProgress(report=True)
     while len(attachments) > 0:
         chunk = attachments[:90]
         attachments = attachments[90:]
@@ -1511,38 +1519,34 @@ def upload_attachment(params, attachments):
             logging.error(e)
             return
 
-        uploaded = {}
-        crypter = crypto.StreamCrypter()
-        crypter.is_gcm = False
-        for record_id, atta in chunk:
-            if not uploads:
-                break
-
-            try:
-                upload = uploads.pop()
-                key = utils.generate_aes_key()
-                crypter.key = key
-                with atta.open() as plain, crypter.set_stream(plain, True) as encypted:
-                    files = {
-                        upload['file_parameter']: (atta.name, encypted, 'application/octet-stream')
-                    }
-                    print('{0} ... '.format(atta.name), file=sys.stderr, end='', flush=True)
-                    response = requests.post(upload['url'], files=files, data=upload['parameters'])
-                    if response.status_code == upload['success_status_code']:
-                        if record_id not in uploaded:
-                            uploaded[record_id] = []
-                        uploaded[record_id].append({
-                            'key': utils.base64_url_encode(key),
-                            'name': atta.name,
-                            'file_id': upload['file_id'],
-                            'size': crypter.bytes_read
-                        })
-                        print('Done')
-                    else:
-                        print('Failed')
+        def upload_file(item):    # type: (Tuple[Tuple[str, ImportAttachment], dict]) -> dict
+            (_, file_atta), upload = item
+            key = utils.generate_aes_key()
+            content = attachment.encrypt_content(file_atta.open, key, False, file_atta.size)
+            attachment.upload_content(params, upload['url'], upload['parameters'], upload['file_parameter'],
+                                      file_atta.name, content, upload['success_status_code'], progress)
+            return {
+                'key': utils.base64_url_encode(key),
+                'name': file_atta.name,
+                'file_id': upload['file_id'],
+                'size': content.size
+            }
 
-            except Exception as e:
-                logging.warning(e)
+        uploaded = {}
+        if not uploads:
+            continue
+        transfers = list(zip(chunk, reversed(uploads)))
+        for ((record_id, atta), _), uploaded_file, error in \
+                attachment.iter_transfers(transfers, upload_file, attachment.get_transfer_workers(params)):
+            if error:
+                print('{0} ... Failed'.format(atta.name), file=sys.stderr)
+                logging.warning(error)
+                continue
+            print('{0} ... Done'.format(atta.name), file=sys.stderr)
+            progress.file_done()
+            if record_id not in uploaded:
+                uploaded[record_id] = []
+            uploaded[record_id].append(uploaded_file)
 
         if len(uploaded) > 0:
             rq = {
@@ -1592,6 +1596,8 @@ def upload_attachment(params, attachments):
             except Exception as e:
                 logging.debug(e)
 
+    logging.info('Uploaded %s', progress)
+
 
 def prepare_folder_add(params, folders, records, manage_users, manage_records, can_edit, can_share):
     """Find what folders to import (?)."""
@@ -2565,8 +2571,7 @@ class KeeperV2Attachment(KeeperBaseAttachment):
         api.resolve_record_access_path(self.params, self.record_uid, path=rq)
         rs = api.communicate(self.params, rq)
         dl = rs['downloads'][0]
-        rs_http = requests.get(dl['url'], proxies=self.params.rest_context.proxies, stream=True)
-        return self.set_stream(rs_http.raw, for_encrypt=False)
+        return self.set_stream(attachment.HttpDownloadStream(self.params, dl['url']), for_encrypt=False)
 
 
 class KeeperV3Attachment(KeeperBaseAttachment):
@@ -2584,7 +2589,9 @@ class KeeperV3Attachment(KeeperBaseAttachment):
             raise KeeperApiError('access_denied', 'Attachment: access denied')
         self.is_gcm = file.fileKeyType == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM
         url = file.url
-        rs_http = requests.get(url, proxies=self.params.rest_context.proxies, stream=True)
-        if rs_http.status_code != file.success_status_code:
+        http_stream = attachment.HttpDownloadStream(self.params, url, file.success_status_code)
+        http_stream.read(0)
+        if http_stream.status_code != file.success_status_code:
+            http_stream.close()
             raise KeeperApiError('file_not_found', 'Attachment: file not found')
-        return self.set_stream(rs_http.raw, for_encrypt=False)
+        return self.set_stream(http_stream, for_encrypt=False)
@@ -14,6 +14,7 @@ import json
 import logging
 import os.path
 import pathlib
+import shutil
 import sys
 import zipfile
 
@@ -24,7 +25,7 @@ from .. import imp_exp
 from ..importer import (BaseFileImporter, BaseExporter, Record, RecordField, RecordSchemaField, RecordReferences,
                         Folder, SharedFolder, Permission, Team, Attachment,
                         BaseDownloadMembership, BaseDownloadRecordType, RecordType, RecordTypeField)
-from ... import api, utils, record_types
+from ... import api, attachment, utils, record_types
 from ...proto import enterprise_pb2
 
 
@@ -410,14 +411,26 @@ class KeeperJsonExporter(BaseExporter):
                 total = len(atta)
                 if total > 0:
                     logging.info('Downloading attachments...')
-                    i = 1
-                    for file_uid, at in atta.items():
+                    progress = attachment.TransferProgress(report=True)
+
+                    def download(item):
+                        with item[1].open() as fs, io.BytesIO() as buffer:
+                            shutil.copyfileobj(fs, buffer, attachment.TRANSFER_BUFFER_SIZE)
+                            progress.add_bytes(buffer.tell())
+                            return buffer.getvalue()
+
+                    workers = kwargs.get('transfer_workers') or attachment.DEFAULT_TRANSFER_WORKERS
+                    for i, ((file_uid, at), data, error) in \
+                            enumerate(attachment.iter_transfers(atta.items(), download, workers), start=1):
+                        if error:
+                            # an archive without some of its files is not a complete export
+                            logging.error(f'{i:>3} of {total:3} {at.name}: {error}')
+                            raise error
                         logging.info(f'{i:>3} of {total:3} {at.name}')
-                        i += 1
-                        with at.open() as fs:
-                            data = fs.read()
-                            if data:
-                                zf.writestr(f'files/{file_uid}', data)
+                        progress.file_done()
+                        if data:
+                            zf.writestr(f'files/{file_uid}', data)
+                    logging.info('Downloaded %s', progress)
         elif filename:
             with open(filename, mode="w", encoding='utf-8') as f:
                 json.dump(jo, f, indent=2, ensure_ascii=False)
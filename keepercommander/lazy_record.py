@@ -0,0 +1,160 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import collections
+import logging
+import threading
+from typing import Optional, Tuple, Dict, Any
+
+from . import crypto, utils
+from .params import KeeperParams
+
+LAZY_DECRYPTION_CONFIG_KEY = 'lazy_decryption'
+PLAINTEXT_CACHE_SIZE_CONFIG_KEY = 'plaintext_cache_size'
+DEFAULT_PLAINTEXT_CACHE_SIZE = 32 * 1024 * 1024
+LAZY_KEYS = frozenset(('data_unencrypted', 'extra_unencrypted'))
+
+
+def decrypt_record_data(record):    # type: (Dict[str, Any]) -> Tuple[bytes, Optional[bytes]]
+    """Decrypts record data and extra. Returns (data, extra). Extra is None for v3+ records"""
+    record_key = record['record_key_unencrypted']
+    if 'version' in record and record['version'] >= 3:
+        data = crypto.decrypt_aes_v2(utils.base64_url_decode(record['data']), record_key) if 'data' in record else b'{}'
+        return data, None
+
+    data = crypto.decrypt_aes_v1(utils.base64_url_decode(record['data']), record_key) if 'data' in record else b'{}'
+    extra = record.get('extra')
+    if extra:
+        extra = crypto.decrypt_aes_v1(utils.base64_url_decode(extra), record_key)
+    else:
+        extra = b'{}'
+    return data, extra
+
+
+def is_lazy_decryption_enabled(params):    # type: (KeeperParams) -> bool
+    return isinstance(params.config, dict) and params.config.get(LAZY_DECRYPTION_CONFIG_KEY) is True
+
+
+def get_plaintext_cache(params):    # type: (KeeperParams) -> Optional[RecordPlaintextCache]
+    """Returns the plaintext LRU if lazy record decryption is enabled"""
+    if params.plaintext_cache is None and is_lazy_decryption_enabled(params):
+        max_size = params.config.get(PLAINTEXT_CACHE_SIZE_CONFIG_KEY)
+        if not isinstance(max_size, int) or max_size <= 0:
+            max_size = DEFAULT_PLAINTEXT_CACHE_SIZE
+        params.plaintext_cache = RecordPlaintextCache(max_size)
+    return params.plaintext_cache
+
+
+class RecordPlaintextCache:
+    """Size-bounded LRU of decrypted record payloads keyed by record UID and revision"""
+    def __init__(self, max_size=DEFAULT_PLAINTEXT_CACHE_SIZE):    # type: (int) -> None
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()    # type: collections.OrderedDict
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, record):    # type: (Dict[str, Any]) -> Optional[Tuple[bytes, Optional[bytes]]]
+        """Returns (data, extra) for a record, decrypting the payload on a cache miss"""
+        if 'record_key_unencrypted' not in record:
+            return None
+        record_uid = record.get('record_uid')
+        revision = record.get('revision', 0)
+        with self._lock:
+            entry = self._entries.get(record_uid)
+            if entry and entry[0] == revision:
+                self._entries.move_to_end(record_uid)
+                self.hits += 1
+                return entry[1], entry[2]
+        try:
+            data, extra = decrypt_record_data(record)
+        except Exception as e:
+            logging.debug('Record %s data/extra decryption error: %s', record_uid, e)
+            return None
+        with self._lock:
+            self.misses += 1
+            self._remove(record_uid)
+            self._entries[record_uid] = (revision, data, extra)
+            self.size += len(data) + (len(extra) if extra else 0)
+            while self.size > self.max_size and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+        return data, extra
+
+    def _remove(self, record_uid):
+        entry = self._entries.pop(record_uid, None)
+        if entry:
+            self.size -= len(entry[1]) + (len(entry[2]) if entry[2] else 0)
+
+    def evict(self, record_uid):    # type: (str) -> None
+        with self._lock:
+            self._remove(record_uid)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class LazyRecord(dict):
+    """record_cache entry that decrypts "data_unencrypted" and "extra_unencrypted" on access.
+
+    Decrypted payloads are kept in a shared RecordPlaintextCache rather than in the entry itself.
+    Values explicitly assigned to these keys are stored in the entry as usual.
+    Membership checks do not decrypt.
+    """
+    __slots__ = ('plaintext_cache',)
+
+    def __init__(self, plaintext_cache, *args, **kwargs):    # type: (RecordPlaintextCache, ...) -> None
+        super(LazyRecord, self).__init__(*args, **kwargs)
+        self.plaintext_cache = plaintext_cache
+
+    def _get_lazy(self, key):
+        plaintext = self.plaintext_cache.get(self)
+        if plaintext is None:
+            return None
+        return plaintext[0] if key == 'data_unencrypted' else plaintext[1]
+
+    def __getitem__(self, key):
+        if key in LAZY_KEYS and not dict.__contains__(self, key):
+            value = self._get_lazy(key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if key in LAZY_KEYS and not dict.__contains__(self, key):
+            # answered without decrypting: the payload is available once the record key is resolved
+            if not dict.__contains__(self, 'record_key_unencrypted'):
+                return False
+            return key == 'data_unencrypted' or dict.get(self, 'version', 0) < 3
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if key in LAZY_KEYS and not dict.__contains__(self, key):
+            value = self._get_lazy(key)
+            return default if value is None else value
+        return dict.get(self, key, default)
+
+    def __delitem__(self, key):
+        if key in LAZY_KEYS:
+            self.plaintext_cache.evict(self.get('record_uid'))
+            if dict.__contains__(self, key):
+                dict.__delitem__(self, key)
+            return
+        dict.__delitem__(self, key)
+
+    def is_decrypted(self):    # type: () -> bool
+        return dict.__contains__(self, 'data_unencrypted')
@@ -7,17 +7,24 @@
 # Keeper Commander 
 # Contact: ops@keepersecurity.com
 #
+import collections
+import threading
 import warnings
 from datetime import datetime
-from typing import Dict, NamedTuple, Optional, Set
+from typing import Dict, NamedTuple, Optional, Set, Iterable, List, Tuple
 from urllib.parse import urlparse, urlunparse
 
+import requests
+from requests.adapters import HTTPAdapter
 from urllib3.exceptions import InsecureRequestWarning
 
+from .throttle import RateGovernor
+
 LAST_RECORD_UID = 'last_record_uid'
 LAST_SHARED_FOLDER_UID = 'last_shared_folder_uid'
 LAST_FOLDER_UID = 'last_folder_uid'
 LAST_TEAM_UID = 'last_team_uid'
+DEFAULT_HTTP_POOL_SIZE = 10
 
 
 class PublicKeys(NamedTuple):
@@ -31,6 +38,159 @@ class RecordOwner(NamedTuple):
     account_uid: str
 
 
+class FolderRecordSet(set):
+    """Record UIDs stored in a folder. Changes are reported to the owning FolderRecordCache."""
+    def __init__(self, owner, folder_uid, record_uids=None):
+        # type: (Optional[FolderRecordCache], str, Optional[Iterable[str]]) -> None
+        super().__init__()
+        self._owner = owner
+        self.folder_uid = folder_uid
+        if record_uids:
+            self.update(record_uids)
+
+    def __reduce__(self):
+        return set, (list(self),)
+
+    def add(self, record_uid):
+        if record_uid not in self:
+            super().add(record_uid)
+            if self._owner is not None:
+                self._owner._link(record_uid, self.folder_uid)
+
+    def discard(self, record_uid):
+        if record_uid in self:
+            super().discard(record_uid)
+            if self._owner is not None:
+                self._owner._unlink(record_uid, self.folder_uid)
+
+    def remove(self, record_uid):
+        if record_uid not in self:
+            raise KeyError(record_uid)
+        self.discard(record_uid)
+
+    def pop(self):
+        if len(self) == 0:
+            raise KeyError('pop from an empty set')
+        record_uid = next(iter(self))
+        self.discard(record_uid)
+        return record_uid
+
+    def clear(self):
+        for record_uid in list(self):
+            self.discard(record_uid)
+
+    def update(self, *others):
+        for other in others:
+            for record_uid in other:
+                self.add(record_uid)
+
+    def difference_update(self, *others):
+        for other in others:
+            for record_uid in other:
+                self.discard(record_uid)
+
+    def intersection_update(self, *others):
+        keep = set(self).intersection(*others)
+        for record_uid in list(self):
+            if record_uid not in keep:
+                self.discard(record_uid)
+
+    def symmetric_difference_update(self, other):
+        for record_uid in set(other):
+            if record_uid in self:
+                self.discard(record_uid)
+            else:
+                self.add(record_uid)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __iand__(self, other):
+        self.intersection_update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __ixor__(self, other):
+        self.symmetric_difference_update(other)
+        return self
+
+
+class FolderRecordCache(dict):
+    """Maps folder UID to the record UIDs it contains. The root folder UID is ''.
+
+    Keeps a record UID to folder UIDs reverse index that is updated by every change to the map.
+    """
+    def __init__(self):
+        super().__init__()
+        self._record_folders = {}    # type: Dict[str, Dict[str, None]]
+
+    def __reduce__(self):
+        return FolderRecordCache, (), None, None, iter(self.items())
+
+    def _link(self, record_uid, folder_uid):    # type: (str, str) -> None
+        folders = self._record_folders.get(record_uid)
+        if folders is None:
+            folders = {}
+            self._record_folders[record_uid] = folders
+        folders[folder_uid] = None
+
+    def _unlink(self, record_uid, folder_uid):    # type: (str, str) -> None
+        folders = self._record_folders.get(record_uid)
+        if folders is not None:
+            folders.pop(folder_uid, None)
+            if not folders:
+                del self._record_folders[record_uid]
+
+    def _detach(self, record_uids):    # type: (Set[str]) -> None
+        if isinstance(record_uids, FolderRecordSet):
+            record_uids._owner = None
+            for record_uid in record_uids:
+                self._unlink(record_uid, record_uids.folder_uid)
+
+    def get_folders(self, record_uid):    # type: (str) -> List[str]
+        """Returns UIDs of folders that contain the record"""
+        folders = self._record_folders.get(record_uid)
+        return list(folders) if folders else []
+
+    def __setitem__(self, folder_uid, record_uids):    # type: (str, Iterable[str]) -> None
+        if folder_uid in self:
+            self._detach(super().__getitem__(folder_uid))
+        super().__setitem__(folder_uid, FolderRecordSet(self, folder_uid, record_uids))
+
+    def __delitem__(self, folder_uid):
+        self._detach(super().__getitem__(folder_uid))
+        super().__delitem__(folder_uid)
+
+    def pop(self, folder_uid, *args):
+        if folder_uid in self:
+            self._detach(super().__getitem__(folder_uid))
+        return super().pop(folder_uid, *args)
+
+    def popitem(self):
+        folder_uid, record_uids = super().popitem()
+        self._detach(record_uids)
+        return folder_uid, record_uids
+
+    def setdefault(self, folder_uid, record_uids=None):
+        if folder_uid not in self:
+            self[folder_uid] = record_uids or ()
+        return self[folder_uid]
+
+    def update(self, *args, **kwargs):
+        for folder_uid, record_uids in dict(*args, **kwargs).items():
+            self[folder_uid] = record_uids
+
+    def clear(self):
+        for record_uids in self.values():
+            record_uids._owner = None
+        super().clear()
+        self._record_folders.clear()
+
+
 class RestApiContext:
     def __init__(self, server='https://keepersecurity.com/api/v2/', locale='en_US'):
         self.server_base = server
@@ -41,6 +201,15 @@ class RestApiContext:
         self.proxies = None
         self._certificate_check = True
         self.fail_on_throttle = False
+        self.governor = RateGovernor()
+        self.transmission_key_max_requests = 0
+        self.transmission_key_max_age = 0
+        self.transmission_key_cache = None    # type: Optional[tuple]
+        # guards transmission_key and transmission_key_cache shared by concurrent requests
+        self.transmission_key_lock = threading.Lock()
+        self.pool_size = DEFAULT_HTTP_POOL_SIZE
+        self.keep_alive = True
+        self.__session = None    # type: Optional[requests.Session]
 
     def __get_server_base(self):
         return self.__server_base
@@ -61,6 +230,23 @@ class RestApiContext:
     def __get_store_server_key(self):
         return self.__store_server_key
 
+    def get_session(self):    # type: () -> requests.Session
+        """Returns the pooled HTTP session shared by all requests made through this context"""
+        if self.__session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+            self.__session = session
+        return self.__session
+
+    def close_session(self):
+        if self.__session is not None:
+            self.__session.close()
+            self.__session = None
+
     def set_proxy(self, proxy_server):
         if proxy_server:
             self.proxies = {
@@ -110,7 +296,12 @@ class KeeperParams:
         self.enterprise_rsa_key = None
         self.revision = 0
         self.sync_down_token = None    # type: Optional[bytes]
+        self.vault_cache = None
+        self.enterprise_cache = None
+        self.plaintext_cache = None
+        self.search_index = None
         self.record_cache = {}
+        self.record_object_cache = collections.OrderedDict()  # type: Dict[str, tuple]
         self.meta_data_cache = {}
         self.non_shared_data_cache = {}
         self.shared_folder_cache = {}
@@ -123,10 +314,11 @@ class KeeperParams:
         self.available_team_cache = None
         self.user_cache = {}
         self.subfolder_cache = {}
-        self.subfolder_record_cache = {}   # type: Dict[str, Set[str]]
+        self.subfolder_record_cache = FolderRecordCache()   # type: Dict[str, Set[str]]
         self.root_folder = None
         self.current_folder = None
         self.folder_cache = {}
+        self.folder_path_cache = {}    # type: Dict[Tuple[str, str], str]
         self.debug = False
         self.timedelay = 0
         self.sync_data = True
@@ -137,6 +329,7 @@ class KeeperParams:
         self.automators = None
         self.is_enterprise_admin = False
         self.enterprise_loader = None
+        self.enterprise_index = None
         self.enterprise_id = 0
         self.msp_tree_key = None
         self.batch_mode = False
@@ -185,7 +378,19 @@ class KeeperParams:
         self.enterprise_rsa_key = None
         self.revision = 0
         self.sync_down_token = None
+        self.__rest_context.close_session()
+        if self.vault_cache:
+            self.vault_cache.close()
+            self.vault_cache = None
+        if self.enterprise_cache:
+            self.enterprise_cache.close()
+            self.enterprise_cache = None
+        if self.plaintext_cache is not None:
+            self.plaintext_cache.clear()
+            self.plaintext_cache = None
+        self.search_index = None
         self.record_cache.clear()
+        self.record_object_cache.clear()
         self.meta_data_cache.clear()
         self.non_shared_data_cache.clear()
         self.shared_folder_cache.clear()
@@ -200,6 +405,7 @@ class KeeperParams:
         self.subfolder_record_cache.clear()
         if self.folder_cache:
             self.folder_cache.clear()
+        self.folder_path_cache.clear()
         self.user_cache.clear()
         self.root_folder = None
         self.current_folder = None
@@ -211,6 +417,7 @@ class KeeperParams:
         self.enterprise = None
         self.automators = None
         self.enterprise_loader = None
+        self.enterprise_index = None
         self.enterprise_id = 0
         self.msp_tree_key = None
         self.pending_share_requests.clear()
@@ -16,7 +16,7 @@ import logging
 import ssl
 import time
 
-from typing import Union, Dict, Optional
+from typing import Union, Dict, Optional, Tuple
 
 from .params import RestApiContext
 from .error import KeeperApiError, Error
@@ -29,6 +29,7 @@ from . import __version__
 
 # CLIENT_VERSION = 'c' + __version__
 CLIENT_VERSION = 'c17.1.0'
+V2_COMMAND_ENDPOINT = 'vault/execute_v2_command'
 
 SERVER_PUBLIC_KEYS = {
     1: crypto.load_rsa_public_key(utils.base64_url_decode(
@@ -114,11 +115,42 @@ SERVER_PUBLIC_KEYS = {
 }   # type: Dict[int, Union[rsa.RSAPublicKey, ec.EllipticCurvePublicKey]]
 
 
+def get_transmission_key(context):    # type: (RestApiContext) -> Tuple[bytes, bytes]
+    """Returns the transmission key and the transmission key wrapped with the current server public key.
+
+    The wrapped key is cached per (transmission key, server key id). When rotation is configured with
+    transmission_key_max_requests or transmission_key_max_age (seconds) a new transmission key is generated
+    once either limit is reached. Concurrent requests share the cache under context.transmission_key_lock.
+    """
+    with context.transmission_key_lock:
+        cached = context.transmission_key_cache
+        if cached and context.transmission_key:
+            key, key_id, encrypted_key, created, requests_sent = cached
+            expired = 0 < context.transmission_key_max_requests <= requests_sent or \
+                (context.transmission_key_max_age > 0 and time.time() - created >= context.transmission_key_max_age)
+            if expired:
+                logging.debug('Rotating transmission key')
+                context.transmission_key = None
+            elif key == context.transmission_key and key_id == context.server_key_id:
+                context.transmission_key_cache = (key, key_id, encrypted_key, created, requests_sent + 1)
+                return key, encrypted_key
+
+        if not context.transmission_key:
+            context.transmission_key = os.urandom(32)
+        transmission_key = context.transmission_key
+        server_public_key = SERVER_PUBLIC_KEYS[context.server_key_id]
+        if isinstance(server_public_key, rsa.RSAPublicKey):
+            encrypted_key = crypto.encrypt_rsa(transmission_key, server_public_key)
+        elif isinstance(server_public_key, ec.EllipticCurvePublicKey):
+            encrypted_key = crypto.encrypt_ec(transmission_key, server_public_key)
+        else:
+            raise ValueError('Invalid server public key')
+        context.transmission_key_cache = (transmission_key, context.server_key_id, encrypted_key, time.time(), 1)
+        return transmission_key, encrypted_key
+
+
 def execute_rest(context, endpoint, payload):
     # type: (RestApiContext, str, proto.ApiRequestPayload) -> Union[bytes, dict]
-    if not context.transmission_key:
-        context.transmission_key = os.urandom(32)
-
     if not context.server_key_id:
         context.server_key_id = 7
 
@@ -127,17 +159,11 @@ def execute_rest(context, endpoint, payload):
         run_request = False
 
         api_request = proto.ApiRequest()
-        server_public_key = SERVER_PUBLIC_KEYS[context.server_key_id]
-        if isinstance(server_public_key, rsa.RSAPublicKey):
-            api_request.encryptedTransmissionKey = crypto.encrypt_rsa(context.transmission_key, server_public_key)
-        elif isinstance(server_public_key, ec.EllipticCurvePublicKey):
-            api_request.encryptedTransmissionKey = crypto.encrypt_ec(context.transmission_key, server_public_key)
-        else:
-            raise ValueError('Invalid server public key')
+        transmission_key, api_request.encryptedTransmissionKey = get_transmission_key(context)
         api_request.publicKeyId = context.server_key_id
         api_request.locale = context.locale or 'en_US'
 
-        api_request.encryptedPayload = crypto.encrypt_aes_v2(payload.SerializeToString(), context.transmission_key)
+        api_request.encryptedPayload = crypto.encrypt_aes_v2(payload.SerializeToString(), transmission_key)
 
         request_data = api_request.SerializeToString()
         if endpoint.startswith('https://'):
@@ -145,9 +171,10 @@ def execute_rest(context, endpoint, payload):
         else:
             url = context.server_base + endpoint
 
+        context.governor.acquire(endpoint)
         try:
-            rs = requests.post(url, data=request_data, headers={'Content-Type': 'application/octet-stream'},
-                               proxies=context.proxies, verify=context.certificate_check)
+            rs = context.get_session().post(url, data=request_data, headers={'Content-Type': 'application/octet-stream'},
+                                             proxies=context.proxies, verify=context.certificate_check)
         except requests.exceptions.SSLError as e:
             doc_url = 'https://docs.keeper.io/secrets-manager/commander-cli/using-commander/troubleshooting-commander-cli#ssl-certificate-errors'
             if len(e.args) > 0:
@@ -164,12 +191,15 @@ def execute_rest(context, endpoint, payload):
 
         content_type = rs.headers.get('Content-Type') or ''
         if rs.status_code == 200:
+            # v2 commands report throttling in the response body: v2_execute records their success
+            if endpoint != V2_COMMAND_ENDPOINT:
+                context.governor.success(endpoint)
             if content_type == 'application/json':
                 return rs.json()
 
             rs_body = rs.content
             if rs_body:
-                rs_body = crypto.decrypt_aes_v2(rs.content, context.transmission_key)
+                rs_body = crypto.decrypt_aes_v2(rs.content, transmission_key)
             return rs_body
         elif rs.status_code >= 400:
             if content_type.startswith('application/json'):
@@ -179,13 +209,14 @@ def execute_rest(context, endpoint, payload):
                     if failure.get('error') == 'key':
                         server_key_id = failure['key_id']
                         if server_key_id != context.server_key_id:
-                            context.server_key_id = server_key_id
+                            with context.transmission_key_lock:
+                                context.server_key_id = server_key_id
+                                context.transmission_key_cache = None
                             run_request = True
                             continue
                 elif rs.status_code == 403:
                     if failure.get('error') == 'throttled' and not context.fail_on_throttle:
-                        logging.info('Throttled. sleeping for 10 seconds')
-                        time.sleep(10)
+                        context.governor.throttled(endpoint)
                         run_request = True
                         continue
                 return failure
@@ -198,15 +229,27 @@ def execute_rest(context, endpoint, payload):
                 raise KeeperApiError(rs.status_code, rs.reason)
 
 
+def is_throttled_response(rs):    # type: (dict) -> bool
+    """Tells whether a v2 command, or the last request of an "execute" command, was throttled"""
+    if rs.get('result') != 'success':
+        return rs.get('result_code') == 'throttled'
+    results = rs.get('results')
+    if isinstance(results, list) and len(results) > 0 and isinstance(results[-1], dict):
+        return results[-1].get('result') != 'success' and results[-1].get('result_code') == 'throttled'
+    return False
+
+
 def v2_execute(context, rq):
     # type: (RestApiContext, dict) -> dict
 
     api_request_payload = proto.ApiRequestPayload()
     api_request_payload.payload = json.dumps(rq).encode('utf-8')
-    rs_data = execute_rest(context, 'vault/execute_v2_command', api_request_payload)
+    rs_data = execute_rest(context, V2_COMMAND_ENDPOINT, api_request_payload)
     if rs_data:
         if type(rs_data) is bytes:
             rs = json.loads(rs_data.decode('utf-8'))
+            if not is_throttled_response(rs):
+                context.governor.success(V2_COMMAND_ENDPOINT)
             logger = logging.getLogger()
             if logger.level <= logging.DEBUG:
                 logger.debug('>>> Request JSON: [%s]', json.dumps(rq, sort_keys=True, indent=4))
@@ -10,12 +10,13 @@
 #
 
 import argparse
+import hashlib
 import importlib
 import json
 import logging
 import os
 import pathlib
-import shutil
+import stat
 
 from types import ModuleType
 from typing import Dict, List, Optional
@@ -23,7 +24,68 @@ from typing import Dict, List, Optional
 from . import rsync
 from ..commands.base import Command, RecordMixin, user_choice
 from ..error import CommandError
-from .. import vault
+from .. import attachment, vault
+
+RSYNC_MANIFEST_NAME = '.rsync.manifest.json'
+DEFAULT_RSYNC_WORKERS = 4
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def stat_local_file(file_path):    # type: (str) -> Optional[os.stat_result]
+    """Returns the stat of a regular file or None if the file does not exist"""
+    try:
+        stat_rs = os.stat(file_path)
+    except OSError:
+        return None
+    return stat_rs if stat.S_ISREG(stat_rs.st_mode) else None
+
+
+def is_local_file_current(remote_entry, local_stat, file_info):
+    # type: (rsync.RSyncFileEntry, Optional[os.stat_result], Optional[dict]) -> bool
+    """Quick check of a local file against the remote entry and the manifest entry of the last sync.
+
+    If the remote file has not changed since the last sync, the local file is current while its size and mtime
+    match the manifest. This also detects local changes of files whose remote mtime is unknown.
+    Otherwise the local file is compared to the remote entry.
+    """
+    if local_stat is None or local_stat.st_size != remote_entry.size:
+        return False
+    local_mtime = int(local_stat.st_mtime)
+    if isinstance(file_info, dict) and 'local_mtime' in file_info and \
+            file_info.get('size') == remote_entry.size and file_info.get('mtime') == remote_entry.last_modified:
+        return file_info['local_mtime'] == local_mtime
+    return remote_entry.last_modified <= 0 or local_mtime == remote_entry.last_modified
+
+
+def get_file_hash(file_path):    # type: (str) -> str
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def load_manifest(manifest_path, remote_path):    # type: (str, str) -> Dict[str, dict]
+    """Returns file entries of the last sync: path -> {"size", "mtime", "local_mtime", "hash"}"""
+    if not os.path.isfile(manifest_path):
+        return {}
+    try:
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict) and manifest.get('remote_path') == remote_path:
+            files = manifest.get('files')
+            if isinstance(files, dict):
+                return files
+    except Exception as e:
+        logging.debug('rsync manifest load error: %s', e)
+    return {}
+
+
+def save_manifest(manifest_path, remote_path, files):    # type: (str, str, Dict[str, dict]) -> None
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'remote_path': remote_path, 'files': files}, f, separators=(',', ':'))
+    os.replace(temp_path, manifest_path)
 
 
 def register_commands(commands):
@@ -43,6 +105,10 @@ rsync_parser.add_argument('--remote-path', dest='remote_path', action='store',
 rsync_parser.add_argument('--record', action='store',
                           help='record UID or path with credentials, Optional once configured.')
 rsync_parser.add_argument('--force', dest='force', action='store_true', help='do not prompt for confirmation')
+rsync_parser.add_argument('--checksum', dest='checksum', action='store_true',
+                          help='verify content hash of unchanged local files')
+rsync_parser.add_argument('--workers', dest='workers', type=int, action='store',
+                          help=f'number of concurrent downloads. Default: {DEFAULT_RSYNC_WORKERS}')
 rsync_parser.add_argument('local_path', nargs='?', type=str, action='store', help='local rsync directory. Required')
 
 
@@ -158,54 +224,91 @@ class RSyncCommand(Command, RecordMixin):
             rsync_info['remote_path'] = remote_path
             should_save = True
 
-        local_entries = {}   # type: Dict[str, rsync.RSyncFileEntry]
-        for e in os.walk(local_path):
-            current_dir = os.path.abspath(e[0])
-            current_dir = os.path.join(current_dir, '')
-            for name in e[2]:
-                if name.startswith('.'):
-                    continue
-                full_path = os.path.join(current_dir, name)
-                rel_path = full_path[len(local_path):]
-                entry = rsync.RSyncFileEntry(rel_path)
-                stat_rs = os.stat(full_path)
-                entry.size = stat_rs.st_size
-                entry.last_modified = int(stat_rs.st_mtime)
-                local_entries[entry.path] = entry
+        manifest_path = os.path.join(local_path, RSYNC_MANIFEST_NAME)
+        manifest = load_manifest(manifest_path, remote_path)
+        checksum = kwargs.get('checksum') is True
 
         plugin.connect(record)
+        synced = {}    # type: Dict[str, dict]
+        completed = False
         try:
             to_download = []   # type: List[rsync.RSyncFileEntry]
             for remote_entry in plugin.get_entries(remote_path):
-                if remote_entry.path in local_entries:
-                    local_entry = local_entries[remote_entry.path]
-                    if remote_entry.size != local_entry.size:
-                        to_download.append(remote_entry)
-                    del local_entries[remote_entry.path]
-                else:
+                # only files that exist remotely are checked: the local tree is not walked
+                local_file = os.path.join(local_path, remote_entry.path)
+                local_stat = stat_local_file(local_file)
+                file_info = manifest.get(remote_entry.path)
+                if not is_local_file_current(remote_entry, local_stat, file_info):
                     to_download.append(remote_entry)
+                    continue
+                if not isinstance(file_info, dict) or file_info.get('size') != remote_entry.size or \
+                        file_info.get('mtime') != remote_entry.last_modified:
+                    file_info = {'size': remote_entry.size, 'mtime': remote_entry.last_modified}
+                file_info['local_mtime'] = int(local_stat.st_mtime)
+                if checksum:
+                    file_hash = get_file_hash(local_file)
+                    if file_info.get('hash', file_hash) != file_hash:
+                        to_download.append(remote_entry)
+                        continue
+                    file_info['hash'] = file_hash
+                synced[remote_entry.path] = file_info
 
             if len(to_download) > 0:
                 logging.info('Downloading %d file(s):', len(to_download))
                 verified_folders = set()
                 for file in to_download:
-                    absolute_path = os.path.join(local_path, file.path)
-                    logging.info(absolute_path)
-                    folder_name = os.path.dirname(absolute_path)
+                    folder_name = os.path.dirname(os.path.join(local_path, file.path))
                     if folder_name not in verified_folders:
-                        if not os.path.isdir(folder_name):
-                            pathlib.Path(folder_name).mkdir(parents=True, exist_ok=True)
+                        pathlib.Path(folder_name).mkdir(parents=True, exist_ok=True)
                         verified_folders.add(folder_name)
-                    with plugin.get_entry_stream(file) as src, open(absolute_path, 'wb') as dst:
-                        shutil.copyfileobj(src, dst, 100 * 1024)
-                    if file.last_modified > 0:
-                        os.utime(absolute_path, (file.last_modified, file.last_modified))
+
+                progress = attachment.TransferProgress(report=True)
+
+                def download(file):    # type: (rsync.RSyncFileEntry) -> dict
+                    absolute_path = os.path.join(local_path, file.path)
+                    folder, name = os.path.split(absolute_path)
+                    temp_path = os.path.join(folder, f'.{name}.rsync')
+                    hasher = hashlib.sha256()
+                    try:
+                        with plugin.get_entry_stream(file) as src, open(temp_path, 'wb') as dst:
+                            for chunk in iter(lambda: src.read(COPY_BUFFER_SIZE), b''):
+                                dst.write(chunk)
+                                hasher.update(chunk)
+                                progress.add_bytes(len(chunk))
+                        if file.last_modified > 0:
+                            os.utime(temp_path, (file.last_modified, file.last_modified))
+                        os.replace(temp_path, absolute_path)
+                    finally:
+                        if os.path.isfile(temp_path):
+                            os.remove(temp_path)
+                    return {'size': file.size, 'mtime': file.last_modified,
+                            'local_mtime': int(os.stat(absolute_path).st_mtime), 'hash': hasher.hexdigest()}
+
+                workers = 1
+                if plugin.supports_concurrent_streams():
+                    workers = kwargs.get('workers') or DEFAULT_RSYNC_WORKERS
+                failed = 0
+                for file, file_info, error in attachment.iter_transfers(to_download, download, workers):
+                    if error:
+                        failed += 1
+                        logging.warning('%s: %s', file.path, error)
+                        continue
+                    logging.info(os.path.join(local_path, file.path))
+                    progress.file_done()
+                    synced[file.path] = file_info
+                logging.info('Downloaded %s', progress)
+                if failed > 0:
+                    logging.warning('Failed to download %d file(s)', failed)
             logging.info('Successfully synced using \"%s\" record.', record.title)
+            completed = True
         finally:
             plugin.disconnect()
             if should_save:
                 with open(rsync_info_path, 'w') as f:
                     json.dump(rsync_info, f, indent=4)
+            if not completed:
+                synced = {**manifest, **synced}
+            save_manifest(manifest_path, remote_path, synced)
 
     @staticmethod
     def load_plugin(plugin_name):    # type: (str) -> ModuleType
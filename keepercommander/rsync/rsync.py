@@ -39,3 +39,7 @@ class RSyncPluginBase(abc.ABC):
     @abc.abstractmethod
     def get_entry_stream(self, entry):    # type: (RSyncFileEntry) -> BinaryIO
         pass
+
+    def supports_concurrent_streams(self):    # type: () -> bool
+        """Returns True if get_entry_stream can be called from several threads at once"""
+        return False
@@ -16,8 +16,9 @@
 
 import logging
 import stat
+import threading
 
-from typing import Optional
+from typing import Optional, List
 
 from paramiko.sftp_client import SFTPClient
 from paramiko import Transport
@@ -30,7 +31,11 @@ logging.getLogger("paramiko").setLevel(logging.WARNING)
 
 class SFtpPlugin(rsync.RSyncPluginBase):
     def __init__(self):
+        self._transport = None   # type: Optional[Transport]
         self._client = None      # type: Optional[SFTPClient]
+        self._thread_clients = []    # type: List[SFTPClient]
+        self._local = threading.local()
+        self._lock = threading.Lock()
 
     def connect(self, record):
         self.disconnect()
@@ -61,12 +66,36 @@ class SFtpPlugin(rsync.RSyncPluginBase):
 
         transport.connect(None, username, password)
         client = SFTPClient.from_transport(transport)
+        self._transport = transport
         self._client = client
 
     def disconnect(self):
+        with self._lock:
+            for client in self._thread_clients:
+                client.close()
+            self._thread_clients.clear()
+        self._local = threading.local()
         if self._client:
             self._client.close()
             self._client = None
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    def supports_concurrent_streams(self):
+        return True
+
+    def _get_thread_client(self):    # type: () -> SFTPClient
+        if threading.current_thread() is threading.main_thread():
+            return self._client
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            # every thread reads through its own SFTP channel of the shared transport
+            client = SFTPClient.from_transport(self._transport)
+            self._local.client = client
+            with self._lock:
+                self._thread_clients.append(client)
+        return client
 
     def get_entries(self, root_dir=None):
         if not self._client:
@@ -101,4 +130,6 @@ class SFtpPlugin(rsync.RSyncPluginBase):
     def get_entry_stream(self, entry):
         if not self._client:
             raise Exception('Not connected')
-        return self._client.open(entry.full_path)
+        stream = self._get_thread_client().open(entry.full_path, 'rb')
+        stream.prefetch(entry.size or None)
+        return stream
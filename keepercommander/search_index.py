@@ -0,0 +1,184 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import logging
+from typing import Optional, Dict, Set, FrozenSet, Iterable, Callable, Any
+
+from . import utils
+from .params import KeeperParams
+from .proto import SyncDown_pb2
+
+MIN_QUERY_LENGTH = 3
+REGEX_SPECIAL_CHARACTERS = frozenset('.^$*+?{}[]\\|()')
+# non-ASCII characters that re.IGNORECASE matches to ASCII letters and str.lower() does not map
+CASE_FOLD_TABLE = {0x131: 'i', 0x17f: 's'}
+
+
+def get_literal(pattern):    # type: (Optional[str]) -> Optional[str]
+    """Returns the lower-cased search literal if a pattern can be answered by the trigram index"""
+    if not pattern or len(pattern) < MIN_QUERY_LENGTH:
+        return None
+    if not pattern.isascii():
+        return None
+    if any(True for x in pattern if x in REGEX_SPECIAL_CHARACTERS):
+        return None
+    return pattern.lower()
+
+
+def _trigrams(text):    # type: (str) -> Set[str]
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+def normalize_text(text):    # type: (str) -> str
+    text = text.lower()
+    if not text.isascii():
+        text = text.translate(CASE_FOLD_TABLE)
+    return text
+
+
+class TrigramIndex:
+    """Trigram index over lower-cased document text.
+
+    Only trigram postings are kept, not the document text. Candidates must be verified against the source.
+    """
+    def __init__(self):
+        self.documents = {}      # type: Dict[str, FrozenSet[str]]
+        self.postings = {}       # type: Dict[str, Set[str]]
+        self.stale = set()       # type: Set[str]
+        self.reconcile = True
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, uid, text):    # type: (str, Optional[str]) -> None
+        self.remove(uid)
+        trigrams = frozenset(_trigrams(normalize_text(text))) if text else frozenset()
+        for trigram in trigrams:
+            uids = self.postings.get(trigram)
+            if uids is None:
+                uids = set()
+                self.postings[trigram] = uids
+            uids.add(uid)
+        self.documents[uid] = trigrams
+
+    def remove(self, uid):    # type: (str) -> None
+        self.stale.discard(uid)
+        trigrams = self.documents.pop(uid, None)
+        if trigrams:
+            for trigram in trigrams:
+                uids = self.postings.get(trigram)
+                if uids is not None:
+                    uids.discard(uid)
+                    if not uids:
+                        del self.postings[trigram]
+
+    def search(self, literal):    # type: (str) -> Set[str]
+        """Returns UIDs of documents that may contain the lower-cased literal"""
+        postings = []
+        for trigram in _trigrams(literal):
+            uids = self.postings.get(trigram)
+            if not uids:
+                return set()
+            postings.append(uids)
+        postings.sort(key=len)
+        result = set(postings[0])
+        for uids in postings[1:]:
+            result.intersection_update(uids)
+            if not result:
+                break
+        return result
+
+    def refresh(self, source, get_text):    # type: (Dict[str, Any], Callable[[str], Optional[str]]) -> None
+        """Brings the index in sync with a cache.
+
+        Stale entries are re-indexed or dropped. The whole cache is compared with the index only
+        on first use and after reconcile is set, i.e. once per sync_down.
+        """
+        uids = set(self.stale)
+        if self.reconcile:
+            uids.update(self.documents.keys() - source.keys())
+            uids.update(source.keys() - self.documents.keys())
+            self.reconcile = False
+        for uid in uids:
+            if uid in source:
+                self.add(uid, get_text(uid))
+            else:
+                self.remove(uid)
+        self.stale.clear()
+
+
+class VaultSearchIndex:
+    """Search indexes over the vault caches, one per document kind.
+
+    Indexes are built on first use and kept current by sync_down through invalidate().
+    """
+    def __init__(self):
+        self.indexes = {}    # type: Dict[str, TrigramIndex]
+
+    def clear(self):
+        self.indexes.clear()
+
+    def invalidate(self, uids):    # type: (Iterable[str]) -> None
+        """Marks documents as changed. Caches may also have lost entries, so indexes reconcile on next use."""
+        uids = set(uids)
+        for index in self.indexes.values():
+            index.stale.update(uids)
+            index.reconcile = True
+
+    def find(self, name, source, literal, get_text):
+        # type: (str, Dict[str, Any], str, Callable[[str], Optional[str]]) -> Set[str]
+        index = self.indexes.get(name)
+        if index is None:
+            index = TrigramIndex()
+            self.indexes[name] = index
+        index.refresh(source, get_text)
+        return index.search(literal)
+
+
+def get_search_index(params):    # type: (KeeperParams) -> VaultSearchIndex
+    if params.search_index is None:
+        params.search_index = VaultSearchIndex()
+    return params.search_index
+
+
+def find_candidates(params, name, source, pattern, get_text):
+    # type: (KeeperParams, str, Dict[str, Any], Optional[str], Callable[[str], Optional[str]]) -> Optional[Iterable[str]]
+    """Returns UIDs in source order that may match a search pattern or None if the pattern requires a full scan.
+
+    get_text returns the searchable text of a cache entry. Candidates must be verified by the caller.
+    """
+    literal = get_literal(pattern)
+    if literal is None:
+        return None
+    uids = get_search_index(params).find(name, source, literal, get_text)
+    logging.debug('Search index "%s": %d of %d candidates', name, len(uids), len(source))
+    # candidates keep the order of source so that results do not depend on set iteration order
+    return [x for x in source if x in uids]
+
+
+def invalidate(params, response):    # type: (KeeperParams, SyncDown_pb2.SyncDownResponse) -> None
+    """Marks search documents changed by a sync_down response as stale"""
+    if params.search_index is None:
+        return
+    if response.cacheStatus == SyncDown_pb2.CLEAR:
+        params.search_index.clear()
+        return
+
+    encode = utils.base64_url_encode
+    uids = set()
+    uids.update((encode(x.recordUid) for x in response.records))
+    uids.update((encode(x.sharedFolderUid) for x in response.sharedFolders))
+    uids.update((encode(x.sharedFolderUid) for x in response.sharedFolderUsers))
+    uids.update((encode(x.sharedFolderUid) for x in response.sharedFolderTeams))
+    uids.update((encode(x.sharedFolderUid) for x in response.removedSharedFolderUsers))
+    uids.update((encode(x.sharedFolderUid) for x in response.removedSharedFolderTeams))
+    uids.update((encode(x.teamUid) for x in response.teams))
+    params.search_index.invalidate(uids)
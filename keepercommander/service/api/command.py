@@ -9,10 +9,26 @@
 # Contact: ops@keepersecurity.com
 #
 
-from flask import Blueprint, request, jsonify
+import hashlib
+from flask import Blueprint, Response, request, jsonify, send_file
 from html import escape
-from ..decorators.unified import unified_api_decorator
+from ..core.globals import get_job_queue
+from ..core.job_queue import Job, JobQueueFullError, is_long_running
+from ..decorators.unified import unified_api_decorator, job_api_decorator
 from ..util.command_util import CommandExecutor
+from ..util.parse_keeper_response import stream_json
+
+def get_job_owner() -> str:
+    """Jobs are visible only to the API key that submitted them."""
+    api_key = request.headers.get('api-key') or ''
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+def command_response(response, status_code):
+    if isinstance(response, bytes):
+        return response, status_code
+    if isinstance(response, dict):
+        return Response(stream_json(response), mimetype='application/json'), status_code
+    return jsonify(response), status_code
 
 def create_command_blueprint():
     """Create Blue Print for Keeper Commander Service."""
@@ -25,8 +41,51 @@ def create_command_blueprint():
             request_command = request.json.get("command")
             command = escape(request_command)
             response, status_code = CommandExecutor.execute(command)
-            return response if isinstance(response, bytes) else jsonify(response), status_code
+            return command_response(response, status_code)
+        except Exception as e:
+            return jsonify({"success": False, "error": f"{str(e)}"}), 500
+
+    @bp.route("/executecommand-async", methods=["POST"])
+    @unified_api_decorator()
+    def execute_command_async(**kwargs):
+        """Queue a long-running command and return its job id. Other commands run inline."""
+        try:
+            request_command = request.json.get("command")
+            command = escape(request_command)
+            if not is_long_running(command):
+                response, status_code = CommandExecutor.execute(command)
+                return command_response(response, status_code)
+            job = get_job_queue().submit(command, get_job_owner())
+            return jsonify(job.to_dict()), 202
+        except JobQueueFullError as e:
+            return jsonify({"success": False, "error": str(e)}), 429
         except Exception as e:
             return jsonify({"success": False, "error": f"{str(e)}"}), 500
 
+    @bp.route("/jobs/<job_id>", methods=["GET"])
+    @job_api_decorator()
+    def get_job(job_id, **kwargs):
+        job = get_job_queue().get(job_id, get_job_owner())
+        if not job:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        return jsonify(job.to_dict()), 200
+
+    @bp.route("/jobs/<job_id>/result", methods=["GET"])
+    @job_api_decorator()
+    def get_job_result(job_id, **kwargs):
+        job = get_job_queue().get(job_id, get_job_owner())
+        if not job:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        if job.status != Job.COMPLETED or not job.result_path:
+            return jsonify(job.to_dict()), 409
+        return send_file(job.result_path, mimetype=job.result_mimetype), job.status_code
+
+    @bp.route("/jobs/<job_id>", methods=["DELETE"])
+    @job_api_decorator()
+    def cancel_job(job_id, **kwargs):
+        job = get_job_queue().cancel(job_id, get_job_owner())
+        if not job:
+            return jsonify({"success": False, "error": "Job not found"}), 404
+        return jsonify(job.to_dict()), 200
+
     return bp
\ No newline at end of file
@@ -9,14 +9,75 @@
 # Contact: ops@keepersecurity.com
 #
 
+import threading
 from typing import Optional
 from keepercommander.params import KeeperParams
+from .session_pool import SessionPool, DEFAULT_WORKER_COUNT, DEFAULT_SYNC_INTERVAL
+from .job_queue import JobQueue, DEFAULT_JOB_WORKERS
 
 _current_params: Optional[KeeperParams] = None
+_session_pool: Optional[SessionPool] = None
+_session_pool_lock = threading.Lock()
+_job_queue: Optional[JobQueue] = None
 
 def init_globals(params: KeeperParams) -> None:
-    global _current_params
+    global _current_params, _session_pool, _job_queue
     _current_params = params
+    _session_pool = None
+    if _job_queue:
+        _job_queue.shutdown()
+    _job_queue = None
 
 def get_current_params() -> Optional[KeeperParams]:
-    return _current_params
\ No newline at end of file
+    return _current_params
+
+def init_session_pool(pool: Optional[SessionPool]) -> None:
+    global _session_pool
+    _session_pool = pool
+
+def _get_config_int(name: str, default: int) -> int:
+    from ..util.config_reader import ConfigReader
+    value = ConfigReader.read_config(name)
+    return value if isinstance(value, int) and value > 0 else default
+
+def _login_from_config() -> KeeperParams:
+    from keepercommander import utils
+    from keepercommander.__main__ import get_params_from_config
+    from keepercommander.commands.utils import LoginCommand
+    params = get_params_from_config(utils.get_default_path() / "config.json")
+    LoginCommand().execute(params, email=params.user, password=params.password, new_login=False)
+    if not params.session_token:
+        raise Exception("Service session login failed")
+    return params
+
+def get_session_pool() -> SessionPool:
+    """Session pool of the service.
+
+    Background mode logs in up to "worker_count" sessions from config.json.
+    Foreground mode shares the logged-in CLI session, so requests run one at a time.
+    """
+    global _session_pool
+    with _session_pool_lock:
+        if _session_pool is None:
+            from ..util.config_reader import ConfigReader
+            sync_interval = _get_config_int('sync_interval', DEFAULT_SYNC_INTERVAL)
+            if ConfigReader.read_config('run_mode') == 'background':
+                worker_count = _get_config_int('worker_count', DEFAULT_WORKER_COUNT)
+                _session_pool = SessionPool(_login_from_config, worker_count, sync_interval)
+            else:
+                params = get_current_params()
+                if not params:
+                    raise Exception("No active session. Please log in through the CLI first.")
+                _session_pool = SessionPool(lambda: params, 1, sync_interval)
+        return _session_pool
+
+def get_job_queue() -> JobQueue:
+    """Queue of long-running commands. Runs up to "job_workers" jobs at once."""
+    global _job_queue
+    with _session_pool_lock:
+        if _job_queue is None:
+            from keepercommander import utils
+            from ..util.command_util import CommandExecutor
+            job_workers = _get_config_int('job_workers', DEFAULT_JOB_WORKERS)
+            _job_queue = JobQueue(CommandExecutor.execute, utils.get_default_path() / 'service_jobs', job_workers)
+        return _job_queue
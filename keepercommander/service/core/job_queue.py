@@ -0,0 +1,200 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import concurrent.futures
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from keepercommander.commands.base import CommandContext, command_context
+from ..decorators.logging import logger
+
+DEFAULT_JOB_WORKERS = 2
+MAX_QUEUED_JOBS = 100
+JOB_RETENTION = 3600
+
+# commands that run in the job queue. Other commands are executed inline
+LONG_RUNNING_COMMANDS = {
+    'compliance', 'compliance-report', 'audit-log', 'audit-report', 'export', 'security-audit-report',
+    'security-audit', 'user-report', 'share-report', 'shared-records-report', 'aging-report',
+    'action-report', 'external-shares-report', 'msp-legacy-report', 'risk-management', 'import',
+}
+
+
+class JobQueueFullError(Exception):
+    """Raised when the job queue does not accept more jobs"""
+    pass
+
+
+class Job:
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    CANCELLED = 'cancelled'
+
+    def __init__(self, command: str, owner: str):
+        self.job_id = uuid.uuid4().hex
+        self.command = command
+        self.owner = owner
+        self.status = Job.QUEUED
+        self.submitted = time.time()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.progress = ''
+        self.error = ''
+        self.status_code = 0
+        self.result_path: Optional[Path] = None
+        self.result_mimetype = 'application/json'
+        self.cancel_requested = False
+        self.future: Optional[concurrent.futures.Future] = None
+        self.context = CommandContext(on_progress=self._set_progress)
+
+    def _set_progress(self, message: str) -> None:
+        self.progress = message[:1024]
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (Job.COMPLETED, Job.FAILED, Job.CANCELLED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished or time.time()
+        result = {
+            "job_id": self.job_id,
+            "command": self.command,
+            "status": self.status,
+            "submitted": self.submitted,
+            "elapsed": round(end - (self.started or end), 3),
+        }
+        if self.progress:
+            result["progress"] = self.progress
+        if self.cancel_requested and not self.is_finished:
+            result["cancel_requested"] = True
+        if self.error:
+            result["error"] = self.error
+        return result
+
+
+def is_long_running(command: str) -> bool:
+    from keepercommander import cli
+    name = command.strip().split(' ')[0]
+    alias = cli.aliases.get(name)
+    if isinstance(alias, (tuple, list)):
+        alias = alias[0]
+    return name in LONG_RUNNING_COMMANDS or alias in LONG_RUNNING_COMMANDS
+
+
+class JobQueue:
+    """Runs long commands in background threads and spools their results to disk.
+
+    At most "workers" jobs run at once and at most "max_queued" unfinished jobs are kept.
+    Jobs run in a CommandContext: commands report progress through it, and cancelling a running job
+    cancels the context. Commands that do not check it run to the end, and their result is discarded.
+    """
+
+    def __init__(self, execute: Callable[[str], Tuple[Any, int]], spool_dir: Path,
+                 workers: int = DEFAULT_JOB_WORKERS, max_queued: int = MAX_QUEUED_JOBS,
+                 retention: int = JOB_RETENTION):
+        self._execute = execute
+        self.spool_dir = spool_dir
+        self.max_queued = max_queued
+        self.retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(workers, 1), thread_name_prefix='service-job')
+
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        for path in self.spool_dir.glob('*.result'):
+            path.unlink(missing_ok=True)
+
+    def submit(self, command: str, owner: str) -> Job:
+        self._expire()
+        with self._lock:
+            unfinished = sum(1 for x in self._jobs.values() if not x.is_finished)
+            if unfinished >= self.max_queued:
+                raise JobQueueFullError(f"Job queue is full: {unfinished} unfinished jobs")
+            job = Job(command, owner)
+            self._jobs[job.job_id] = job
+        job.future = self._executor.submit(self._run, job)
+        logger.debug(f"Job {job.job_id} queued: {command}")
+        return job
+
+    def get(self, job_id: str, owner: str) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        return job if job and job.owner == owner else None
+
+    def cancel(self, job_id: str, owner: str) -> Optional[Job]:
+        job = self.get(job_id, owner)
+        if job and not job.is_finished:
+            job.cancel_requested = True
+            job.context.cancel()
+            if job.future and job.future.cancel():
+                self._finish(job, Job.CANCELLED)
+        return job
+
+    def _finish(self, job: Job, status: str) -> None:
+        job.status = status
+        job.finished = time.time()
+        if status != Job.COMPLETED and job.result_path:
+            job.result_path.unlink(missing_ok=True)
+            job.result_path = None
+
+    def _run(self, job: Job) -> None:
+        if job.cancel_requested:
+            self._finish(job, Job.CANCELLED)
+            return
+        job.status = Job.RUNNING
+        job.started = time.time()
+        try:
+            with command_context(job.context):
+                response, job.status_code = self._execute(job.command)
+            if job.cancel_requested:
+                self._finish(job, Job.CANCELLED)
+                return
+            job.result_path = self._spool(job, response)
+            self._finish(job, Job.COMPLETED)
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, Job.CANCELLED if job.cancel_requested else Job.FAILED)
+        finally:
+            logger.debug(f"Job {job.job_id} {job.status}")
+
+    def _spool(self, job: Job, response: Any) -> Path:
+        from ..util.parse_keeper_response import stream_json
+        path = self.spool_dir / f'{job.job_id}.result'
+        if isinstance(response, bytes):
+            job.result_mimetype = 'application/octet-stream'
+            path.write_bytes(response)
+        else:
+            with open(path, 'w', encoding='utf-8') as f:
+                for chunk in stream_json(response):
+                    f.write(chunk)
+        return path
+
+    def _expire(self) -> None:
+        """Drop finished jobs and their results after the retention period."""
+        now = time.time()
+        with self._lock:
+            expired = [x for x in self._jobs.values() if x.is_finished and now - x.finished > self.retention]
+            for job in expired:
+                del self._jobs[job.job_id]
+                if job.result_path:
+                    job.result_path.unlink(missing_ok=True)
+
+    def shutdown(self) -> None:
+        for job in list(self._jobs.values()):
+            job.context.cancel()
+            if job.future:
+                job.future.cancel()
+        self._executor.shutdown(wait=False)
@@ -35,6 +35,9 @@ if __name__ == '__main__':
         print("Error: Service configuration is incomplete. Please configure the service port in service_config")
 
     ssl_context = ServiceManager.get_ssl_context(config_data)
+
+    from keepercommander.service.core.globals import get_session_pool
+    get_session_pool().warm_up()
     
     flask_app.run(
         host='0.0.0.0',
@@ -0,0 +1,107 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import contextlib
+import queue
+import threading
+import time
+from typing import Callable, Iterator, List, Optional
+
+from keepercommander import api
+from keepercommander.params import KeeperParams
+from ..decorators.logging import logger
+
+DEFAULT_WORKER_COUNT = 4
+DEFAULT_SYNC_INTERVAL = 60
+SESSION_WAIT_TIMEOUT = 300
+
+
+class ServiceSession:
+    """Logged-in Commander session that executes one request at a time."""
+
+    def __init__(self, params: KeeperParams):
+        self.params = params
+        self.last_sync = time.time()
+        self.revision = params.revision
+
+    def sync_if_stale(self, sync_interval: int) -> None:
+        """Sync down the vault if it has not been synced for sync_interval seconds."""
+        if self.params.session_token and time.time() - self.last_sync >= sync_interval:
+            logger.debug("Session is stale: syncing down")
+            api.sync_down(self.params)
+            self.mark_synced()
+
+    def mark_synced(self) -> None:
+        self.last_sync = time.time()
+        self.revision = self.params.revision
+
+
+class SessionPool:
+    """Pool of pre-authenticated sessions shared by request threads.
+
+    Sessions are created on demand up to "size". A request takes a session exclusively,
+    so KeeperParams is never used by two requests at the same time.
+    """
+
+    def __init__(self, create_params: Callable[[], KeeperParams], size: int = DEFAULT_WORKER_COUNT,
+                 sync_interval: int = DEFAULT_SYNC_INTERVAL):
+        self._create_params = create_params
+        self.size = max(size, 1)
+        self.sync_interval = sync_interval
+        self._idle: queue.Queue = queue.Queue()
+        self._sessions: List[ServiceSession] = []
+        self._lock = threading.Lock()
+
+    def _new_session(self) -> Optional[ServiceSession]:
+        with self._lock:
+            if len(self._sessions) >= self.size:
+                return None
+            session = ServiceSession(self._create_params())
+            self._sessions.append(session)
+            logger.debug(f"Created service session {len(self._sessions)} of {self.size}")
+            return session
+
+    def warm_up(self) -> None:
+        """Log in all sessions before the first request."""
+        while True:
+            session = self._new_session()
+            if session is None:
+                break
+            self._idle.put(session)
+
+    @contextlib.contextmanager
+    def acquire(self, timeout: Optional[float] = SESSION_WAIT_TIMEOUT) -> Iterator[ServiceSession]:
+        """Take an idle session. Waits up to "timeout" seconds when all sessions are busy."""
+        try:
+            session = self._idle.get_nowait()
+        except queue.Empty:
+            session = self._new_session()
+            if session is None:
+                try:
+                    session = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError("All service sessions are busy")
+        try:
+            session.sync_if_stale(self.sync_interval)
+            yield session
+            if session.params.revision != session.revision:
+                # the command changed the vault: other sessions sync before their next command
+                session.mark_synced()
+                self.invalidate(session)
+        finally:
+            self._idle.put(session)
+
+    def invalidate(self, except_session: Optional[ServiceSession] = None) -> None:
+        """Make sessions sync down before their next command."""
+        with self._lock:
+            for session in self._sessions:
+                if session is not except_session:
+                    session.last_sync = 0
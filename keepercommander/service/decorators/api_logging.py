@@ -58,7 +58,7 @@ def api_log_handler(fn: Callable) -> Callable:
                 status_color = "\033[93m"  # Yellow for server errors
             
             # Sanitize request data to hide passwords
-            sanitized_data = sanitize_password_in_command(request.json)
+            sanitized_data = sanitize_password_in_command(request.get_json(silent=True))
             data_str = f"data={sanitized_data}" if sanitized_data else "no-data"
             
             log_parts = [
@@ -77,7 +77,7 @@ def api_log_handler(fn: Callable) -> Callable:
             duration = time.time() - start_time
             
             # Sanitize request data for error logs too
-            sanitized_data = sanitize_password_in_command(request.json)
+            sanitized_data = sanitize_password_in_command(request.get_json(silent=True))
             data_str = f"data={sanitized_data}" if sanitized_data else "no-data"
             
             log_parts = [
@@ -28,4 +28,18 @@ def unified_api_decorator() -> Callable:
         def wrapped_function(*args, **kwargs):
             return f(*args, **kwargs)
         return wrapped_function
-    return decorator
\ No newline at end of file
+    return decorator
+
+def job_api_decorator() -> Callable:
+    """Same checks as unified_api_decorator except the command policy: job requests have no command."""
+    def decorator(f: Callable) -> Callable:
+        @wraps(f)
+        @api_log_handler
+        @security_check
+        @auth_check
+        @catch_all
+        @debug_decorator
+        def wrapped_function(*args, **kwargs):
+            return f(*args, **kwargs)
+        return wrapped_function
+    return decorator
@@ -9,21 +9,70 @@
 # Contact: ops@keepersecurity.com
 #
 
+import contextlib
 import io, html
-from pathlib import Path
 import sys
 import json
-from typing import Any, Tuple, Optional
-from keepercommander import cli, utils
-from keepercommander.__main__ import get_params_from_config
-from keepercommander.service.config.service_config import ServiceConfig
+import threading
+from typing import Any, Iterator, Tuple, Optional
+from keepercommander import cli
+from keepercommander.commands.base import capture_report_data, json_serialized
 from .exceptions import CommandExecutionError
 from .config_reader import ConfigReader
-from ..core.globals import get_current_params
-from .parse_keeper_response import parse_keeper_response
+from ..core.globals import get_current_params, get_session_pool
+from .parse_keeper_response import parse_keeper_response, KeeperResponseParser
 from keepercommander.crypto import encrypt_aes_v2
 from ..decorators.logging import logger, debug_decorator
 
+class ThreadOutput(io.TextIOBase):
+    """sys.stdout replacement that sends output of capturing threads to their own buffers."""
+
+    def __init__(self, default: Any):
+        super().__init__()
+        self.default = default
+        self._local = threading.local()
+
+    def _target(self) -> Any:
+        return getattr(self._local, 'buffer', None) or self.default
+
+    @property
+    def encoding(self) -> str:
+        return getattr(self.default, 'encoding', None) or 'utf-8'
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        return self._target().write(s)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def isatty(self) -> bool:
+        return self._target().isatty()
+
+    def fileno(self) -> int:
+        return self.default.fileno()
+
+    @contextlib.contextmanager
+    def capture(self) -> Iterator[io.StringIO]:
+        previous = getattr(self._local, 'buffer', None)
+        buffer = io.StringIO()
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = previous
+
+_install_lock = threading.Lock()
+
+def get_thread_output() -> ThreadOutput:
+    """Install ThreadOutput as sys.stdout once. Output of other threads goes to the original stream."""
+    with _install_lock:
+        if not isinstance(sys.stdout, ThreadOutput):
+            sys.stdout = ThreadOutput(sys.stdout)
+        return sys.stdout
+
 class CommandExecutor:
     @staticmethod
     @debug_decorator
@@ -43,15 +92,9 @@ class CommandExecutor:
     @staticmethod
     @debug_decorator
     def capture_output(params: Any, command: str) -> Tuple[Any, str]:
-        captured_output = io.StringIO()
-        sys.stdout = captured_output
-        try:
+        with get_thread_output().capture() as captured_output:
             return_value = cli.do_command(params, command)
             return return_value, captured_output.getvalue()
-        except Exception as e:
-            raise
-        finally:
-            sys.stdout = sys.__stdout__
 
     @staticmethod
     @debug_decorator
@@ -60,7 +103,7 @@ class CommandExecutor:
         if encryption_key:
             try:
                 encryption_key_bytes = encryption_key.encode('utf-8')
-                response_bytes = json.dumps(response).encode('utf-8')
+                response_bytes = json.dumps(response, default=json_serialized).encode('utf-8')
                 return encrypt_aes_v2(response_bytes, encryption_key_bytes)
             except Exception as e:
                 raise
@@ -74,30 +117,16 @@ class CommandExecutor:
         if validation_error:
             return validation_error
         
-        service_config = ServiceConfig()
-        config_data = service_config.load_config()
-
-        if config_data.get("run_mode") == "background":
-            try:
-                config_path = utils.get_default_path() / "config.json"
-                params = get_params_from_config(config_path)
-            except FileNotFoundError:
-                logger.error(f"Config file not found at {config_path}")
-                raise
-            except Exception as e:
-                logger.error(f"Failed to load params from config file: {e}")
-                raise
-        else:
-            params = get_current_params()
-
         try:
             command = html.unescape(command)
-            return_value, printed_output = cls.capture_output(params, command)
-            response = return_value if return_value else printed_output
+            with get_session_pool().acquire() as session, capture_report_data() as reports:
+                return_value, printed_output = cls.capture_output(session.params, command)
 
-            cli.do_command(params, 'sync-down')
-            
-            response = parse_keeper_response(command, response)
+            if reports and not return_value and not KeeperResponseParser.get_command_parser(command):
+                response = KeeperResponseParser.parse_report_data(command, reports, printed_output)
+            else:
+                response = return_value if return_value else printed_output
+                response = parse_keeper_response(command, response)
             response = cls.encrypt_response(response)
             if response:
                 logger.debug("Command executed successfully")
@@ -105,4 +134,4 @@ class CommandExecutor:
             else:
                 return "Internal Server Error", 500
         except Exception as e:
-            raise CommandExecutionError(f"Command execution failed: {str(e)}")
\ No newline at end of file
+            raise CommandExecutionError(f"Command execution failed: {str(e)}")
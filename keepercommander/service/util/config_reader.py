@@ -9,11 +9,15 @@
 # Contact: ops@keepersecurity.com
 #
 
-from typing import Any
+import threading
+from typing import Any, Dict, Optional, Tuple
 from ..decorators.logging import logger
 
 class ConfigReader:
     _service_config = None
+    _config_data: Optional[Dict[str, Any]] = None
+    _config_stamp: Optional[Tuple] = None
+    _config_lock = threading.Lock()
 
     @classmethod
     def _get_service_config(cls) -> Any:
@@ -23,13 +27,37 @@ class ConfigReader:
             cls._service_config = ServiceConfig()
         return cls._service_config
 
+    @classmethod
+    def _get_config_stamp(cls) -> Optional[Tuple]:
+        """Modification time and size of the service config files or None if there is no config file."""
+        config_dir = cls._get_service_config().format_handler.config_dir
+        stamp = []
+        for suffix in ('.json', '.yaml'):
+            path = config_dir / f'service_config{suffix}'
+            if path.exists():
+                stat = path.stat()
+                stamp.append((suffix, stat.st_mtime_ns, stat.st_size))
+        return tuple(stamp) if stamp else None
+
+    @classmethod
+    def load_config(cls) -> Dict[str, Any]:
+        """Load service config. The file is decrypted again only after it changes."""
+        service_config = cls._get_service_config()
+        stamp = cls._get_config_stamp()
+        if stamp is None:
+            return service_config.load_config()
+        with cls._config_lock:
+            if cls._config_data is None or cls._config_stamp != stamp:
+                logger.debug("Loading service config file")
+                cls._config_data = service_config.load_config()
+                cls._config_stamp = stamp
+            return cls._config_data
+
     @classmethod
     def read_config(cls, service_config_param: str, api_key: str = "") -> Any:
         """Read configuration parameter from service config file."""
-        service_config = cls._get_service_config()
-        
         try:
-            config_data = service_config.load_config()
+            config_data = cls.load_config()
             logger.debug(f"Successfully loaded config file")
             
             param_handlers = {
@@ -42,7 +70,10 @@ class ConfigReader:
                 'ngrok_public_url': lambda: config_data.get('ngrok_public_url', ""),
                 'certfile': lambda: config_data.get('certfile', ""),
                 'certpassword': lambda: config_data.get('certpassword', ""),
-                'run_mode': lambda: config_data.get('run_mode', "")
+                'run_mode': lambda: config_data.get('run_mode', ""),
+                'worker_count': lambda: config_data.get('worker_count', ""),
+                'sync_interval': lambda: config_data.get('sync_interval', ""),
+                'job_workers': lambda: config_data.get('job_workers', "")
             }
 
             if handler := param_handlers.get(service_config_param):
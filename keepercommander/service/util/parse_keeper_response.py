@@ -9,8 +9,12 @@
 # Contact: ops@keepersecurity.com
 #
 
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Iterator, List, Optional
 import re, json
+from keepercommander.commands.base import json_serialized, is_json_value_field
+
+STREAM_CHUNK_SIZE = 64 * 1024
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
 
 class KeeperResponseParser:
     @staticmethod
@@ -29,28 +33,35 @@ class KeeperResponseParser:
             return {"status": "success", "data": None}
         
         response_str = str(response).strip()
+        parser = KeeperResponseParser.get_command_parser(command)
+        if parser:
+            return parser(response_str)
+        return {
+            "status": "success",
+            "command": command,
+            "data": response_str
+        }
+
+    @staticmethod
+    def get_command_parser(command: str) -> Optional[Callable[[str], Dict[str, Any]]]:
+        """Returns the dedicated output parser of a command, or None."""
         if '--format=json' in command:
-            return KeeperResponseParser._parse_json_format_command(command, response_str)
+            return lambda x: KeeperResponseParser._parse_json_format_command(command, x)
         if command.startswith("ls"):
-            return KeeperResponseParser._parse_ls_command(response_str)
+            return KeeperResponseParser._parse_ls_command
         elif command.startswith("tree"):
-            return KeeperResponseParser._parse_tree_command(response_str)
+            return KeeperResponseParser._parse_tree_command
         elif command.startswith("mkdir"):
-            return KeeperResponseParser._parse_mkdir_command(response_str)
+            return KeeperResponseParser._parse_mkdir_command
         elif command.startswith("record-add"):
-            return KeeperResponseParser._parse_record_add_command(response_str)
+            return KeeperResponseParser._parse_record_add_command
         elif "search record" in command:
-            return KeeperResponseParser._parse_search_record_command(response_str)
+            return KeeperResponseParser._parse_search_record_command
         elif "search folder" in command:
-            return KeeperResponseParser._parse_search_folder_command(response_str)
+            return KeeperResponseParser._parse_search_folder_command
         elif command.startswith("get") or command.startswith("download"):
-            return KeeperResponseParser._parse_get_command(response_str)
-        else:
-            return {
-                "status": "success",
-                "command": command,
-                "data": response_str
-            }
+            return KeeperResponseParser._parse_get_command
+        return None
 
     @staticmethod
     def _parse_ls_command(response: str) -> Dict[str, Any]:
@@ -285,6 +296,71 @@ class KeeperResponseParser:
         finally:
             return result
 
+    @staticmethod
+    def _header_to_key(header: str) -> str:
+        return re.sub(r'[^0-9a-z]+', '_', str(header).lower()).strip('_')
+
+    @staticmethod
+    def parse_report_data(command: str, reports: List[dict], printed_output: str = '') -> Dict[str, Any]:
+        """
+        Build a structured response from tables collected by capture_report_data.
+        Used for commands without a dedicated output parser.
+
+        Args:
+            command (str): The executed command
+            reports (List[dict]): Tables that the command passed to dump_report_data
+            printed_output (str): Other text printed by the command
+
+        Returns:
+            Dict[str, Any]: Rows as objects keyed by column name. A command that produced
+            several tables returns a list of {"title", "data"} objects; untitled tables
+            are named "table_1", "table_2", ...
+        """
+        tables = []
+        for report_no, report in enumerate(reports, start=1):
+            keys = [KeeperResponseParser._header_to_key(x) for x in report['headers']]
+            rows = []
+            for row in report['rows']:
+                obj = {}
+                for index, value in enumerate(row):
+                    key = keys[index] if index < len(keys) else f'column_{index}'
+                    if key and is_json_value_field(value):
+                        obj[key] = ANSI_ESCAPE.sub('', value) if isinstance(value, str) else value
+                rows.append(obj)
+            title = report.get('title')
+            if not title and len(reports) > 1:
+                title = f'table_{report_no}'
+            tables.append({"title": title, "data": rows})
+
+        result = {
+            "status": "success",
+            "command": command.split(' ')[0],
+        }
+        if len(tables) == 1:
+            if tables[0]["title"]:
+                result["title"] = tables[0]["title"]
+            result["data"] = tables[0]["data"]
+        else:
+            result["data"] = tables
+        message = printed_output.strip() if printed_output else ''
+        if message:
+            result["message"] = message
+        return result
+
+def stream_json(response: Any) -> Iterator[str]:
+    """Serialize a response in chunks so large results are not built as one string."""
+    chunks = []
+    size = 0
+    for chunk in json.JSONEncoder(default=json_serialized).iterencode(response):
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_SIZE:
+            yield ''.join(chunks)
+            chunks.clear()
+            size = 0
+    if chunks:
+        yield ''.join(chunks)
+
 def parse_keeper_response(command: str, response: Any) -> Dict[str, Any]:
     """
     Main entry point for parsing Keeper Commander responses.
@@ -1,21 +1,67 @@
+import collections
+import concurrent.futures
 import datetime
 import logging
 import os
-import sqlite3
 import sys
-from typing import Dict, Tuple
+from typing import Dict, Tuple, List, Optional, Callable, Any, Deque
 
 from .. import api, crypto, utils
+from ..commands.base import check_cancelled
 from ..commands.helpers.enterprise import user_has_privilege, is_addon_enabled
 from ..error import CommandError, Error, KeeperApiError
 from ..params import KeeperParams
 from ..proto import enterprise_pb2
+from ..storage import sqlite_dao
 from . import sqlite_storage, sox_data
 from .storage_types import StorageRecord, StorageUser, StorageUserRecordLink, StorageTeam, \
     StorageRecordPermissions, StorageTeamUserLink, StorageSharedFolderRecordLink, StorageSharedFolderUserLink, \
     StorageSharedFolderTeamLink
 
 API_SOX_REQUEST_USER_LIMIT = 1000
+PIPELINE_DEPTH_CONFIG_KEY = 'compliance_pipeline_depth'
+DEFAULT_PIPELINE_DEPTH = 4
+
+
+def get_pipeline_depth(params):    # type: (KeeperParams) -> int
+    depth = params.config.get(PIPELINE_DEPTH_CONFIG_KEY) if isinstance(params.config, dict) else None
+    return depth if isinstance(depth, int) and depth > 0 else DEFAULT_PIPELINE_DEPTH
+
+
+def run_pipelined(next_task, fetch, save, max_in_flight):
+    # type: (Callable[[], Any], Callable[[Any], Any], Callable[[Any, Any], None], int) -> None
+    """Runs "fetch" for tasks in worker threads keeping up to "max_in_flight" tasks in flight.
+
+    "save" is called in the calling thread in task order, so it is the only writer to the storage.
+    "next_task" returns None when no task is ready. It is called again after every "save",
+    which may queue more tasks. Throttled requests are retried and paced by the REST client.
+    Raises CommandError after a "save" if the command of the calling thread has been cancelled.
+    """
+    if max_in_flight <= 1:
+        task = next_task()
+        while task is not None:
+            save(task, fetch(task))
+            check_cancelled()
+            task = next_task()
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = collections.deque()    # type: Deque[Tuple[Any, concurrent.futures.Future]]
+        try:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    task = next_task()
+                    if task is None:
+                        break
+                    in_flight.append((task, executor.submit(fetch, task)))
+                if not in_flight:
+                    break
+                task, future = in_flight.popleft()
+                save(task, future.result())
+                check_cancelled()
+        finally:
+            for _, future in in_flight:
+                future.cancel()
 
 
 def validate_data_access(params, cmd=''):
@@ -55,11 +101,12 @@ def get_sox_database_name(params, enterprise_id):  # type: (KeeperParams, int) -
 def get_prelim_data(params, enterprise_id=0, rebuild=False, min_updated=0, cache_only=False, no_cache=False, shared_only=False):
     # type: (KeeperParams, int, bool, int, bool, bool, bool) -> sox_data.SoxData
     def sync_down(name_by_id, store):  # type: (Dict[int, str], sqlite_storage.SqliteSoxStorage) ->  None
-        def to_storage_types(user_data, username_lookup):
+        def to_storage_types(user_data, username_lookup, existing_users, existing_records):
             def to_record_entity(record):
                 record_uid_bytes = record.recordUid
                 record_uid = utils.base64_url_encode(record_uid_bytes)
-                entity = store.get_records().get_entity(record_uid) or StorageRecord()
+                entity = existing_records.get(record_uid) or StorageRecord()
+                existing_records[record_uid] = entity
                 entity.record_uid_bytes = record_uid_bytes
                 entity.record_uid = record_uid
                 entity.encrypted_data = record.encryptedData
@@ -67,7 +114,7 @@ def get_prelim_data(params, enterprise_id=0, rebuild=False, min_updated=0, cache
                 return entity
 
             def to_user_entity(user, email_lookup):
-                entity = store.get_users().get_entity(user.enterpriseUserId) or StorageUser()
+                entity = existing_users.get(user.enterpriseUserId) or StorageUser()
                 entity.status = user.status
                 user_id = user.enterpriseUserId
                 entity.user_uid = user_id
@@ -87,70 +134,94 @@ def get_prelim_data(params, enterprise_id=0, rebuild=False, min_updated=0, cache
                               record_ents}
             return user_ent, record_ents, user_rec_links
 
+        def save_response(rs):  # type: (enterprise_pb2.PreliminaryComplianceDataResponse) -> int
+            user_ids = {x.enterpriseUserId for x in rs.auditUserData}
+            record_uids = {utils.base64_url_encode(r.recordUid)
+                           for x in rs.auditUserData for r in x.auditUserRecords if r.encryptedData}
+            existing_users = {x.user_uid: x for x in store.get_users().find_entities(user_ids)}
+            existing_records = {x.record_uid: x for x in store.get_records().find_entities(record_uids)}
+            users, records, links = [], {}, set()
+            for user_data in rs.auditUserData:
+                t_user, t_recs, t_links = to_storage_types(user_data, name_by_id, existing_users, existing_records)
+                users.append(t_user)
+                records.update(((x.record_uid, x) for x in t_recs))
+                links.update(t_links)
+            store.put_prelim_data(users, records.values(), links)
+            return len(records)
+
         def print_status(users_loaded, users_total, records_loaded, records_total):
             print('\r' + (100 * ' '), file=sys.stderr, end='', flush=True)
             print(f'\rLoading record information - Users: {users_loaded}/{users_total}, Current Batch: {records_loaded}/{records_total}', file=sys.stderr, end='', flush=True)
 
         def sync_all():
-            user_ids = list(user_lookup.keys())
+            user_ids = collections.deque(user_lookup.keys())
             users_total = len(user_ids)
             records_total = 0
             print_status(0, users_total, 0, records_total)
-            users, records, links = [], [], []
             chunk_size = 1
             problem_ids = set()
-            while user_ids:
-                token = b''
-                chunk = user_ids[:chunk_size]
-                user_ids = user_ids[chunk_size:]
+
+            def next_chunk():   # type: () -> Optional[List[int]]
+                if not user_ids:
+                    return None
+                return [user_ids.popleft() for _ in range(min(chunk_size, len(user_ids)))]
+
+            def fetch_chunk(chunk):
+                # type: (List[int]) -> Tuple[List[enterprise_pb2.PreliminaryComplianceDataResponse], Optional[KeeperApiError]]
+                responses = []
                 rq = enterprise_pb2.PreliminaryComplianceDataRequest()
                 rq.enterpriseUserIds.extend(chunk)
                 rq.includeNonShared = not shared_only
-                has_more = True
-                current_batch_loaded = 0
-                while has_more:
-                    rq.continuationToken = token or rq.continuationToken
-                    rq.includeTotalMatchingRecordsInFirstResponse = True
-                    endpoint = 'enterprise/get_preliminary_compliance_data'
-                    rs_type = enterprise_pb2.PreliminaryComplianceDataResponse
+                rq.includeTotalMatchingRecordsInFirstResponse = True
+                endpoint = 'enterprise/get_preliminary_compliance_data'
+                rs_type = enterprise_pb2.PreliminaryComplianceDataResponse
+                while True:
                     try:
                         rs = api.communicate_rest(params, rq, endpoint, rs_type=rs_type)
-                        has_more = rs.hasMore
-                        if rs.totalMatchingRecords:
-                            current_batch_loaded = 0
-                            records_total = rs.totalMatchingRecords
-                            if records_total < 20 * API_SOX_REQUEST_USER_LIMIT:
-                               # Adjust chunk size to optimize queries
-                               chunk_size = min(chunk_size * 2, API_SOX_REQUEST_USER_LIMIT)
-                        token = rs.continuationToken
-                        for user_data in rs.auditUserData:
-                            t_user, t_recs, t_links = to_storage_types(user_data, name_by_id)
-                            users += [t_user]
-                            records += t_recs
-                            current_batch_loaded += len(t_recs)
-                            print_status(users_total - len(user_ids), users_total, current_batch_loaded, records_total)
-                            links += t_links
-                        if not has_more:
-                            print_status(users_total - len(user_ids), users_total, records_total, records_total)
                     except KeeperApiError as kae:
                         if kae.message.lower() == 'gateway_timeout':
-                            # Break up the request if the number of corresponding records exceeds the backend's limit
-                            if chunk_size > 1:
-                                chunk_size = 1
-                                user_ids = [*chunk, *user_ids]
-                            else:
-                                problem_ids.update(*chunk)
-                            break
-                        else:
-                            raise kae
-                    except Exception as ex:
-                        raise ex
+                            return responses, kae
+                        raise kae
+                    responses.append(rs)
+                    if not rs.hasMore:
+                        return responses, None
+                    rq.continuationToken = rs.continuationToken
+
+            def save_chunk(chunk, result):
+                nonlocal chunk_size, records_total
+                responses, error = result
+                current_batch_loaded = 0
+                for rs in responses:
+                    if rs.totalMatchingRecords:
+                        records_total = rs.totalMatchingRecords
+                        if records_total < 20 * API_SOX_REQUEST_USER_LIMIT:
+                            # Adjust chunk size to optimize queries
+                            chunk_size = min(chunk_size * 2, API_SOX_REQUEST_USER_LIMIT)
+                    current_batch_loaded += save_response(rs)
+                    print_status(users_total - len(user_ids), users_total, current_batch_loaded, records_total)
+                if error:
+                    # Break up the request if the number of corresponding records exceeds the backend's limit
+                    if len(chunk) > 1:
+                        chunk_size = 1
+                        user_ids.extendleft(reversed(chunk))
+                    else:
+                        problem_ids.update(chunk)
+                else:
+                    print_status(users_total - len(user_ids), users_total, records_total, records_total)
+
+            run_pipelined(next_chunk, fetch_chunk, save_chunk, get_pipeline_depth(params))
             if problem_ids:
                 problem_emails = '\n'.join([name_by_id.get(id) for id in problem_ids])
                 logging.error(f'Data could not fetched for the following users: \n{problem_emails}')
 
-            store.rebuild_prelim_data(users, records, links)
-        sync_all()
+        # every response is committed on its own, so no write transaction is open across network calls.
+        # An interrupted sync leaves "prelim data updated" cleared and the next run syncs again
+        store.clear_non_aging_data()
+        try:
+            sync_all()
+            store.set_prelim_data_updated()
+        finally:
+            store.close()
         print('', file=sys.stderr, flush=True)
 
     validate_data_access(params)
@@ -161,14 +232,13 @@ def get_prelim_data(params, enterprise_id=0, rebuild=False, min_updated=0, cache
     ecc_key = crypto.decrypt_aes_v2(ecc_key, tree_key)
     key = crypto.load_ec_private_key(ecc_key)
     storage = sqlite_storage.SqliteSoxStorage(
-        get_connection=lambda: sqlite3.connect(database_name), owner=params.user, database_name=database_name
+        get_connection=sqlite_dao.ThreadConnections(database_name), owner=params.user, database_name=database_name
     )
     last_updated = storage.last_prelim_data_update
     only_shared_cached = storage.shared_records_only
     refresh_data = rebuild or not last_updated or min_updated > last_updated or only_shared_cached and not shared_only
     if refresh_data and not cache_only:
         user_lookup = {x['enterprise_user_id']: x['username'] for x in params.enterprise.get('users', [])}
-        storage.clear_non_aging_data()
         sync_down(user_lookup, storage)
         storage.set_shared_records_only(shared_only)
     return sox_data.SoxData(params, storage=storage, no_cache=no_cache)
@@ -188,18 +258,20 @@ def get_compliance_data(params, node_id, enterprise_id=0, rebuild=False, min_upd
                 record_uids_raw = [rec.record_uid_bytes for rec in sdata.get_records().values()]
                 max_len = API_SOX_REQUEST_USER_LIMIT
                 total_ruids = len(record_uids_raw)
-                ruid_chunks = [record_uids_raw[x:x + max_len] for x in range(0, total_ruids, max_len)]
-                for chunk in ruid_chunks:
-                    sync_chunk(chunk, users_uids)
-                sdata.storage.set_compliance_data_updated()
+                ruid_chunks = iter([record_uids_raw[x:x + max_len] for x in range(0, total_ruids, max_len)])
+                # responses are saved in chunk order, so anonymous user IDs are assigned as in a sequential run
+                try:
+                    run_pipelined(lambda: next(ruid_chunks, None),
+                                  lambda chunk: fetch_response(raw_ruids=chunk, user_uids=users_uids),
+                                  lambda chunk, rs: save_response(rs),
+                                  get_pipeline_depth(params))
+                    sdata.storage.set_compliance_data_updated()
+                finally:
+                    sdata.storage.close()
                 print('', file=sys.stderr, flush=True)
 
             do_tasks()
 
-        def sync_chunk(chunk, uuids):
-            rs = fetch_response(raw_ruids=chunk, user_uids=uuids)
-            save_response(rs)
-
         def fetch_response(raw_ruids, user_uids):
             rq = enterprise_pb2.ComplianceReportRequest()
             rq.saveReport = False
@@ -238,19 +310,22 @@ def get_compliance_data(params, node_id, enterprise_id=0, rebuild=False, min_upd
             save_all_types(hash_anon_ids(rs))
 
         def save_all_types(rs):
-            save_users(rs.userProfiles)
-            save_records(rs.auditRecords)
-            save_teams(rs.auditTeams)
-            save_shared_folders_records(rs.sharedFolderRecords)
-            save_shared_folder_users(rs.sharedFolderUsers)
-            save_shared_folder_teams(rs.sharedFolderTeams)
-            save_record_permissions(rs.sharedFolderRecords, rs.userRecords)
-            save_team_users(rs.auditTeamUsers)
+            with sdata.storage.bulk_update():
+                save_users(rs.userProfiles)
+                save_records(rs.auditRecords)
+                save_teams(rs.auditTeams)
+                save_shared_folders_records(rs.sharedFolderRecords)
+                save_shared_folder_users(rs.sharedFolderUsers)
+                save_shared_folder_teams(rs.sharedFolderTeams)
+                save_record_permissions(rs.sharedFolderRecords, rs.userRecords)
+                save_team_users(rs.auditTeamUsers)
 
         def save_users(user_profiles):
             entities = []
+            existing = {x.user_uid: x for x in
+                        sdata.storage.users.find_entities({x.enterpriseUserId for x in user_profiles})}
             for up in user_profiles:
-                entity = sdata.storage.users.get_entity(up.enterpriseUserId) or StorageUser()
+                entity = existing.get(up.enterpriseUserId) or StorageUser()
                 entity.user_uid = entity.user_uid or up.enterpriseUserId
                 entity.email = entity.email or encrypt_data(params, up.email)
                 entity.job_title = entity.job_title or encrypt_data(params, up.jobTitle)
@@ -262,9 +337,11 @@ def get_compliance_data(params, node_id, enterprise_id=0, rebuild=False, min_upd
 
         def save_teams(audit_teams):
             entities = []
+            existing = {x.team_uid: x for x in
+                        sdata.storage.teams.find_entities({utils.base64_url_encode(x.teamUid) for x in audit_teams})}
             for team in audit_teams:
                 team_uid = utils.base64_url_encode(team.teamUid)
-                entity = sdata.storage.teams.get_entity(team_uid) or StorageTeam()
+                entity = existing.get(team_uid) or StorageTeam()
                 entity.team_uid = team_uid
                 entity.team_name = team.teamName
                 entity.restrict_edit = team.restrictEdit
@@ -337,12 +414,14 @@ def get_compliance_data(params, node_id, enterprise_id=0, rebuild=False, min_upd
 
         def save_records(records):
             entities = []
+            existing = {x.record_uid: x for x in
+                        sdata.storage.records.find_entities({utils.base64_url_encode(x.recordUid) for x in records})}
             for record in records:
                 nonlocal recs_processed
                 recs_processed += 1
                 print_status(recs_processed/len(sdata.get_records()))
                 rec_uid = utils.base64_url_encode(record.recordUid)
-                entity = sdata.storage.records.get_entity(rec_uid)
+                entity = existing.get(rec_uid)
                 if entity:
                     entity.in_trash = record.inTrash
                     entity.has_attachments = record.hasAttachments
@@ -165,10 +165,7 @@ class SoxData:
             # type: (sqlite_storage.SqliteSoxStorage, RebuildTask) -> Dict[str, sox_types.Record]
             entities = []   # type: List[storage_types.StorageRecord]
             if changes.records:
-                for uid in changes.records:
-                    entity = store.records.get_entity(uid)
-                    if entity:
-                        entities.append(entity)
+                entities.extend(store.records.find_entities(changes.records))
             else:
                 entities.extend(store.records.get_all())
 
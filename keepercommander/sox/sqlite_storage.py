@@ -8,6 +8,7 @@
 # Copyright 2022 Keeper Security Inc.
 # Contact: ops@keepersecurity.coms
 #
+import contextlib
 import datetime
 import logging
 import os
@@ -180,25 +181,43 @@ class SqliteSoxStorage:
         self.set_last_pw_audit(0)
 
     def clear_non_aging_data(self):
-        self._records.delete_all()
-        self._users.delete_all()
-        self._user_record_links.delete_all()
-        self._teams.delete_all()
-        self._roles.delete_all()
-        self._sf_team_links.delete_all()
-        self._sf_user_links.delete_all()
-        self._sf_record_links.delete_all()
-        self._team_user_links.delete_all()
-        self._record_permissions.delete_all()
-        self.set_prelim_data_updated(0)
-        self.set_compliance_data_updated(0)
+        with self.bulk_update():
+            self._records.delete_all()
+            self._users.delete_all()
+            self._user_record_links.delete_all()
+            self._teams.delete_all()
+            self._roles.delete_all()
+            self._sf_team_links.delete_all()
+            self._sf_user_links.delete_all()
+            self._sf_record_links.delete_all()
+            self._team_user_links.delete_all()
+            self._record_permissions.delete_all()
+            self.set_prelim_data_updated(0)
+            self.set_compliance_data_updated(0)
+
+    def bulk_update(self):
+        """Groups storage writes into a single transaction if the connection supports it"""
+        connection = self.get_connection()
+        if isinstance(connection, sqlite_dao.BulkConnection):
+            return connection.bulk()
+        return contextlib.nullcontext()
+
+    def put_prelim_data(self, users, records, links):
+        with self.bulk_update():
+            self._users.put_entities(users)
+            self._records.put_entities(records)
+            self._user_record_links.put_links(links)
+
+    def close(self):
+        """Closes database connections. The storage reconnects when it is used again"""
+        if isinstance(self.get_connection, sqlite_dao.ThreadConnections):
+            self.get_connection.close_all()
 
     def rebuild_prelim_data(self, users, records, links):
-        self.clear_non_aging_data()
-        self._users.put_entities(users)
-        self._records.put_entities(records)
-        self._user_record_links.put_links(links)
-        self.set_prelim_data_updated()
+        with self.bulk_update():
+            self.clear_non_aging_data()
+            self.put_prelim_data(users, records, links)
+            self.set_prelim_data_updated()
 
     def clear_all(self):
         self.clear_non_aging_data()
@@ -207,9 +226,15 @@ class SqliteSoxStorage:
 
     def delete_db(self):
         try:
-            conn = self.get_connection()
-            conn.close()
+            if isinstance(self.get_connection, sqlite_dao.ThreadConnections):
+                self.get_connection.close_all()
+            else:
+                conn = self.get_connection()
+                conn.close()
             os.remove(self.database_name)
+            for suffix in ('-wal', '-shm'):
+                if os.path.exists(self.database_name + suffix):
+                    os.remove(self.database_name + suffix)
         except Exception as e:
             logging.info(f'could not delete db from filesystem, name = {self.database_name}')
             logging.info(f'Exception e:\n{e}')
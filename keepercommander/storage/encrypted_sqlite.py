@@ -0,0 +1,109 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import json
+import logging
+import sqlite3
+from typing import Optional, Any, Type, Sequence
+
+from .. import crypto, utils
+from . import sqlite_dao, sqlite
+
+
+def json_default(o):
+    """json.dumps "default" that stores bytes as {"$b": base64url} and sets as lists"""
+    if isinstance(o, (bytes, bytearray)):
+        return {'$b': utils.base64_url_encode(o)}
+    if isinstance(o, (set, frozenset)):
+        return list(o)
+    raise TypeError(f'Object of type {type(o).__name__} is not serializable')
+
+
+def json_object_hook(d):
+    """json.loads "object_hook" that restores bytes stored by json_default"""
+    if len(d) == 1 and '$b' in d:
+        return utils.base64_url_decode(d['$b'])
+    return d
+
+
+class EncryptedSqliteStore:
+    """SQLite store of JSON objects encrypted with the user's data key.
+
+    The store has a settings table with one row per owner and an entity table.
+    Settings types have a "key_check" field: it holds "key_check" encrypted with the data key,
+    so the store is cleared when it is opened with another data key.
+    """
+    def __init__(self, database_name, owner, data_key, key_check, settings_type, entity_type, entity_key):
+        # type: (str, str, bytes, bytes, Type, Type, Sequence[str]) -> None
+        self.database_name = database_name
+        self.owner = owner
+        self._data_key = data_key
+        self._key_check = key_check
+        self._connection = None     # type: Optional[sqlite3.Connection]
+
+        settings_schema = sqlite_dao.TableSchema.load_schema(settings_type, [], owner_column='account_uid')
+        entity_schema = sqlite_dao.TableSchema.load_schema(entity_type, entity_key, owner_column='account_uid')
+        sqlite_dao.verify_database(self.get_connection(), (settings_schema, entity_schema))
+
+        self._settings = sqlite.SqliteRecordStorage(self.get_connection, settings_schema, owner)
+        self._entities = sqlite_dao.SqliteStorage(self.get_connection, entity_schema, owner)
+
+    def get_connection(self):   # type: () -> sqlite3.Connection
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.database_name)
+        return self._connection
+
+    def close(self):
+        if self._connection:
+            self._connection.close()
+            self._connection = None
+
+    def clear(self):
+        self._entities.delete_all()
+        self._settings.delete()
+
+    def reset(self, error):    # type: (Exception) -> None
+        """Logs a load or save error and clears the store"""
+        logging.debug('Cache "%s" error: %s', self.database_name, error)
+        try:
+            self.clear()
+        except Exception as e:
+            logging.debug('Cache "%s" clear error: %s', self.database_name, e)
+
+    def encrypt(self, obj):    # type: (Any) -> bytes
+        return crypto.encrypt_aes_v2(json.dumps(obj, default=json_default, separators=(',', ':')).encode(),
+                                     self._data_key)
+
+    def decrypt(self, data):    # type: (bytes) -> Any
+        return json.loads(crypto.decrypt_aes_v2(data, self._data_key), object_hook=json_object_hook)
+
+    def encrypt_bytes(self, data):    # type: (bytes) -> bytes
+        return crypto.encrypt_aes_v2(data, self._data_key)
+
+    def decrypt_bytes(self, data):    # type: (bytes) -> bytes
+        return crypto.decrypt_aes_v2(data, self._data_key)
+
+    def load_settings(self):    # type: () -> Optional[Any]
+        """Returns the settings row. Clears the store and returns None if it was written with another data key"""
+        settings = self._settings.load()
+        if not settings:
+            return None
+        try:
+            if self.decrypt_bytes(settings.key_check) != self._key_check:
+                raise ValueError('data key mismatch')
+        except Exception as e:
+            self.reset(e)
+            return None
+        return settings
+
+    def store_settings(self, settings):    # type: (Any) -> None
+        settings.key_check = self.encrypt_bytes(self._key_check)
+        self._settings.store(settings)
@@ -32,6 +32,10 @@ class SqliteEntityStorage(sqlite_dao.SqliteStorage, IEntityStorage):
         for value in pk_values:
             yield self.get_entity(value)
 
+    def find_entities(self, pk_values):
+        """Loads entities for the primary key values in chunked queries. Missing keys are skipped"""
+        return self.select_by_values(self.schema.primary_key[0], pk_values)
+
     def get_all(self):
         for entity in self.select_all():
             yield entity
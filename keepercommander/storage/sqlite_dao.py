@@ -1,10 +1,15 @@
 import collections
+import contextlib
 import logging
 import sqlite3
-from typing import Dict, Union, Sequence, Any, List, Optional, Type, Callable, Iterable, Iterator
+import threading
+from typing import Dict, Union, Sequence, Any, List, Optional, Type, Callable, Iterable, Iterator, Set
 
 FieldSchema = collections.namedtuple('FieldSchema', ['name', 'type'])
 
+# SQLite versions before 3.32 limit a statement to 999 host parameters
+MAX_QUERY_PARAMETERS = 900
+
 
 class TableSchema:
     def __init__(self):
@@ -193,6 +198,86 @@ def verify_database(connection, tables, apply_changes=True):
     return result
 
 
+class BulkConnection(sqlite3.Connection):
+    """Connection that can group writes of several storages into a single transaction.
+
+    Inside "with connection.bulk():" commit() calls are deferred until the outermost block exits.
+    """
+    def __init__(self, *args, **kwargs):
+        super(BulkConnection, self).__init__(*args, **kwargs)
+        self._bulk_depth = 0
+
+    def commit(self):
+        if self._bulk_depth == 0:
+            super(BulkConnection, self).commit()
+
+    @contextlib.contextmanager
+    def bulk(self):
+        self._bulk_depth += 1
+        try:
+            yield self
+        except Exception:
+            self._bulk_depth -= 1
+            if self._bulk_depth == 0:
+                super(BulkConnection, self).rollback()
+            raise
+        self._bulk_depth -= 1
+        if self._bulk_depth == 0:
+            super(BulkConnection, self).commit()
+
+
+def connect(database_name, **kwargs):    # type: (str, ...) -> BulkConnection
+    """Opens a connection tuned for large local caches: WAL journal, relaxed fsync, bigger page cache"""
+    connection = sqlite3.connect(database_name, factory=BulkConnection, **kwargs)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute('PRAGMA temp_store=MEMORY')
+    connection.execute('PRAGMA cache_size=-65536')
+    return connection
+
+
+class ThreadConnections:
+    """Callable "get_connection" that keeps one connection per thread.
+
+    close_all() closes the connections of all threads. A thread that asks again gets a new connection.
+    """
+    def __init__(self, database_name):    # type: (str) -> None
+        self.database_name = database_name
+        self._local = threading.local()
+        self._connections = set()    # type: Set[BulkConnection]
+        self._lock = threading.Lock()
+
+    def __call__(self):    # type: () -> BulkConnection
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or connection not in self._connections:
+            # a connection is used by its own thread only. close_all() may close it from another thread
+            connection = connect(self.database_name, check_same_thread=False)
+            self._local.connection = connection
+            with self._lock:
+                self._connections.add(connection)
+        return connection
+
+    def close(self):
+        """Closes the connection of the current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            self._local.connection = None
+            with self._lock:
+                self._connections.discard(connection)
+            connection.close()
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        self._local.connection = None
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception as e:
+                logging.debug('Close connection error: %s', e)
+
+
 class SqliteStorage:
     def __init__(self, get_connection, schema, owner=None):
         # type: (Callable[[], sqlite3.Connection], TableSchema, Union[str, int, None]) -> None
@@ -312,6 +397,34 @@ class SqliteStorage:
         for row in curr:
             yield self._populate_data_object(row)
 
+    def select_by_values(self, column, values):
+        # type: (str, Iterable[Any]) -> Iterator[Any]
+        """Selects rows where "column" matches any of "values" using IN queries"""
+        adjusted_columns = self._adjust_filter_columns(column)
+        column = adjusted_columns[0]
+        values = list(values)
+        if not values:
+            return
+
+        conn = self.get_connection()
+        for pos in range(0, len(values), MAX_QUERY_PARAMETERS):
+            chunk = values[pos:pos + MAX_QUERY_PARAMETERS]
+            key = f'select-by-values: {column}: {len(chunk)}'
+            query = self._queries.get(key)
+            if not query:
+                wheres = []
+                if self.schema.owner_column:
+                    wheres.append(f'{self.schema.owner_column}=?')
+                wheres.append(f'{column} IN (' + ', '.join('?' * len(chunk)) + ')')
+                query = 'SELECT ' + ', '.join(self.schema.columns) + f' FROM {self.schema.table_name} ' + \
+                        'WHERE ' + ' AND '.join(wheres)
+                if len(chunk) == MAX_QUERY_PARAMETERS:
+                    self._queries[key] = query
+            params = [self.owner] if self.schema.owner_column else []
+            params.extend(chunk)
+            for row in conn.execute(query, params):
+                yield self._populate_data_object(row)
+
     def delete_all(self):   # type: () -> int
         query = self._queries.get('delete-all')
         if not query:
@@ -11,10 +11,22 @@
 import logging
 from typing import Optional, Tuple, Dict, Iterable, List, Set, Union
 
-from .params import KeeperParams
+from .params import KeeperParams, FolderRecordCache
 
 
 def get_folder_path(params, folder_uid, delimiter='/'):
+    path_cache = getattr(params, 'folder_path_cache', None)
+    if isinstance(path_cache, dict):
+        key = (folder_uid, delimiter)
+        path = path_cache.get(key)
+        if path is None:
+            path = _build_folder_path(params, folder_uid, delimiter)
+            path_cache[key] = path
+        return path
+    return _build_folder_path(params, folder_uid, delimiter)
+
+
+def _build_folder_path(params, folder_uid, delimiter):
     uid = folder_uid
     path = ''
     while uid in params.folder_cache:
@@ -29,21 +41,26 @@ def get_folder_path(params, folder_uid, delimiter='/'):
     return path
 
 
+def get_record_folders(params, record_uid):   # type: (KeeperParams, str) -> List[str]
+    """Returns UIDs of folders that contain the record. The root folder UID is ''"""
+    if isinstance(params.subfolder_record_cache, FolderRecordCache):
+        return params.subfolder_record_cache.get_folders(record_uid)
+    return [fuid for fuid, record_uids in params.subfolder_record_cache.items() if record_uid in record_uids]
+
+
 def find_folders(params, record_uid):   # type: (KeeperParams, str) -> Iterable[str]
-    for fuid in params.subfolder_record_cache:
-        if record_uid in params.subfolder_record_cache[fuid]:
-            if fuid:
-                yield fuid
+    for fuid in get_record_folders(params, record_uid):
+        if fuid:
+            yield fuid
 
 
 def find_all_folders(params, record_uid):   # type: (KeeperParams, str) -> Iterable[BaseFolderNode]
-    for fuid in params.subfolder_record_cache:
-        if record_uid in params.subfolder_record_cache[fuid]:
-            if fuid:
-                if fuid in params.folder_cache:
-                    yield params.folder_cache[fuid]
-            else:
-                yield params.root_folder
+    for fuid in get_record_folders(params, record_uid):
+        if fuid:
+            if fuid in params.folder_cache:
+                yield params.folder_cache[fuid]
+        else:
+            yield params.root_folder
 
 
 def find_parent_top_folder(params, record_uid):
@@ -57,10 +74,9 @@ def find_parent_top_folder(params, record_uid):
     contained_folder_uids = []
 
     # Get all folders that might contain the given record
-    for fuid in params.subfolder_record_cache:
+    for fuid in get_record_folders(params, record_uid):
         if fuid:    # record is in root folder
-            if record_uid in params.subfolder_record_cache[fuid]:
-                contained_folder_uids.append(fuid)
+            contained_folder_uids.append(fuid)
 
     shared_folders_containing_record = []
 
@@ -9,24 +9,107 @@
 # Contact: ops@keepersecurity.com
 #
 
+import concurrent.futures
 import json
 import logging
-from typing import Any, List, Dict, Optional
+import os
+import time
+from typing import Any, List, Dict, Optional, Tuple, Callable, Iterable, Set
 
 import google
 
-from . import api, utils, crypto, convert_keys
+from . import api, utils, crypto, convert_keys, lazy_record, search_index, vault_cache
 from .display import bcolors
 from .params import KeeperParams, RecordOwner
 from .proto import SyncDown_pb2, record_pb2, client_pb2, breachwatch_pb2
-from .subfolder import RootFolderNode, UserFolderNode, SharedFolderNode, SharedFolderFolderNode, BaseFolderNode
+from .subfolder import RootFolderNode, UserFolderNode, SharedFolderNode, SharedFolderFolderNode, BaseFolderNode, \
+    get_record_folders
 from .vault import KeeperRecord
 
 
+class KeyedList(list):
+    """List of dict entries indexed by a key field.
+
+    Shared folder users, teams, records and team shared folder keys are stored as KeyedList.
+    It reads and mutates like a list; find() and remove_keys() use the key index.
+    """
+    def __init__(self, key_field, items=None):    # type: (str, Optional[Iterable[Dict]]) -> None
+        super().__init__(items or ())
+        self.key_field = key_field
+        self._index = None     # type: Optional[Dict[Any, Dict]]
+
+    def _get_index(self):    # type: () -> Dict[Any, Dict]
+        if self._index is None:
+            index = {}
+            for item in self:
+                index.setdefault(item.get(self.key_field), item)
+            self._index = index
+        return self._index
+
+    def find(self, key):    # type: (Any) -> Optional[Dict]
+        return self._get_index().get(key)
+
+    def remove_keys(self, keys, key_field=None):    # type: (Set[Any], Optional[str]) -> None
+        """Removes entries whose key field, the list key by default, is in keys"""
+        if keys:
+            key_field = key_field or self.key_field
+            super().__setitem__(slice(None), [x for x in self if x.get(key_field) not in keys])
+            self._index = None
+
+    def append(self, item):
+        super().append(item)
+        if self._index is not None:
+            self._index.setdefault(item.get(self.key_field), item)
+
+    def extend(self, items):
+        self._index = None
+        super().extend(items)
+
+    def insert(self, index, item):
+        self._index = None
+        super().insert(index, item)
+
+    def remove(self, item):
+        self._index = None
+        super().remove(item)
+
+    def pop(self, index=-1):
+        self._index = None
+        return super().pop(index)
+
+    def clear(self):
+        self._index = None
+        super().clear()
+
+    def __setitem__(self, index, value):
+        self._index = None
+        super().__setitem__(index, value)
+
+    def __delitem__(self, index):
+        self._index = None
+        super().__delitem__(index)
+
+    def __iadd__(self, items):
+        self._index = None
+        return super().__iadd__(items)
+
+
+def get_keyed_list(container, name, key_field):    # type: (Dict, str, str) -> KeyedList
+    """Returns container[name] as KeyedList. Converts lists loaded from storage."""
+    items = container.get(name)
+    if not isinstance(items, KeyedList):
+        items = KeyedList(key_field, items if isinstance(items, list) else None)
+        container[name] = items
+    return items
+
+
 def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> None
     """Sync full or partial data down to the client"""
 
     params.sync_data = False
+    cache = vault_cache.get_vault_cache(params)
+    if cache and params.sync_down_token is None:
+        cache.load(params)
     token = params.sync_down_token
     if not token:
         logging.info('Syncing...')
@@ -73,6 +156,8 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
     request = SyncDown_pb2.SyncDownRequest()
     revision = params.revision
     full_sync = False
+    affected_uids = None if not token else set()
+    changed_folders = set()
     done = False
     while not done:
         if token:
@@ -80,9 +165,15 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
         response = api.communicate_rest(params, request, 'vault/sync_down', rs_type=SyncDown_pb2.SyncDownResponse)
         done = not response.hasMore
         token = response.continuationToken
+        if cache and affected_uids is not None:
+            affected_uids.update(vault_cache.get_affected_uids(params, response))
+        search_index.invalidate(params, response)
+        changed_folders.update(get_changed_folders(response))
         if response.cacheStatus == SyncDown_pb2.CLEAR:
             full_sync = True
+            affected_uids = None
             params.record_cache.clear()
+            params.record_object_cache.clear()
             params.record_rotation_cache.clear()
             params.meta_data_cache.clear()
             params.shared_folder_cache.clear()
@@ -114,27 +205,27 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
                 # delete record key
                 delete_record_key(record_uid)
                 # remove record from user folders
-                for folder_uid in params.subfolder_record_cache:
-                    if record_uid in params.subfolder_record_cache[folder_uid]:
-                        if folder_uid in params.subfolder_cache:
-                            folder = params.subfolder_cache[folder_uid]
-                            if folder.get('type') == 'user_folder':
-                                params.subfolder_record_cache[folder_uid].remove(record_uid)
-                        elif folder_uid == '':
+                for folder_uid in get_record_folders(params, record_uid):
+                    if folder_uid in params.subfolder_cache:
+                        folder = params.subfolder_cache[folder_uid]
+                        if folder.get('type') == 'user_folder':
                             params.subfolder_record_cache[folder_uid].remove(record_uid)
+                    elif folder_uid == '':
+                        params.subfolder_record_cache[folder_uid].remove(record_uid)
 
         if len(response.removedTeams) > 0:
             logging.debug('Processing removed teams')
+            removed_teams = set()
             for team_uid_bytes in response.removedTeams:
                 team_uid = utils.base64_url_encode(team_uid_bytes)
                 delete_team_key(team_uid)
-                # remove team from shared folder
-                for shared_folder_uid in params.shared_folder_cache:
-                    shared_folder = params.shared_folder_cache[shared_folder_uid]
-                    if 'teams' in shared_folder:
-                        shared_folder['teams'] = [x for x in shared_folder['teams'] if x['team_uid'] != team_uid]
+                removed_teams.add(team_uid)
                 if team_uid in params.team_cache:
                     del params.team_cache[team_uid]
+            # remove teams from shared folders
+            for shared_folder in params.shared_folder_cache.values():
+                if 'teams' in shared_folder:
+                    get_keyed_list(shared_folder, 'teams', 'team_uid').remove_keys(removed_teams)
 
         if len(response.removedSharedFolders) > 0:
             logging.debug('Processing removed shared folders')
@@ -148,7 +239,7 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
                     if 'key_type' in shared_folder:
                         del shared_folder['key_type']
                     if 'users' in shared_folder:
-                        shared_folder['users'] = [x for x in shared_folder['users'] if x['username'] != params.user]
+                        get_keyed_list(shared_folder, 'users', 'account_uid').remove_keys({params.user}, 'username')
                     if 'records' in shared_folder:
                         for r in shared_folder['records']:
                             if 'record_uid' in r:
@@ -295,23 +386,19 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
                     params.team_cache[team_uid] = team
                 assign_team(t, team)
 
-                if len(t.removedSharedFolders) > 0 and 'shared_folder_keys' in team:
-                    sf_keys = team['shared_folder_keys']
-                    if isinstance(sf_keys, list):
-                        for rsf in t.removedSharedFolders:
-                            sf_uid = utils.base64_url_encode(rsf)
-                            delete_shared_folder_key(sf_uid)
-                            pos = next((i for i, x in enumerate(sf_keys) if x['shared_folder_uid'] == sf_uid), -1)
-                            if pos >= 0:
-                                del sf_keys[pos]
+                if len(t.removedSharedFolders) > 0 and isinstance(team.get('shared_folder_keys'), list):
+                    removed_keys = set()
+                    for rsf in t.removedSharedFolders:
+                        sf_uid = utils.base64_url_encode(rsf)
+                        delete_shared_folder_key(sf_uid)
+                        removed_keys.add(sf_uid)
+                    get_keyed_list(team, 'shared_folder_keys', 'shared_folder_uid').remove_keys(removed_keys)
 
                 if len(t.sharedFolderKeys) > 0:
-                    if 'shared_folder_keys' not in team:
-                        team['shared_folder_keys'] = []
-                    sf_keys = team['shared_folder_keys']  # type: List[Dict]
+                    sf_keys = get_keyed_list(team, 'shared_folder_keys', 'shared_folder_uid')
                     for sfk in t.sharedFolderKeys:
                         sf_uid = utils.base64_url_encode(sfk.sharedFolderUid)
-                        sf_key = next((x for x in sf_keys if x['shared_folder_uid'] == sf_uid), None)
+                        sf_key = sf_keys.find(sf_uid)
                         if sf_key is None:
                             sf_key = {
                                 'shared_folder_uid': sf_uid
@@ -372,16 +459,14 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
                 shared_folder_uid = utils.base64_url_encode(sfu.sharedFolderUid)
                 account_uid = utils.base64_url_encode(sfu.accountUid) if sfu.accountUid else utils.base64_url_encode(params.account_uid_bytes)
                 if shared_folder_uid in params.shared_folder_cache:
-                    sf = params.shared_folder_cache[shared_folder_uid]
-                    if 'users' not in sf:
-                        sf['users'] = []
-                    sf_user = next((x for x in sf['users'] if x['account_uid'] == account_uid), None)
+                    sf_users = get_keyed_list(params.shared_folder_cache[shared_folder_uid], 'users', 'account_uid')
+                    sf_user = sf_users.find(account_uid)
                     if sf_user is None:
                         sf_user = {
                             'username': sfu.username,
                             'account_uid': account_uid
                         }
-                        sf['users'].append(sf_user)
+                        sf_users.append(sf_user)
                     sf_user['manage_records'] = sfu.manageRecords
                     sf_user['manage_users'] = sfu.manageUsers
                     if sfu.expiration > 0:
@@ -391,16 +476,14 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
             for sft in response.sharedFolderTeams:
                 shared_folder_uid = utils.base64_url_encode(sft.sharedFolderUid)
                 if shared_folder_uid in params.shared_folder_cache:
-                    sf = params.shared_folder_cache[shared_folder_uid]
-                    if 'teams' not in sf:
-                        sf['teams'] = []
+                    sf_teams = get_keyed_list(params.shared_folder_cache[shared_folder_uid], 'teams', 'team_uid')
                     team_uid = utils.base64_url_encode(sft.teamUid)
-                    sf_team = next((x for x in sf['teams'] if x['team_uid'] == team_uid), None)
+                    sf_team = sf_teams.find(team_uid)
                     if sf_team is None:
                         sf_team = {
                             'team_uid': team_uid
                         }
-                        sf['teams'].append(sf_team)
+                        sf_teams.append(sf_team)
                     sf_team['name'] = sft.name if hasattr(sft, 'name') else ''
                     sf_team['manage_records'] = sft.manageRecords
                     sf_team['manage_users'] = sft.manageUsers
@@ -420,56 +503,56 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
             for sfr in response.sharedFolderRecords:
                 shared_folder_uid = utils.base64_url_encode(sfr.sharedFolderUid)
                 if shared_folder_uid in params.shared_folder_cache:
-                    sf = params.shared_folder_cache[shared_folder_uid]
-                    if 'records' not in sf:
-                        sf['records'] = []
+                    sf_records = get_keyed_list(params.shared_folder_cache[shared_folder_uid], 'records', 'record_uid')
                     record_uid = utils.base64_url_encode(sfr.recordUid)
-                    sf_record = next((x for x in sf['records'] if x['record_uid'] == record_uid), None)  # type: Dict
+                    sf_record = sf_records.find(record_uid)
                     if sf_record is None:
                         sf_record = {
                             'record_uid': record_uid
                         }
-                        sf['records'].append(sf_record)
+                        sf_records.append(sf_record)
                     assign_shared_folder_record(sfr, sf_record)
                     params.record_owner_cache[record_uid] = \
                         RecordOwner(sf_record['owner'], sf_record['owner_account_uid'])
 
+        # removed shared folder entries are grouped by shared folder and dropped in a single pass
         if len(response.removedSharedFolderRecords) > 0:
+            removed_records = {}    # type: Dict[str, Set[str]]
             for rsfr in response.removedSharedFolderRecords:
                 shared_folder_uid = utils.base64_url_encode(rsfr.sharedFolderUid)
                 record_uid = utils.base64_url_encode(rsfr.recordUid)
                 delete_record_key(record_uid)
-                if shared_folder_uid in params.shared_folder_cache:
-                    sf = params.shared_folder_cache[shared_folder_uid]  # type: dict
-                    if 'records' in sf:
-                        pos = next((i for i, x in enumerate(sf['records']) if x['record_uid'] == record_uid), -1)
-                        if pos >= 0:
-                            del sf['records'][pos]
+                removed_records.setdefault(shared_folder_uid, set()).add(record_uid)
+            for shared_folder_uid, record_uids in removed_records.items():
+                sf = params.shared_folder_cache.get(shared_folder_uid)
+                if sf and 'records' in sf:
+                    get_keyed_list(sf, 'records', 'record_uid').remove_keys(record_uids)
 
         if len(response.removedSharedFolderUsers) > 0:
+            removed_users = {}    # type: Dict[str, Tuple[Set[str], Set[str]]]
             for rsfu in response.removedSharedFolderUsers:
                 shared_folder_uid = utils.base64_url_encode(rsfu.sharedFolderUid)
-                if shared_folder_uid in params.shared_folder_cache:
-                    sf = params.shared_folder_cache[shared_folder_uid]
-                    if 'users' in sf:
-                        if len(rsfu.username) > 0:
-                            pos = next((i for i, x in enumerate(sf['users']) if x['username'] == rsfu.username), -1)
-                        else:
-                            account_uid = utils.base64_url_encode(rsfu.accountUid)
-                            pos = next((i for i, x in enumerate(sf['users']) if x['account_uid'] == account_uid), -1)
-                        if pos >= 0:
-                            del sf['users'][pos]
+                usernames, account_uids = removed_users.setdefault(shared_folder_uid, (set(), set()))
+                if len(rsfu.username) > 0:
+                    usernames.add(rsfu.username)
+                else:
+                    account_uids.add(utils.base64_url_encode(rsfu.accountUid))
+            for shared_folder_uid, (usernames, account_uids) in removed_users.items():
+                sf = params.shared_folder_cache.get(shared_folder_uid)
+                if sf and 'users' in sf:
+                    sf_users = get_keyed_list(sf, 'users', 'account_uid')
+                    sf_users.remove_keys(usernames, 'username')
+                    sf_users.remove_keys(account_uids)
 
         if len(response.removedSharedFolderTeams) > 0:
+            removed_teams = {}    # type: Dict[str, Set[str]]
             for rsft in response.removedSharedFolderTeams:
                 shared_folder_uid = utils.base64_url_encode(rsft.sharedFolderUid)
-                team_uid = utils.base64_url_encode(rsft.teamUid)
-                if shared_folder_uid in params.shared_folder_cache:
-                    sf = params.shared_folder_cache[shared_folder_uid]
-                    if 'teams' in sf:
-                        pos = next((i for i, x in enumerate(sf['teams']) if x['team_uid'] == team_uid), -1)
-                        if pos >= 0:
-                            del sf['teams'][pos]
+                removed_teams.setdefault(shared_folder_uid, set()).add(utils.base64_url_encode(rsft.teamUid))
+            for shared_folder_uid, team_uids in removed_teams.items():
+                sf = params.shared_folder_cache.get(shared_folder_uid)
+                if sf and 'teams' in sf:
+                    get_keyed_list(sf, 'teams', 'team_uid').remove_keys(team_uids)
 
         if len(response.userFolders) > 0:
             def convert_user_folder(uf):
@@ -630,68 +713,148 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
                 if account_uid and account_uid in params.user_cache:
                     bwr['scanned_by'] = params.user_cache[account_uid]
 
-    to_delete = set()
+    decrypt_vault(params)
 
-    logging.debug('Decrypting meta data keys')
-    for record_uid, meta_data in params.meta_data_cache.items():
-        if 'record_key_unencrypted' in meta_data:
+    if params.record_object_cache:
+        for record_uid in [x for x in params.record_object_cache if x not in params.record_cache]:
+            del params.record_object_cache[record_uid]
+
+    prepare_folder_tree(params, None if full_sync else changed_folders)
+
+    # Populate/update cache record security data
+    for sec_data in resp_sec_data_recs:
+        record_uid = utils.base64_url_encode(sec_data.recordUid)
+        params.breach_watch_security_data[record_uid] = {'revision': sec_data.revision}
+
+    # Populate/update security score data
+    for sec_score_rec in resp_sec_scores:
+        record_uid = utils.base64_url_encode(sec_score_rec.recordUid or b'')
+        record = KeeperRecord.load(params, record_uid)
+        if not record:
             continue
-        record_key = None
+        revision = sec_score_rec.revision
+        data = sec_score_rec.data
         try:
-            if 'record_key' not in meta_data:
-                # old record that doesn't have a record key so make one
-                logging.debug('...no record key.  creating...')
-                # store as b64 encoded string
-                # note: decode() converts bytestream (b'') to string
-                # note2: remove == from the end
-                record_key = utils.generate_aes_key()
-                record_key_encrypted = crypto.encrypt_aes_v1(record_key, params.data_key)
-                meta_data['record_key'] = utils.base64_url_encode(record_key_encrypted)
-                meta_data['record_key_type'] = 1
-                # temporary flag for decryption routine below
-                meta_data['old_record_flag'] = True
-                meta_data['is_converted_record_type'] = True
+            if data:
+                data = crypto.decrypt_aes_v2(sec_score_rec.data, record.record_key).decode()
+                data = json.loads(data)
             else:
-                record_key_encrypted = utils.base64_url_decode(meta_data['record_key'])
-                key_type = meta_data['record_key_type']
-                if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY:
-                    record_key = crypto.decrypt_aes_v1(record_key_encrypted, params.data_key)
-                elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY:
-                    record_key = crypto.decrypt_rsa(record_key_encrypted, params.rsa_key2)
-                elif key_type == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM:
-                    record_key = crypto.decrypt_aes_v2(record_key_encrypted, params.data_key)
-                elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY_ECC:
-                    record_key = crypto.decrypt_ec(record_key_encrypted, params.ecc_key)
-                else:
-                    raise Exception('Unsupported key type')
+                data = dict()
+        except:
+            data = dict()
+        params.security_score_data.update({record_uid: dict(record_uid=record_uid, data=data, revision=revision)})
+
+    # Populate/update cache BreachWatch records data
+    for p_bwr in resp_bw_recs:
+        record_uid = utils.base64_url_encode(p_bwr.recordUid)
+        if not record_uid:
+            continue
+        record = params.record_cache.get(record_uid)
+        if not record:
+            continue
+        if 'record_key_unencrypted' not in record:
+            continue
+        try:
+            bwr = {
+                'record_uid': utils.base64_url_encode(p_bwr.recordUid),
+                'data': utils.base64_url_encode(p_bwr.data),
+                'type': 'RECORD' if p_bwr.type == breachwatch_pb2.RECORD else 'ALTERNATE_PASSWORD',
+                'revision': p_bwr.revision,
+                'scanned_by_account_uid': utils.base64_url_encode(p_bwr.scannedByAccountUid or params.account_uid_bytes)
+            }
+            if len(p_bwr.data) > 0:
+                data = crypto.decrypt_aes_v2(p_bwr.data, record['record_key_unencrypted'])
+                data_obj = client_pb2.BreachWatchData()
+                data_obj.ParseFromString(data)
+                bwr['data_unencrypted'] = google.protobuf.json_format.MessageToDict(data_obj)
+            params.breach_watch_records[record_uid] = bwr
         except Exception as e:
-            logging.debug('Record %s meta data decryption error: %s', record_uid, e)
+            logging.debug('Decrypt bw data: %s', e)
 
-        if record_key and len(record_key) == 32:
-            meta_data['record_key_unencrypted'] = record_key
-        else:
-            to_delete.add(record_uid)
+    if full_sync or record_types:
+        # Record V3 types cache population
+        record_types_rs = _sync_record_types(params)
+        if len(record_types_rs.recordTypes) > 0:
+            params.record_type_cache = {}
+            for rt in record_types_rs.recordTypes:
+                type_id = rt.recordTypeId
+                type_id += rt.scope * 1000000
+                params.record_type_cache[type_id] = rt.content
 
-    for record_uid in to_delete:
-        del params.meta_data_cache[record_uid]
-    to_delete.clear()
+    if cache:
+        cache.save(params, affected_uids)
 
-    logging.debug('Decrypting team keys')
-    for team_uid, team in params.team_cache.items():
+    if full_sync:
+        convert_keys.change_key_types(params)
+
+        if params.breach_watch:
+            weak_count = 0
+            for _ in params.breach_watch.get_records_by_status(params, ['WEAK', 'BREACHED']):
+                weak_count += 1
+            if weak_count > 0:
+                logging.info(bcolors.WARNING +
+                             f'The number of records that are affected by breaches or contain high-risk passwords: {weak_count}' +
+                             '\nUse \"breachwatch list\" command to get more details' +
+                             bcolors.ENDC)
+
+        record_count = 0
+        valid_versions = {2, 3}
+        for r in params.record_cache.values():
+            if r.get('version', 0) in valid_versions:
+                record_count += 1
+        if record_count:
+            logging.info('Decrypted [%d] record(s)', record_count)
+
+
+DECRYPT_MAX_WORKERS = min(8, (os.cpu_count() or 1) + 2)
+DECRYPT_PARALLEL_THRESHOLD = 256
+_DECRYPT_BATCH_SIZE = 128
+
+
+def _run_tier(executor, func, items):
+    # type: (Optional[concurrent.futures.Executor], Callable[[Any], Any], List[Any]) -> List[Any]
+    if executor is None or len(items) < DECRYPT_PARALLEL_THRESHOLD:
+        return [func(x) for x in items]
+
+    def run_batch(batch):
+        return [func(x) for x in batch]
+
+    batches = [items[i:i + _DECRYPT_BATCH_SIZE] for i in range(0, len(items), _DECRYPT_BATCH_SIZE)]
+    results = []
+    for batch_results in executor.map(run_batch, batches):
+        results.extend(batch_results)
+    return results
+
+
+def _decrypt_by_user_key(params, encrypted_key, key_type, default_aes_v1=False):
+    # type: (KeeperParams, bytes, int, bool) -> bytes
+    if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY:
+        return crypto.decrypt_aes_v1(encrypted_key, params.data_key)
+    if key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY:
+        return crypto.decrypt_rsa(encrypted_key, params.rsa_key2)
+    if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM:
+        return crypto.decrypt_aes_v2(encrypted_key, params.data_key)
+    if key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY_ECC:
+        return crypto.decrypt_ec(encrypted_key, params.ecc_key)
+    if default_aes_v1:
+        return crypto.decrypt_aes_v1(encrypted_key, params.data_key)
+    raise Exception('Unsupported key type')
+
+
+def decrypt_vault(params):    # type: (KeeperParams) -> List[Tuple[str, int, float]]
+    """Decrypts keys and data of the vault caches.
+
+    Decryption runs in dependency order: team keys, shared folder keys, record keys, record data and folders.
+    Every tier is processed as a batch on a thread pool.
+    Returns the timing breakdown: (tier name, number of items, seconds)
+    """
+    timings = []     # type: List[Tuple[str, int, float]]
+
+    def decrypt_team(team):
+        team_uid = team['team_uid']
         if 'team_key_unencrypted' not in team:
             try:
-                encrypted_team_key = utils.base64_url_decode(team['team_key'])
-                key_type = team['team_key_type']
-                if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY:
-                    team_key = crypto.decrypt_aes_v1(encrypted_team_key, params.data_key)
-                elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY:
-                    team_key = crypto.decrypt_rsa(encrypted_team_key, params.rsa_key2)
-                elif key_type == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM:
-                    team_key = crypto.decrypt_aes_v2(encrypted_team_key, params.data_key)
-                elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY_ECC:
-                    team_key = crypto.decrypt_ec(encrypted_team_key, params.ecc_key)
-                else:
-                    raise Exception('Unsupported key type')
+                team_key = _decrypt_by_user_key(params, utils.base64_url_decode(team['team_key']), team['team_key_type'])
                 team['team_key_unencrypted'] = team_key
                 if 'team_private_key' in team:
                     encrypted_team_private_key = utils.base64_url_decode(team['team_private_key'])
@@ -701,120 +864,267 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
                     team['team_ec_private_key_unencrypted'] = crypto.decrypt_aes_v2(encrypted_team_private_key, team_key)
             except Exception as e:
                 logging.info('Could not decrypt team %s key: %s', team_uid, e)
-        if 'team_key_unencrypted' in team:
-            team_key = team['team_key_unencrypted']
-            team_uid = team['team_uid']
-            if 'shared_folder_keys' in team:
-                for sf_key in team['shared_folder_keys']:
-                    shared_folder_uid = sf_key['shared_folder_uid']
-                    if 'shared_folder_key_unencrypted' not in sf_key:
-                        encrypted_sf_key = utils.base64_url_decode(sf_key['shared_folder_key'])
-                        try:
-                            key_type = sf_key['key_type']
-                            decrypted_sf_key = None
-                            if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY:
-                                decrypted_sf_key = crypto.decrypt_aes_v1(encrypted_sf_key, team_key)
-                            elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY:
-                                if 'team_private_key_unencrypted' in team:
-                                    team_private_key = team['team_private_key_unencrypted']
-                                    team_pk = crypto.load_rsa_private_key(team_private_key)
-                                    decrypted_sf_key = crypto.decrypt_rsa(encrypted_sf_key, team_pk)
-                            elif key_type == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM:
-                                decrypted_sf_key = crypto.decrypt_aes_v2(encrypted_sf_key, team_key)
-                            elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY_ECC:
-                                if 'team_ec_private_key_unencrypted' in team:
-                                    team_private_key = team['team_ec_private_key_unencrypted']
-                                    team_pk = crypto.load_ec_private_key(team_private_key)
-                                    decrypted_sf_key = crypto.decrypt_ec(encrypted_sf_key, team_pk)
-                            else:
-                                raise Exception('Unsupported key type')
-                            if decrypted_sf_key:
-                                sf_key['shared_folder_key_unencrypted'] = decrypted_sf_key
-                            else:
-                                logging.debug('Cannot decrypt team\' shared folder key: team_uid=%s, shared_folder_uid=%s', team_uid, shared_folder_uid)
-                        except Exception as e:
-                            logging.debug('Decryption error: team_uid=%s, shared_folder_uid=%s: %s', team_uid, shared_folder_uid, e)
-        else:
-            to_delete.add(team_uid)
-
-    for team_uid in to_delete:
-        del params.team_cache[team_uid]
-    to_delete.clear()
+        if 'team_key_unencrypted' not in team:
+            return False
+
+        team_key = team['team_key_unencrypted']
+        if 'shared_folder_keys' in team:
+            for sf_key in team['shared_folder_keys']:
+                shared_folder_uid = sf_key['shared_folder_uid']
+                if 'shared_folder_key_unencrypted' not in sf_key:
+                    encrypted_sf_key = utils.base64_url_decode(sf_key['shared_folder_key'])
+                    try:
+                        key_type = sf_key['key_type']
+                        decrypted_sf_key = None
+                        if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY:
+                            decrypted_sf_key = crypto.decrypt_aes_v1(encrypted_sf_key, team_key)
+                        elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY:
+                            if 'team_private_key_unencrypted' in team:
+                                team_private_key = team['team_private_key_unencrypted']
+                                team_pk = crypto.load_rsa_private_key(team_private_key)
+                                decrypted_sf_key = crypto.decrypt_rsa(encrypted_sf_key, team_pk)
+                        elif key_type == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM:
+                            decrypted_sf_key = crypto.decrypt_aes_v2(encrypted_sf_key, team_key)
+                        elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY_ECC:
+                            if 'team_ec_private_key_unencrypted' in team:
+                                team_private_key = team['team_ec_private_key_unencrypted']
+                                team_pk = crypto.load_ec_private_key(team_private_key)
+                                decrypted_sf_key = crypto.decrypt_ec(encrypted_sf_key, team_pk)
+                        else:
+                            raise Exception('Unsupported key type')
+                        if decrypted_sf_key:
+                            sf_key['shared_folder_key_unencrypted'] = decrypted_sf_key
+                        else:
+                            logging.debug('Cannot decrypt team\' shared folder key: team_uid=%s, shared_folder_uid=%s', team_uid, shared_folder_uid)
+                    except Exception as e:
+                        logging.debug('Decryption error: team_uid=%s, shared_folder_uid=%s: %s', team_uid, shared_folder_uid, e)
+        return True
 
-    logging.debug('Decrypting shared folder keys')
-    for shared_folder_uid, shared_folder in params.shared_folder_cache.items():
+    def decrypt_shared_folder(shared_folder):
+        shared_folder_uid = shared_folder['shared_folder_uid']
         if 'shared_folder_key_unencrypted' not in shared_folder and 'shared_folder_key' in shared_folder:
             # shared folder key
             try:
                 encrypted_sf_key = utils.base64_url_decode(shared_folder['shared_folder_key'])
-                key_type = shared_folder['key_type']
-                if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY:
-                    sf_key = crypto.decrypt_aes_v1(encrypted_sf_key, params.data_key)
-                elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY:
-                    sf_key = crypto.decrypt_rsa(encrypted_sf_key, params.rsa_key2)
-                elif key_type == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM:
-                    sf_key = crypto.decrypt_aes_v2(encrypted_sf_key, params.data_key)
-                elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY_ECC:
-                    sf_key = crypto.decrypt_ec(encrypted_sf_key, params.ecc_key)
-                else:
-                    sf_key = crypto.decrypt_aes_v1(encrypted_sf_key, params.data_key)
-                shared_folder['shared_folder_key_unencrypted'] = sf_key
+                shared_folder['shared_folder_key_unencrypted'] = \
+                    _decrypt_by_user_key(params, encrypted_sf_key, shared_folder['key_type'], default_aes_v1=True)
             except Exception as e:
                 logging.debug('Shared folder %s key decryption error: %s', shared_folder_uid, e)
 
         if 'shared_folder_key_unencrypted' not in shared_folder:
             # team's shared folder key
-            for team_uid, team in params.team_cache.items():
-                if 'shared_folder_keys' in team:
-                    sf_key = next((x for x in team['shared_folder_keys'] if x['shared_folder_uid'] == shared_folder_uid), None)
-                    if sf_key and 'shared_folder_key_unencrypted' in sf_key:
-                        shared_folder['shared_folder_key_unencrypted'] = sf_key['shared_folder_key_unencrypted']
+            if shared_folder_uid in team_sf_keys:
+                shared_folder['shared_folder_key_unencrypted'] = team_sf_keys[shared_folder_uid]
 
-        if 'shared_folder_key_unencrypted' in shared_folder:
-            sf_key = shared_folder['shared_folder_key_unencrypted']
-            try:
-                if 'name_unencrypted' not in shared_folder:
-                    name = shared_folder.get('name')
-                    if name:
-                        shared_folder['name_unencrypted'] = \
-                            crypto.decrypt_aes_v1(utils.base64_url_decode(name), sf_key).decode('utf-8')
-                    else:
-                        data = shared_folder.get('data')
-                        if data:
-                            shared_folder['data_unencrypted'] = \
-                                crypto.decrypt_aes_v1(utils.base64_url_decode(data), sf_key)
-                            data_json = json.loads(shared_folder['data_unencrypted'].decode('utf-8'))
-                            shared_folder['name_unencrypted'] = data_json['name']
-                if 'data' in shared_folder and 'data_unencrypted' not in shared_folder:
-                    data = utils.base64_url_decode(shared_folder['data'])
-                    shared_folder['data_unencrypted'] = crypto.decrypt_aes_v1(data, sf_key)
+        if 'shared_folder_key_unencrypted' not in shared_folder:
+            return False
 
-            except Exception as e:
-                logging.debug('Shared folder %s name decryption error: %s', shared_folder_uid, e)
+        sf_key = shared_folder['shared_folder_key_unencrypted']
+        try:
             if 'name_unencrypted' not in shared_folder:
-                shared_folder['name_unencrypted'] = shared_folder_uid
+                name = shared_folder.get('name')
+                if name:
+                    shared_folder['name_unencrypted'] = \
+                        crypto.decrypt_aes_v1(utils.base64_url_decode(name), sf_key).decode('utf-8')
+                else:
+                    data = shared_folder.get('data')
+                    if data:
+                        shared_folder['data_unencrypted'] = \
+                            crypto.decrypt_aes_v1(utils.base64_url_decode(data), sf_key)
+                        data_json = json.loads(shared_folder['data_unencrypted'].decode('utf-8'))
+                        shared_folder['name_unencrypted'] = data_json['name']
+            if 'data' in shared_folder and 'data_unencrypted' not in shared_folder:
+                data = utils.base64_url_decode(shared_folder['data'])
+                shared_folder['data_unencrypted'] = crypto.decrypt_aes_v1(data, sf_key)
 
-            if 'records' in shared_folder:
-                for sfr in shared_folder['records']:
-                    if 'record_key_unencrypted' not in sfr:
-                        try:
-                            encrypted_key = utils.base64_url_decode(sfr['record_key'])
-                            if len(encrypted_key) == 60:
-                                decrypted_key = crypto.decrypt_aes_v2(encrypted_key, sf_key)
-                            else:
-                                decrypted_key = crypto.decrypt_aes_v1(encrypted_key, sf_key)
-                            sfr['record_key_unencrypted'] = decrypted_key
-                        except Exception as e:
-                            logging.debug('Shared folder %s record key decryption error: %s', shared_folder_uid, e)
-        else:
-            to_delete.add(shared_folder_uid)
+        except Exception as e:
+            logging.debug('Shared folder %s name decryption error: %s', shared_folder_uid, e)
+        if 'name_unencrypted' not in shared_folder:
+            shared_folder['name_unencrypted'] = shared_folder_uid
 
-    for shared_folder_uid in to_delete:
-        del params.shared_folder_cache[shared_folder_uid]
-        if shared_folder_uid in params.subfolder_cache:
-            del params.subfolder_cache[shared_folder_uid]
-    to_delete.clear()
+        if 'records' in shared_folder:
+            for sfr in shared_folder['records']:
+                if 'record_key_unencrypted' not in sfr:
+                    try:
+                        encrypted_key = utils.base64_url_decode(sfr['record_key'])
+                        if len(encrypted_key) == 60:
+                            decrypted_key = crypto.decrypt_aes_v2(encrypted_key, sf_key)
+                        else:
+                            decrypted_key = crypto.decrypt_aes_v1(encrypted_key, sf_key)
+                        sfr['record_key_unencrypted'] = decrypted_key
+                    except Exception as e:
+                        logging.debug('Shared folder %s record key decryption error: %s', shared_folder_uid, e)
+        return True
 
+    def decrypt_meta_data(meta_data):
+        record_uid = meta_data['record_uid']
+        record_key = None
+        try:
+            if 'record_key' not in meta_data:
+                # old record that doesn't have a record key so make one
+                logging.debug('...no record key.  creating...')
+                # store as b64 encoded string
+                # note: decode() converts bytestream (b'') to string
+                # note2: remove == from the end
+                record_key = utils.generate_aes_key()
+                record_key_encrypted = crypto.encrypt_aes_v1(record_key, params.data_key)
+                meta_data['record_key'] = utils.base64_url_encode(record_key_encrypted)
+                meta_data['record_key_type'] = 1
+                # temporary flag for decryption routine below
+                meta_data['old_record_flag'] = True
+                meta_data['is_converted_record_type'] = True
+            else:
+                record_key_encrypted = utils.base64_url_decode(meta_data['record_key'])
+                record_key = _decrypt_by_user_key(params, record_key_encrypted, meta_data['record_key_type'])
+        except Exception as e:
+            logging.debug('Record %s meta data decryption error: %s', record_uid, e)
+
+        if record_key and len(record_key) == 32:
+            meta_data['record_key_unencrypted'] = record_key
+            return True
+        return False
+
+    def decrypt_record(record):
+        if 'data_unencrypted' not in record:
+            try:
+                data, extra = lazy_record.decrypt_record_data(record)
+                record['data_unencrypted'] = data
+                if extra is not None:
+                    record['extra_unencrypted'] = extra
+            except Exception as e:
+                logging.debug('Record %s data/extra decryption error: %s', record['record_uid'], e)
+
+    def decrypt_non_shared_data(nsd):
+        record_uid = nsd['record_uid']
+        record = params.record_cache[record_uid]
+        data = nsd.get('data')
+        if data:
+            version = record.get('version') or 0
+            try:
+                if version >= 3:
+                    nsd['data_unencrypted'] = crypto.decrypt_aes_v2(utils.base64_url_decode(data), params.data_key)
+                else:
+                    nsd['data_unencrypted'] = crypto.decrypt_aes_v1(utils.base64_url_decode(data), params.data_key)
+            except:
+                try:
+                    if version < 3:
+                        nsd['data_unencrypted'] = crypto.decrypt_aes_v2(utils.base64_url_decode(data), params.data_key)
+                    else:
+                        nsd['data_unencrypted'] = crypto.decrypt_aes_v1(utils.base64_url_decode(data), params.data_key)
+                except Exception as e:
+                    logging.debug('Non Shared Data %s data decryption error: %s', record_uid, e)
+
+    def decrypt_folder(sf):
+        folder_type = sf['type']
+        if folder_type == 'user_folder':
+            if 'folder_key_unencrypted' not in sf:
+                try:
+                    encrypted_key = utils.base64_url_decode(sf['user_folder_key'])
+                    sf['folder_key_unencrypted'] = \
+                        _decrypt_by_user_key(params, encrypted_key, sf['key_type'], default_aes_v1=True)
+                except Exception as e:
+                    logging.debug('User folder data decryption error: %s', e)
+        elif folder_type == 'shared_folder_folder':
+            if 'folder_key_unencrypted' not in sf:
+                try:
+                    shared_folder_uid = sf['shared_folder_uid']
+                    if shared_folder_uid in params.shared_folder_cache:
+                        shared_folder = params.shared_folder_cache[shared_folder_uid]
+                        encrypted_key = utils.base64_url_decode(sf['shared_folder_folder_key'])
+                        sf['folder_key_unencrypted'] = crypto.decrypt_aes_v1(encrypted_key, shared_folder['shared_folder_key_unencrypted'])
+                except Exception as e:
+                    logging.debug('Shared folder folder %s data decryption error: %s', sf['folder_uid'], e)
+        else:
+            return
+        if 'folder_key_unencrypted' in sf:
+            if 'data_unencrypted' not in sf:
+                try:
+                    data_encrypted = utils.base64_url_decode(sf['data'])
+                    sf['data_unencrypted'] = crypto.decrypt_aes_v1(data_encrypted, sf['folder_key_unencrypted'])
+                except Exception as e:
+                    logging.debug('Error decrypting shared folder folder %s data: %s', sf['folder_uid'], e)
+
+    def run_tier(name, func, items):
+        started = time.perf_counter()
+        results = _run_tier(executor, func, items)
+        timings.append((name, len(items), time.perf_counter() - started))
+        return results
+
+    plaintext_cache = lazy_record.get_plaintext_cache(params)
+    if plaintext_cache is not None:
+        pending = sum((1 for x in params.meta_data_cache.values() if 'record_key_unencrypted' not in x))
+    else:
+        pending = sum((1 for x in params.record_cache.values() if 'data_unencrypted' not in x))
+    executor = None
+    if DECRYPT_MAX_WORKERS > 1 and pending >= DECRYPT_PARALLEL_THRESHOLD:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=DECRYPT_MAX_WORKERS,
+                                                         thread_name_prefix='sync_down')
+    try:
+        logging.debug('Decrypting team keys')
+        teams = list(params.team_cache.values())
+        results = run_tier('Team keys', decrypt_team, teams)
+        for team, ok in zip(teams, results):
+            if not ok:
+                del params.team_cache[team['team_uid']]
+
+        logging.debug('Decrypting shared folder keys')
+        team_sf_keys = {}    # type: Dict[str, bytes]
+        for team in params.team_cache.values():
+            if 'shared_folder_keys' in team:
+                for sf_key in team['shared_folder_keys']:
+                    if 'shared_folder_key_unencrypted' in sf_key:
+                        team_sf_keys[sf_key['shared_folder_uid']] = sf_key['shared_folder_key_unencrypted']
+        shared_folders = list(params.shared_folder_cache.values())
+        results = run_tier('Shared folder keys', decrypt_shared_folder, shared_folders)
+        for shared_folder, ok in zip(shared_folders, results):
+            if not ok:
+                shared_folder_uid = shared_folder['shared_folder_uid']
+                del params.shared_folder_cache[shared_folder_uid]
+                if shared_folder_uid in params.subfolder_cache:
+                    del params.subfolder_cache[shared_folder_uid]
+
+        logging.debug('Decrypting meta data keys')
+        started = time.perf_counter()
+        meta_data = [x for x in params.meta_data_cache.values() if 'record_key_unencrypted' not in x]
+        results = _run_tier(executor, decrypt_meta_data, meta_data)
+        for md, ok in zip(meta_data, results):
+            if not ok:
+                del params.meta_data_cache[md['record_uid']]
+        _resolve_record_keys(params)
+        timings.append(('Record keys', len(meta_data), time.perf_counter() - started))
+
+        if plaintext_cache is not None:
+            # record payloads are decrypted on first access
+            for record_uid, record in list(params.record_cache.items()):
+                if not isinstance(record, lazy_record.LazyRecord):
+                    params.record_cache[record_uid] = lazy_record.LazyRecord(
+                        plaintext_cache, ((k, v) for k, v in record.items() if k not in lazy_record.LAZY_KEYS))
+        else:
+            logging.debug('Decrypting records')
+            records = [x for x in params.record_cache.values() if 'data_unencrypted' not in x]
+            run_tier('Record data', decrypt_record, records)
+
+        logging.debug('Decrypting non shared data')
+        nsd = [x for uid, x in params.non_shared_data_cache.items()
+               if 'data_unencrypted' not in x and uid in params.record_cache]
+        run_tier('Non shared data', decrypt_non_shared_data, nsd)
+
+        logging.debug('Decrypting folders')
+        folders = [x for x in params.subfolder_cache.values()
+                   if 'folder_key_unencrypted' not in x or 'data_unencrypted' not in x]
+        run_tier('Folders', decrypt_folder, folders)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug('Decryption timings: %s',
+                      ', '.join((f'{name}: {count} in {elapsed:.3f}s' for name, count, elapsed in timings)))
+    return timings
+
+
+def _resolve_record_keys(params):    # type: (KeeperParams) -> None
+    to_delete = set()
     logging.debug('Resolve record keys. Meta data')
     for record_uid, record in params.record_cache.items():
         if 'record_key_unencrypted' not in record:
@@ -875,168 +1185,6 @@ def sync_down(params, record_types=False):   # type: (KeeperParams, bool) -> Non
             if record_uid in parents:
                 del parents[record_uid]
         del params.record_cache[record_uid]
-    to_delete.clear()
-
-    logging.debug('Decrypting records')
-    for record_uid, record in params.record_cache.items():
-        record_key = record['record_key_unencrypted']
-        if 'data_unencrypted' not in record:
-            try:
-                if 'version' in record and record['version'] >= 3:
-                    record['data_unencrypted'] = crypto.decrypt_aes_v2(utils.base64_url_decode(record['data']), record_key) if 'data' in record else b'{}'
-                else:
-                    record['data_unencrypted'] = crypto.decrypt_aes_v1(utils.base64_url_decode(record['data']), record_key) if 'data' in record else b'{}'
-                    extra = record.get('extra')
-                    if extra:
-                        record['extra_unencrypted'] = crypto.decrypt_aes_v1(utils.base64_url_decode(extra), record_key)
-                    else:
-                        record['extra_unencrypted'] = b'{}'
-            except Exception as e:
-                logging.debug('Record %s data/extra decryption error: %s', record_uid, e)
-
-    logging.debug('Decrypting non shared data')
-    for record_uid, nsd in params.non_shared_data_cache.items():
-        if 'data_unencrypted' not in nsd and record_uid in params.record_cache:
-            record = params.record_cache[record_uid]
-            data = nsd.get('data')
-            if data:
-                version = record.get('version') or 0
-                try:
-                    if version >= 3:
-                        nsd['data_unencrypted'] = crypto.decrypt_aes_v2(utils.base64_url_decode(data), params.data_key)
-                    else:
-                        nsd['data_unencrypted'] = crypto.decrypt_aes_v1(utils.base64_url_decode(data), params.data_key)
-                except:
-                    try:
-                        if version < 3:
-                            nsd['data_unencrypted'] = crypto.decrypt_aes_v2(utils.base64_url_decode(data), params.data_key)
-                        else:
-                            nsd['data_unencrypted'] = crypto.decrypt_aes_v1(utils.base64_url_decode(data), params.data_key)
-                    except Exception as e:
-                        logging.debug('Non Shared Data %s data decryption error: %s', record_uid, e)
-
-    logging.debug('Decrypting folders')
-    for folder_uid, sf in params.subfolder_cache.items():
-        folder_type = sf['type']
-        if folder_type == 'user_folder':
-            if 'folder_key_unencrypted' not in sf:
-                try:
-                    encrypted_key = utils.base64_url_decode(sf['user_folder_key'])
-                    key_type = sf['key_type']
-                    if key_type == record_pb2.ENCRYPTED_BY_DATA_KEY:
-                        sf['folder_key_unencrypted'] = crypto.decrypt_aes_v1(encrypted_key, params.data_key)
-                    elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY:
-                        sf['folder_key_unencrypted'] = crypto.decrypt_rsa(encrypted_key, params.rsa_key2)
-                    elif key_type == record_pb2.ENCRYPTED_BY_DATA_KEY_GCM:
-                        sf['folder_key_unencrypted'] = crypto.decrypt_aes_v2(encrypted_key, params.data_key)
-                    elif key_type == record_pb2.ENCRYPTED_BY_PUBLIC_KEY_ECC:
-                        sf['folder_key_unencrypted'] = crypto.decrypt_ec(encrypted_key, params.ecc_key)
-                    else:
-                        sf['folder_key_unencrypted'] = crypto.decrypt_aes_v1(encrypted_key, params.data_key)
-                except Exception as e:
-                    logging.debug('User folder data decryption error: %s', e)
-        elif folder_type == 'shared_folder_folder':
-            if 'folder_key_unencrypted' not in sf:
-                try:
-                    shared_folder_uid = sf['shared_folder_uid']
-                    if shared_folder_uid in params.shared_folder_cache:
-                        shared_folder = params.shared_folder_cache[shared_folder_uid]
-                        encrypted_key = utils.base64_url_decode(sf['shared_folder_folder_key'])
-                        sf['folder_key_unencrypted'] = crypto.decrypt_aes_v1(encrypted_key, shared_folder['shared_folder_key_unencrypted'])
-                except Exception as e:
-                    logging.debug('Shared folder folder %s data decryption error: %s', sf['folder_uid'], e)
-        else:
-            continue
-        if 'folder_key_unencrypted' in sf:
-            if 'data_unencrypted' not in sf:
-                try:
-                    data_encrypted = utils.base64_url_decode(sf['data'])
-                    sf['data_unencrypted'] = crypto.decrypt_aes_v1(data_encrypted, sf['folder_key_unencrypted'])
-                except Exception as e:
-                    logging.debug('Error decrypting shared folder folder %s data: %s', sf['folder_uid'], e)
-
-    prepare_folder_tree(params)
-
-    # Populate/update cache record security data
-    for sec_data in resp_sec_data_recs:
-        record_uid = utils.base64_url_encode(sec_data.recordUid)
-        params.breach_watch_security_data[record_uid] = {'revision': sec_data.revision}
-
-    # Populate/update security score data
-    for sec_score_rec in resp_sec_scores:
-        record_uid = utils.base64_url_encode(sec_score_rec.recordUid or b'')
-        record = KeeperRecord.load(params, record_uid)
-        if not record:
-            continue
-        revision = sec_score_rec.revision
-        data = sec_score_rec.data
-        try:
-            if data:
-                data = crypto.decrypt_aes_v2(sec_score_rec.data, record.record_key).decode()
-                data = json.loads(data)
-            else:
-                data = dict()
-        except:
-            data = dict()
-        params.security_score_data.update({record_uid: dict(record_uid=record_uid, data=data, revision=revision)})
-
-    # Populate/update cache BreachWatch records data
-    for p_bwr in resp_bw_recs:
-        record_uid = utils.base64_url_encode(p_bwr.recordUid)
-        if not record_uid:
-            continue
-        record = params.record_cache.get(record_uid)
-        if not record:
-            continue
-        if 'record_key_unencrypted' not in record:
-            continue
-        try:
-            bwr = {
-                'record_uid': utils.base64_url_encode(p_bwr.recordUid),
-                'data': utils.base64_url_encode(p_bwr.data),
-                'type': 'RECORD' if p_bwr.type == breachwatch_pb2.RECORD else 'ALTERNATE_PASSWORD',
-                'revision': p_bwr.revision,
-                'scanned_by_account_uid': utils.base64_url_encode(p_bwr.scannedByAccountUid or params.account_uid_bytes)
-            }
-            if len(p_bwr.data) > 0:
-                data = crypto.decrypt_aes_v2(p_bwr.data, record['record_key_unencrypted'])
-                data_obj = client_pb2.BreachWatchData()
-                data_obj.ParseFromString(data)
-                bwr['data_unencrypted'] = google.protobuf.json_format.MessageToDict(data_obj)
-            params.breach_watch_records[record_uid] = bwr
-        except Exception as e:
-            logging.debug('Decrypt bw data: %s', e)
-
-    if full_sync or record_types:
-        # Record V3 types cache population
-        record_types_rs = _sync_record_types(params)
-        if len(record_types_rs.recordTypes) > 0:
-            params.record_type_cache = {}
-            for rt in record_types_rs.recordTypes:
-                type_id = rt.recordTypeId
-                type_id += rt.scope * 1000000
-                params.record_type_cache[type_id] = rt.content
-
-    if full_sync:
-        convert_keys.change_key_types(params)
-
-        if params.breach_watch:
-            weak_count = 0
-            for _ in params.breach_watch.get_records_by_status(params, ['WEAK', 'BREACHED']):
-                weak_count += 1
-            if weak_count > 0:
-                logging.info(bcolors.WARNING +
-                             f'The number of records that are affected by breaches or contain high-risk passwords: {weak_count}' +
-                             '\nUse \"breachwatch list\" command to get more details' +
-                             bcolors.ENDC)
-
-        record_count = 0
-        valid_versions = {2, 3}
-        for r in params.record_cache.values():
-            if r.get('version', 0) in valid_versions:
-                record_count += 1
-        if record_count:
-            logging.info('Decrypted [%d] record(s)', record_count)
 
 
 def _sync_record_types(params):  # type: (KeeperParams) -> Any
@@ -1054,49 +1202,112 @@ def merge_lists_on_value(list1, list2, field_name):
     return [x for x in d.values()]
 
 
-def prepare_folder_tree(params):    # type: (KeeperParams) -> None
-    params.folder_cache = {}
-    params.root_folder = RootFolderNode()
-
-    for sf in params.subfolder_cache.values():
-        data_unencrypted = sf.get('data_unencrypted')    # type: Optional[bytes]
-        folder_uid = None
-        if sf['type'] == 'user_folder':
-            folder_uid = sf['folder_uid']
-            uf = UserFolderNode()
-            uf.uid = folder_uid
-            uf.parent_uid = sf.get('parent_uid')
-            params.folder_cache[uf.uid] = uf
-
-        elif sf['type'] == 'shared_folder_folder':
-            folder_uid = sf['folder_uid']
-            sff = SharedFolderFolderNode()
-            sff.uid = folder_uid
-            sff.shared_folder_uid = sf['shared_folder_uid']
-            sff.parent_uid = sf.get('parent_uid') or sff.shared_folder_uid
-            params.folder_cache[sff.uid] = sff
-
-        elif sf['type'] == 'shared_folder':
-            folder_uid = sf['shared_folder_uid']
-            shf = SharedFolderNode()
-            shf.uid = folder_uid
-            shf.parent_uid = sf.get('folder_uid')
-            folder = params.shared_folder_cache.get(shf.uid)
-            if folder is not None:
-                data_unencrypted = folder.get('data_unencrypted')
-                shf.name = folder['name_unencrypted']
-            params.folder_cache[shf.uid] = shf
-
-        if data_unencrypted and folder_uid:
-            try:
-                f = params.folder_cache.get(folder_uid)    # type: Optional[BaseFolderNode]
-                data = json.loads(data_unencrypted.decode())
-                f.name = data.get('name') or f.name or f.uid
-                f.color = data.get('color')
-            except Exception as e:
-                logging.debug('Error decrypting user folder name. Folder UID: %s. Error: %s', sf.uid, e)
-
-    for f in params.folder_cache.values():
-        parent_folder = params.folder_cache.get(f.parent_uid) if f.parent_uid else params.root_folder
+def get_changed_folders(response):    # type: (SyncDown_pb2.SyncDownResponse) -> Set[str]
+    """Returns UIDs of folders whose tree nodes a sync_down response changes"""
+    encode = utils.base64_url_encode
+    uids = set()
+    uids.update((encode(x.folderUid) for x in response.userFolders))
+    uids.update((encode(x.folderUid) for x in response.sharedFolderFolders))
+    uids.update((encode(x.sharedFolderUid) for x in response.userFolderSharedFolders))
+    uids.update((encode(x.sharedFolderUid) for x in response.sharedFolders))
+    uids.update((encode(x) for x in response.removedUserFolders))
+    uids.update((encode(x.folderUid or x.sharedFolderUid) for x in response.removedSharedFolderFolders))
+    uids.update((encode(x.sharedFolderUid) for x in response.removedUserFolderSharedFolders))
+    uids.update((encode(x) for x in response.removedSharedFolders))
+    for team in response.teams:
+        uids.update((encode(x.sharedFolderUid) for x in team.sharedFolderKeys))
+        uids.update((encode(x) for x in team.removedSharedFolders))
+    return uids
+
+
+def create_folder_node(params, sf):    # type: (KeeperParams, dict) -> Optional[BaseFolderNode]
+    data_unencrypted = sf.get('data_unencrypted')    # type: Optional[bytes]
+    f = None    # type: Optional[BaseFolderNode]
+    if sf['type'] == 'user_folder':
+        f = UserFolderNode()
+        f.uid = sf['folder_uid']
+        f.parent_uid = sf.get('parent_uid')
+
+    elif sf['type'] == 'shared_folder_folder':
+        f = SharedFolderFolderNode()
+        f.uid = sf['folder_uid']
+        f.shared_folder_uid = sf['shared_folder_uid']
+        f.parent_uid = sf.get('parent_uid') or f.shared_folder_uid
+
+    elif sf['type'] == 'shared_folder':
+        f = SharedFolderNode()
+        f.uid = sf['shared_folder_uid']
+        f.parent_uid = sf.get('folder_uid')
+        folder = params.shared_folder_cache.get(f.uid)
+        if folder is not None:
+            data_unencrypted = folder.get('data_unencrypted')
+            f.name = folder['name_unencrypted']
+
+    if data_unencrypted and f:
+        try:
+            data = json.loads(data_unencrypted.decode())
+            f.name = data.get('name') or f.name or f.uid
+            f.color = data.get('color')
+        except Exception as e:
+            logging.debug('Error decrypting user folder name. Folder UID: %s. Error: %s', f.uid, e)
+    return f
+
+
+def prepare_folder_tree(params, changed_folders=None):    # type: (KeeperParams, Optional[Set[str]]) -> None
+    """Builds the folder tree from params.subfolder_cache.
+
+    If changed_folders is passed only those folders are applied to the existing tree.
+    """
+    if changed_folders is None or params.root_folder is None:
+        params.folder_cache = {}
+        params.root_folder = RootFolderNode()
+        params.folder_path_cache.clear()
+        for sf in params.subfolder_cache.values():
+            f = create_folder_node(params, sf)
+            if f:
+                params.folder_cache[f.uid] = f
+
+        for f in params.folder_cache.values():
+            parent_folder = params.folder_cache.get(f.parent_uid) if f.parent_uid else params.root_folder
+            if parent_folder:
+                parent_folder.subfolders.append(f.uid)
+        return
+
+    def get_parent(folder):    # type: (BaseFolderNode) -> Optional[BaseFolderNode]
+        return params.folder_cache.get(folder.parent_uid) if folder.parent_uid else params.root_folder
+
+    # folders dropped from subfolder_cache without a removal in the response,
+    # e.g. shared folders whose only key came with a removed team
+    changed_folders = set(changed_folders)
+    changed_folders.update((x for x in params.folder_cache if x not in params.subfolder_cache))
+
+    to_attach = []    # type: List[BaseFolderNode]
+    paths_changed = False
+    for folder_uid in changed_folders:
+        old_folder = params.folder_cache.pop(folder_uid, None)    # type: Optional[BaseFolderNode]
+        sf = params.subfolder_cache.get(folder_uid)
+        f = create_folder_node(params, sf) if sf else None
+        if old_folder:
+            if f:
+                f.subfolders = old_folder.subfolders
+            if f is None or f.parent_uid != old_folder.parent_uid:
+                parent_folder = get_parent(old_folder)
+                if parent_folder and folder_uid in parent_folder.subfolders:
+                    parent_folder.subfolders.remove(folder_uid)
+                if f:
+                    to_attach.append(f)
+            if f is None or f.parent_uid != old_folder.parent_uid or f.name != old_folder.name:
+                paths_changed = True
+        elif f:
+            to_attach.append(f)
+            paths_changed = True
+        if f:
+            params.folder_cache[folder_uid] = f
+
+    for f in to_attach:
+        parent_folder = get_parent(f)
         if parent_folder:
             parent_folder.subfolders.append(f.uid)
+
+    if paths_changed:
+        params.folder_path_cache.clear()
@@ -0,0 +1,128 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional, Any
+
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 60.0
+MIN_RATE = 0.2
+RATE_DECREASE_FACTOR = 0.5
+RATE_INCREASE_STEP = 0.05
+RATE_SMOOTHING = 0.2
+
+
+class EndpointState:
+    def __init__(self):
+        self.rate = None          # type: Optional[float]
+        self.observed_rate = 0.0
+        self.tokens = 1.0
+        self.last_request = 0.0
+        self.last_seen = 0.0
+        self.throttle_count = 0
+        self.consecutive_throttles = 0
+        self.request_count = 0
+        self.wait_time = 0.0
+
+
+class RateGovernor:
+    """Paces API calls and backs off on throttling.
+
+    Endpoints are not paced until the server throttles them. A throttle halves the endpoint's
+    sustainable rate, learned from the observed request rate, and every successful call raises it again
+    in small steps. Throttled calls wait with exponential backoff and jitter.
+    """
+    def __init__(self):
+        self._endpoints = {}    # type: Dict[str, EndpointState]
+        self._lock = threading.Lock()
+        self.throttle_count = 0
+        self.wait_time = 0.0
+
+    def _get_state(self, endpoint):    # type: (str) -> EndpointState
+        state = self._endpoints.get(endpoint)
+        if state is None:
+            state = EndpointState()
+            self._endpoints[endpoint] = state
+        return state
+
+    def _sleep(self, state, delay):    # type: (EndpointState, float) -> None
+        if delay > 0:
+            time.sleep(delay)
+            with self._lock:
+                state.wait_time += delay
+                self.wait_time += delay
+
+    def acquire(self, endpoint):    # type: (str) -> None
+        """Waits until a request to the endpoint fits its learned rate"""
+        with self._lock:
+            state = self._get_state(endpoint)
+            now = time.time()
+            if state.last_seen > 0:
+                interval = max(now - state.last_seen, 0.001)
+                state.observed_rate += RATE_SMOOTHING * (1.0 / interval - state.observed_rate)
+            state.last_seen = now
+            state.request_count += 1
+            delay = 0.0
+            if state.rate:
+                state.tokens = min(1.0, state.tokens + (now - state.last_request) * state.rate)
+                state.tokens -= 1.0
+                if state.tokens < 0:
+                    delay = -state.tokens / state.rate
+            state.last_request = now + delay
+        self._sleep(state, delay)
+
+    def success(self, endpoint):    # type: (str) -> None
+        with self._lock:
+            state = self._get_state(endpoint)
+            state.consecutive_throttles = 0
+            if state.rate:
+                state.rate += RATE_INCREASE_STEP
+
+    def throttled(self, endpoint):    # type: (str) -> None
+        """Records a throttle response and waits before the request is retried"""
+        with self._lock:
+            state = self._get_state(endpoint)
+            state.throttle_count += 1
+            state.consecutive_throttles += 1
+            self.throttle_count += 1
+            rate = state.rate or state.observed_rate or MIN_RATE
+            state.rate = max(MIN_RATE, rate * RATE_DECREASE_FACTOR)
+            state.tokens = 0.0
+            backoff = min(BACKOFF_MAX, BACKOFF_BASE * (2 ** (state.consecutive_throttles - 1)))
+            delay = random.uniform(backoff / 2, backoff)
+        logging.info('Throttled. sleeping for %.1f seconds', delay)
+        self._sleep(state, delay)
+        with self._lock:
+            state.last_request = time.time()
+
+    def get_statistics(self):    # type: () -> Dict[str, Any]
+        with self._lock:
+            return {
+                'throttle_count': self.throttle_count,
+                'wait_time': round(self.wait_time, 3),
+                'endpoints': {
+                    endpoint: {
+                        'requests': state.request_count,
+                        'throttle_count': state.throttle_count,
+                        'wait_time': round(state.wait_time, 3),
+                        'rate': round(state.rate, 3) if state.rate else None,
+                    } for endpoint, state in self._endpoints.items()
+                }
+            }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self.throttle_count = 0
+            self.wait_time = 0.0
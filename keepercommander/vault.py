@@ -20,6 +20,9 @@ import itertools
 from .params import KeeperParams
 from . import record_types, constants
 
+RECORD_OBJECT_CACHE_SIZE_CONFIG_KEY = 'record_object_cache_size'
+DEFAULT_RECORD_OBJECT_CACHE_SIZE = 10000
+
 
 def sanitize_str_field_value(value):    # type: (Any) -> str
     if not isinstance(value, str):
@@ -48,6 +51,11 @@ def sanitize_bool_field_value(value):    # type: (Any) -> bool
     return value
 
 
+def get_record_object_cache_size(params):    # type: (KeeperParams) -> int
+    size = params.config.get(RECORD_OBJECT_CACHE_SIZE_CONFIG_KEY) if isinstance(params.config, dict) else None
+    return size if isinstance(size, int) and size > 0 else DEFAULT_RECORD_OBJECT_CACHE_SIZE
+
+
 class KeeperRecord(abc.ABC):
     def __init__(self):
         self.record_uid = ''
@@ -158,6 +166,35 @@ class KeeperRecord(abc.ABC):
 
         return keeper_record
 
+    @staticmethod
+    def load_cached(params, record_uid):    # type: (KeeperParams, str) -> Optional['KeeperRecord']
+        """Returns a parsed record shared through params.record_object_cache.
+
+        The returned object is shared between callers and must not be modified. Use load() for an editable record.
+        The cache keeps the most recently used "record_object_cache_size" records.
+        """
+        record = params.record_cache.get(record_uid)
+        if record is None:
+            return None
+        revision = record.get('revision', 0)
+        shared = record.get('shared', False)
+        data = dict.get(record, 'data_unencrypted') if isinstance(record, dict) else None
+        cache = params.record_object_cache
+        entry = cache.get(record_uid)
+        if entry and entry[0] == revision and entry[1] == shared and entry[2] is data:
+            cache.move_to_end(record_uid)
+            return entry[3]
+        keeper_record = KeeperRecord.load(params, record)
+        if keeper_record:
+            cache[record_uid] = (revision, shared, data, keeper_record)
+            cache.move_to_end(record_uid)
+            max_size = get_record_object_cache_size(params)
+            while len(cache) > max_size:
+                cache.popitem(last=False)
+        else:
+            cache.pop(record_uid, None)
+        return keeper_record
+
     def enumerate_fields(self):    # type: () -> Iterable[Tuple[str, Union[None, str, List[str]]]]
         yield '(title)', self.title
 
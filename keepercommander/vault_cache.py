@@ -0,0 +1,269 @@
+#  _  __
+# | |/ /___ ___ _ __  ___ _ _ ®
+# | ' </ -_) -_) '_ \/ -_) '_|
+# |_|\_\___\___| .__/\___|_|
+#              |_|
+#
+# Keeper Commander
+# Copyright 2024 Keeper Security Inc.
+# Contact: ops@keepersecurity.com
+#
+
+import hashlib
+import json
+import logging
+import os
+from typing import Optional, Set, Iterable
+
+from . import utils
+from .params import KeeperParams, RecordOwner
+from .proto import SyncDown_pb2
+from .storage.encrypted_sqlite import EncryptedSqliteStore
+from .subfolder import get_record_folders
+
+VAULT_CACHE_CONFIG_KEY = 'vault_cache'
+_KEY_CHECK = b'keeper-vault-cache'
+
+# caches keyed by UID. Every entry is stored as a separate encrypted row
+ENTITY_CACHES = (
+    'record_cache', 'meta_data_cache', 'non_shared_data_cache', 'shared_folder_cache', 'team_cache',
+    'subfolder_cache', 'subfolder_record_cache', 'record_link_cache', 'record_rotation_cache',
+    'breach_watch_records', 'breach_watch_security_data', 'security_score_data',
+)
+# small caches stored as a single encrypted row
+BLOB_CACHES = ('user_cache', 'record_type_cache')
+_TRANSIENT_KEYS = {'shares'}
+
+
+class VaultCacheSettings:
+    def __init__(self):
+        self.revision = 0
+        self.sync_down_token = b''
+        self.key_check = b''
+
+
+class VaultCacheEntity:
+    def __init__(self):
+        self.cache_name = ''
+        self.uid = ''
+        self.data = b''
+
+
+def is_vault_cache_enabled(params):    # type: (KeeperParams) -> bool
+    return isinstance(params.config, dict) and params.config.get(VAULT_CACHE_CONFIG_KEY) is True
+
+
+def get_vault_cache_database_name(params):    # type: (KeeperParams) -> str
+    path = os.path.dirname(os.path.abspath(params.config_filename or '1'))
+    return os.path.join(path, 'vault_cache.db')
+
+
+def get_vault_cache(params):    # type: (KeeperParams) -> Optional[VaultCache]
+    """Returns the vault cache for the logged-in user or None if the cache is disabled"""
+    if not is_vault_cache_enabled(params) or not params.data_key or not params.account_uid_bytes:
+        return None
+    owner = utils.base64_url_encode(params.account_uid_bytes)
+    if params.vault_cache is None or params.vault_cache.owner != owner:
+        if params.vault_cache:
+            params.vault_cache.close()
+        try:
+            params.vault_cache = VaultCache(get_vault_cache_database_name(params), owner, params.data_key)
+        except Exception as e:
+            logging.debug('Vault cache open error: %s', e)
+            params.vault_cache = None
+    return params.vault_cache
+
+
+class VaultCache(EncryptedSqliteStore):
+    """Data-key-encrypted SQLite copy of the sync_down state.
+
+    Every cached object is serialized to JSON and encrypted with the user's data key,
+    so the database content is only usable after a successful login.
+    """
+    def __init__(self, database_name, owner, data_key):     # type: (str, str, bytes) -> None
+        self._stored = {}           # type: dict[str, Set[str]]
+        self._blobs = {}            # type: dict[str, bytes]
+        super(VaultCache, self).__init__(database_name, owner, data_key, _KEY_CHECK,
+                                         VaultCacheSettings, VaultCacheEntity, ['cache_name', 'uid'])
+
+    def clear(self):
+        self._stored.clear()
+        self._blobs.clear()
+        super(VaultCache, self).clear()
+
+    def load(self, params):     # type: (KeeperParams) -> bool
+        """Restores vault caches and the continuation token. Returns True if the vault was restored"""
+        settings = self.load_settings()
+        if not settings or not settings.sync_down_token:
+            return False
+
+        self._stored.clear()
+        self._blobs.clear()
+        try:
+            for entity in self._entities.select_all():
+                obj = self.decrypt(entity.data)
+                if entity.cache_name in BLOB_CACHES:
+                    if entity.cache_name == 'record_type_cache':
+                        obj = {int(k): v for k, v in obj.items()}
+                    setattr(params, entity.cache_name, obj)
+                    self._blobs[entity.cache_name] = hashlib.sha256(json.dumps(obj, sort_keys=True).encode()).digest()
+                elif entity.cache_name in ENTITY_CACHES:
+                    if entity.cache_name == 'subfolder_record_cache':
+                        obj = set(obj)
+                    getattr(params, entity.cache_name)[entity.uid] = obj
+                    stored = self._stored.get(entity.cache_name)
+                    if stored is None:
+                        stored = set()
+                        self._stored[entity.cache_name] = stored
+                    stored.add(entity.uid)
+        except Exception as e:
+            for cache_name in ENTITY_CACHES:
+                getattr(params, cache_name).clear()
+            params.user_cache.clear()
+            params.record_type_cache = {}
+            self.reset(e)
+            return False
+
+        params.record_owner_cache.clear()
+        for record_uid, md in params.meta_data_cache.items():
+            params.record_owner_cache[record_uid] = RecordOwner(md.get('owner'), md.get('owner_account_uid'))
+        for sf in params.shared_folder_cache.values():
+            for sfr in sf.get('records') or []:
+                if 'owner_account_uid' in sfr:
+                    params.record_owner_cache[sfr['record_uid']] = RecordOwner(sfr.get('owner'), sfr['owner_account_uid'])
+
+        params.sync_down_token = settings.sync_down_token
+        params.revision = settings.revision
+        logging.debug('Vault cache: restored %d record(s)', len(params.record_cache))
+        return True
+
+    def save(self, params, uids=None):     # type: (KeeperParams, Optional[Iterable[str]]) -> None
+        """Writes vault caches. Writes only entries identified by "uids" unless it is None"""
+        try:
+            if uids is None:
+                self._entities.delete_all()
+                self._stored.clear()
+                self._blobs.clear()
+            else:
+                uids = set(uids)
+
+            to_put = []
+            to_delete = []
+            for cache_name in ENTITY_CACHES:
+                cache = getattr(params, cache_name)
+                stored = self._stored.get(cache_name)
+                if stored is None:
+                    stored = set()
+                    self._stored[cache_name] = stored
+                keys = cache.keys() if uids is None else [x for x in uids if x in cache]
+                for uid in keys:
+                    obj = cache[uid]
+                    if isinstance(obj, dict) and not _TRANSIENT_KEYS.isdisjoint(obj.keys()):
+                        obj = {k: v for k, v in obj.items() if k not in _TRANSIENT_KEYS}
+                    entity = VaultCacheEntity()
+                    entity.cache_name = cache_name
+                    entity.uid = uid
+                    entity.data = self.encrypt(obj)
+                    to_put.append(entity)
+                    stored.add(uid)
+                removed = stored.difference(cache.keys())
+                if removed:
+                    to_delete.extend(((cache_name, x) for x in removed))
+                    stored.difference_update(removed)
+
+            for cache_name in BLOB_CACHES:
+                data = json.dumps(getattr(params, cache_name), sort_keys=True).encode()
+                digest = hashlib.sha256(data).digest()
+                if self._blobs.get(cache_name) == digest:
+                    continue
+                entity = VaultCacheEntity()
+                entity.cache_name = cache_name
+                entity.data = self.encrypt(getattr(params, cache_name))
+                to_put.append(entity)
+                self._blobs[cache_name] = digest
+
+            if to_delete:
+                self._entities.delete_by_filter(['cache_name', 'uid'], to_delete, multiple_criteria=True)
+            if to_put:
+                self._entities.put(to_put)
+
+            settings = VaultCacheSettings()
+            settings.revision = params.revision
+            settings.sync_down_token = params.sync_down_token or b''
+            self.store_settings(settings)
+        except Exception as e:
+            self.reset(e)
+
+
+def get_affected_uids(params, response):     # type: (KeeperParams, SyncDown_pb2.SyncDownResponse) -> Set[str]
+    """Returns UIDs of cached objects a sync_down response is about to change.
+
+    Must be called before the response is applied to the caches.
+    """
+    uids = set()
+
+    def add_shared_folder(sf_uid):
+        uids.add(sf_uid)
+        sf = params.shared_folder_cache.get(sf_uid)
+        if sf and 'records' in sf:
+            uids.update((x['record_uid'] for x in sf['records']))
+
+    def add_team(team_uid):
+        uids.add(team_uid)
+        team = params.team_cache.get(team_uid)
+        if team and 'shared_folder_keys' in team:
+            for sfk in team['shared_folder_keys']:
+                add_shared_folder(sfk['shared_folder_uid'])
+
+    encode = utils.base64_url_encode
+    for record_uid in (encode(x) for x in response.removedRecords):
+        uids.add(record_uid)
+        uids.update(get_record_folders(params, record_uid))
+    if len(response.removedTeams) > 0:
+        for team_uid in response.removedTeams:
+            add_team(encode(team_uid))
+        uids.update((sf_uid for sf_uid, sf in params.shared_folder_cache.items() if 'teams' in sf))
+    for sf_uid in response.removedSharedFolders:
+        add_shared_folder(encode(sf_uid))
+    for link in response.removedRecordLinks:
+        uids.add(encode(link.childRecordUid))
+    uids.update((encode(x) for x in response.removedUserFolders))
+    uids.update((encode(x.folderUid or x.sharedFolderUid) for x in response.removedSharedFolderFolders))
+    uids.update((encode(x.sharedFolderUid) for x in response.removedUserFolderSharedFolders))
+    for ufr in response.removedUserFolderRecords:
+        uids.add(encode(ufr.folderUid) if ufr.folderUid else '')
+        uids.add(encode(ufr.recordUid))
+    for sffr in response.removedSharedFolderFolderRecords:
+        uids.add(encode(sffr.folderUid or sffr.sharedFolderUid))
+        uids.add(encode(sffr.recordUid))
+    uids.update((encode(x.childRecordUid) for x in response.recordLinks))
+    uids.update((encode(x.recordUid) for x in response.recordMetaData))
+    uids.update((encode(x.recordUid) for x in response.records))
+    uids.update((encode(x.recordUid) for x in response.nonSharedData))
+    for t in response.teams:
+        add_team(encode(t.teamUid))
+        for sf_uid in t.removedSharedFolders:
+            add_shared_folder(encode(sf_uid))
+    for sf in response.sharedFolders:
+        add_shared_folder(encode(sf.sharedFolderUid))
+    uids.update((encode(x.sharedFolderUid) for x in response.sharedFolderUsers))
+    uids.update((encode(x.sharedFolderUid) for x in response.sharedFolderTeams))
+    for sfr in response.sharedFolderRecords:
+        uids.add(encode(sfr.sharedFolderUid))
+        uids.add(encode(sfr.recordUid))
+    for sfr in response.removedSharedFolderRecords:
+        uids.add(encode(sfr.sharedFolderUid))
+        uids.add(encode(sfr.recordUid))
+    uids.update((encode(x.sharedFolderUid) for x in response.removedSharedFolderUsers))
+    uids.update((encode(x.sharedFolderUid) for x in response.removedSharedFolderTeams))
+    uids.update((encode(x.folderUid) for x in response.userFolders))
+    uids.update((encode(x.folderUid) if x.folderUid else '' for x in response.userFolderRecords))
+    uids.update((encode(x.sharedFolderUid) for x in response.userFolderSharedFolders))
+    uids.update((encode(x.folderUid) for x in response.sharedFolderFolders))
+    uids.update((encode(x.folderUid or x.sharedFolderUid) for x in response.sharedFolderFolderRecords))
+    uids.update((encode(x.recordUid) for x in response.sharingChanges))
+    uids.update((encode(x.recordUid) for x in response.breachWatchRecords))
+    uids.update((encode(x.recordUid) for x in response.breachWatchSecurityData))
+    uids.update((encode(x.recordUid or b'') for x in response.securityScoreData))
+    uids.update((encode(x.recordUid) for x in response.recordRotations))
+    return uids
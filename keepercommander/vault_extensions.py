@@ -11,9 +11,9 @@
 import abc
 import itertools
 import re
-from typing import Optional, Union, Iterator, Dict, Set, Callable, Any, Iterable
+from typing import Optional, Union, Iterator, Dict, Set, Callable, Any, Iterable, List
 
-from . import crypto, utils, vault, record_types
+from . import crypto, utils, vault, record_types, search_index
 from .params import KeeperParams
 
 
@@ -32,6 +32,27 @@ def _match_value(pattern, value):  # type: (Callable[[str], Any], Any) -> bool
     return False
 
 
+def _collect_strings(value, strings):  # type: (Any, List[str]) -> None
+    if isinstance(value, str):
+        strings.append(value)
+    elif isinstance(value, list):
+        for v in value:
+            _collect_strings(v, strings)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _collect_strings(v, strings)
+
+
+def get_record_search_text(record):    # type: (vault.KeeperRecord) -> str
+    """Returns all text matches_record() can match for a record, one value per line"""
+    strings = [record.record_uid]
+    for key, value in record.enumerate_fields():
+        if key:
+            strings.append(key)
+        _collect_strings(value, strings)
+    return '\n'.join(strings)
+
+
 def matches_record(record, pattern, search_fields=None):    # type: (vault.KeeperRecord, Union[str, Callable[[str], Any]], Optional[Iterable[str]]) -> bool
     if isinstance(pattern, str):
         pattern = re.compile(pattern, re.IGNORECASE).search
@@ -56,8 +77,14 @@ def find_records(params,                   # type: KeeperParams
                  search_str=None,          # type: Optional[str]
                  record_type=None,         # type: Union[str, Iterable[str], None]
                  record_version=None,      # type: Union[int, Iterable[int], None]
-                 search_fields=None        # type: Optional[Iterable[str]]
+                 search_fields=None,       # type: Optional[Iterable[str]]
+                 editable=True             # type: bool
                  ):                       # type: (...) -> Iterator[vault.KeeperRecord]
+    """Yields records matching the filters.
+
+    With editable=False the shared parsed records from KeeperRecord.load_cached are yielded.
+    These must not be modified, but are not parsed again.
+    """
     pattern = re.compile(search_str, re.IGNORECASE).search if search_str else None
 
     type_filter = None       # type: Optional[Set[str]]
@@ -76,12 +103,21 @@ def find_records(params,                   # type: KeeperParams
         if isinstance(record_version, Iterable):
             version_filter.update((x for x in record_version if isinstance(x, int)))
 
-    for record_uid in params.record_cache:
-        record = vault.KeeperRecord.load(params, record_uid)
+    def get_search_text(uid):
+        r = vault.KeeperRecord.load_cached(params, uid)
+        return get_record_search_text(r) if r else None
+
+    record_uids = search_index.find_candidates(params, 'record', params.record_cache, search_str, get_search_text)
+    if record_uids is None:
+        record_uids = list(params.record_cache)
+
+    for record_uid in record_uids:
+        # match against the shared parsed record
+        record = vault.KeeperRecord.load_cached(params, record_uid)
         if not record:
             continue
         if search_str and record.record_uid == search_str:
-            yield record
+            yield vault.KeeperRecord.load(params, record_uid) if editable else record
             continue
         if version_filter and record.version not in version_filter:
             continue
@@ -93,7 +129,7 @@ def find_records(params,                   # type: KeeperParams
         else:
             is_match = True
         if is_match:
-            yield record
+            yield vault.KeeperRecord.load(params, record_uid) if editable else record
 
 
 def get_record_description(record):   # type: (vault.KeeperRecord) -> Optional[str]
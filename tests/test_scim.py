@@ -14,4 +14,5 @@ class TestScimCommands(TestCase):
             "externalId":"e9e306a331660a",
             "displayName": "Queued Team",
         }
-        scim.ScimPushCommand.post_scim_resource(f'{scim_url}/Groups', token, payload)
+        client = scim.ScimClient(scim_url, token)
+        client.execute_one(scim.ScimOperation('POST', '/Groups', payload, description='Queued Team'))
@@ -0,0 +1,173 @@
+import sys
+if sys.version_info >= (3, 8):
+    import json
+    import tempfile
+    import threading
+    import time
+    import unittest
+    from pathlib import Path
+    from unittest import mock
+    from flask import Flask
+    from keepercommander.commands.base import report_progress, check_cancelled
+    from keepercommander.service.api.command import create_command_blueprint
+    from keepercommander.service.core.job_queue import Job, JobQueue, JobQueueFullError, is_long_running
+
+    def wait_finished(job, timeout=5):
+        end = time.time() + timeout
+        while not job.is_finished and time.time() < end:
+            time.sleep(0.01)
+        return job.is_finished
+
+    class TestJobQueue(unittest.TestCase):
+        def setUp(self):
+            self.temp_dir = tempfile.TemporaryDirectory()
+            self.release = threading.Event()
+            self.queue = None
+
+        def tearDown(self):
+            self.release.set()
+            if self.queue:
+                self.queue.shutdown()
+            self.temp_dir.cleanup()
+
+        def execute(self, command):
+            if command == 'export':
+                for i in range(500):
+                    report_progress(f'Exported {i}')
+                    check_cancelled('export')
+                    time.sleep(0.01)
+            self.release.wait(timeout=5)
+            if command == 'fail':
+                raise Exception('Command failed')
+            return {'status': 'success', 'command': command, 'data': [{'row': 1}]}, 200
+
+        def test_submit_and_spool(self):
+            self.queue = JobQueue(self.execute, Path(self.temp_dir.name), workers=1)
+            job = self.queue.submit('audit-report', 'owner')
+            self.assertIn(job.status, (Job.QUEUED, Job.RUNNING))
+            self.assertIsNone(self.queue.get(job.job_id, 'other'))
+
+            self.release.set()
+            self.assertTrue(wait_finished(job))
+            self.assertEqual(job.status, Job.COMPLETED)
+            with open(job.result_path, encoding='utf-8') as f:
+                self.assertEqual(json.load(f)['data'], [{'row': 1}])
+
+            failed = self.queue.submit('fail', 'owner')
+            self.assertTrue(wait_finished(failed))
+            self.assertEqual(failed.status, Job.FAILED)
+            self.assertEqual(failed.error, 'Command failed')
+            self.assertIsNone(failed.result_path)
+
+        def test_cancel_and_limit(self):
+            self.queue = JobQueue(self.execute, Path(self.temp_dir.name), workers=1, max_queued=2)
+            running = self.queue.submit('audit-report', 'owner')
+            queued = self.queue.submit('audit-report', 'owner')
+            with self.assertRaises(JobQueueFullError):
+                self.queue.submit('audit-report', 'owner')
+
+            self.queue.cancel(queued.job_id, 'owner')
+            self.assertEqual(queued.status, Job.CANCELLED)
+            self.queue.cancel(running.job_id, 'owner')
+            self.assertTrue(running.to_dict()['cancel_requested'])
+            self.release.set()
+            self.assertTrue(wait_finished(running))
+            self.assertEqual(running.status, Job.CANCELLED)
+            self.assertIsNone(running.result_path)
+            self.assertEqual(list(Path(self.temp_dir.name).iterdir()), [])
+
+        def test_progress_and_cooperative_cancel(self):
+            self.queue = JobQueue(self.execute, Path(self.temp_dir.name), workers=1)
+            job = self.queue.submit('export', 'owner')
+            end = time.time() + 5
+            while not job.progress and time.time() < end:
+                time.sleep(0.01)
+            self.assertTrue(job.progress.startswith('Exported'))
+
+            self.queue.cancel(job.job_id, 'owner')
+            self.assertTrue(wait_finished(job, timeout=2))
+            self.assertEqual(job.status, Job.CANCELLED)
+            self.assertEqual(job.error, 'export: Command cancelled')
+
+            # the cancelled job released its worker
+            queued = self.queue.submit('audit-report', 'owner')
+            self.release.set()
+            self.assertTrue(wait_finished(queued))
+            self.assertEqual(queued.status, Job.COMPLETED)
+
+        def test_expire(self):
+            self.release.set()
+            self.queue = JobQueue(self.execute, Path(self.temp_dir.name), workers=1, retention=0)
+            job = self.queue.submit('audit-report', 'owner')
+            self.assertTrue(wait_finished(job))
+            result_path = job.result_path
+            self.assertTrue(result_path.exists())
+            job.finished -= 1
+            self.queue.submit('audit-report', 'owner')
+            self.assertIsNone(self.queue.get(job.job_id, 'owner'))
+            self.assertFalse(result_path.exists())
+
+        def test_is_long_running(self):
+            self.assertTrue(is_long_running('audit-report --format json'))
+            self.assertTrue(is_long_running('compliance report'))
+            self.assertFalse(is_long_running('ls -l'))
+
+    class TestJobApi(unittest.TestCase):
+        CONFIG = {
+            'api-key': 'test-key',
+            'expiration_timestamp': '9999-12-31T00:00:00',
+            'command_list': 'ls,audit-report',
+            'rate_limiting': '1000/minute',
+            'ip_allowed_list': '127.0.0.1',
+        }
+
+        def setUp(self):
+            self.temp_dir = tempfile.TemporaryDirectory()
+            app = Flask(__name__)
+            app.register_blueprint(create_command_blueprint(), url_prefix='/api/v1')
+            self.client = app.test_client()
+            self.queue = JobQueue(self.execute, Path(self.temp_dir.name), workers=1)
+            self.patches = [
+                mock.patch('keepercommander.service.util.config_reader.ConfigReader.read_config',
+                           side_effect=lambda name, *args: self.CONFIG.get(name, '')),
+                mock.patch('keepercommander.service.api.command.get_job_queue', return_value=self.queue),
+                mock.patch('keepercommander.service.api.command.CommandExecutor.execute', side_effect=self.execute),
+            ]
+            for p in self.patches:
+                p.start()
+
+        def tearDown(self):
+            for p in self.patches:
+                p.stop()
+            self.queue.shutdown()
+            self.temp_dir.cleanup()
+
+        @staticmethod
+        def execute(command):
+            return {'status': 'success', 'command': command}, 200
+
+        def request(self, method, path, **kwargs):
+            return self.client.open(f'/api/v1{path}', method=method, headers={'api-key': 'test-key'}, **kwargs)
+
+        def test_async_command(self):
+            rs = self.request('POST', '/executecommand-async', json={'command': 'ls'})
+            self.assertEqual(rs.status_code, 200)
+            self.assertEqual(rs.get_json()['command'], 'ls')
+
+            rs = self.request('POST', '/executecommand-async', json={'command': 'audit-report'})
+            self.assertEqual(rs.status_code, 202)
+            job_id = rs.get_json()['job_id']
+            job = self.queue.get(job_id, mock.ANY)
+            self.assertTrue(wait_finished(job))
+
+            rs = self.request('GET', f'/jobs/{job_id}')
+            self.assertEqual(rs.get_json()['status'], Job.COMPLETED)
+            rs = self.request('GET', f'/jobs/{job_id}/result')
+            self.assertEqual(rs.status_code, 200)
+            self.assertEqual(json.loads(rs.data)['command'], 'audit-report')
+            rs.close()
+
+            rs = self.client.get(f'/api/v1/jobs/{job_id}', headers={'api-key': 'other-key'})
+            self.assertEqual(rs.status_code, 401)
+            rs = self.request('DELETE', '/jobs/unknown')
+            self.assertEqual(rs.status_code, 404)
@@ -1,8 +1,14 @@
 import sys
 if sys.version_info >= (3, 8):
   import pytest
+  import datetime
+  import json
   from unittest import TestCase
-  from keepercommander.service.util.parse_keeper_response import KeeperResponseParser
+  from keepercommander.commands.base import capture_report_data, dump_report_data
+  from unittest import mock
+  from keepercommander.service.core.session_pool import SessionPool
+  from keepercommander.service.util.command_util import CommandExecutor
+  from keepercommander.service.util.parse_keeper_response import KeeperResponseParser, stream_json
 
   class TestKeeperResponseParser(TestCase):
       def test_parse_ls_command(self):
@@ -76,4 +82,66 @@ if sys.version_info >= (3, 8):
           self.assertEqual(result['data']['title'], 'Test Record')
           self.assertEqual(result['data']['username'], 'testuser')
           self.assertEqual(result['data']['password'], 'testpass')
-          self.assertEqual(result['data']['url'], 'https://example.com')
\ No newline at end of file
+          self.assertEqual(result['data']['url'], 'https://example.com')
+
+      def test_parse_report_data(self):
+          """Test structured response from collected report tables"""
+          with capture_report_data() as reports:
+              rows = [['uid2', 'Beta', ['a', 'b']], ['uid1', 'Alpha', None]]
+              result = dump_report_data(rows, ['Record UID', 'Title', 'Shared To'], sort_by=1, row_number=True)
+          self.assertIsNone(result)
+          self.assertEqual(len(reports), 1)
+
+          result = KeeperResponseParser.parse_report_data('search -v test', reports)
+          self.assertEqual(result['command'], 'search')
+          self.assertEqual(result['data'], [
+              {'record_uid': 'uid1', 'title': 'Alpha'},
+              {'record_uid': 'uid2', 'title': 'Beta', 'shared_to': ['a', 'b']},
+          ])
+
+          with capture_report_data() as reports:
+              dump_report_data([['f1']], ['Folder UID'], title='Folders')
+              dump_report_data([['r1']], ['Record UID'], title='Records')
+              self.assertIsNotNone(dump_report_data([['r1']], ['record_uid'], fmt='json'))
+          result = KeeperResponseParser.parse_report_data('list-sf', reports, 'done\n')
+          self.assertEqual([x['title'] for x in result['data']], ['Folders', 'Records'])
+          self.assertEqual(result['message'], 'done')
+
+          with capture_report_data() as reports:
+              dump_report_data([['\x1b[1mFolder\x1b[0m']], ['Name'])
+              dump_report_data([['Record']], ['Name'])
+          result = KeeperResponseParser.parse_report_data('list-sf', reports)
+          self.assertEqual(result['data'], [{'title': 'table_1', 'data': [{'name': 'Folder'}]},
+                                            {'title': 'table_2', 'data': [{'name': 'Record'}]}])
+
+      def test_execute_keeps_command_parsers(self):
+          """Commands with a dedicated parser keep their response format when they print tables"""
+          def do_command(params, command):
+              dump_report_data([['b4pBzT1WowoUXHk_US0SCg', 'Root', 'RS']], ['Folder UID', 'Name', 'Flags'])
+              print('# Folder UID                           Root                                                    Flags')
+              print('  1   b4pBzT1WowoUXHk_US0SCg   Root                                                    RS')
+              return None
+
+          pool = SessionPool(lambda: mock.Mock(revision=1, session_token='token'), 1, 60)
+          with mock.patch('keepercommander.service.util.command_util.get_session_pool', return_value=pool), \
+                  mock.patch('keepercommander.service.util.command_util.ConfigReader.read_config', return_value=None), \
+                  mock.patch('keepercommander.cli.do_command', side_effect=do_command):
+              response, status_code = CommandExecutor.execute('ls -l')
+              self.assertEqual(status_code, 200)
+              self.assertEqual(response['command'], 'ls')
+              self.assertIn('folders', response['data'])
+
+              response, _ = CommandExecutor.execute('list-sf')
+              self.assertEqual(response['data'][0]['folder_uid'], 'b4pBzT1WowoUXHk_US0SCg')
+
+      def test_stream_json(self):
+          """Test chunked serialization of large responses"""
+          response = {
+              'status': 'success',
+              'data': [{'uid': f'uid{i}', 'created': datetime.datetime(2024, 1, 1)} for i in range(10000)]
+          }
+          chunks = list(stream_json(response))
+          self.assertGreater(len(chunks), 1)
+          parsed = json.loads(''.join(chunks))
+          self.assertEqual(len(parsed['data']), 10000)
+          self.assertEqual(parsed['data'][0]['created'], '2024-01-01T00:00:00')
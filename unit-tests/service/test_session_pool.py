@@ -0,0 +1,93 @@
+import sys
+if sys.version_info >= (3, 8):
+    import os
+    import tempfile
+    import threading
+    import time
+    import unittest
+    from pathlib import Path
+    from unittest import mock
+    from keepercommander.service.core.session_pool import SessionPool
+    from keepercommander.service.util.command_util import CommandExecutor
+    from keepercommander.service.util.config_reader import ConfigReader
+
+    class TestSessionPool(unittest.TestCase):
+        def create_params(self):
+            params = mock.Mock()
+            params.session_token = 'token'
+            params.revision = 1
+            self.created += 1
+            return params
+
+        def setUp(self):
+            self.created = 0
+
+        def test_concurrent_requests(self):
+            """Requests run in parallel, each with its own session and output"""
+            pool = SessionPool(self.create_params, 3, 60)
+            barrier = threading.Barrier(3)
+            results = {}
+
+            def do_command(params, command):
+                barrier.wait(timeout=5)
+                print(f'output of {command}')
+                return None
+
+            def request(command):
+                with pool.acquire() as session:
+                    results[command] = CommandExecutor.capture_output(session.params, command)[1], session.params
+
+            with mock.patch('keepercommander.cli.do_command', side_effect=do_command):
+                threads = [threading.Thread(target=request, args=(f'cmd{i}',)) for i in range(3)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+
+            self.assertEqual(self.created, 3)
+            self.assertEqual({x: y[0] for x, y in results.items()},
+                             {f'cmd{i}': f'output of cmd{i}\n' for i in range(3)})
+            self.assertEqual(len({id(x[1]) for x in results.values()}), 3)
+
+            with pool.acquire():
+                pass
+            self.assertEqual(self.created, 3)
+
+        def test_sync_on_stale_or_mutation(self):
+            pool = SessionPool(self.create_params, 2, 60)
+            with mock.patch('keepercommander.api.sync_down') as mock_sync:
+                with pool.acquire() as session1, pool.acquire() as session2:
+                    session1.params.revision = 2
+                mock_sync.assert_not_called()
+                self.assertEqual(session2.last_sync, 0)
+                self.assertGreater(session1.last_sync, 0)
+
+                with pool.acquire() as session:
+                    self.assertIs(session, session2)
+                mock_sync.assert_called_once_with(session2.params)
+
+                session1.last_sync = time.time() - 61
+                with pool.acquire(), pool.acquire():
+                    pass
+                self.assertEqual(mock_sync.call_count, 2)
+                mock_sync.assert_called_with(session1.params)
+
+    class TestConfigCache(unittest.TestCase):
+        def test_reload_on_change(self):
+            with tempfile.TemporaryDirectory() as temp_dir:
+                config_path = Path(temp_dir) / 'service_config.json'
+                config_path.write_text('{}')
+                service_config = mock.Mock()
+                service_config.format_handler.config_dir = Path(temp_dir)
+                service_config.load_config.return_value = {'run_mode': 'background'}
+                with mock.patch.object(ConfigReader, '_service_config', service_config), \
+                        mock.patch.object(ConfigReader, '_config_data', None):
+                    self.assertEqual(ConfigReader.read_config('run_mode'), 'background')
+                    self.assertEqual(ConfigReader.read_config('run_mode'), 'background')
+                    self.assertEqual(service_config.load_config.call_count, 1)
+
+                    config_path.write_text('{"run_mode": "foreground"}')
+                    os.utime(config_path, ns=(time.time_ns(), time.time_ns() + 10 ** 9))
+                    service_config.load_config.return_value = {'run_mode': 'foreground'}
+                    self.assertEqual(ConfigReader.read_config('run_mode'), 'foreground')
+                    self.assertEqual(service_config.load_config.call_count, 2)
@@ -1,9 +1,16 @@
+import collections
+import json
+import sys
+import threading
+import time
 from unittest import TestCase, mock
 from collections import namedtuple
 
 from data_vault import VaultEnvironment, get_synced_params, get_connected_params
 from helper import KeeperApiHelper
-from keepercommander import api, generator
+from keepercommander import api, crypto, generator, rest_api, throttle
+from keepercommander.params import RestApiContext
+from keepercommander.proto import APIRequest_pb2
 
 vault_env = VaultEnvironment()
 
@@ -22,6 +29,165 @@ class TestPasswordGenerator(TestCase):
             generator.KeeperPasswordGenerator(length=20, caps=0, lower=0, digits=0, symbols=0)
 
 
+class TestRestApiContext(TestCase):
+    def test_pooled_session(self):
+        context = RestApiContext()
+        context.pool_size = 4
+        session = context.get_session()
+        self.assertIs(context.get_session(), session)
+        self.assertEqual(session.get_adapter('https://keepersecurity.com')._pool_maxsize, 4)
+        context.close_session()
+        self.assertIsNot(context.get_session(), session)
+        context.close_session()
+
+    def test_transmission_key_cache(self):
+        context = RestApiContext()
+        rs = mock.Mock()
+        rs.status_code = 200
+        rs.headers = {}
+        rs.content = b''
+        with mock.patch('requests.Session.post', return_value=rs), \
+                mock.patch('keepercommander.crypto.encrypt_ec', return_value=b'key') as mock_encrypt:
+            for _ in range(3):
+                rest_api.execute_rest(context, 'test', APIRequest_pb2.ApiRequestPayload())
+            self.assertEqual(mock_encrypt.call_count, 1)
+
+            transmission_key = context.transmission_key
+            context.transmission_key_max_requests = 2
+            for _ in range(2):
+                rest_api.execute_rest(context, 'test', APIRequest_pb2.ApiRequestPayload())
+            self.assertEqual(mock_encrypt.call_count, 2)
+            self.assertNotEqual(context.transmission_key, transmission_key)
+        context.close_session()
+
+    def test_concurrent_transmission_key_rotation(self):
+        context = RestApiContext()
+        context.transmission_key_max_requests = 10
+        keys = []
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+        def get_keys():
+            for _ in range(100):
+                keys.append(rest_api.get_transmission_key(context)[0])
+
+        try:
+            # a slow key encryption widens the window between reading and updating the cache
+            with mock.patch('keepercommander.crypto.encrypt_ec', side_effect=lambda *x: time.sleep(0.001) or b'key') \
+                    as mock_encrypt:
+                threads = [threading.Thread(target=get_keys) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        self.assertEqual(len(keys), 800)
+        # every key is used for exactly 10 requests
+        self.assertEqual(mock_encrypt.call_count, 80)
+        self.assertTrue(all(x == 10 for x in collections.Counter(keys).values()))
+
+
+class TestRateGovernor(TestCase):
+    def test_throttle_backoff(self):
+        governor = throttle.RateGovernor()
+        with mock.patch('time.sleep') as mock_sleep:
+            for _ in range(5):
+                governor.acquire('test')
+            self.assertEqual(mock_sleep.call_count, 0)
+
+            governor.throttled('test')
+            governor.throttled('test')
+            self.assertEqual(mock_sleep.call_count, 2)
+            first, second = (x[0][0] for x in mock_sleep.call_args_list)
+            self.assertLessEqual(first, throttle.BACKOFF_BASE)
+            self.assertGreaterEqual(second, throttle.BACKOFF_BASE)
+
+            governor.acquire('test')
+            governor.acquire('test')
+            self.assertEqual(mock_sleep.call_count, 4)
+
+        stats = governor.get_statistics()
+        self.assertEqual(stats['throttle_count'], 2)
+        self.assertGreater(stats['wait_time'], 0)
+        self.assertIsNotNone(stats['endpoints']['test']['rate'])
+
+
+    def test_consecutive_v2_throttles(self):
+        params = get_connected_params()
+        context = params.rest_context
+        bodies = [{'result': 'fail', 'result_code': 'throttled', 'message': 'throttled'}] * 4
+        bodies.append({'result': 'success'})
+
+        def post(*args, **kwargs):
+            rs = mock.Mock()
+            rs.status_code = 200
+            rs.headers = {}
+            rs.content = crypto.encrypt_aes_v2(json.dumps(bodies.pop(0)).encode(), context.transmission_key)
+            return rs
+
+        with mock.patch('requests.Session.post', side_effect=post), mock.patch('time.sleep'), \
+                mock.patch('random.uniform', side_effect=lambda a, b: b) as mock_uniform:
+            rs = api.communicate(params, {'command': 'test'})
+        context.close_session()
+        self.assertEqual(rs['result'], 'success')
+        backoffs = [x[0][1] for x in mock_uniform.call_args_list]
+        self.assertEqual(backoffs, [throttle.BACKOFF_BASE * (2 ** i) for i in range(4)])
+
+
+class TestExecuteBatch(TestCase):
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_pipelined_order_and_throttle(self):
+        params = get_connected_params()
+        requests = [{'command': 'test', 'id': i} for i in range(2500)]
+        throttled = set()
+
+        def communicate(_, rq):
+            results = []
+            for x in rq['requests']:
+                if x['id'] % 1000 == 500 and x['id'] not in throttled:
+                    throttled.add(x['id'])
+                    results.append({'result': 'fail', 'result_code': 'throttled'})
+                    break
+                results.append({'result': 'success', 'id': x['id']})
+            return {'result': 'success', 'results': results}
+
+        mock.patch('keepercommander.api.run_command', side_effect=communicate).start()
+        mock.patch('time.sleep').start()
+        responses = api.execute_batch(params, requests, pipelined=True)
+        self.assertEqual([x['id'] for x in responses], list(range(2500)))
+        self.assertEqual(len(throttled), 2)
+
+    def test_failed_chunk_status(self):
+        params = get_connected_params()
+        mock.patch('keepercommander.api.run_command', side_effect=Exception('network')).start()
+        with mock.patch('logging.error'):
+            responses = api.execute_batch(params, [{'command': 'test'}, {'command': 'test'}])
+        self.assertEqual(len(responses), 2)
+        self.assertTrue(all(x['result'] == 'fail' and x['message'] == 'network' for x in responses))
+
+    def test_chunk_without_results(self):
+        params = get_connected_params()
+        requests = [{'command': 'test', 'id': i} for i in range(2500)]
+
+        def communicate(_, rq):
+            if rq['requests'][0]['id'] == 999:
+                return {'result': 'success'}
+            return {'result': 'success', 'results': [{'result': 'success', 'id': x['id']} for x in rq['requests']]}
+
+        mock.patch('keepercommander.api.run_command', side_effect=communicate).start()
+        with mock.patch('logging.error'):
+            responses = api.execute_batch(params, requests, pipelined=True)
+        self.assertEqual(len(responses), len(requests))
+        for i, rs in enumerate(responses):
+            if 999 <= i < 1998:
+                self.assertEqual(rs['result'], 'fail')
+            else:
+                self.assertEqual(rs['id'], i)
+
+
 class TestSearch(TestCase):
     def setUp(self):
         self.communicate_mock = mock.patch('keepercommander.api.communicate').start()
@@ -86,7 +252,10 @@ class TestSearch(TestCase):
         }
         with mock.patch('builtins.print'), mock.patch('builtins.input', return_value='accept'):
 
-            KeeperApiHelper.communicate_expect(['share_account'])
+            KeeperApiHelper.communicate_expect([lambda rq: {
+                'results': [{'result': 'success', 'result_code': 'success'} for x in rq['requests']
+                            if x['command'] == 'share_account']
+            }])
             self.assertTrue(api.accept_account_transfer_consent(params))
             self.assertTrue(KeeperApiHelper.is_expect_empty())
 
@@ -2,7 +2,7 @@ from collections import OrderedDict
 import sys
 from unittest import TestCase, mock
 
-from keepercommander.commands import base
+from keepercommander.commands import base, command_manifest
 from keepercommander.cli import do_command, read_command_with_continuation
 from data_vault import get_connected_params
 
@@ -17,6 +17,23 @@ class TestCommandLineInterface(TestCase):
         #base.register_commands(commands, aliases, command_info)
         base.register_enterprise_commands(commands, aliases, command_info)
 
+    def test_command_manifest(self):
+        with open(command_manifest.__file__, 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), base.build_command_manifest(),
+                             'commands/command_manifest.py is out of date')
+
+    def test_lazy_commands(self):
+        commands = base.LazyCommandDict()
+        aliases = {}
+        command_info = OrderedDict()
+        base.register_enterprise_commands(commands, aliases, command_info)
+        self.assertIn('enterprise-info', commands)
+        self.assertIsInstance(dict.__getitem__(commands, 'enterprise-info'), base._LazyCommandGroup)
+        self.assertIsInstance(commands['enterprise-info'], base.CliCommand)
+        self.assertIsInstance(dict.__getitem__(commands, 'enterprise-user'), base.CliCommand)
+        self.assertIsInstance(dict.__getitem__(commands, 'scim'), base._LazyCommandGroup)
+        self.assertIn('enterprise-info', command_info)
+
     def test_normalize_output_param(self):
         saved_platform = sys.platform
         try:
@@ -1,11 +1,11 @@
 import logging
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 from unittest import TestCase, mock
 
 from data_enterprise import EnterpriseEnvironment, get_enterprise_data, enterprise_allocate_ids
-from keepercommander import api, crypto, utils, vault
+from keepercommander import api, crypto, utils, vault, enterprise as keeper_enterprise
 from keepercommander.params import KeeperParams, PublicKeys
 from keepercommander.error import CommandError
 from data_vault import VaultEnvironment, get_connected_params
@@ -55,6 +55,57 @@ class TestEnterprise(TestCase):
             cmd = enterprise.EnterpriseInfoCommand()
             cmd.execute(params, verbose=True)
 
+    def test_enterprise_index(self):
+        params = get_connected_params()
+        api.query_enterprise(params)
+        params.enterprise_loader = keeper_enterprise._EnterpriseLoader()
+        index = keeper_enterprise.get_enterprise_index(params)
+
+        for user in params.enterprise['users']:
+            user_id = user['enterprise_user_id']
+            self.assertIs(index.get_user(user_id), user)
+            self.assertIs(index.get_user_by_email(user['username'].upper()), user)
+            self.assertEqual(index.get_user_roles(user_id),
+                             {x['role_id'] for x in params.enterprise['role_users'] if x['enterprise_user_id'] == user_id})
+            self.assertEqual(list(index.get_user_teams(user_id)),
+                             [x['team_uid'] for x in params.enterprise['team_users'] if x['enterprise_user_id'] == user_id])
+        for ru in params.enterprise['role_users']:
+            self.assertIn(ru['enterprise_user_id'], index.get_role_users(ru['role_id']))
+        for tu in params.enterprise['team_users']:
+            self.assertIn(tu['enterprise_user_id'], index.get_team_users(tu['team_uid']))
+        for node in params.enterprise['nodes']:
+            if node.get('parent_id'):
+                self.assertIn(node['node_id'], index.get_node_children(node['parent_id']))
+        for mn in params.enterprise['managed_nodes']:
+            self.assertIn(mn, index.get_role_managed_nodes(mn['role_id']))
+            self.assertIn(mn, index.get_node_managed_nodes(mn['managed_node_id']))
+        self.assertIsNone(index.get_user(-1))
+        self.assertEqual(index.get_role_users(-1), set())
+
+        user = params.enterprise['users'][0]
+        email = user['username']
+        user['username'] = 'renamed@company.com'
+        self.assertIs(index.get_user_by_email(email), user)
+        index.invalidate(['users'])
+        self.assertIsNone(index.get_user_by_email(email))
+        self.assertIs(index.get_user_by_email('renamed@company.com'), user)
+
+    def test_enterprise_index_without_loader(self):
+        params = get_connected_params()
+        api.query_enterprise(params)
+        params.enterprise_loader = None
+        index = keeper_enterprise.get_enterprise_index(params)
+        self.assertIs(keeper_enterprise.get_enterprise_index(params), index)
+
+        user = params.enterprise['users'].pop()
+        self.assertIsNone(index.get_user(user['enterprise_user_id']))
+        params.enterprise['users'].append(user)
+        self.assertIs(index.get_user(user['enterprise_user_id']), user)
+
+        params.enterprise = {'users': [dict(user)]}
+        index = keeper_enterprise.get_enterprise_index(params)
+        self.assertIsNot(index.get_user(user['enterprise_user_id']), user)
+
     def test_enterprise_add_user(self):
         params = get_connected_params()
         api.query_enterprise(params)
@@ -241,6 +292,98 @@ class TestEnterprise(TestCase):
         }
         splunk.convert_event(props, self.get_audit_event())
 
+    def test_audit_log_export_events(self):
+        class CollectExport(aram.AuditLogBaseExport):
+            def __init__(self):
+                super().__init__()
+                self.events = []
+
+            def chunk_size(self):
+                return 300
+
+            def default_record_title(self):
+                return 'Collect'
+
+            def get_properties(self, record, props):
+                pass
+
+            def convert_event(self, props, event):
+                return event['id']
+
+            def export_events(self, props, events):
+                self.events.extend(events)
+
+        now_ts = int(datetime.now().timestamp())
+        start_ts = now_ts - 1000
+        # events created in the same second span page boundaries
+        audit_events = [{'id': x, 'created': start_ts + x // 3, 'audit_event_type': 'login'} for x in range(2500)]
+
+        def communicate(params, request):
+            created = request['filter']['created']
+            rows = [x for x in audit_events if created.get('min', 0) <= x['created'] <= created['max']]
+            return {'result': 'success', 'audit_event_overview_report_rows': [dict(x) for x in rows[:request['limit']]]}
+
+        params = get_connected_params()
+        cmd = aram.AuditLogCommand()
+        log_export = CollectExport()
+        rq = {'command': 'get_audit_event_reports', 'report_type': 'raw', 'limit': 1000,
+              'filter': {'created': {'max': now_ts}}}
+        with mock.patch('keepercommander.api.communicate') as mock_comm, mock.patch('builtins.print'):
+            mock_comm.side_effect = communicate
+            num_exported, last_event_time = cmd.export_audit_events(
+                params, log_export, {}, rq, start_ts, now_ts, len(audit_events))
+        self.assertEqual(num_exported, len(audit_events))
+        self.assertEqual(log_export.events, list(range(len(audit_events))))
+        self.assertEqual(last_event_time, now_ts)
+
+        shards = aram.split_event_period(len(audit_events), start_ts, audit_events[-1]['created'], shard_events=700)
+        self.assertEqual(len(shards), 4)
+        self.assertEqual(shards[0][0], start_ts)
+        self.assertEqual(shards[-1][1], audit_events[-1]['created'])
+        self.assertTrue(all(x[1] + 1 == y[0] for x, y in zip(shards, shards[1:])))
+
+        log_export = CollectExport()
+        checkpoints = []
+        with mock.patch('keepercommander.api.communicate') as mock_comm, mock.patch('builtins.print'), \
+                mock.patch('keepercommander.commands.aram.AUDIT_CHECKPOINT_SHARDS', 2):
+            mock_comm.side_effect = communicate
+            num_exported, last_event_time = cmd.export_audit_events(
+                params, log_export, {}, rq, start_ts, now_ts, len(audit_events),
+                shards=shards, max_in_flight=3, on_checkpoint=checkpoints.append)
+        self.assertEqual(num_exported, len(audit_events))
+        self.assertEqual(log_export.events, list(range(len(audit_events))))
+        self.assertEqual(checkpoints, [shards[1][1] + 1, shards[3][1] + 1])
+        self.assertEqual(last_event_time, now_ts)
+
+    def test_audit_report_backfill_limit(self):
+        start_ts = int(datetime.now().timestamp()) - 20000
+        audit_events = [{'id': x, 'created': start_ts + x // 3, 'audit_event_type': 'login', 'username': 'user@company.com'}
+                        for x in range(4 * aram.AUDIT_SHARD_EVENTS)]
+        requested_periods = []
+
+        def communicate(params, request):
+            if request.get('command') != 'get_audit_event_reports':
+                return {'result': 'success', 'dimensions': {'audit_event_type': []}}
+            if request.get('report_type') == 'span':
+                return {'result': 'success', 'audit_event_overview_report_rows': [{
+                    'occurrences': len(audit_events), 'first_created': audit_events[0]['created'],
+                    'last_created': audit_events[-1]['created']}]}
+            created = request['filter']['created']
+            requested_periods.append(created['max'])
+            rows = [x for x in audit_events if created.get('min', 0) <= x['created'] <= created['max']]
+            return {'result': 'success', 'audit_event_overview_report_rows': [dict(x) for x in rows[:request['limit']]]}
+
+        params = get_connected_params()
+        api.query_enterprise(params)
+        self.communicate_mock.side_effect = communicate
+        cmd = aram.AuditReportCommand()
+        report = cmd.execute(params, report_type='raw', backfill=2, limit=100, order='desc', format='json')
+        rows = json.loads(report)
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows[0]['created'], datetime.fromtimestamp(audit_events[-1]['created'], timezone.utc).isoformat())
+        # 4 shards: only the newest shards, the ones in flight when the limit is reached, are requested
+        self.assertLessEqual(len(set(requested_periods)), 2)
+
     def test_audit_audit_report_parse_date_filter(self):
         cmd = aram.AuditReportCommand()
 
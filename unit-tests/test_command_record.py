@@ -11,6 +11,8 @@ from helper import KeeperApiHelper
 from keepercommander import api, utils, crypto, attachment, vault
 from keepercommander.commands import record, record_edit
 from keepercommander.error import CommandError
+from keepercommander.proto import record_pb2
+from urllib3.exceptions import ProtocolError
 
 
 class TestRecord(TestCase):
@@ -284,11 +286,106 @@ class TestRecord(TestCase):
             return rs
 
         with mock.patch('keepercommander.attachment.prepare_attachment_download', side_effect=prepare_download), \
-                mock.patch('requests.get', side_effect=requests_get), \
+                mock.patch('requests.Session.get', side_effect=requests_get), \
                 mock.patch('builtins.open', mock.mock_open()), \
                 mock.patch('os.path.abspath', return_value='/file_name'):
             cmd.execute(params, record=record_uid)
 
+    def test_download_resume(self):
+        params = get_synced_params()
+        key = utils.generate_aes_key()
+        body = os.urandom(100000)
+        body_encrypted = crypto.encrypt_aes_v2(body, key)
+        rq = attachment.AttachmentDownloadRequest()
+        rq.url = 'https://keepersecurity.com/files/file_id'
+        rq.is_gcm_encrypted = True
+        rq.encryption_key = key
+        ranges = []
+
+        class BrokenStream(io.BytesIO):
+            def readinto(self, buffer):
+                if self.tell() >= 20000:
+                    raise ProtocolError('Connection reset')
+                return super().readinto(memoryview(buffer)[:10000])
+
+        def requests_get(url, headers=None, **kwargs):
+            rs = mock.Mock()
+            if headers:
+                start = int(headers['Range'][len('bytes='):-1])
+                ranges.append(start)
+                rs.status_code = 206
+                rs.raw = BrokenStream(body_encrypted[start:])
+            else:
+                rs.status_code = 200
+                rs.raw = BrokenStream(body_encrypted)
+            return rs
+
+        progress = attachment.TransferProgress()
+        with mock.patch('requests.Session.get', side_effect=requests_get), mock.patch('time.sleep'):
+            output = io.BytesIO()
+            rq.download_to_stream(params, output, progress)
+        self.assertEqual(output.getvalue(), body)
+        # more resumes than retries: the retry counter restarts after every successful read
+        self.assertGreater(len(ranges), attachment.TRANSFER_RETRIES)
+        self.assertGreaterEqual(ranges[0], 20000)
+        self.assertEqual(progress.bytes, len(body_encrypted))
+
+    def test_upload_attachments(self):
+        params = get_synced_params()
+        record = vault.TypedRecord()
+        record.type_name = 'login'
+        tasks = []
+        for i in range(10):
+            task = attachment.BytesUploadTask(os.urandom(1000 + i))
+            task.name = f'file{i}.bin'
+            tasks.append(task)
+
+        def communicate_rest(params, rq, endpoint, **kwargs):
+            rs = record_pb2.FilesAddResponse()
+            for file in rq.files:
+                status = rs.files.add()
+                status.record_uid = file.record_uid
+                status.status = record_pb2.FA_SUCCESS
+                status.url = f'https://keepersecurity.com/upload/{utils.base64_url_encode(file.record_uid)}'
+                status.parameters = '{}'
+                status.thumbnail_parameters = '{}'
+                status.success_status_code = 201
+            return rs
+
+        uploaded = {}
+        failures = {}
+
+        def requests_post(url, data=None, headers=None, **kwargs):
+            # the body is streamed with a Content-Length
+            self.assertNotIsInstance(data, bytes)
+            body = data.read()
+            self.assertEqual(len(body), len(data))
+            boundary = headers['Content-Type'].split('boundary=')[1].encode()
+            part = next(x for x in body.split(b'--' + boundary) if b'name="file"' in x)
+            content = part[part.index(b'\r\n\r\n') + 4:-2]
+            rs = mock.Mock()
+            if url not in failures:
+                failures[url] = content
+                rs.status_code = 503
+            else:
+                # the retry encrypts the source again
+                self.assertNotEqual(failures[url], content)
+                uploaded[url] = content
+                rs.status_code = 201
+            return rs
+
+        self.communicate_mock.side_effect = communicate_rest
+        progress = attachment.TransferProgress()
+        with mock.patch('requests.Session.post', side_effect=requests_post), mock.patch('time.sleep'):
+            attachment.upload_attachments(params, record, tasks, progress)
+
+        file_refs = record.get_typed_field('fileRef').value
+        self.assertEqual(len(file_refs), len(tasks))
+        self.assertEqual(progress.files, len(tasks))
+        for file_ref, task in zip(file_refs, tasks):
+            content = uploaded[f'https://keepersecurity.com/upload/{file_ref}']
+            self.assertEqual(crypto.decrypt_aes_v2(content, record.linked_keys[file_ref]), task.data)
+
     def test_delete_attachment_command(self):
         params = get_synced_params()
         record_uid = next((x['record_uid'] for x in params.record_cache.values()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from data_vault import get_connected_params
+from keepercommander import api, crypto, utils, enterprise_cache
+from keepercommander.proto import enterprise_pb2 as proto
+
+
+class TestEnterpriseCache(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config_filename = os.path.join(self.temp_dir.name, 'config.json')
+        self.tree_key = crypto.get_random_bytes(32)
+        self.token = crypto.get_random_bytes(32)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_params(self):
+        params = get_connected_params()
+        params.config_filename = self.config_filename
+        params.config = {'enterprise_cache': True}
+        return params
+
+    def communicate_rest(self, params, rq, endpoint, **kwargs):
+        if endpoint == 'enterprise/get_enterprise_data_keys':
+            rs = proto.GetEnterpriseDataKeysResponse()
+            rs.treeKey.treeKey = utils.base64_url_encode(crypto.encrypt_aes_v2(self.tree_key, params.data_key))
+            rs.treeKey.keyTypeId = proto.ENCRYPTED_BY_DATA_KEY_GCM
+            rs.enterpriseKeys.rsaEncryptedPrivateKey = crypto.encrypt_aes_v2(b'rsa', self.tree_key)
+            rs.enterpriseKeys.eccEncryptedPrivateKey = crypto.encrypt_aes_v2(b'ecc', self.tree_key)
+            return rs
+        if endpoint == 'enterprise/get_enterprise_data_for_user':
+            rs = proto.EnterpriseDataResponse()
+            rs.continuationToken = self.token
+            if not rq.continuationToken:
+                rs.generalData.enterpriseName = 'Enterprise'
+                node = proto.Node()
+                node.nodeId = 100
+                ed = rs.data.add()
+                ed.entity = proto.NODES
+                ed.data.append(node.SerializeToString())
+                ed = rs.data.add()
+                ed.entity = proto.USERS
+                for user_id in (101, 102):
+                    user = proto.User()
+                    user.enterpriseUserId = user_id
+                    user.nodeId = 100
+                    user.username = f'user{user_id}@company.com'
+                    user.encryptedData = f'User {user_id}'
+                    user.keyType = 'no_key'
+                    ed.data.append(user.SerializeToString())
+                qtu = proto.QueuedTeamUser()
+                qtu.teamUid = crypto.get_random_bytes(16)
+                qtu.users.extend((101, 102))
+                ed = rs.data.add()
+                ed.entity = proto.QUEUED_TEAM_USERS
+                ed.data.append(qtu.SerializeToString())
+            else:
+                user = proto.User()
+                user.enterpriseUserId = 102
+                ed = rs.data.add()
+                ed.entity = proto.USERS
+                ed.delete = True
+                ed.data.append(user.SerializeToString())
+            return rs
+        raise Exception(f'Unexpected endpoint: {endpoint}')
+
+    def test_query_enterprise_resumes_from_token(self):
+        params = self.get_params()
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.side_effect = self.communicate_rest
+            api.query_enterprise(params)
+        self.assertEqual(len(params.enterprise['users']), 2)
+        params.clear_session()
+
+        params = self.get_params()
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.side_effect = self.communicate_rest
+            api.query_enterprise(params)
+            endpoints = [x[0][2] for x in mock_comm.call_args_list]
+            self.assertEqual(endpoints, ['enterprise/get_enterprise_data_for_user'])
+            self.assertEqual(mock_comm.call_args[0][1].continuationToken, self.token)
+
+        self.assertEqual(params.enterprise['unencrypted_tree_key'], self.tree_key)
+        self.assertEqual(params.enterprise['enterprise_name'], 'Enterprise')
+        self.assertEqual(params.enterprise_loader.enterprise.rsa_key, b'rsa')
+        self.assertEqual([x['enterprise_user_id'] for x in params.enterprise['users']], [101])
+        self.assertEqual(params.enterprise['users'][0]['data']['displayname'], 'User 101')
+        params.clear_session()
+
+    def test_entity_rows(self):
+        params = self.get_params()
+        cache = enterprise_cache.get_enterprise_cache(params)
+        enterprise = {
+            'users': [{'enterprise_user_id': 101}],
+            'queued_team_users': [{'team_uid': 'team', 'users': {101, 102}}],
+            'unencrypted_tree_key': self.tree_key,
+            'user_root_nodes': [100],
+        }
+        cache.save(enterprise, self.tree_key, self.token)
+        connection = cache.get_connection()
+        names = {x[0] for x in connection.execute('SELECT name FROM EnterpriseCacheEntity')}
+        self.assertEqual(names, {'users', 'queued_team_users'})
+        stored_tree_key = connection.execute('SELECT tree_key FROM EnterpriseCacheSettings').fetchone()[0]
+        self.assertNotIn(self.tree_key, stored_tree_key)
+
+        del enterprise['users']
+        enterprise['teams'] = [{'team_uid': 'team'}]
+        cache.save(enterprise, self.tree_key, self.token, names=['users', 'teams'])
+        tree_key, token, loaded = cache.load()
+        self.assertEqual(tree_key, self.tree_key)
+        self.assertEqual(token, self.token)
+        self.assertEqual(set(loaded.keys()), {'queued_team_users', 'teams'})
+        self.assertEqual(loaded['queued_team_users'][0]['users'], {101, 102})
+        params.clear_session()
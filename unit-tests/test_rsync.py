@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import threading
+import types
+from io import BytesIO
+from unittest import TestCase, mock
+
+from data_vault import get_synced_params
+from keepercommander.rsync import rsync, command
+
+
+class MemoryPlugin(rsync.RSyncPluginBase):
+    files = {}
+    downloaded = []
+
+    def connect(self, record):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def get_entries(self, root_dir=None):
+        for path, (data, mtime) in self.files.items():
+            entry = rsync.RSyncFileEntry(path)
+            entry.size = len(data)
+            entry.last_modified = mtime
+            entry.full_path = path
+            yield entry
+
+    def get_entry_stream(self, entry):
+        MemoryPlugin.downloaded.append((entry.path, threading.current_thread().name))
+        return BytesIO(self.files[entry.path][0])
+
+    def supports_concurrent_streams(self):
+        return True
+
+
+class TestRSync(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        MemoryPlugin.files = {
+            'file1.txt': (b'1' * 100, 1600000000),
+            os.path.join('folder', 'file2.txt'): (b'2' * 200, 1600000001),
+            os.path.join('folder', 'file3.txt'): (b'3' * 300, 1600000002),
+        }
+        MemoryPlugin.downloaded.clear()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def sync(self, params, **kwargs):
+        plugin_module = types.SimpleNamespace(RSyncPlugin=MemoryPlugin)
+        record_uid = next(iter(params.record_cache))
+        cmd = command.RSyncCommand()
+        with mock.patch.object(command.RSyncCommand, 'load_plugin', return_value=plugin_module):
+            cmd.execute(params, local_path=self.temp_dir.name, plugin='memory', remote_path='/',
+                        record=record_uid, force=True, **kwargs)
+
+    def test_delta_sync(self):
+        params = get_synced_params()
+        self.sync(params)
+        self.assertEqual(len(MemoryPlugin.downloaded), 3)
+        with open(os.path.join(self.temp_dir.name, 'folder', 'file3.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'3' * 300)
+        with open(os.path.join(self.temp_dir.name, command.RSYNC_MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        self.assertEqual(manifest['files']['file1.txt']['size'], 100)
+        self.assertEqual(manifest['files']['file1.txt']['mtime'], 1600000000)
+        self.assertIn('hash', manifest['files']['file1.txt'])
+        self.assertEqual([x for x in os.listdir(os.path.join(self.temp_dir.name, 'folder')) if x.startswith('.')], [])
+
+        MemoryPlugin.downloaded.clear()
+        MemoryPlugin.files['file1.txt'] = (b'4' * 100, 1600000010)
+        self.sync(params)
+        self.assertEqual([x[0] for x in MemoryPlugin.downloaded], ['file1.txt'])
+
+        MemoryPlugin.downloaded.clear()
+        file2 = os.path.join(self.temp_dir.name, 'folder', 'file2.txt')
+        with open(file2, 'wb') as f:
+            f.write(b'5' * 200)
+        os.utime(file2, (1600000001, 1600000001))
+        self.sync(params)
+        self.assertEqual(MemoryPlugin.downloaded, [])
+        self.sync(params, checksum=True)
+        self.assertEqual([x[0] for x in MemoryPlugin.downloaded], [os.path.join('folder', 'file2.txt')])
+        with open(file2, 'rb') as f:
+            self.assertEqual(f.read(), b'2' * 200)
+
+    def test_local_change_without_remote_mtime(self):
+        params = get_synced_params()
+        MemoryPlugin.files['file4.txt'] = (b'4' * 50, 0)
+        self.sync(params)
+        self.assertEqual(len(MemoryPlugin.downloaded), 4)
+
+        MemoryPlugin.downloaded.clear()
+        self.sync(params)
+        self.assertEqual(MemoryPlugin.downloaded, [])
+
+        file4 = os.path.join(self.temp_dir.name, 'file4.txt')
+        with open(file4, 'wb') as f:
+            f.write(b'5' * 50)
+        os.utime(file4, (1600000100, 1600000100))
+        self.sync(params)
+        self.assertEqual([x[0] for x in MemoryPlugin.downloaded], ['file4.txt'])
+        with open(file4, 'rb') as f:
+            self.assertEqual(f.read(), b'4' * 50)
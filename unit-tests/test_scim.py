@@ -0,0 +1,261 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from keepercommander.commands import scim
+
+
+class MockScimServer:
+    """In-process SCIM 2.0 endpoint. Supports Users, Groups, paging, PatchOp, Bulk and throttling.
+    "unavailable_bulk" Bulk requests are applied and then answered with 503."""
+
+    def __init__(self, bulk=True, latency=0.0, throttle_every=0, unavailable_bulk=0):
+        self.bulk = bulk
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.unavailable_bulk = unavailable_bulk
+        self.resources = {'Users': {}, 'Groups': {}}
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.create_handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server.server_address[1]}/scim/v2'
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def add(self, resource_type, resource):
+        resource = dict(resource)
+        resource['id'] = resource.get('id') or uuid.uuid4().hex
+        self.resources[resource_type][resource['id']] = resource
+        return resource
+
+    def handle(self, method, path, data):
+        """Returns (status, response) of one SCIM operation"""
+        comps = [x for x in path.split('/') if x]
+        resource_type = comps[0] if comps else ''
+        if resource_type not in self.resources:
+            return 404, None
+        resources = self.resources[resource_type]
+        if method == 'POST' and len(comps) == 1:
+            with self.lock:
+                return 201, self.add(resource_type, data)
+        if len(comps) != 2 or comps[1] not in resources:
+            return 404, None
+        resource = resources[comps[1]]
+        if method == 'DELETE':
+            with self.lock:
+                del resources[comps[1]]
+            return 204, None
+        if method == 'PATCH':
+            with self.lock:
+                for op in data.get('Operations') or []:
+                    if op.get('path') == 'groups':
+                        groups = {x['value'] for x in resource.get('groups') or []}
+                        values = {x['value'] for x in op['value']}
+                        groups = groups | values if op['op'] == 'add' else groups - values
+                        resource['groups'] = [{'value': x} for x in sorted(groups)]
+                    else:
+                        resource.update(op['value'])
+            return 200, resource
+        return 405, None
+
+    def create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def send(self, status, body=None, headers=None):
+                content = json.dumps(body).encode() if body is not None else b''
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', 'application/scim+json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def process(self):
+                with server.lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    self.process_request()
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+
+            def process_request(self):
+                comps = urlparse(self.path)
+                path = comps.path[len('/scim/v2'):]
+                length = int(self.headers.get('Content-Length') or 0)
+                data = json.loads(self.rfile.read(length)) if length else None
+                with server.lock:
+                    server.requests.append((self.command, path))
+                    count = len(server.requests)
+                if server.throttle_every and count % server.throttle_every == 0:
+                    return self.send(429, headers={'Retry-After': '0'})
+                if server.latency:
+                    time.sleep(server.latency)
+
+                if path == '/ServiceProviderConfig':
+                    return self.send(200, {'bulk': {'supported': server.bulk, 'maxOperations': 50,
+                                                    'maxPayloadSize': 1048576}})
+                if path == '/Bulk':
+                    if not server.bulk:
+                        return self.send(501)
+                    operations = []
+                    for op in data['Operations']:
+                        status, response = server.handle(op['method'], op['path'], op.get('data'))
+                        op_rs = {'method': op['method'], 'bulkId': op.get('bulkId'), 'status': str(status)}
+                        if op['method'] == 'POST' and status == 201:
+                            op_rs['location'] = f'{server.url}{op["path"]}/{response["id"]}'
+                        operations.append(op_rs)
+                    with server.lock:
+                        unavailable = server.unavailable_bulk > 0
+                        if unavailable:
+                            server.unavailable_bulk -= 1
+                    if unavailable:
+                        return self.send(503)
+                    return self.send(200, {'schemas': ['urn:ietf:params:scim:api:messages:2.0:BulkResponse'],
+                                           'Operations': operations})
+                if self.command == 'GET':
+                    resource_type = path.strip('/')
+                    query = parse_qs(comps.query)
+                    start_index = int(query.get('startIndex', ['1'])[0])
+                    count = min(int(query.get('count', ['100'])[0]), 30)
+                    resources = list(server.resources.get(resource_type, {}).values())
+                    page = resources[start_index - 1:start_index - 1 + count]
+                    return self.send(200, {'totalResults': len(resources), 'startIndex': start_index,
+                                           'itemsPerPage': len(page), 'Resources': page})
+                status, response = server.handle(self.command, path, data)
+                self.send(status, response)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = process
+
+        return Handler
+
+
+class TestScimPush(TestCase):
+    USER_COUNT = 100
+
+    @staticmethod
+    def external_data(user_count):
+        groups = {}
+        for i in range(4):
+            group = scim.ScimGroup()
+            group.id = f'g{i}'
+            group.name = f'Group {i}'
+            groups[group.id] = group
+        users = {}
+        for i in range(user_count):
+            user = scim.ScimUser()
+            user.id = f'u{i}'
+            user.email = f'user{i}@company.com'
+            user.full_name = f'User {i}'
+            user.first_name = 'User'
+            user.last_name = str(i)
+            user.active = True
+            user.groups = [f'g{i % 4}']
+            users[user.id] = user
+        return groups, users
+
+    def push(self, server, workers, bulk):
+        session = requests.Session()
+        session.trust_env = False
+        client = scim.ScimClient(server.url, 'token', workers=workers, bulk=bulk, session=session)
+        keeper_users = {}
+        keeper_groups = {}
+        for element in scim.ScimPushCommand.scim_keeper(server.url, 'token', client=client):
+            if isinstance(element, scim.ScimUser):
+                keeper_users[element.id] = element
+            else:
+                keeper_groups[element.id] = element
+        external_groups, external_users = self.external_data(self.USER_COUNT)
+
+        started = time.time()
+        scim.ScimPushCommand.sync_groups(server.url, 'token', keeper_groups, external_groups, client=client)
+        scim.ScimPushCommand.sync_users(server.url, 'token', keeper_users, external_users, client=client)
+        scim.ScimPushCommand.sync_membership(server.url, 'token', keeper_groups, keeper_users, external_users,
+                                             client=client)
+        elapsed = time.time() - started
+        operations = len(external_groups) + len(external_users) * 2
+        logging.info('SCIM push workers=%d bulk=%s: %d operations in %.2f seconds (%.0f ops/s), %d requests',
+                     workers, bulk, operations, elapsed, operations / elapsed, client.request_count)
+        session.close()
+        return elapsed, keeper_users
+
+    def assert_pushed(self, server):
+        users = server.resources['Users']
+        self.assertEqual(len(users), self.USER_COUNT)
+        self.assertEqual(len(server.resources['Groups']), 4)
+        group_ids = {x['externalId']: x['id'] for x in server.resources['Groups'].values()}
+        for user in users.values():
+            number = int(user['externalId'][1:])
+            self.assertEqual(user['groups'], [{'value': group_ids[f'g{number % 4}']}])
+
+    def test_bulk_push(self):
+        with MockScimServer(bulk=True, latency=0.005) as server:
+            self.push(server, 4, True)
+            self.assert_pushed(server)
+            bulk_requests = sum(1 for x in server.requests if x[1] == '/Bulk')
+            # 4 groups + 100 users + 100 memberships in batches of up to 50 operations
+            self.assertEqual(bulk_requests, 1 + 2 + 2)
+            self.assertFalse(any(x[0] in ('PATCH', 'DELETE') for x in server.requests))
+
+            server.requests.clear()
+            _, keeper_users = self.push(server, 4, True)
+            self.assertEqual(len(keeper_users), self.USER_COUNT)
+            self.assertEqual([x for x in server.requests if x[0] != 'GET'], [])
+
+    def test_concurrent_push(self):
+        with MockScimServer(bulk=False, latency=0.005) as server:
+            self.push(server, 1, True)
+            self.assert_pushed(server)
+            self.assertFalse(any(x[1] == '/Bulk' for x in server.requests))
+            self.assertEqual(server.max_in_flight, 1)
+
+        with MockScimServer(bulk=False, latency=0.005) as server:
+            self.push(server, 8, False)
+            self.assert_pushed(server)
+            self.assertGreater(server.max_in_flight, 1)
+            self.assertLessEqual(server.max_in_flight, 8)
+
+    def test_bulk_unavailable_not_retried(self):
+        with MockScimServer(bulk=True, unavailable_bulk=1) as server:
+            session = requests.Session()
+            session.trust_env = False
+            client = scim.ScimClient(server.url, 'token', workers=1, session=session)
+            operations = [scim.ScimOperation('POST', '/Users', {'externalId': f'u{i}'}) for i in range(3)]
+            results = list(client.execute(operations))
+            session.close()
+            self.assertEqual(len(results), 3)
+            self.assertTrue(all(x[2] is not None for x in results))
+            self.assertEqual(sum(1 for x in server.requests if x[1] == '/Bulk'), 1)
+            self.assertEqual(len(server.resources['Users']), 3)
+
+    def test_retry_throttled(self):
+        with MockScimServer(bulk=False, throttle_every=7) as server:
+            self.push(server, 4, True)
+            self.assert_pushed(server)
+            self.assertTrue(any(x[0] == 'POST' for x in server.requests))
@@ -0,0 +1,39 @@
+import collections
+import random
+import threading
+import time
+from unittest import TestCase
+
+from keepercommander import sox
+
+
+class TestSox(TestCase):
+    def test_run_pipelined(self):
+        tasks = collections.deque(range(20))
+        lock = threading.Lock()
+        active = [0, 0]
+        saved = []
+
+        def fetch(task):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(random.uniform(0, 0.01))
+            with lock:
+                active[0] -= 1
+            return task * 10
+
+        def save(task, result):
+            self.assertEqual(threading.current_thread(), threading.main_thread())
+            saved.append(result)
+            if task == 5:
+                tasks.append(100)
+
+        sox.run_pipelined(lambda: tasks.popleft() if tasks else None, fetch, save, 4)
+        self.assertEqual(saved, [x * 10 for x in range(20)] + [1000])
+        self.assertLessEqual(active[1], 4)
+
+        saved.clear()
+        tasks.extend(range(3))
+        sox.run_pipelined(lambda: tasks.popleft() if tasks else None, fetch, save, 1)
+        self.assertEqual(saved, [0, 10, 20])
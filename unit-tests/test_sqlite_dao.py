@@ -0,0 +1,112 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from unittest import TestCase
+
+from keepercommander import utils
+from keepercommander.storage import sqlite_dao, sqlite, encrypted_sqlite
+
+
+class SampleEntity:
+    def __init__(self, uid='', name=''):
+        self.uid = uid
+        self.name = name
+
+
+class TestSqliteDao(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.get_connection = sqlite_dao.ThreadConnections(os.path.join(self.temp_dir.name, 'test.db'))
+        schema = sqlite_dao.TableSchema.load_schema(SampleEntity, 'uid')
+        sqlite_dao.verify_database(self.get_connection(), (schema,))
+        self.storage = sqlite.SqliteEntityStorage(self.get_connection, schema)
+
+    def tearDown(self):
+        self.get_connection.close_all()
+        self.temp_dir.cleanup()
+
+    def test_find_entities(self):
+        count = sqlite_dao.MAX_QUERY_PARAMETERS * 2 + 10
+        self.storage.put_entities((SampleEntity(f'uid{x}', f'name{x}') for x in range(count)))
+        uids = [f'uid{x}' for x in range(0, count + 100, 2)]
+        entities = {x.uid: x for x in self.storage.find_entities(uids)}
+        self.assertEqual(len(entities), (count + 1) // 2)
+        self.assertEqual(entities['uid10'].name, 'name10')
+        self.assertEqual(list(self.storage.find_entities([])), [])
+
+        entities = list(self.storage.get_entities(['uid10', 'missing']))
+        self.assertEqual(entities[0].name, 'name10')
+        self.assertIsNone(entities[1])
+
+    def test_close_all(self):
+        self.storage.put_entities([SampleEntity('uid1', 'name1')])
+        worker = []
+        thread = threading.Thread(target=lambda: worker.append(self.get_connection()))
+        thread.start()
+        thread.join()
+        main = self.get_connection()
+        self.assertIsNot(main, worker[0])
+
+        self.get_connection.close_all()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            worker[0].execute('SELECT 1')
+        with self.assertRaises(sqlite3.ProgrammingError):
+            main.execute('SELECT 1')
+        self.assertIsNot(self.get_connection(), main)
+        self.assertEqual(self.storage.get_entity('uid1').name, 'name1')
+
+    def test_bulk_transaction(self):
+        connection = self.get_connection()
+        self.assertEqual(connection.execute('PRAGMA journal_mode').fetchone()[0].lower(), 'wal')
+        with connection.bulk():
+            self.storage.put_entities([SampleEntity('uid1', 'name1')])
+            self.storage.put_entities([SampleEntity('uid2', 'name2')])
+            self.assertTrue(connection.in_transaction)
+        self.assertFalse(connection.in_transaction)
+        self.assertEqual(len(list(self.storage.get_all())), 2)
+
+        with self.assertRaises(ValueError):
+            with connection.bulk():
+                self.storage.delete_all()
+                self.storage.put_entities([SampleEntity('uid3', 'name3')])
+                raise ValueError()
+        self.assertEqual({x.uid for x in self.storage.get_all()}, {'uid1', 'uid2'})
+
+
+class SampleSettings:
+    def __init__(self):
+        self.token = b''
+        self.key_check = b''
+
+
+class TestEncryptedSqliteStore(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.database_name = os.path.join(self.temp_dir.name, 'cache.db')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def open_store(self, data_key):
+        return encrypted_sqlite.EncryptedSqliteStore(
+            self.database_name, 'owner', data_key, b'key-check', SampleSettings, SampleEntity, ['uid'])
+
+    def test_data_key_check(self):
+        data_key = utils.generate_aes_key()
+        store = self.open_store(data_key)
+        obj = {'bytes': b'\x00\x01', 'set': {1}, 'list': [b'\x02']}
+        self.assertEqual(store.decrypt(store.encrypt(obj)), {'bytes': b'\x00\x01', 'set': [1], 'list': [b'\x02']})
+        settings = SampleSettings()
+        settings.token = b'token'
+        store.store_settings(settings)
+        store.close()
+
+        store = self.open_store(data_key)
+        self.assertEqual(store.load_settings().token, b'token')
+        store.close()
+
+        store = self.open_store(utils.generate_aes_key())
+        self.assertIsNone(store.load_settings())
+        self.assertIsNone(store._settings.load())
+        store.close()
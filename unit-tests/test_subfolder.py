@@ -7,6 +7,7 @@ from unittest.mock import Mock
 import pytest
 
 import keepercommander.subfolder as subfolder
+from keepercommander.params import FolderRecordCache
 
 
 def BFN(*, type, uid, parent_uid, name, subfolders):
@@ -82,3 +83,37 @@ def test_subfolder_try_resolve_path(input_, expected_folder, expected_final):
     actual_folder, actual_final = subfolder.try_resolve_path(global_params, input_)
     assert actual_folder is expected_folder
     assert actual_final == expected_final
+
+
+def test_folder_record_cache_reverse_index():
+    """Check that record to folder lookups follow every change of the folder record map."""
+    cache = FolderRecordCache()
+
+    def assert_index():
+        record_uids = set()
+        for record_set in cache.values():
+            record_uids.update(record_set)
+        record_uids.update(('r1', 'r2', 'r3', 'r4'))
+        for record_uid in record_uids:
+            expected = {fuid for fuid, rs in cache.items() if record_uid in rs}
+            assert set(cache.get_folders(record_uid)) == expected
+
+    cache[''] = {'r1', 'r2'}
+    cache.setdefault('f1', set()).add('r1')
+    assert_index()
+    cache['f1'].update(('r2', 'r3'))
+    cache['f1'].remove('r2')
+    cache['f1'] -= {'r3'}
+    cache['f2'] = cache['f1']
+    assert_index()
+    cache[''].discard('r1')
+    cache[''] |= {'r4'}
+    cache['f1'] &= {'r4'}
+    assert_index()
+    detached = cache.pop('f2')
+    detached.add('r3')
+    del cache['']
+    assert_index()
+    assert subfolder.get_record_folders(Mock(subfolder_record_cache=cache), 'r1') == []
+    cache.clear()
+    assert cache.get_folders('r4') == []
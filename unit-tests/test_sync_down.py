@@ -1,8 +1,14 @@
+import json
+import time
 from unittest import TestCase, mock
 
-from data_vault import VaultEnvironment, get_synced_params
+from data_vault import VaultEnvironment, get_synced_params, get_connected_params, get_sync_down_responses
+from keepercommander import vault, sync_down as sync_down_module
 from keepercommander.api import sync_down, crypto, utils
+from keepercommander.lazy_record import LazyRecord
 from keepercommander.proto import SyncDown_pb2
+from keepercommander.sync_down import decrypt_vault, KeyedList, prepare_folder_tree
+from keepercommander.subfolder import get_folder_path
 
 vault_env = VaultEnvironment()
 
@@ -95,6 +101,143 @@ class TestSyncDown(TestCase):
         self.assertEqual(len(params.team_cache), 0)
         self.assert_key_unencrypted(params)
 
+    def test_large_shared_folder_sync(self):
+        scanned = [0]
+        list_iter = list.__iter__
+        list_contains = list.__contains__
+        list_remove = list.remove
+
+        def counting_iter(keyed_list):
+            for item in list_iter(keyed_list):
+                scanned[0] += 1
+                yield item
+
+        def counting_contains(keyed_list, item):
+            scanned[0] += len(keyed_list)
+            return list_contains(keyed_list, item)
+
+        def counting_remove(keyed_list, item):
+            scanned[0] += len(keyed_list)
+            keyed_list._index = None
+            list_remove(keyed_list, item)
+
+        def replay(size):
+            params = get_synced_params()
+            sf_uid = next(iter(params.shared_folder_cache))
+            sf_records = len(params.shared_folder_cache[sf_uid]['records'])
+            sf_users = len(params.shared_folder_cache[sf_uid]['users'])
+            sf_uid_bytes = utils.base64_url_decode(sf_uid)
+            record_uids = [crypto.get_random_bytes(16) for _ in range(size)]
+            account_uids = [crypto.get_random_bytes(16) for _ in range(size)]
+
+            add_rs = SyncDown_pb2.SyncDownResponse()
+            for uid in record_uids:
+                add_rs.sharedFolderRecords.add(sharedFolderUid=sf_uid_bytes, recordUid=uid)
+            for uid in account_uids:
+                add_rs.sharedFolderUsers.add(sharedFolderUid=sf_uid_bytes, accountUid=uid, username='user')
+            remove_rs = SyncDown_pb2.SyncDownResponse()
+            for uid in record_uids[::2]:
+                remove_rs.removedSharedFolderRecords.add(sharedFolderUid=sf_uid_bytes, recordUid=uid)
+            for uid in account_uids[::2]:
+                remove_rs.removedSharedFolderUsers.add(sharedFolderUid=sf_uid_bytes, accountUid=uid)
+
+            scanned[0] = 0
+            with mock.patch('keepercommander.api.communicate_rest', side_effect=[add_rs, remove_rs]), \
+                    mock.patch.object(KeyedList, '__iter__', counting_iter), \
+                    mock.patch.object(KeyedList, '__contains__', counting_contains), \
+                    mock.patch.object(KeyedList, 'remove', counting_remove):
+                sync_down(params)
+                sync_down(params)
+
+            sf = params.shared_folder_cache[sf_uid]
+            self.assertIsInstance(sf['records'], KeyedList)
+            self.assertEqual(len(sf['records']), sf_records + size // 2)
+            self.assertEqual(len(sf['users']), sf_users + size // 2)
+            self.assertIsNotNone(sf['records'].find(utils.base64_url_encode(record_uids[1])))
+            self.assertIsNone(sf['records'].find(utils.base64_url_encode(record_uids[0])))
+            return scanned[0]
+
+        # entries of shared folder lists visited while the responses are applied
+        small = replay(2500)
+        large = replay(10000)
+        self.assertGreater(small, 0)
+        # linear processing visits 4 times more entries for 4 times more entries, quadratic 16 times
+        self.assertLess(large / small, 5)
+
+    def test_incremental_folder_tree(self):
+        params = get_synced_params()
+
+        def user_folder(folder_uid, name, parent_uid=None):
+            folder_key = utils.generate_aes_key()
+            uf = SyncDown_pb2.UserFolder()
+            uf.folderUid = utils.base64_url_decode(folder_uid)
+            if parent_uid:
+                uf.parentUid = utils.base64_url_decode(parent_uid)
+            uf.userFolderKey = crypto.encrypt_aes_v1(folder_key, params.data_key)
+            uf.keyType = 1
+            uf.data = crypto.encrypt_aes_v1(json.dumps({'name': name}).encode('utf-8'), folder_key)
+            return uf
+
+        def get_tree():
+            tree = {uid: (f.parent_uid, f.name, sorted(f.subfolders)) for uid, f in params.folder_cache.items()}
+            tree[''] = sorted(params.root_folder.subfolders)
+            return tree
+
+        def apply(rs):
+            rs.continuationToken = crypto.get_random_bytes(64)
+            with mock.patch('keepercommander.api.communicate_rest', return_value=rs), \
+                    mock.patch('keepercommander.sync_down.create_folder_node',
+                               wraps=sync_down_module.create_folder_node) as mock_create:
+                sync_down(params)
+            tree = get_tree()
+            prepare_folder_tree(params)
+            self.assertEqual(tree, get_tree())
+            return mock_create.call_count
+
+        parent_uid = utils.generate_uid()
+        child_uid = utils.generate_uid()
+        rs = SyncDown_pb2.SyncDownResponse()
+        rs.userFolders.extend([user_folder(parent_uid, 'Parent'), user_folder(child_uid, 'Child', parent_uid)])
+        self.assertEqual(apply(rs), 2)
+        self.assertEqual(get_folder_path(params, child_uid), 'Parent/Child')
+
+        rs = SyncDown_pb2.SyncDownResponse()
+        rs.userFolders.append(user_folder(parent_uid, 'Renamed'))
+        self.assertEqual(apply(rs), 1)
+        self.assertEqual(get_folder_path(params, child_uid), 'Renamed/Child')
+
+        rs = SyncDown_pb2.SyncDownResponse()
+        rs.userFolders.append(user_folder(child_uid, 'Child'))
+        self.assertEqual(apply(rs), 1)
+        self.assertEqual(get_folder_path(params, child_uid), 'Child')
+
+        rs = SyncDown_pb2.SyncDownResponse()
+        rs.removedUserFolders.append(utils.base64_url_decode(parent_uid))
+        self.assertEqual(apply(rs), 0)
+        self.assertNotIn(parent_uid, params.folder_cache)
+
+    def test_incremental_folder_tree_remove_team(self):
+        params = get_synced_params()
+        sf_uid = next(iter(params.shared_folder_cache))
+        team_uid = next(iter(params.team_cache))
+        self.assertIn(sf_uid, (x['shared_folder_uid'] for x in params.team_cache[team_uid]['shared_folder_keys']))
+        self.assertIn(sf_uid, params.root_folder.subfolders)
+        # the team grants the only key to the shared folder
+        shared_folder = params.shared_folder_cache[sf_uid]
+        shared_folder.pop('shared_folder_key', None)
+        shared_folder.pop('key_type', None)
+
+        rs = SyncDown_pb2.SyncDownResponse()
+        rs.continuationToken = crypto.get_random_bytes(64)
+        rs.removedTeams.append(utils.base64_url_decode(team_uid))
+        with mock.patch('keepercommander.api.communicate_rest', return_value=rs):
+            sync_down(params)
+
+        self.assertNotIn(sf_uid, params.shared_folder_cache)
+        self.assertNotIn(sf_uid, params.subfolder_cache)
+        self.assertNotIn(sf_uid, params.folder_cache)
+        self.assertNotIn(sf_uid, params.root_folder.subfolders)
+
     def assert_key_unencrypted(self, params):
         for r in params.record_cache.values():
             self.assertTrue('record_key_unencrypted' in r)
@@ -102,3 +245,47 @@ class TestSyncDown(TestCase):
             self.assertTrue('shared_folder_key_unencrypted' in sf)
         for t in params.team_cache.values():
             self.assertTrue('team_key_unencrypted' in t)
+
+    def test_parallel_decryption(self):
+        with mock.patch('keepercommander.sync_down.DECRYPT_PARALLEL_THRESHOLD', 1), \
+                mock.patch('keepercommander.sync_down.DECRYPT_MAX_WORKERS', 4):
+            params = get_synced_params()
+            self.assertEqual(len(params.record_cache), 3)
+            self.assert_key_unencrypted(params)
+            for r in params.record_cache.values():
+                self.assertTrue('data_unencrypted' in r)
+
+            timings = decrypt_vault(params)
+        self.assertEqual([x[0] for x in timings],
+                         ['Team keys', 'Shared folder keys', 'Record keys', 'Record data', 'Non shared data', 'Folders'])
+
+    def test_lazy_decryption(self):
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.side_effect = get_sync_down_responses
+            params = get_connected_params()
+            params.config = {'lazy_decryption': True}
+            sync_down(params)
+
+        self.assertEqual(len(params.record_cache), 3)
+        self.assert_key_unencrypted(params)
+        self.assertEqual(len(params.plaintext_cache), 0)
+        for record_uid, r in params.record_cache.items():
+            self.assertIsInstance(r, LazyRecord)
+            self.assertFalse(r.is_decrypted())
+            record = vault.KeeperRecord.load(params, record_uid)
+            self.assertIsNotNone(record)
+            self.assertTrue(record.title)
+        self.assertEqual(len(params.plaintext_cache), 3)
+
+        params.plaintext_cache.max_size = 1
+        params.plaintext_cache.clear()
+        misses = params.plaintext_cache.misses
+        for r in params.record_cache.values():
+            self.assertTrue('data_unencrypted' in r)
+            self.assertEqual('extra_unencrypted' in r, r.get('version', 0) < 3)
+        self.assertEqual(len(params.plaintext_cache), 0)
+        self.assertEqual(params.plaintext_cache.misses, misses)
+
+        for r in params.record_cache.values():
+            self.assertTrue(r['data_unencrypted'])
+        self.assertEqual(len(params.plaintext_cache), 1)
@@ -0,0 +1,137 @@
+import json
+import re
+from unittest import TestCase, mock
+
+from data_vault import get_synced_params
+from keepercommander import api, vault, vault_extensions, crypto, utils, search_index
+from keepercommander.api import sync_down
+from keepercommander.proto import SyncDown_pb2
+
+
+class TestRecordObjectCache(TestCase):
+    def test_load_cached(self):
+        params = get_synced_params()
+        record_uid = next(iter(params.record_cache))
+        record = vault.KeeperRecord.load_cached(params, record_uid)
+        self.assertIsNotNone(record)
+        self.assertIs(vault.KeeperRecord.load_cached(params, record_uid), record)
+        self.assertIsNot(vault.KeeperRecord.load(params, record_uid), record)
+
+        params.record_cache[record_uid]['revision'] += 1
+        self.assertIsNot(vault.KeeperRecord.load_cached(params, record_uid), record)
+
+    def test_find_records_returns_copies(self):
+        params = get_synced_params()
+        records = list(vault_extensions.find_records(params))
+        self.assertEqual(len(records), len(params.record_cache))
+        self.assertEqual(len(params.record_object_cache), len(params.record_cache))
+        for record in records:
+            self.assertIsNot(params.record_object_cache[record.record_uid][3], record)
+
+        record = records[0]
+        record.title = 'Modified'
+        self.assertNotEqual(vault.KeeperRecord.load_cached(params, record.record_uid).title, 'Modified')
+
+    def test_find_records_read_only(self):
+        params = get_synced_params()
+        with mock.patch('keepercommander.vault.KeeperRecord.load', wraps=vault.KeeperRecord.load) as mock_load:
+            records = list(vault_extensions.find_records(params, editable=False))
+            self.assertEqual(mock_load.call_count, len(params.record_cache))
+            records_again = list(vault_extensions.find_records(params, editable=False))
+            self.assertEqual(mock_load.call_count, len(params.record_cache))
+        for record, record_again in zip(records, records_again):
+            self.assertIs(record, record_again)
+
+    def test_cache_size_bound(self):
+        params = get_synced_params()
+        params.config[vault.RECORD_OBJECT_CACHE_SIZE_CONFIG_KEY] = 2
+        record_uids = list(params.record_cache)
+        for record_uid in record_uids:
+            vault.KeeperRecord.load_cached(params, record_uid)
+        self.assertEqual(list(params.record_object_cache), record_uids[-2:])
+        vault.KeeperRecord.load_cached(params, record_uids[-2])
+        vault.KeeperRecord.load_cached(params, record_uids[0])
+        self.assertEqual(list(params.record_object_cache), [record_uids[-2], record_uids[0]])
+
+    def test_sync_down_invalidates(self):
+        params = get_synced_params()
+        list(vault_extensions.find_records(params))
+        record_uid = next(iter(params.record_object_cache))
+
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            rs = SyncDown_pb2.SyncDownResponse()
+            rs.continuationToken = crypto.get_random_bytes(64)
+            rs.removedRecords.append(utils.base64_url_decode(record_uid))
+            mock_comm.return_value = rs
+            sync_down(params)
+        self.assertNotIn(record_uid, params.record_cache)
+        self.assertNotIn(record_uid, params.record_object_cache)
+
+
+class TestSearchIndex(TestCase):
+    def test_index_matches_full_scan(self):
+        params = get_synced_params()
+        for pattern in ('record', 'Record 1', 'keepersecurity.com/2', 'value2', 'note', 'INVALID', 're.ord', '1'):
+            indexed = [x.record_uid for x in vault_extensions.find_records(params, pattern)]
+            scanned = [x.record_uid for x in (vault.KeeperRecord.load(params, r) for r in params.record_cache)
+                       if vault_extensions.matches_record(x, pattern)]
+            self.assertEqual(indexed, scanned, pattern)
+        self.assertIsNotNone(params.search_index)
+
+        record_uid = next(iter(params.record_cache))
+        self.assertEqual([x.record_uid for x in vault_extensions.find_records(params, record_uid)], [record_uid])
+        self.assertEqual(len(api.search_shared_folders(params, 'Folder 1')), 1)
+        self.assertEqual(len(api.search_teams(params, 'team 1')), 1)
+
+    def test_sync_down_updates_index(self):
+        params = get_synced_params()
+        record = next(x for x in params.record_cache.values() if x.get('version') == 2)
+        record_uid = record['record_uid']
+        self.assertEqual(len(list(vault_extensions.find_records(params, 'Record 1'))), 1)
+
+        data = json.loads(record['data_unencrypted'])
+        data['title'] = 'Renamed'
+        rs = SyncDown_pb2.SyncDownResponse()
+        rs.continuationToken = crypto.get_random_bytes(64)
+        rec = SyncDown_pb2.Record()
+        rec.recordUid = utils.base64_url_decode(record_uid)
+        rec.revision = record['revision'] + 1
+        rec.version = 2
+        rec.data = crypto.encrypt_aes_v1(json.dumps(data).encode(), record['record_key_unencrypted'])
+        if record.get('extra'):
+            rec.extra = utils.base64_url_decode(record['extra'])
+        rs.records.append(rec)
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.return_value = rs
+            sync_down(params)
+
+        self.assertEqual(len(list(vault_extensions.find_records(params, 'Record 1'))), 0)
+        self.assertEqual([x.record_uid for x in vault_extensions.find_records(params, 'renamed')], [record_uid])
+
+    def test_trigram_index(self):
+        index = search_index.TrigramIndex()
+        long_text = 'x' * 10000 + ' needle'
+        source = {'ascii': 'Plain Title', 'unicode': 'Caf\u00e9 \u0130stanbul pa\u017f\u017fword', 'long': long_text}
+        with mock.patch.object(index, 'add', wraps=index.add) as mock_add:
+            index.refresh(source, source.get)
+            self.assertEqual(mock_add.call_count, 3)
+            index.refresh(source, source.get)
+            self.assertEqual(mock_add.call_count, 3)
+
+        for literal in ('plain', 'caf', 'stanbul', 'password', 'needle', 'title'):
+            pattern = re.compile(literal, re.IGNORECASE)
+            expected = {uid for uid, text in source.items() if pattern.search(text)}
+            self.assertEqual(index.search(literal), expected, literal)
+        self.assertEqual(index.search('missing'), set())
+        for trigrams in index.documents.values():
+            self.assertIsInstance(trigrams, frozenset)
+
+        del source['long']
+        source['new'] = 'new needle'
+        index.stale.add('new')
+        index.refresh(source, source.get)
+        self.assertEqual(index.search('needle'), {'long', 'new'})
+        index.reconcile = True
+        index.refresh(source, source.get)
+        self.assertEqual(index.search('needle'), {'new'})
+        self.assertEqual(len(index), 3)
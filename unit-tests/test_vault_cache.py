@@ -0,0 +1,90 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from data_vault import get_connected_params, get_sync_down_responses
+from keepercommander import api, crypto, utils, vault_cache
+from keepercommander.proto import SyncDown_pb2
+
+
+class TestVaultCache(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config_filename = os.path.join(self.temp_dir.name, 'config.json')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def get_params(self):
+        params = get_connected_params()
+        params.config_filename = self.config_filename
+        params.config = {'vault_cache': True}
+        return params
+
+    @staticmethod
+    def empty_response():
+        rs = SyncDown_pb2.SyncDownResponse()
+        rs.continuationToken = crypto.get_random_bytes(64)
+        return rs
+
+    def test_resume_from_cache(self):
+        params = self.get_params()
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.side_effect = get_sync_down_responses
+            api.sync_down(params)
+        token = params.sync_down_token
+        record_uids = set(params.record_cache.keys())
+        params.clear_session()
+
+        params = self.get_params()
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.return_value = self.empty_response()
+            api.sync_down(params)
+            rq = mock_comm.call_args[0][1]
+            self.assertEqual(rq.continuationToken, token)
+
+        self.assertEqual(set(params.record_cache.keys()), record_uids)
+        self.assertEqual(len(params.shared_folder_cache), 1)
+        self.assertEqual(len(params.team_cache), 1)
+        self.assertGreater(len(params.record_type_cache), 0)
+        for r in params.record_cache.values():
+            self.assertTrue('record_key_unencrypted' in r)
+            self.assertTrue('data_unencrypted' in r)
+        params.clear_session()
+
+    def test_delta_removes_records(self):
+        params = self.get_params()
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.side_effect = get_sync_down_responses
+            api.sync_down(params)
+
+        owned = [x for x, md in params.meta_data_cache.items() if md.get('owner') is True]
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            rs = self.empty_response()
+            rs.removedRecords.extend((utils.base64_url_decode(x) for x in owned))
+            mock_comm.return_value = rs
+            api.sync_down(params)
+        record_uids = set(params.record_cache.keys())
+        params.clear_session()
+
+        params = self.get_params()
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.return_value = self.empty_response()
+            api.sync_down(params)
+        self.assertEqual(set(params.record_cache.keys()), record_uids)
+        params.clear_session()
+
+    def test_wrong_data_key(self):
+        params = self.get_params()
+        with mock.patch('keepercommander.api.communicate_rest') as mock_comm:
+            mock_comm.side_effect = get_sync_down_responses
+            api.sync_down(params)
+        params.clear_session()
+
+        params = self.get_params()
+        params.data_key = utils.generate_aes_key()
+        cache = vault_cache.get_vault_cache(params)
+        self.assertFalse(cache.load(params))
+        self.assertIsNone(params.sync_down_token)
+        self.assertEqual(len(params.record_cache), 0)
+        params.clear_session()